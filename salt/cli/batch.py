@@ -8,10 +8,14 @@ from __future__ import print_function
 import math
 import time
 import copy
+import logging
 
 # Import salt libs
 import salt.client
 import salt.output
+import salt.utils.minions
+
+log = logging.getLogger(__name__)
 
 
 class Batch(object):
@@ -28,6 +32,14 @@ class Batch(object):
         '''
         Return a list of minions to use for the batch run
         '''
+        if self.opts.get('batch_presence'):
+            present = self.__present_minions()
+            if present:
+                return present
+            log.info(
+                'No minion presence data is available, pinging the targeted '
+                'minions'
+            )
         args = [self.opts['tgt'],
                 'test.ping',
                 [],
@@ -48,6 +60,25 @@ class Batch(object):
                 fret.append(minion)
         return sorted(fret)
 
+    def __present_minions(self):
+        '''
+        Return the targeted minions which are connected to the master, from
+        the minion data cache instead of pinging them
+        '''
+        ckminions = salt.utils.minions.CkMinions(self.opts)
+        present = ckminions.connected_ids()
+        if not present:
+            return []
+        expr_form = self.opts.get('selected_target_option') \
+            or self.opts.get('expr_form', 'glob')
+        fret = []
+        for minion in ckminions.check_minions(self.opts['tgt'], expr_form):
+            if minion in present:
+                if not self.quiet:
+                    print('{0} Detected for this batch run'.format(minion))
+                fret.append(minion)
+        return sorted(fret)
+
     def get_bnum(self):
         '''
         Return the active number of minions to maintain
@@ -70,117 +101,100 @@ class Batch(object):
     def run(self):
         '''
         Execute the batch run
+
+        The minions run in a sliding window, one subscription to the event
+        bus receives the returns of every sub job and the command is sent to
+        the next minions as soon as a slot in the window is free.
         '''
-        args = [[],
-                self.opts['fun'],
-                self.opts['arg'],
-                self.opts['timeout'],
-                'list',
-                ]
         bnum = self.get_bnum()
+        if not bnum:
+            return
+        timeout = self.opts['timeout']
         to_run = copy.deepcopy(self.minions)
-        active = []
-        ret = {}
-        iters = []
-
-        # the minion tracker keeps track of responses and iterators
-        # - it removes finished iterators from iters[]
-        # - if a previously detected minion does not respond, its
-        #   added with an empty answer to ret{} once the timeout is reached
-        # - unresponsive minions are removed from active[] to make
-        #   sure that the main while loop finishes even with unresp minions
-        minion_tracker = {}
-
-        # Iterate while we still have things to execute
-        while len(ret) < len(self.minions):
-            next_ = []
-            if len(to_run) <= bnum and not active:
-                # last bit of them, add them all to next iterator
-                while to_run:
-                    next_.append(to_run.pop())
-            else:
-                for i in range(bnum - len(active)):
-                    if to_run:
-                        next_.append(to_run.pop())
-
-            active += next_
-            args[0] = next_
+        # minion -> [jid, time the return is due]
+        active = {}
+        event = self.local.event
+        event.subscribe('')
 
+        while to_run or active:
+            next_ = []
+            while to_run and len(active) + len(next_) < bnum:
+                next_.append(to_run.pop())
             if next_:
                 if not self.quiet:
                     print('\nExecuting run on {0}\n'.format(next_))
-                # create a new iterator for this batch of minions
-                new_iter = self.local.cmd_iter_no_block(
-                                *args,
-                                raw=self.opts.get('raw', False))
-                # add it to our iterators and to the minion_tracker
-                iters.append(new_iter)
-                minion_tracker[new_iter] = {}
-                # every iterator added is 'active' and has its set of minions
-                minion_tracker[new_iter]['minions'] = next_
-                minion_tracker[new_iter]['active'] = True
-
-            else:
-                time.sleep(0.02)
-            parts = {}
-
-            for queue in iters:
-                try:
-                    # Gather returns until we get to the bottom
-                    ncnt = 0
-                    while True:
-                        part = next(queue)
-                        if part is None:
-                            time.sleep(0.01)
-                            ncnt += 1
-                            if ncnt > 5:
-                                break
-                            continue
-                        if self.opts.get('raw'):
-                            parts.update({part['id']: part})
-                        else:
-                            parts.update(part)
-                except StopIteration:
-                    # if a iterator is done:
-                    # - set it to inactive
-                    # - add minions that have not responded to parts{}
-
-                    # check if the tracker contains the iterator
-                    if queue in minion_tracker:
-                        minion_tracker[queue]['active'] = False
-
-                        # add all minions that belong to this iterator and
-                        # that have not responded to parts{} with an empty response
-                        for minion in minion_tracker[queue]['minions']:
-                            if minion not in parts.keys():
-                                parts[minion] = {}
-                                parts[minion]['ret'] = {}
-
-            for minion, data in parts.items():
-                active.remove(minion)
+                pub_data = self.local.run_job(
+                        next_,
+                        self.opts['fun'],
+                        self.opts['arg'],
+                        'list',
+                        timeout=timeout)
+                if not pub_data:
+                    # The publish failed, the minions return nothing
+                    for minion in next_:
+                        part = {'id': minion, 'ret': {}}
+                        for ret in self._return(minion, part):
+                            yield ret
+                    continue
+                due = time.time() + timeout
+                for minion in next_:
+                    active[minion] = [pub_data['jid'], due]
+
+            wait = min(job[1] for job in active.values()) - time.time()
+            raw = None
+            if wait > 0:
+                raw = event.get_event(wait, full=True)
+            if raw is not None:
+                data = raw['data']
+                if not isinstance(data, dict):
+                    continue
+                minion = data.get('id')
+                if 'return' not in data \
+                        or active.get(minion, [None])[0] != data.get('jid'):
+                    continue
+                del active[minion]
                 if self.opts.get('raw'):
-                    yield data
+                    part = data
                 else:
-                    ret[minion] = data['ret']
-                    yield {minion: data['ret']}
-                if not self.quiet:
-                    ret[minion] = data['ret']
-                    data[minion] = data.pop('ret')
+                    part = {'ret': data['return']}
                     if 'out' in data:
-                        out = data.pop('out')
-                    else:
-                        out = None
-                    salt.output.display_output(
-                            data,
-                            out,
-                            self.opts)
-
-            # remove inactive iterators from the iters list
-            for queue in minion_tracker.keys():
-                # only remove inactive queues
-                if not minion_tracker[queue]['active'] and queue in iters:
-                    iters.remove(queue)
-                    # also remove the iterator's minions from the active list
-                    for minion in minion_tracker[queue]['minions']:
-                        if minion in active:
-                            active.remove(minion)
+                        part['out'] = data['out']
+                for ret in self._return(minion, part):
+                    yield ret
+                continue
+
+            # The returns of some minions are overdue, check if the job is
+            # still running on them
+            now = time.time()
+            overdue = {}
+            for minion, job in active.items():
+                if job[1] <= now:
+                    overdue.setdefault(job[0], set()).add(minion)
+            for jid, minions in overdue.items():
+                jinfo = self.local.gather_job_info(
+                        jid, list(minions), 'list', set(minions)) or {}
+                for minion in minions:
+                    if minion not in active:
+                        continue
+                    if jinfo.get(minion):
+                        active[minion][1] = time.time() + timeout
+                        continue
+                    del active[minion]
+                    part = {'id': minion, 'ret': {}}
+                    for ret in self._return(minion, part):
+                        yield ret
+
+    def _return(self, minion, data):
+        '''
+        Display the return of a minion and yield it
+        '''
+        if self.opts.get('raw'):
+            yield data
+        else:
+            yield {minion: data['ret']}
+        if not self.quiet:
+            ret = data.get('return') if self.opts.get('raw') else data['ret']
+            salt.output.display_output(
+                    {minion: ret},
+                    data.get('out'),
+                    self.opts)
@@ -13,6 +13,9 @@ import shutil
 import copy
 import time
 import multiprocessing
+import threading
+import Queue
+import pipes
 import re
 import logging
 import yaml
@@ -40,15 +43,16 @@ RSTR = '_edbc7885e4f9aac9b83b35999b68d015148caf467b78fa39c05f669c0ff89878'
 # - Explicitly invokes Bourne shell for universal compatibility
 #
 # 1. Identify a suitable python
-# 2. Test for remote salt-call and version if present
-# 3. Signal to (re)deploy if missing or out of date
+# 2. Unpack a thin or thin delta tarball which was sent
+# 3. Signal to (re)deploy if salt-call is missing or the thin is out of date,
+#    together with the id of the thin which is held
 #    - If this is a a first deploy, then test python version
 # 4. Perform salt-call
 
 # Note there are two levels of formatting.
-# - First format pass inserts salt version and delimiter
+# - First format pass inserts the delimiter
 # - Second pass at run-time and inserts optional "sudo" and command
-SSH_SHIM = '''/bin/sh << 'EOF'
+SHIM_BODY = '''
       for py_candidate in \\
             python27      \\
             python2.7     \\
@@ -87,39 +91,55 @@ SSH_SHIM = '''/bin/sh << 'EOF'
          CUT_MARK=1
       fi
 
-      if [ -f $SALT ]
+      if [ -f /tmp/.salt/salt-thin.tgz ]
       then
-         if [ $(cat /tmp/.salt/version) != {0} ]
+         if [ "$($SUMCHECK /tmp/.salt/salt-thin.tgz | cut -f$CUT_MARK -d' ')" = {{3}} ]
          then
-            {{0}} rm -rf /tmp/.salt && install -m 0700 -d /tmp/.salt
-            if [ $? -ne 0 ]; then
-                exit 1
+            {{0}} tar opxzf /tmp/.salt/salt-thin.tgz -C /tmp/.salt
+            if [ -f /tmp/.salt/thin.deleted ]
+            then
+               (cd /tmp/.salt && {{0}} xargs rm -f < thin.deleted)
+               {{0}} rm -f /tmp/.salt/thin.deleted
             fi
-            echo "{1}"
-            echo "deploy"
-            exit 1
          fi
-      else
+         {{0}} rm -f /tmp/.salt/salt-thin.tgz
+      fi
+      if [ ! -f $SALT ]
+      then
          PY_TOO_OLD=$($PYTHON -c 'import sys; print sys.hexversion < 0x02060000')
          if [ $PY_TOO_OLD = 'True' ];
          then
             echo "Python too old" >&2
             exit 1
          fi
-         if [ -f /tmp/.salt/salt-thin.tgz ]
-         then
-             [ $($SUMCHECK /tmp/.salt/salt-thin.tgz | cut -f$CUT_MARK -d' ') = {{3}} ] && {{0}} tar opxzvf /tmp/.salt/salt-thin.tgz -C /tmp/.salt
-         else
-             install -m 0700 -d /tmp/.salt
-             echo "{1}"
-             echo "deploy"
-             exit 1
-         fi
+      fi
+      if [ ! -f $SALT ] || [ "$(cat /tmp/.salt/thin_id 2>/dev/null)" != {{5}} ]
+      then
+         install -m 0700 -d /tmp/.salt
+         echo "{0}"
+         echo "deploy $(cat /tmp/.salt/thin_id 2>/dev/null)"
+         exit 1
       fi
       echo '{{4}}' > /tmp/.salt/minion
-      echo "{1}"
+      echo "{0}"
       {{0}} $PYTHON $SALT --local --out json -l quiet {{1}} -c /tmp/.salt
-EOF'''.format(salt.__version__, RSTR)
+'''.format(RSTR)
+
+# The shim is fed to the remote Bourne shell on stdin
+SSH_SHIM = '''/bin/sh << 'EOF'{0}EOF'''.format(SHIM_BODY)
+
+# When the thin has to be deployed it is sent on stdin instead, together with
+# the command, the shim is then passed to the Bourne shell as an argument.
+# The first field clears out an unknown thin before a full one is sent.
+DEPLOY_CMD = ('{0}install -m 0700 -d /tmp/.salt && '
+              'cat > /tmp/.salt/salt-thin.tgz && /bin/sh -c {1}')
+
+# Content addressed state bundles are kept here on the targets
+STATE_DIR = '/tmp/.salt/state'
+
+# Clear out the files of a thin which is replaced, the state bundles are kept
+CLEAN_CMD = ('for fn_ in /tmp/.salt/*; do '
+             '[ "$fn_" = {0} ] || {{0}} rm -rf "$fn_"; done; ').format(STATE_DIR)
 
 log = logging.getLogger(__name__)
 
@@ -270,16 +290,23 @@ class SSH(object):
         Run the routine in a "Thread", put a dict on the queue
         '''
         opts = copy.deepcopy(opts)
-        single = Single(
-                opts,
-                opts['arg_str'],
-                host,
-                **target)
-        ret = {'id': single.id}
-        stdout, stderr, retcode = single.run()
-        if stdout.startswith('deploy'):
-            single.deploy()
+        ret = {'id': host}
+        try:
+            single = Single(
+                    opts,
+                    opts['arg_str'],
+                    host,
+                    **target)
             stdout, stderr, retcode = single.run()
+            if stdout.startswith('deploy'):
+                single.deploy()
+                stdout, stderr, retcode = single.run()
+        except Exception as exc:
+            log.error(
+                'Exception {0} occurred running on {1}'.format(exc, host),
+                exc_info=True
+            )
+            stdout, stderr, retcode = '', str(exc), None
         # This job is done, yield
         try:
             data = salt.utils.find_json(stdout)
@@ -299,24 +326,44 @@ class SSH(object):
             }
         que.put(ret)
 
+    def _threaded(self):
+        '''
+        Return True if the routines can run in threads. Wrapper functions
+        compile data on the master through the loader, whose modules are
+        shared by all threads, so those still get a process per target.
+        '''
+        if self.opts.get('raw_shell'):
+            return True
+        fun = self.opts.get('arg_str', '').split()[:1]
+        if not fun:
+            return True
+        return fun[0] not in salt.loader.ssh_wrapper(self.opts)
+
     def handle_ssh(self):
         '''
         Spin up the needed threads or processes and execute the subsequent
         routines
         '''
-        que = multiprocessing.Queue()
+        if self._threaded():
+            que = Queue.Queue()
+            worker = threading.Thread
+        else:
+            que = multiprocessing.Queue()
+            worker = multiprocessing.Process
+        if not self.opts.get('raw_shell'):
+            # Build the thin tarball once, before the routines deploy it
+            salt.utils.thin.gen_thin(self.opts['cachedir'])
+        max_procs = self.opts.get('ssh_max_procs', 25)
         running = {}
-        target_iter = self.targets.__iter__()
-        returned = set()
-        rets = set()
-        init = False
+        target_iter = iter(self.targets)
+        exhausted = False
         while True:
-            if len(running) < self.opts.get('ssh_max_procs', 25) and not init:
+            while not exhausted and len(running) < max_procs:
                 try:
                     host = next(target_iter)
                 except StopIteration:
-                    init = True
-                    continue
+                    exhausted = True
+                    break
                 for default in self.defaults:
                     if not default in self.targets[host]:
                         self.targets[host][default] = self.defaults[default]
@@ -326,33 +373,40 @@ class SSH(object):
                         host,
                         self.targets[host],
                         )
-                routine = multiprocessing.Process(
-                                target=self.handle_routine,
-                                args=args)
+                routine = worker(target=self.handle_routine, args=args)
+                routine.daemon = True
                 routine.start()
-                running[host] = {'thread': routine}
-                continue
-            ret = {}
+                running[host] = routine
+            if not running:
+                break
             try:
-                ret = que.get(False)
-                if 'id' in ret:
-                    returned.add(ret['id'])
-            except Exception:
-                pass
-            for host in running:
-                if host in returned:
-                    if not running[host]['thread'].is_alive():
-                        running[host]['thread'].join()
-                        rets.add(host)
-            for host in rets:
-                if host in running:
-                    running.pop(host)
-            if ret:
-                if not isinstance(ret, dict):
+                rets = [que.get(True, 1)]
+            except Queue.Empty:
+                rets = []
+            dead = []
+            if not rets:
+                dead = [host for host, routine in running.items()
+                        if not routine.is_alive()]
+                # A routine may have put its return and exited since the
+                # queue was found empty, take its return before telling it
+                # is gone without one
+                while True:
+                    try:
+                        rets.append(que.get_nowait())
+                    except Queue.Empty:
+                        break
+            for ret in rets:
+                routine = running.pop(ret['id'], None)
+                if routine is None:
                     continue
+                routine.join()
                 yield {ret['id']: ret['ret']}
-            if len(rets) >= len(self.targets):
-                break
+            for host in dead:
+                routine = running.pop(host, None)
+                if routine is None:
+                    continue
+                routine.join()
+                yield {host: 'Target routine exited without a return'}
 
     def run_iter(self):
         '''
@@ -490,11 +544,29 @@ class Single(object):
         Deploy salt-thin
         '''
         thin = salt.utils.thin.gen_thin(self.opts['cachedir'])
+        sudo = 'sudo' if self.target['sudo'] else ''
+        self.shell.exec_cmd(pipes.quote(
+                CLEAN_CMD.format(sudo) + 'install -m 0700 -d /tmp/.salt'))
         self.shell.send(
                 thin,
                 '/tmp/.salt/salt-thin.tgz')
         return True
 
+    def send_bundle(self, bundle):
+        '''
+        Send a content addressed bundle to the target, unless the target
+        already holds it. Bundles which were not used for a day are removed
+        from the target. Returns the path of the bundle on the target.
+        '''
+        remote = '{0}/{1}'.format(STATE_DIR, os.path.basename(bundle))
+        cmd = ('install -m 0700 -d {0} && '
+               'find {0} -name \'*.tgz\' -mtime +1 -exec rm -f {{}} \\; ; '
+               'test -f {1} && touch {1}').format(STATE_DIR, remote)
+        stdout, stderr, retcode = self.shell.exec_cmd(pipes.quote(cmd))
+        if retcode != 0:
+            self.shell.send(bundle, remote)
+        return remote
+
     def run(self, deploy_attempted=False):
         '''
         Execute the routine, the routine can be either:
@@ -609,12 +681,14 @@ class Single(object):
         thin_sum = salt.utils.thin.thin_sum(
                 self.opts['cachedir'],
                 self.opts['hash_type'])
+        thin_id = salt.utils.thin.thin_id(self.opts['cachedir'])
         cmd = SSH_SHIM.format(
                 sudo,
                 self.arg_str,
                 self.opts['hash_type'],
                 thin_sum,
-                self.minion_config)
+                self.minion_config,
+                thin_id)
         for stdout, stderr, retcode in self.shell.exec_nb_cmd(cmd):
             yield stdout, stderr, retcode
 
@@ -636,12 +710,14 @@ class Single(object):
         thin_sum = salt.utils.thin.thin_sum(
                 self.opts['cachedir'],
                 self.opts['hash_type'])
+        thin_id = salt.utils.thin.thin_id(self.opts['cachedir'])
         cmd = SSH_SHIM.format(
                 sudo,
                 self.arg_str,
                 self.opts['hash_type'],
                 thin_sum,
-                self.minion_config)
+                self.minion_config,
+                thin_id)
         log.debug('Performing shimmed command as follows:\n{0}'.format(cmd))
         stdout, stderr, retcode = self.shell.exec_cmd(cmd)
 
@@ -656,13 +732,48 @@ class Single(object):
         if RSTR in stdout:
             stdout = stdout.split(RSTR)[1].strip()
         if stdout.startswith('deploy'):
-            self.deploy()
-            stdout, stderr, retcode = self.shell.exec_cmd(cmd)
+            # The target reports the id of the thin it holds, when the thin
+            # is known only the files which changed are sent
+            held = stdout.splitlines()[0].split()[1:]
+            bundle = salt.utils.thin.thin_delta(
+                    self.opts['cachedir'],
+                    held[0] if held else None)
+            clean = ''
+            if bundle is None:
+                bundle = salt.utils.thin.gen_thin(self.opts['cachedir'])
+                clean = CLEAN_CMD.format(sudo)
+            shim = SHIM_BODY.format(
+                    sudo,
+                    self.arg_str,
+                    self.opts['hash_type'],
+                    salt.utils.thin.bundle_sum(
+                        bundle,
+                        self.opts['hash_type']),
+                    self.minion_config,
+                    thin_id)
+            stdout, stderr, retcode = self.deploy_cmd(shim, bundle, clean)
             if RSTR in stdout:
                 stdout = stdout.split(RSTR)[1].strip()
+            else:
+                # The remote shell could not run the combined command
+                stdout = 'deploy'
+            if stdout.startswith('deploy'):
+                self.deploy()
+                stdout, stderr, retcode = self.shell.exec_cmd(cmd)
+                if RSTR in stdout:
+                    stdout = stdout.split(RSTR)[1].strip()
 
         return stdout, stderr, retcode
 
+    def deploy_cmd(self, shim, bundle, clean=''):
+        '''
+        Deploy the salt-thin or thin delta bundle and run the shim in the same
+        ssh session
+        '''
+        cmd = pipes.quote(DEPLOY_CMD.format(clean, pipes.quote(shim)))
+        with salt.utils.fopen(bundle, 'rb') as fp_:
+            return self.shell.exec_cmd(cmd, stdin=fp_)
+
     def categorize_shim_errors(self, stdout, stderr, retcode):
         # Unused stdout and retcode for now but these may be used to
         # categorize errors
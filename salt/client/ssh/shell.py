@@ -6,7 +6,11 @@ Manage transport commands via ssh
 # Import python libs
 import os
 import time
+import hashlib
+import socket
 import logging
+import tempfile
+import threading
 import subprocess
 
 # Import salt libs
@@ -15,6 +19,10 @@ import salt.utils.nb_popen
 
 log = logging.getLogger(__name__)
 
+# control path -> lock held while the master connection is started
+_MASTER_LOCKS = {}
+_MASTER_LOCKS_LOCK = threading.Lock()
+
 
 def gen_key(path):
     '''
@@ -50,6 +58,7 @@ class Shell(object):
         self.timeout = timeout
         self.sudo = sudo
         self.tty = tty
+        self.control_path = self._control_path()
 
     def get_error(self, errstr):
         '''
@@ -65,6 +74,90 @@ class Shell(object):
             return line
         return errstr
 
+    def _control_path(self):
+        '''
+        Return the path to the socket of the shared master connection to the
+        host, or None if connections are not multiplexed
+        '''
+        if not self.opts.get('ssh_control_persist'):
+            return None
+        sock_dir = os.path.join(
+            self.opts.get('sock_dir', tempfile.gettempdir()), 'ssh'
+        )
+        if not os.path.isdir(sock_dir):
+            try:
+                os.makedirs(sock_dir, 0700)
+            except OSError:
+                return None
+        # Unix socket paths are short, hash the destination
+        name = hashlib.md5(
+            '{0}@{1}:{2}'.format(self.user, self.host, self.port)
+        ).hexdigest()[:16]
+        return os.path.join(sock_dir, name)
+
+    def _control_opts(self):
+        '''
+        Return the options to run over the shared master connection
+        '''
+        if not self.control_path:
+            return ''
+        return '-o ControlMaster=no -o ControlPath={0} '.format(
+            self.control_path
+        )
+
+    def _master(self):
+        '''
+        Start the master connection to the host in the background unless it
+        is already running. It is kept open for ssh_control_persist seconds
+        after the last command, later commands and copies to the host skip
+        the ssh handshake.
+        '''
+        if not self.control_path or self._master_alive():
+            return
+        with _MASTER_LOCKS_LOCK:
+            lock = _MASTER_LOCKS.setdefault(self.control_path,
+                                            threading.Lock())
+        with lock:
+            if self._master_alive():
+                return
+            cmd = self._cmd_str(
+                '-N -f -o ControlMaster=yes -o ControlPath={0} '
+                '-o ControlPersist={1}'.format(
+                    self.control_path, self.opts['ssh_control_persist']
+                ),
+                control=False
+            )
+            if cmd is None:
+                return
+            # The backgrounded master must not hold on to our pipes, if it
+            # cannot be started the commands connect on their own
+            with open(os.devnull, 'w') as devnull:
+                try:
+                    subprocess.call(cmd, shell=True, stdin=devnull,
+                                    stdout=devnull, stderr=devnull)
+                except OSError:
+                    pass
+
+    def _master_alive(self):
+        '''
+        Return True if the master connection accepts commands, the socket of
+        a master which went away is removed
+        '''
+        if not os.path.exists(self.control_path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.control_path)
+        except socket.error:
+            try:
+                os.remove(self.control_path)
+            except OSError:
+                pass
+            return False
+        finally:
+            sock.close()
+        return True
+
     def _key_opts(self):
         '''
         Return options for the ssh command base for Salt to call
@@ -93,11 +186,7 @@ class Shell(object):
         '''
         Return options to pass to sshpass
         '''
-        # TODO ControlMaster does not work without ControlPath
-        # user could take advantage of it if they set ControlPath in their
-        # ssh config.  Also, ControlPersist not widely available.
-        options = ['ControlMaster=auto',
-                   'StrictHostKeyChecking=no',
+        options = ['StrictHostKeyChecking=no',
                    'GSSAPIAuthentication=no',
                    ]
         options.append('ConnectTimeout={0}'.format(self.timeout))
@@ -166,7 +255,7 @@ class Shell(object):
         if stderr.startswith('Usage'):
             self._run_cmd(self._copy_id_str_new())
 
-    def _cmd_str(self, cmd, ssh='ssh'):
+    def _cmd_str(self, cmd, ssh='ssh', control=True):
         '''
         Return the cmd string to execute
         '''
@@ -176,6 +265,8 @@ class Shell(object):
 
         if self.passwd and salt.utils.which('sshpass'):
             opts = self._passwd_opts()
+            if control:
+                opts += self._control_opts()
             # Using single quotes prevents shell expansion and
             # passwords containig '$'
             return "sshpass -p '{0}' {1} {2} {3} {4} {5}".format(
@@ -187,6 +278,8 @@ class Shell(object):
                     cmd)
         if self.priv:
             opts = self._key_opts()
+            if control:
+                opts += self._control_opts()
             return "{0} {1} {2} {3} {4}".format(
                     ssh,
                     '' if ssh == 'scp' else self.host,
@@ -195,14 +288,16 @@ class Shell(object):
                     cmd)
         return None
 
-    def _run_cmd(self, cmd):
+    def _run_cmd(self, cmd, stdin=None):
         '''
-        Cleanly execute the command string
+        Cleanly execute the command string, stdin is an optional file object
+        to read the input of the command from
         '''
         try:
             proc = subprocess.Popen(
                 cmd,
                 shell=True,
+                stdin=stdin,
                 stderr=subprocess.PIPE,
                 stdout=subprocess.PIPE,
             )
@@ -243,6 +338,7 @@ class Shell(object):
         r_out = []
         r_err = []
         rcode = None
+        self._master()
         cmd = self._cmd_str(cmd)
 
         logmsg = 'Executing non-blocking command: {0}'.format(cmd)
@@ -258,10 +354,12 @@ class Shell(object):
             yield None, None, None
         yield ''.join(r_out), ''.join(r_err), rcode
 
-    def exec_cmd(self, cmd):
+    def exec_cmd(self, cmd, stdin=None):
         '''
-        Execute a remote command
+        Execute a remote command, the input of the remote command is read
+        from the optional stdin file object
         '''
+        self._master()
         cmd = self._cmd_str(cmd)
 
         logmsg = 'Executing command: {0}'.format(cmd)
@@ -269,13 +367,14 @@ class Shell(object):
             logmsg = logmsg.replace(self.passwd, ('*' * len(self.passwd))[:6])
         log.debug(logmsg)
 
-        ret = self._run_cmd(cmd)
+        ret = self._run_cmd(cmd, stdin)
         return ret
 
     def send(self, local, remote):
         '''
         scp a file or files to a remote system
         '''
+        self._master()
         cmd = '{0} {1}:{2}'.format(local, self.host, remote)
         cmd = self._cmd_str(cmd, ssh='scp')
 
@@ -4,10 +4,12 @@ Create ssh executor system
 '''
 # Import python libs
 import os
+import time
+import json
+import hashlib
 import tarfile
 import tempfile
-import json
-import shutil
+import StringIO
 from contextlib import closing
 
 # Import salt libs
@@ -114,11 +116,12 @@ def prep_trans_tar(opts, chunks, file_refs):
     '''
     Generate the execution package from the saltenv file refs and a low state
     data structure
+
+    The package is named by the hash of its contents and kept in the
+    cachedir, a run which sends the same package to many targets only builds
+    it once.
     '''
-    gendir = tempfile.mkdtemp()
-    trans_tar = salt.utils.mkstemp()
     file_client = salt.fileclient.LocalClient(opts)
-    lowfn = os.path.join(gendir, 'lowstate.json')
     sync_refs = [
             ['salt://_modules'],
             ['salt://_states'],
@@ -127,44 +130,96 @@ def prep_trans_tar(opts, chunks, file_refs):
             ['salt://_returners'],
             ['salt://_outputters'],
             ]
-    with open(lowfn, 'w+') as fp_:
-        fp_.write(json.dumps(chunks))
+    lowstate = json.dumps(chunks, sort_keys=True)
+    # arcname -> path of the cached file
+    members = {}
     for saltenv in file_refs:
         file_refs[saltenv].extend(sync_refs)
-        env_root = os.path.join(gendir, saltenv)
-        if not os.path.isdir(env_root):
-            os.makedirs(env_root)
         for ref in file_refs[saltenv]:
             for name in ref:
                 short = name[7:]
                 path = file_client.cache_file(name, saltenv)
                 if path:
-                    tgt = os.path.join(env_root, short)
-                    tgt_dir = os.path.dirname(tgt)
-                    if not os.path.isdir(tgt_dir):
-                        os.makedirs(tgt_dir)
-                    shutil.copy(path, tgt)
+                    members[os.path.join(saltenv, short)] = path
                     break
                 files = file_client.cache_dir(name, saltenv)
                 if files:
                     for filename in files:
                         tgt = os.path.join(
-                                env_root,
+                                saltenv,
                                 short,
                                 filename[filename.find(short) + len(short) + 1:],
                                 )
-                        tgt_dir = os.path.dirname(tgt)
-                        if not os.path.isdir(tgt_dir):
-                            os.makedirs(tgt_dir)
-                        shutil.copy(filename, tgt)
+                        members[tgt] = filename
                     break
-    cwd = os.getcwd()
-    os.chdir(gendir)
-    with closing(tarfile.open(trans_tar, 'w:gz')) as tfp:
-        for root, dirs, files in os.walk(gendir):
-            for name in files:
-                full = os.path.join(root, name)
-                tfp.add(full[len(gendir):].lstrip(os.sep))
-    os.chdir(cwd)
-    shutil.rmtree(gendir)
+    hsum = hashlib.sha1(lowstate)
+    for saltenv in sorted(file_refs):
+        hsum.update('{0}\0'.format(saltenv))
+    for arcname in sorted(members):
+        hsum.update('{0}\0{1}\n'.format(
+            arcname,
+            salt.utils.get_hash(members[arcname], 'sha1')))
+    bundle_dir = os.path.join(opts['cachedir'], 'ssh', 'bundles')
+    trans_tar = os.path.join(bundle_dir, '{0}.tgz'.format(hsum.hexdigest()))
+    if os.path.isfile(trans_tar):
+        os.utime(trans_tar, None)
+        return trans_tar
+    if not os.path.isdir(bundle_dir):
+        try:
+            os.makedirs(bundle_dir)
+        except OSError:
+            # Made by another run
+            pass
+    _reap_bundles(bundle_dir)
+    fd_, tarpath = tempfile.mkstemp(dir=bundle_dir)
+    try:
+        with closing(os.fdopen(fd_, 'w+b')) as tfo:
+            with closing(tarfile.open(fileobj=tfo, mode='w')) as tfp:
+                info = _tar_info('lowstate.json')
+                info.size = len(lowstate)
+                tfp.addfile(info, StringIO.StringIO(lowstate))
+                # Every saltenv gets a directory, even without files
+                for saltenv in sorted(file_refs):
+                    info = _tar_info(saltenv)
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0755
+                    tfp.addfile(info)
+                for arcname in sorted(members):
+                    info = _tar_info(arcname)
+                    info.size = os.path.getsize(members[arcname])
+                    if os.access(members[arcname], os.X_OK):
+                        info.mode = 0755
+                    with salt.utils.fopen(members[arcname], 'rb') as fp_:
+                        tfp.addfile(info, fp_)
+        salt.utils.thin.gzip_tar(tarpath, trans_tar)
+    finally:
+        os.remove(tarpath)
     return trans_tar
+
+
+def _tar_info(arcname):
+    '''
+    Return the header of a package member. Nothing but the name, size and
+    the executable bit is taken from the files, so packages of the same
+    contents are the same bytes and match the name they are stored by.
+    '''
+    info = tarfile.TarInfo(arcname)
+    info.mode = 0644
+    info.mtime = 0
+    info.uid = info.gid = 0
+    info.uname = info.gname = 'root'
+    return info
+
+
+def _reap_bundles(bundle_dir, max_age=86400):
+    '''
+    Remove the packages which were not used for a day
+    '''
+    now = time.time()
+    for fn_ in os.listdir(bundle_dir):
+        path = os.path.join(bundle_dir, fn_)
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            pass
@@ -8,6 +8,7 @@ import copy
 import json
 
 # Import salt libs
+import salt.client.ssh
 import salt.client.ssh.shell
 import salt.client.ssh.state
 import salt.utils
@@ -62,8 +63,10 @@ def sls(mods, saltenv='base', test=None, exclude=None, env=None, **kwargs):
             __opts__,
             chunks,
             file_refs)
-    trans_tar_sum = salt.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
+    trans_tar_sum = salt.utils.thin.bundle_sum(trans_tar, __opts__['hash_type'])
+    cmd = 'state.pkg {0}/{1} test={2} pkg_sum={3} hash_type={4}'.format(
+            salt.client.ssh.STATE_DIR,
+            os.path.basename(trans_tar),
             test,
             trans_tar_sum,
             __opts__['hash_type'])
@@ -71,9 +74,7 @@ def sls(mods, saltenv='base', test=None, exclude=None, env=None, **kwargs):
             __opts__,
             cmd,
             **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
+    single.send_bundle(trans_tar)
     stdout, stderr, _ = single.cmd_block()
     return json.loads(stdout, object_hook=salt.utils.decode_dict)
 
@@ -100,17 +101,17 @@ def low(data):
             __opts__,
             chunks,
             file_refs)
-    trans_tar_sum = salt.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz pkg_sum={0} hash_type={1}'.format(
+    trans_tar_sum = salt.utils.thin.bundle_sum(trans_tar, __opts__['hash_type'])
+    cmd = 'state.pkg {0}/{1} pkg_sum={2} hash_type={3}'.format(
+            salt.client.ssh.STATE_DIR,
+            os.path.basename(trans_tar),
             trans_tar_sum,
             __opts__['hash_type'])
     single = salt.client.ssh.Single(
             __opts__,
             cmd,
             **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
+    single.send_bundle(trans_tar)
     stdout, stderr, _ = single.cmd_block()
     return json.loads(stdout, object_hook=salt.utils.decode_dict)
 
@@ -134,17 +135,17 @@ def high(data):
             __opts__,
             chunks,
             file_refs)
-    trans_tar_sum = salt.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz pkg_sum={0} hash_type={1}'.format(
+    trans_tar_sum = salt.utils.thin.bundle_sum(trans_tar, __opts__['hash_type'])
+    cmd = 'state.pkg {0}/{1} pkg_sum={2} hash_type={3}'.format(
+            salt.client.ssh.STATE_DIR,
+            os.path.basename(trans_tar),
             trans_tar_sum,
             __opts__['hash_type'])
     single = salt.client.ssh.Single(
             __opts__,
             cmd,
             **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
+    single.send_bundle(trans_tar)
     stdout, stderr, _ = single.cmd_block()
     return json.loads(stdout, object_hook=salt.utils.decode_dict)
 
@@ -170,8 +171,10 @@ def highstate(test=None, **kwargs):
             __opts__,
             chunks,
             file_refs)
-    trans_tar_sum = salt.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
+    trans_tar_sum = salt.utils.thin.bundle_sum(trans_tar, __opts__['hash_type'])
+    cmd = 'state.pkg {0}/{1} test={2} pkg_sum={3} hash_type={4}'.format(
+            salt.client.ssh.STATE_DIR,
+            os.path.basename(trans_tar),
             test,
             trans_tar_sum,
             __opts__['hash_type'])
@@ -179,9 +182,7 @@ def highstate(test=None, **kwargs):
             __opts__,
             cmd,
             **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
+    single.send_bundle(trans_tar)
     stdout, stderr, _ = single.cmd_block()
     return json.loads(stdout, object_hook=salt.utils.decode_dict)
 
@@ -211,8 +212,10 @@ def top(topfn, test=None, **kwargs):
             __opts__,
             chunks,
             file_refs)
-    trans_tar_sum = salt.utils.get_hash(trans_tar, __opts__['hash_type'])
-    cmd = 'state.pkg /tmp/.salt/salt_state.tgz test={0} pkg_sum={1} hash_type={2}'.format(
+    trans_tar_sum = salt.utils.thin.bundle_sum(trans_tar, __opts__['hash_type'])
+    cmd = 'state.pkg {0}/{1} test={2} pkg_sum={3} hash_type={4}'.format(
+            salt.client.ssh.STATE_DIR,
+            os.path.basename(trans_tar),
             test,
             trans_tar_sum,
             __opts__['hash_type'])
@@ -220,9 +223,7 @@ def top(topfn, test=None, **kwargs):
             __opts__,
             cmd,
             **__salt__.kwargs)
-    single.shell.send(
-            trans_tar,
-            '/tmp/.salt/salt_state.tgz')
+    single.send_bundle(trans_tar)
     stdout, stderr, _ = single.cmd_block()
     return json.loads(stdout, object_hook=salt.utils.decode_dict)
 
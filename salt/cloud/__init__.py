@@ -13,6 +13,7 @@ import time
 import signal
 import logging
 import multiprocessing
+import Queue
 from itertools import groupby
 
 # Import salt.cloud libs
@@ -1605,6 +1606,8 @@ class Map(Cloud):
                 # explicitely saying it's the local one
                 local_master = True
 
+            salt.utils.cloud.reset_phases()
+            start = time.time()
             out = self.create(master_profile, local_master=local_master)
 
             if not isinstance(out, dict):
@@ -1637,6 +1640,10 @@ class Map(Cloud):
                         master_name
                     )
                 )
+            if isinstance(out, dict):
+                out['phases'] = salt.utils.cloud.phase_times(
+                    time.time() - start
+                )
             output[master_name] = out
         except StopIteration:
             log.debug('No make_master found in map')
@@ -1688,11 +1695,17 @@ class Map(Cloud):
 
             # Not deploying in parallel
             try:
+                salt.utils.cloud.reset_phases()
+                start = time.time()
                 output[name] = self.create(
                     profile, local_master=local_master
                 )
                 if self.opts.get('show_deploy_args', False) is False:
                     output[name].pop('deploy_kwargs', None)
+                if isinstance(output[name], dict):
+                    output[name]['phases'] = salt.utils.cloud.phase_times(
+                        time.time() - start
+                    )
             except SaltCloudException as exc:
                 log.error(
                     'Failed to deploy {0!r}. Error: {1}'.format(
@@ -1712,9 +1725,8 @@ class Map(Cloud):
             else:
                 pool_size = len(parallel_data)
             log.info('Cloud pool size: {0}'.format(pool_size))
-            output_multip = multiprocessing.Pool(pool_size).map(
-                func=create_multiprocessing,
-                iterable=parallel_data
+            output_multip = self._create_parallel(
+                dmap, parallel_data, pool_size
             )
             # We have deployed in parallel, now do start action in
             # correct order based on dependencies.
@@ -1741,7 +1753,7 @@ class Map(Cloud):
                         timeout=self.opts['timeout'] * 60, expr_form='list'
                     ))
                 for obj in output_multip:
-                    obj.values()[0]['ret'] = out[obj.keys()[0]]
+                    obj.values()[0]['ret'] = out.get(obj.keys()[0])
                     output.update(obj)
             else:
                 for obj in output_multip:
@@ -1749,6 +1761,69 @@ class Map(Cloud):
 
         return output
 
+    def _create_parallel(self, dmap, parallel_data, pool_size):
+        '''
+        Create the VMs in a pool of processes, each one as soon as the VMs it
+        requires are up rather than a whole dependency level at a time. The
+        VMs which require a VM that failed are not created.
+        '''
+        pending = dict((data['name'], data) for data in parallel_data)
+        # The existing VMs and the ones created already (the master) are up
+        done = set(dmap.get('existing', ()))
+        done.update(name for name in dmap['create'] if name not in pending)
+        failed = set()
+        results = Queue.Queue()
+        running = 0
+        ret = []
+        pool = multiprocessing.Pool(pool_size)
+        try:
+            while pending or running:
+                blocked = True
+                while blocked:
+                    blocked = [
+                        name for name in pending
+                        if failed.intersection(
+                            dmap['create'][name].get('requires', ()))
+                    ]
+                    for name in blocked:
+                        log.error(
+                            'Not creating {0!r}, a VM it requires failed to '
+                            'be created'.format(name)
+                        )
+                        del pending[name]
+                        failed.add(name)
+                        ret.append({name: {
+                            'Error': 'A required VM failed to be created'
+                        }})
+                for name in sorted(pending):
+                    requires = dmap['create'][name].get('requires', ())
+                    if done.issuperset(requires):
+                        log.debug('Starting the creation of {0!r}'.format(
+                            name))
+                        pool.apply_async(
+                            _create_scheduled, (pending.pop(name),),
+                            callback=results.put
+                        )
+                        running += 1
+                if not running:
+                    break
+                try:
+                    # A timeout keeps the wait interruptible
+                    obj = results.get(True, 1)
+                except Queue.Empty:
+                    continue
+                running -= 1
+                ret.append(obj)
+                name, out = obj.items()[0]
+                if not isinstance(out, dict) or 'Error' in out:
+                    failed.add(name)
+                else:
+                    done.add(name)
+        finally:
+            pool.close()
+            pool.join()
+        return ret
+
 
 def init_pool_worker():
     '''
@@ -1765,6 +1840,8 @@ def create_multiprocessing(parallel_data):
     '''
     parallel_data['opts']['output'] = 'json'
     cloud = Cloud(parallel_data['opts'])
+    salt.utils.cloud.reset_phases()
+    start = time.time()
     try:
         output = cloud.create(
             parallel_data['profile'],
@@ -1782,12 +1859,30 @@ def create_multiprocessing(parallel_data):
 
     if parallel_data['opts'].get('show_deploy_args', False) is False:
         output.pop('deploy_kwargs', None)
+    output['phases'] = salt.utils.cloud.phase_times(time.time() - start)
 
     return {
         parallel_data['name']: salt.utils.cloud.simple_types_filter(output)
     }
 
 
+def _create_scheduled(parallel_data):
+    '''
+    Run create_multiprocessing, turning any error into the VM's return so
+    the scheduling process always hears back from it
+    '''
+    try:
+        return create_multiprocessing(parallel_data)
+    except Exception as exc:
+        log.error(
+            'Failed to deploy {0[name]!r}. Error: {1}'.format(
+                parallel_data, exc
+            ),
+            exc_info=log.isEnabledFor(logging.DEBUG)
+        )
+        return {parallel_data['name']: {'Error': str(exc)}}
+
+
 def destroy_multiprocessing(parallel_data):
     '''
     This function will be called from another process when running a map in
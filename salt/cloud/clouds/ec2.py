@@ -78,8 +78,11 @@ import hmac
 import hashlib
 import binascii
 import datetime
+import re
+import socket
 import urllib
-import urllib2
+import httplib
+import urlparse
 
 # Import salt libs
 from salt._compat import ElementTree as ET
@@ -87,6 +90,7 @@ from salt._compat import ElementTree as ET
 # Import salt.cloud libs
 import salt.utils.cloud
 import salt.config as config
+from salt import syspaths
 from salt.cloud.libcloudfuncs import *   # pylint: disable=W0614,W0401
 from salt.cloud.exceptions import (
     SaltCloudException,
@@ -130,6 +134,9 @@ DEFAULT_LOCATION = 'us-east-1'
 
 DEFAULT_EC2_API_VERSION = '2013-10-01'
 
+# Instance ids, as opposed to Name tags which may also start with i-
+INSTANCE_ID_RE = re.compile(r'^i-[0-9a-f]{8,17}$')
+
 if hasattr(Provider, 'EC2_AP_SOUTHEAST2'):
     EC2_LOCATIONS['ap-southeast-2'] = Provider.EC2_AP_SOUTHEAST2
 
@@ -275,100 +282,103 @@ def optimize_providers(providers):
     return optimized_providers
 
 
+def _retry_query(status, body):
+    '''
+    Tell if an EC2 error is one which goes away when the request is retried
+    '''
+    if status < 400:
+        return False
+    code = re.search(r'<Code>([^<]+)</Code>', body)
+    return code is not None and code.group(1) in EC2_RETRY_CODES
+
+
+def _idempotent_query(requesturl):
+    '''
+    Tell if an EC2 request can safely be sent more than once, the requests
+    which only describe resources and those with a client token
+    '''
+    params = urlparse.parse_qs(urlparse.urlparse(requesturl).query)
+    action = params.get('Action', [''])[0]
+    return action.startswith('Describe') or 'ClientToken' in params
+
+
 def query(params=None, setname=None, requesturl=None, location=None,
           return_url=False, return_root=False):
 
     provider = get_configured_provider()
     service_url = provider.get('service_url', 'amazonaws.com')
 
-    attempts = 5
-    while attempts > 0:
-        timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
-
-        if not location:
-            location = get_location()
+    timestamp = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
 
-        if not requesturl:
-            method = 'GET'
+    if not location:
+        location = get_location()
 
-            endpoint = provider.get(
-                'endpoint',
-                'ec2.{0}.{1}'.format(location, service_url)
-            )
+    if not requesturl:
+        method = 'GET'
 
-            ec2_api_version = provider.get(
-                'ec2_api_version',
-                DEFAULT_EC2_API_VERSION
-            )
+        endpoint = provider.get(
+            'endpoint',
+            'ec2.{0}.{1}'.format(location, service_url)
+        )
 
-            params['AWSAccessKeyId'] = provider['id']
-            params['SignatureVersion'] = '2'
-            params['SignatureMethod'] = 'HmacSHA256'
-            params['Timestamp'] = '{0}'.format(timestamp)
-            params['Version'] = ec2_api_version
-            keys = sorted(params.keys())
-            values = map(params.get, keys)
-            querystring = urllib.urlencode(list(zip(keys, values)))
+        ec2_api_version = provider.get(
+            'ec2_api_version',
+            DEFAULT_EC2_API_VERSION
+        )
 
-            uri = '{0}\n{1}\n/\n{2}'.format(method.encode('utf-8'),
-                                            endpoint.encode('utf-8'),
-                                            querystring.encode('utf-8'))
+        params['AWSAccessKeyId'] = provider['id']
+        params['SignatureVersion'] = '2'
+        params['SignatureMethod'] = 'HmacSHA256'
+        params['Timestamp'] = '{0}'.format(timestamp)
+        params['Version'] = ec2_api_version
+        keys = sorted(params.keys())
+        values = map(params.get, keys)
+        querystring = urllib.urlencode(list(zip(keys, values)))
 
-            hashed = hmac.new(provider['key'], uri, hashlib.sha256)
-            sig = binascii.b2a_base64(hashed.digest())
-            params['Signature'] = sig.strip()
+        uri = '{0}\n{1}\n/\n{2}'.format(method.encode('utf-8'),
+                                        endpoint.encode('utf-8'),
+                                        querystring.encode('utf-8'))
 
-            querystring = urllib.urlencode(params)
-            requesturl = 'https://{0}/?{1}'.format(endpoint, querystring)
+        hashed = hmac.new(provider['key'], uri, hashlib.sha256)
+        sig = binascii.b2a_base64(hashed.digest())
+        params['Signature'] = sig.strip()
 
-        log.debug('EC2 Request: {0}'.format(requesturl))
-        try:
-            result = urllib2.urlopen(requesturl)
-            log.debug(
-                'EC2 Response Status Code: {0}'.format(
-                    result.getcode()
-                )
-            )
-            break
-        except urllib2.URLError as exc:
-            root = ET.fromstring(exc.read())
-            data = _xml_to_dict(root)
-
-            # check to see if we should retry the query
-            err_code = data.get('Errors', {}).get('Error', {}).get('Code', '')
-            if attempts > 0 and err_code and err_code in EC2_RETRY_CODES:
-                attempts -= 1
-                log.error(
-                    'EC2 Response Status Code and Error: [{0} {1}] {2}; '
-                    'Attempts remaining: {3}'.format(
-                        exc.code, exc.msg, data, attempts
-                    )
-                )
-                # Wait a bit before continuing to prevent throttling
-                time.sleep(2)
-                continue
+        querystring = urllib.urlencode(params)
+        requesturl = 'https://{0}/?{1}'.format(endpoint, querystring)
 
-            log.error(
-                'EC2 Response Status Code and Error: [{0} {1}] {2}'.format(
-                    exc.code, exc.msg, data
-                )
-            )
-            if return_url is True:
-                return {'error': data}, requesturl
-            return {'error': data}
+    log.debug('EC2 Request: {0}'.format(requesturl))
+    try:
+        status, _, response = salt.utils.cloud.http_query(
+            requesturl,
+            key='{0}:{1}'.format(__active_provider_name__ or 'ec2', location),
+            rate=provider.get('api_rate'),
+            burst=provider.get('api_burst'),
+            retry=_retry_query,
+            idempotent=_idempotent_query(requesturl)
+        )
+    except (httplib.HTTPException, socket.error) as exc:
+        status = None
+        data = {'Errors': {'Error': {'Code': 'ConnectionError',
+                                     'Message': str(exc)}}}
     else:
+        log.debug('EC2 Response Status Code: {0}'.format(status))
+        if status >= 400:
+            try:
+                data = _xml_to_dict(ET.fromstring(response))
+            except SyntaxError:
+                data = {'Errors': {'Error': {'Code': str(status),
+                                             'Message': response}}}
+
+    if status is None or status >= 400:
         log.error(
-            'EC2 Response Status Code and Error: [{0} {1}] {2}'.format(
-                exc.code, exc.msg, data
+            'EC2 Response Status Code and Error: [{0}] {1}'.format(
+                status, data
             )
         )
         if return_url is True:
             return {'error': data}, requesturl
         return {'error': data}
 
-    response = result.read()
-    result.close()
-
     root = ET.fromstring(response)
     items = root[1]
     if return_root is True:
@@ -1068,6 +1078,9 @@ def create(vm_=None, call=None):
         # Normal instances should have no prefix.
         spot_prefix = ''
 
+    # The instance is launched once however many times the request is sent
+    params['ClientToken'] = uuid.uuid4().hex
+
     image_id = vm_['image']
     params[spot_prefix + 'ImageId'] = image_id
 
@@ -1861,9 +1874,7 @@ def get_tags(name=None, instance_id=None, call=None, location=None):
         if location is None:
             location = get_location()
 
-        instances = list_nodes_full(location)
-        if name in instances:
-            instance_id = instances[name]['instanceId']
+        instance_id = _get_node(name, location).get('instanceId')
 
     params = {'Action': 'DescribeTags',
               'Filter.1.Name': 'resource-id',
@@ -1917,6 +1928,7 @@ def rename(name, kwargs, call=None):
     log.info('Renaming {0} to {1}'.format(name, kwargs['newname']))
 
     set_tags(name, {'Name': kwargs['newname']}, call='action')
+    _node_cache(get_location()).remove(name)
 
     salt.utils.cloud.rename_key(
         __opts__['pki_dir'], name, kwargs['newname']
@@ -1983,6 +1995,7 @@ def destroy(name, call=None):
     result = query(params)
     log.info(result)
     ret.update(result[0])
+    _node_cache(get_location()).remove(name)
 
     # If this instance is part of a spot instance request, we
     # need to cancel it as well
@@ -2049,14 +2062,45 @@ def show_instance(name, call=None):
     return _get_node(name)
 
 
+def _node_cache(location):
+    '''
+    Return the node cache of the provider in the location
+    '''
+    provider = get_configured_provider()
+    fname = '{0}-{1}.json'.format(
+        (__active_provider_name__ or 'ec2').replace(':', '-'), location
+    )
+    return salt.utils.cloud.NodeCache(
+        os.path.join(
+            __opts__.get('cachedir', syspaths.CACHE_DIR),
+            'cloud', 'nodes', fname
+        ),
+        provider.get('node_cache_ttl', 30)
+    )
+
+
+def _node_filter(name):
+    '''
+    Return the DescribeInstances params which only list the named node, a
+    node without a Name tag is named after its instance id
+    '''
+    if INSTANCE_ID_RE.match(name):
+        return {'InstanceId.1': name}
+    return {'Filter.1.Name': 'tag:Name', 'Filter.1.Value.1': name}
+
+
 def _get_node(name, location=None):
     if location is None:
         location = get_location()
 
+    node = _node_cache(location).get(name)
+    if node is not None:
+        return node
+
     attempts = 10
     while attempts >= 0:
         try:
-            return list_nodes_full(location)[name]
+            return _list_nodes_full(location, _node_filter(name))[name]
         except KeyError:
             attempts -= 1
             log.debug(
@@ -2115,13 +2159,16 @@ def _extract_name_tag(item):
     return item['instanceId']
 
 
-def _list_nodes_full(location=None):
+def _list_nodes_full(location=None, filters=None):
     '''
-    Return a list of the VMs that in this location
+    Return a list of the VMs that in this location, or only those matching
+    the DescribeInstances filters
     '''
 
     ret = {}
     params = {'Action': 'DescribeInstances'}
+    if filters:
+        params.update(filters)
     instances = query(params, location=location)
     if 'error' in instances:
         raise SaltCloudSystemExit(
@@ -2132,22 +2179,10 @@ def _list_nodes_full(location=None):
 
     for instance in instances:
         # items could be type dict or list (for stopped EC2 instances)
-        if isinstance(instance['instancesSet']['item'], list):
-            for item in instance['instancesSet']['item']:
-                name = _extract_name_tag(item)
-                ret[name] = item
-                ret[name].update(
-                    dict(
-                        id=item['instanceId'],
-                        image=item['imageId'],
-                        size=item['instanceType'],
-                        state=item['instanceState']['name'],
-                        private_ips=item.get('privateIpAddress', []),
-                        public_ips=item.get('ipAddress', [])
-                    )
-                )
-        else:
-            item = instance['instancesSet']['item']
+        items = instance['instancesSet']['item']
+        if not isinstance(items, list):
+            items = [items]
+        for item in items:
             name = _extract_name_tag(item)
             ret[name] = item
             ret[name].update(
@@ -2160,6 +2195,7 @@ def _list_nodes_full(location=None):
                     public_ips=item.get('ipAddress', [])
                 )
             )
+    _node_cache(location).update(ret, complete=not filters)
     return ret
 
 
@@ -2211,8 +2247,7 @@ def show_term_protect(name=None, instance_id=None, call=None, quiet=False):
         )
 
     if not instance_id:
-        instances = list_nodes_full(get_location())
-        instance_id = instances[name]['instanceId']
+        instance_id = _get_node(name)['instanceId']
     params = {'Action': 'DescribeInstanceAttribute',
               'InstanceId': instance_id,
               'Attribute': 'disableApiTermination'}
@@ -2277,8 +2312,7 @@ def _toggle_term_protect(name, value):
 
         salt-cloud -a disable_term_protect mymachine
     '''
-    instances = list_nodes_full(get_location())
-    instance_id = instances[name]['instanceId']
+    instance_id = _get_node(name)['instanceId']
     params = {'Action': 'ModifyInstanceAttribute',
               'InstanceId': instance_id,
               'DisableApiTermination.Value': value}
@@ -2311,8 +2345,7 @@ def show_delvol_on_destroy(name, kwargs=None, call=None):
     volume_id = kwargs.get('volume_id', None)
 
     if instance_id is None:
-        instances = list_nodes_full()
-        instance_id = instances[name]['instanceId']
+        instance_id = _get_node(name)['instanceId']
 
     params = {'Action': 'DescribeInstances',
               'InstanceId.1': instance_id}
@@ -2396,8 +2429,7 @@ def _toggle_delvol(name=None, instance_id=None, device=None, volume_id=None,
                    value=None, requesturl=None):
 
     if not instance_id:
-        instances = list_nodes_full(get_location())
-        instance_id = instances[name]['instanceId']
+        instance_id = _get_node(name)['instanceId']
 
     if requesturl:
         data = query(requesturl=requesturl)
@@ -2493,8 +2525,7 @@ def attach_volume(name=None, kwargs=None, instance_id=None, call=None):
         instance_id = kwargs['instance_id']
 
     if name and not instance_id:
-        instances = list_nodes_full(get_location())
-        instance_id = instances[name]['instanceId']
+        instance_id = _get_node(name)['instanceId']
 
     if not name and not instance_id:
         log.error('Either a name or an instance_id is required.')
@@ -56,6 +56,10 @@ VALID_OPTS = {
     'id': str,
     'cachedir': str,
     'cache_jobs': bool,
+    'cmd_stream_chunk_size': int,
+    'cmd_stream_tail': int,
+    'cmd_runas_env_ttl': int,
+    'cmd_runas_shell': bool,
     'conf_file': str,
     'sock_dir': str,
     'backup_mode': str,
@@ -71,6 +75,9 @@ VALID_OPTS = {
     'file_roots': dict,
     'pillar_roots': dict,
     'hash_type': str,
+    'file_hash_cache': bool,
+    'file_hash_cache_min_size': int,
+    'file_diff_max_size': int,
     'external_nodes': str,
     'disable_modules': list,
     'disable_returners': list,
@@ -105,6 +112,13 @@ VALID_OPTS = {
     'state_output': str,
     'state_auto_order': bool,
     'state_events': bool,
+    'state_events_mode': str,
+    'state_events_batch_size': int,
+    'state_events_batch_interval': float,
+    'state_parallel': bool,
+    'state_parallel_workers': int,
+    'state_parallel_caps': dict,
+    'state_compile_cache': bool,
     'acceptance_wait_time': float,
     'acceptance_wait_time_max': float,
     'loop_interval': float,
@@ -139,6 +153,10 @@ VALID_OPTS = {
     'gitfs_base': str,
     'gitfs_env_whitelist': list,
     'gitfs_env_blacklist': list,
+    'gitfs_update_workers': int,
+    'gitfs_update_timeout': int,
+    'gitfs_update_backoff': int,
+    'gitfs_update_backoff_max': int,
     'hgfs_remotes': list,
     'hgfs_mountpoint': str,
     'hgfs_root': str,
@@ -167,14 +185,22 @@ VALID_OPTS = {
     'fileserver_followsymlinks': bool,
     'fileserver_ignoresymlinks': bool,
     'fileserver_limit_traversal': bool,
+    'fileserver_roots_index': bool,
+    'fileserver_list_page_size': int,
     'max_open_files': int,
     'auto_accept': bool,
+    'key_events_batch': bool,
     'master_tops': bool,
     'order_masters': bool,
     'job_cache': bool,
     'ext_job_cache': str,
     'master_ext_job_cache': str,
+    'returner_pool_size': int,
+    'returner_batch_size': int,
+    'returner_batch_interval': int,
+    'returner_batch_queue': int,
     'minion_data_cache': bool,
+    'batch_presence': bool,
     'publish_session': int,
     'reactor': list,
     'reactor_refresh_interval': int,
@@ -188,6 +214,11 @@ VALID_OPTS = {
     'win_gitrepos': list,
     'modules_max_memory': int,
     'grains_refresh_every': int,
+    'grains_cache': bool,
+    'grains_cache_expiration': int,
+    'grains_cache_ttl': dict,
+    'grains_parallel': int,
+    'grains_timeout': int,
     'enable_lspci': bool,
     'syndic_wait': int,
     'jinja_lstrip_blocks': bool,
@@ -207,6 +238,11 @@ VALID_OPTS = {
     'ssh_sudo': bool,
     'ssh_timeout': float,
     'ssh_user': str,
+    'ssh_control_persist': int,
+    'ssh_scan_ports': list,
+    'ssh_scan_timeout': float,
+    'ssh_scan_concurrency': int,
+    'ssh_scan_cache_time': int,
     'raet_port': int,
 }
 
@@ -221,8 +257,22 @@ DEFAULT_MINION_OPTS = {
     'id': None,
     'cachedir': os.path.join(salt.syspaths.CACHE_DIR, 'minion'),
     'cache_jobs': False,
+    'cmd_stream_chunk_size': 65536,
+    'cmd_stream_tail': 65536,
+    'cmd_runas_env_ttl': 300,
+    'cmd_runas_shell': False,
     'grains_cache': False,
     'grains_cache_expiration': 300,
+    'grains_cache_ttl': {
+        'core.hwaddr_interfaces': 86400,
+        'core.ip4': 60,
+        'core.ip6': 60,
+        'core.ip_interfaces': 60,
+        'core.fqdn_ip4': 60,
+        'core.fqdn_ip6': 60,
+    },
+    'grains_parallel': 8,
+    'grains_timeout': 60,
     'conf_file': os.path.join(salt.syspaths.CONFIG_DIR, 'minion'),
     'sock_dir': os.path.join(salt.syspaths.SOCK_DIR, 'minion'),
     'backup_mode': '',
@@ -243,6 +293,9 @@ DEFAULT_MINION_OPTS = {
         'base': [salt.syspaths.BASE_PILLAR_ROOTS_DIR],
     },
     'hash_type': 'md5',
+    'file_hash_cache': True,
+    'file_hash_cache_min_size': 1048576,
+    'file_diff_max_size': 1048576,
     'external_nodes': '',
     'disable_modules': [],
     'disable_returners': [],
@@ -274,11 +327,19 @@ DEFAULT_MINION_OPTS = {
     'log_granular_levels': {},
     'test': False,
     'ext_job_cache': '',
+    'returner_pool_size': 4,
     'cython_enable': False,
     'state_verbose': True,
     'state_output': 'full',
     'state_auto_order': True,
     'state_events': True,
+    'state_events_mode': 'chunk',
+    'state_events_batch_size': 100,
+    'state_events_batch_interval': 5,
+    'state_parallel': False,
+    'state_parallel_workers': 4,
+    'state_parallel_caps': {},
+    'state_compile_cache': False,
     'acceptance_wait_time': 10,
     'acceptance_wait_time_max': 0,
     'loop_interval': 1,
@@ -343,6 +404,10 @@ DEFAULT_MASTER_OPTS = {
     'gitfs_base': 'master',
     'gitfs_env_whitelist': [],
     'gitfs_env_blacklist': [],
+    'gitfs_update_workers': 4,
+    'gitfs_update_timeout': 300,
+    'gitfs_update_backoff': 60,
+    'gitfs_update_backoff_max': 3600,
     'hgfs_remotes': [],
     'hgfs_mountpoint': '',
     'hgfs_root': '',
@@ -373,11 +438,14 @@ DEFAULT_MASTER_OPTS = {
     'fileserver_followsymlinks': True,
     'fileserver_ignoresymlinks': False,
     'fileserver_limit_traversal': False,
+    'fileserver_roots_index': False,
+    'fileserver_list_page_size': 10000,
     'max_open_files': 100000,
     'hash_type': 'md5',
     'conf_file': os.path.join(salt.syspaths.CONFIG_DIR, 'master'),
     'open_mode': False,
     'auto_accept': False,
+    'key_events_batch': False,
     'renderer': 'yaml_jinja',
     'failhard': False,
     'state_top': 'top.sls',
@@ -387,7 +455,12 @@ DEFAULT_MASTER_OPTS = {
     'job_cache': True,
     'ext_job_cache': '',
     'master_ext_job_cache': '',
+    'returner_pool_size': 4,
+    'returner_batch_size': 0,
+    'returner_batch_interval': 1000,
+    'returner_batch_queue': 10000,
     'minion_data_cache': True,
+    'batch_presence': False,
     'enforce_mine_cache': False,
     'ipv6': False,
     'log_file': os.path.join(salt.syspaths.LOGS_DIR, 'master'),
@@ -440,6 +513,11 @@ DEFAULT_MASTER_OPTS = {
     'ssh_sudo': False,
     'ssh_timeout': 60,
     'ssh_user': 'root',
+    'ssh_control_persist': 60,
+    'ssh_scan_ports': [22],
+    'ssh_scan_timeout': 1.0,
+    'ssh_scan_concurrency': 1024,
+    'ssh_scan_cache_time': 300,
     'master_floscript': os.path.join(FLO_DIR, 'master.flo'),
     'ioflo_verbose': 3,
     'ioflo_period': 0.01,
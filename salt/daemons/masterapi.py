@@ -191,6 +191,7 @@ class RemoteFuncs(object):
         self._file_list = fs_.file_list
         self._file_list_emptydirs = fs_.file_list_emptydirs
         self._dir_list = fs_.dir_list
+        self._file_list_page = fs_.list_page
         self._symlink_list = fs_.symlink_list
         self._file_envs = fs_.envs
 
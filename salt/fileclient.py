@@ -6,7 +6,6 @@ Classes that manage file clients
 # Import python libs
 import contextlib
 import logging
-import hashlib
 import os
 import shutil
 import subprocess
@@ -24,6 +23,7 @@ import salt.transport
 import salt.utils
 import salt.utils.templates
 import salt.utils.gzip_util
+import salt.utils.filehash
 from salt._compat import (
     URLError, HTTPError, BaseHTTPServer, urlparse, urlunparse, url_open,
     url_passwd_mgr, url_auth_handler, url_build_opener, url_install_opener)
@@ -211,9 +211,8 @@ class Client(object):
                 path, saltenv
             )
         )
-        #go through the list of all files finding ones that are in
-        #the target directory and caching them
-        for fn_ in self.file_list(saltenv):
+        #go through the files in the target directory and cache them
+        for fn_ in self.file_list(saltenv, prefix=path):
             if fn_.strip() and fn_.startswith(path):
                 if salt.utils.check_include_exclude(
                         fn_, include_pat, exclude_pat):
@@ -234,7 +233,7 @@ class Client(object):
                 'files',
                 saltenv
             )
-            for fn_ in self.file_list_emptydirs(saltenv):
+            for fn_ in self.file_list_emptydirs(saltenv, prefix=path):
                 if fn_.startswith(path):
                     minion_dir = '{0}/{1}'.format(dest, fn_)
                     if not os.path.isdir(minion_dir):
@@ -466,7 +465,7 @@ class Client(object):
                 )
         # Replicate empty dirs from master
         try:
-            for fn_ in self.file_list_emptydirs(saltenv):
+            for fn_ in self.file_list_emptydirs(saltenv, prefix=path):
                 if fn_.startswith(path):
                     # Prevent an empty dir "salt://foobar/" from matching a path of
                     # "salt://foo"
@@ -539,7 +538,11 @@ class Client(object):
         try:
             with contextlib.closing(url_open(fixed_url)) as srcfp:
                 with salt.utils.fopen(dest, 'wb') as destfp:
-                    shutil.copyfileobj(srcfp, destfp)
+                    destfp = salt.utils.filehash.HashingFile(
+                        destfp, salt.utils.filehash.hash_types(self.opts))
+                    shutil.copyfileobj(
+                        srcfp, destfp, salt.utils.filehash.CHUNK_SIZE)
+            salt.utils.filehash.store(dest, destfp.sums(), self.opts)
             return dest
         except HTTPError as ex:
             raise MinionError('HTTP error {0} reading {1}: {3}'.format(
@@ -780,17 +783,16 @@ class LocalClient(Client):
                 log.warning(err.format(path))
                 return ret
             else:
-                with salt.utils.fopen(path, 'rb') as ifile:
-                    ret['hsum'] = hashlib.md5(ifile.read()).hexdigest()
+                ret['hsum'] = salt.utils.filehash.get_hash(
+                    path, 'md5', self.opts)
                 ret['hash_type'] = 'md5'
                 return ret
         path = self._find_file(path, saltenv)['path']
         if not path:
             return {}
         ret = {}
-        with salt.utils.fopen(path, 'rb') as ifile:
-            ret['hsum'] = getattr(hashlib, self.opts['hash_type'])(
-                ifile.read()).hexdigest()
+        ret['hsum'] = salt.utils.filehash.get_hash(
+            path, self.opts['hash_type'], self.opts)
         ret['hash_type'] = self.opts['hash_type']
         return ret
 
@@ -861,6 +863,47 @@ class RemoteClient(Client):
             self.auth = salt.crypt.SAuth(opts)
         else:
             self.auth = ''
+        # (form, saltenv, prefix) -> (version, list)
+        self.list_cache = {}
+
+    def _list_pages(self, form, saltenv, prefix):
+        '''
+        Fetch a file list from the master one page at a time, reusing the
+        cached list if the master reports it as unchanged. Returns None if
+        the master does not serve paged lists.
+        '''
+        prefix = prefix.strip('/')
+        key = (form, saltenv, prefix)
+        load = {'saltenv': saltenv,
+                'prefix': prefix,
+                'form': form,
+                'cmd': '_file_list_page'}
+        if key in self.list_cache:
+            load['version'] = self.list_cache[key][0]
+        channel = salt.transport.Channel.factory(self.opts, auth=self.auth)
+        for _ in range(3):
+            ret = []
+            version = None
+            while True:
+                data = channel.send(load)
+                if not isinstance(data, dict) or 'version' not in data:
+                    # An older master
+                    return None
+                if data.get('unchanged'):
+                    return list(self.list_cache[key][1])
+                if version is None:
+                    version = data['version']
+                    load.pop('version', None)
+                elif data['version'] != version:
+                    # The list changed between two pages, start over
+                    break
+                ret.extend(data['items'])
+                if not data['marker']:
+                    self.list_cache[key] = (version, ret)
+                    return list(ret)
+                load['marker'] = data['marker']
+            load.pop('marker', None)
+        return None
 
     def get_file(self,
                  path,
@@ -927,7 +970,9 @@ class RemoteClient(Client):
                     os.makedirs(destdir)
                 else:
                     return False
-            fn_ = salt.utils.fopen(dest, 'wb+')
+            fn_ = salt.utils.filehash.HashingFile(
+                salt.utils.fopen(dest, 'wb+'),
+                salt.utils.filehash.hash_types(self.opts))
         while True:
             if not fn_:
                 load['loc'] = 0
@@ -952,15 +997,19 @@ class RemoteClient(Client):
                     # Master has prompted a file verification, if the
                     # verification fails, re-download the file. Try 3 times
                     d_tries += 1
-                    with salt.utils.fopen(dest, 'rb') as fp_:
-                        hsum = getattr(
-                            hashlib,
-                            data.get('hash_type', 'md5')
-                        )(fp_.read()).hexdigest()
-                        if hsum != data['hsum']:
-                            log.warn('Bad download of file {0}, attempt {1} '
-                                     'of 3'.format(path, d_tries))
-                            continue
+                    hash_type = data.get('hash_type', 'md5')
+                    if fn_ and hash_type in fn_.hashes:
+                        # Hashed while it was written
+                        hsum = fn_.sums()[hash_type]
+                    else:
+                        if fn_:
+                            fn_.flush()
+                        hsum = salt.utils.get_hash(
+                            dest, hash_type, salt.utils.filehash.CHUNK_SIZE)
+                    if hsum != data['hsum']:
+                        log.warn('Bad download of file {0}, attempt {1} '
+                                 'of 3'.format(path, d_tries))
+                        continue
                 break
             if not fn_:
                 with self._cache_loc(data['dest'], saltenv) as cache_dest:
@@ -969,7 +1018,9 @@ class RemoteClient(Client):
                     # remove it to avoid a traceback trying to write the file
                     if os.path.isdir(dest):
                         salt.utils.rm_rf(dest)
-                    fn_ = salt.utils.fopen(dest, 'wb+')
+                    fn_ = salt.utils.filehash.HashingFile(
+                        salt.utils.fopen(dest, 'wb+'),
+                        salt.utils.filehash.hash_types(self.opts))
             if data.get('gzip', None):
                 data = salt.utils.gzip_util.uncompress(data['data'])
             else:
@@ -977,6 +1028,7 @@ class RemoteClient(Client):
             fn_.write(data)
         if fn_:
             fn_.close()
+            salt.utils.filehash.store(dest, fn_.sums(), self.opts)
             log.info(
                 'Fetching file from saltenv {0!r}, ** done ** {1!r}'.format(
                     saltenv, path
@@ -1002,6 +1054,9 @@ class RemoteClient(Client):
                 'prefix': prefix,
                 'cmd': '_file_list'}
         try:
+            ret = self._list_pages('files', saltenv, prefix)
+            if ret is not None:
+                return ret
             channel = salt.transport.Channel.factory(
                     self.opts,
                     auth=self.auth)
@@ -1027,10 +1082,13 @@ class RemoteClient(Client):
                 'prefix': prefix,
                 'cmd': '_file_list_emptydirs'}
         try:
+            ret = self._list_pages('empty_dirs', saltenv, prefix)
+            if ret is not None:
+                return ret
             channel = salt.transport.Channel.factory(
                     self.opts,
                     auth=self.auth)
-            channel.send(load)
+            return channel.send(load)
         except SaltReqTimeoutError:
             return ''
 
@@ -1052,6 +1110,9 @@ class RemoteClient(Client):
                 'prefix': prefix,
                 'cmd': '_dir_list'}
         try:
+            ret = self._list_pages('dirs', saltenv, prefix)
+            if ret is not None:
+                return ret
             channel = salt.transport.Channel.factory(
                     self.opts,
                     auth=self.auth)
@@ -1099,8 +1160,8 @@ class RemoteClient(Client):
                 return {}
             else:
                 ret = {}
-                ret['hsum'] = salt.utils.get_hash(
-                    path, form='md5', chunk_size=4096)
+                ret['hsum'] = salt.utils.filehash.get_hash(
+                    path, 'md5', self.opts)
                 ret['hash_type'] = 'md5'
                 return ret
         load = {'path': path,
@@ -6,17 +6,25 @@ File server pluggable modules and generic backend functions
 # Import python libs
 import os
 import re
+import bisect
 import fnmatch
+import hashlib
 import logging
 import time
 import errno
 
 # Import salt libs
 import salt.loader
+import salt.payload
 import salt.utils
 
 log = logging.getLogger(__name__)
 
+# The backend function behind each form of file list
+_LIST_FUNCS = {'files': 'file_list',
+               'dirs': 'dir_list',
+               'empty_dirs': 'file_list_emptydirs'}
+
 
 def _lock_cache(w_lock):
     try:
@@ -210,6 +218,72 @@ def reap_fileserver_cache_dir(cache_base, find_func):
                     os.unlink(file_path)
 
 
+def blob_hash(opts, store, blob, path):
+    '''
+    Return the hash of a file holding the contents of a content-addressed
+    blob. The hash of a blob never changes, so it is cached in the store
+    directory once per blob, however many environments serve it:
+
+    store -> blob[:2] -> blob.hash_type
+    '''
+    hash_type = opts['hash_type']
+    cache_path = os.path.join(
+        store, blob[:2], '{0}.{1}'.format(blob, hash_type)
+    )
+    try:
+        with salt.utils.fopen(cache_path, 'rb') as fp_:
+            return fp_.read()
+    except (IOError, OSError):
+        pass
+    hsum = salt.utils.get_hash(path, hash_type)
+    cache_dir = os.path.dirname(cache_path)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp = '{0}.{1}.tmp'.format(cache_path, os.getpid())
+        with salt.utils.fopen(tmp, 'w+') as fp_:
+            fp_.write(hsum)
+        os.rename(tmp, cache_path)
+    except (IOError, OSError) as exc:
+        log.error(
+            'Unable to cache the hash of blob {0}: {1}'.format(blob, exc)
+        )
+    return hsum
+
+
+def reap_hash_store(store, refs):
+    '''
+    Remove the cached hashes of the blobs in a store written by blob_hash()
+    which are no longer referenced. The store is swept by name only, the
+    blobs do not need to be looked up again.
+    '''
+    try:
+        subdirs = os.listdir(store)
+    except OSError:
+        return 0
+    removed = 0
+    for subdir in subdirs:
+        path = os.path.join(store, subdir)
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in names:
+            if name.split('.', 1)[0] in refs:
+                continue
+            try:
+                os.remove(os.path.join(path, name))
+                removed += 1
+            except OSError:
+                pass
+        try:
+            os.rmdir(path)
+        except OSError:
+            # Not empty
+            pass
+    return removed
+
+
 def is_file_ignored(opts, fname):
     '''
     If file_ignore_regex or file_ignore_glob were given in config,
@@ -238,6 +312,18 @@ def is_file_ignored(opts, fname):
     return False
 
 
+def _prefix_end(items, start, prefix, limit=None):
+    '''
+    Return the index after the last item of a sorted list which starts with
+    the prefix, looking at no more than limit items from start
+    '''
+    end = start
+    stop = len(items) if limit is None else min(len(items), start + limit)
+    while end < stop and items[end].startswith(prefix):
+        end += 1
+    return end
+
+
 class Fileserver(object):
     '''
     Create a fileserver wrapper object that wraps the fileserver functions and
@@ -247,6 +333,9 @@ class Fileserver(object):
     def __init__(self, opts):
         self.opts = opts
         self.servers = salt.loader.fileserver(opts, opts['fileserver_backend'])
+        self.serial = salt.payload.Serial(opts)
+        # (saltenv, form) -> (backend lists, version, sorted list)
+        self.lists = {}
 
     def _gen_back(self, back):
         '''
@@ -396,9 +485,32 @@ class Fileserver(object):
             return self.servers[fstr](load, fnd)
         return ''
 
-    def file_list(self, load):
+    def _list_index(self, saltenv, form):
         '''
-        Return a list of files from the dominant environment
+        Return the version token and the sorted, merged list of the backends
+        for a form of file list. The list is only merged and sorted again
+        when a backend returned a different list.
+        '''
+        lists = []
+        for fsb in self._gen_back(None):
+            fstr = '{0}.{1}'.format(fsb, _LIST_FUNCS[form])
+            if fstr in self.servers:
+                lists.append(self.servers[fstr]({'saltenv': saltenv}))
+        cached = self.lists.get((saltenv, form))
+        if cached is not None and cached[0] == lists:
+            return cached[1], cached[2]
+        ret = set()
+        for items in lists:
+            ret.update(items)
+        ret = sorted(ret)
+        version = hashlib.md5(self.serial.dumps(ret)).hexdigest()
+        self.lists[(saltenv, form)] = (lists, version, ret)
+        return version, ret
+
+    def _list(self, load, form):
+        '''
+        Return the sorted list for a form of file list, limited to the prefix
+        in the load
         '''
         if 'env' in load:
             salt.utils.warn_until(
@@ -409,49 +521,42 @@ class Fileserver(object):
             )
             load['saltenv'] = load.pop('env')
 
-        ret = set()
         if 'saltenv' not in load:
             return []
-        for fsb in self._gen_back(None):
-            fstr = '{0}.file_list'.format(fsb)
-            if fstr in self.servers:
-                ret.update(self.servers[fstr](load))
-        # some *fs do not handle prefix. Ensure it is filtered
+        items = self._list_index(load['saltenv'], form)[1]
         prefix = load.get('prefix', '').strip('/')
-        if prefix != '':
-            ret = [f for f in ret if f.startswith(prefix)]
-        return sorted(ret)
+        if prefix == '':
+            return list(items)
+        start = bisect.bisect_left(items, prefix)
+        return items[start:_prefix_end(items, start, prefix)]
+
+    def file_list(self, load):
+        '''
+        Return a list of files from the dominant environment
+        '''
+        return self._list(load, 'files')
 
     def file_list_emptydirs(self, load):
         '''
         List all emptydirs in the given environment
         '''
-        if 'env' in load:
-            salt.utils.warn_until(
-                'Boron',
-                'Passing a salt environment should be done using \'saltenv\' '
-                'not \'env\'. This functionality will be removed in Salt '
-                'Boron.'
-            )
-            load['saltenv'] = load.pop('env')
-
-        ret = set()
-        if 'saltenv' not in load:
-            return []
-        for fsb in self._gen_back(None):
-            fstr = '{0}.file_list_emptydirs'.format(fsb)
-            if fstr in self.servers:
-                ret.update(self.servers[fstr](load))
-        # some *fs do not handle prefix. Ensure it is filtered
-        prefix = load.get('prefix', '').strip('/')
-        if prefix != '':
-            ret = [f for f in ret if f.startswith(prefix)]
-        return sorted(ret)
+        return self._list(load, 'empty_dirs')
 
     def dir_list(self, load):
         '''
         List all directories in the given environment
         '''
+        return self._list(load, 'dirs')
+
+    def list_page(self, load):
+        '''
+        Return one page of the files, dirs or empty_dirs of an environment
+        which start with a prefix. The return contains the page as
+        ``items``, the last item to pass as ``marker`` for the next page, or
+        an empty string on the last page, and a ``version`` token of the
+        whole list. If the ``version`` in the load still matches, only
+        ``unchanged`` is returned.
+        '''
         if 'env' in load:
             salt.utils.warn_until(
                 'Boron',
@@ -461,18 +566,28 @@ class Fileserver(object):
             )
             load['saltenv'] = load.pop('env')
 
-        ret = set()
-        if 'saltenv' not in load:
-            return []
-        for fsb in self._gen_back(None):
-            fstr = '{0}.dir_list'.format(fsb)
-            if fstr in self.servers:
-                ret.update(self.servers[fstr](load))
-        # some *fs do not handle prefix. Ensure it is filtered
+        form = load.get('form', 'files')
+        if 'saltenv' not in load or form not in _LIST_FUNCS:
+            return {}
+        version, items = self._list_index(load['saltenv'], form)
+        if load.get('version') == version:
+            return {'version': version, 'unchanged': True}
         prefix = load.get('prefix', '').strip('/')
-        if prefix != '':
-            ret = [f for f in ret if f.startswith(prefix)]
-        return sorted(ret)
+        start = bisect.bisect_left(items, prefix)
+        if load.get('marker'):
+            start = max(start, bisect.bisect_right(items, load['marker']))
+        limit = self.opts.get('fileserver_list_page_size', 10000)
+        if load.get('limit'):
+            limit = max(1, min(int(load['limit']), limit))
+        # Look one past the page to know if there is another one
+        end = _prefix_end(items, start, prefix, limit + 1)
+        page = items[start:min(end, start + limit)]
+        marker = ''
+        if end > start + limit:
+            marker = page[-1]
+        return {'version': version,
+                'items': page,
+                'marker': marker}
 
     def symlink_list(self, load):
         '''
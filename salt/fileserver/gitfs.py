@@ -49,6 +49,7 @@ to specify which provider should be used.
 '''
 
 # Import python libs
+import binascii
 import distutils.version  # pylint: disable=E0611
 import glob
 import hashlib
@@ -56,12 +57,29 @@ import logging
 import os
 import re
 import shutil
+import stat
 import subprocess
+import threading
+import time
+import Queue
 from datetime import datetime
 
 VALID_PROVIDERS = ('gitpython', 'pygit2', 'dulwich')
 PYGIT2_TRANSPORTS = ('http', 'https', 'file')
-PER_REMOTE_PARAMS = ('mountpoint', 'root')
+PER_REMOTE_PARAMS = ('mountpoint', 'root', 'update_timeout')
+
+# repo hash -> (failed fetches in a row, time of the next attempt)
+_BACKOFF = {}
+# repo hash -> thread of the last fetch
+_FETCHING = {}
+# The repo hashes of fetches which changed the remote, until the change is
+# picked up by an update. A fetch which finishes after its deadline leaves
+# its change here for the next update.
+_CHANGED = set()
+# tree SHA -> tree index, see _tree_index()
+_TREES = {}
+# (stat of ref_map.p, ref map) as last read
+_REF_MAP = [None, {}]
 
 _RECOMMEND_GITPYTHON = (
     'GitPython is installed, you may wish to set gitfs_provider to '
@@ -295,27 +313,6 @@ def _dulwich_remote(repo):
     return _dulwich_conf(repo).get(('remote', 'origin'), 'url')
 
 
-def _dulwich_walk_tree(repo, tree, path):
-    '''
-    Dulwich does not provide a means of directly accessing subdirectories. This
-    function will walk down to the directory specified by 'path', and return a
-    Tree object at that path. If path is an empty string, the original tree
-    will be returned, and if there are any issues encountered walking the tree,
-    None will be returned.
-    '''
-    if not path:
-        return tree
-    # Walk down the tree to get to the file
-    for parent in path.split(os.path.sep):
-        try:
-            tree = repo.get_object(tree[parent][1])
-        except (KeyError, TypeError):
-            # Directory not found, or tree passed into function is not a Tree
-            # object. Either way, desired path does not exist.
-            return None
-    return tree
-
-
 _dulwich_env_refs = lambda refs: [x for x in refs
                                   if re.match('refs/(heads|tags)', x)
                                   and not x.endswith('^{}')]
@@ -325,7 +322,7 @@ def _get_tree_gitpython(repo, short):
     '''
     Return a git.Tree object if the branch/tag/SHA is found, otherwise None
     '''
-    if short in envs():
+    if short in envs() or short == __opts__['gitfs_base']:
         for ref in repo.refs:
             if isinstance(ref, (git.RemoteReference, git.TagReference)):
                 parted = ref.name.partition('/')
@@ -339,7 +336,7 @@ def _get_tree_gitpython(repo, short):
         return None
     try:
         commit = repo.rev_parse(short)
-    except gitdb.exc.BadObject:
+    except (gitdb.exc.BadObject, getattr(gitdb.exc, 'BadName', ValueError)):
         pass
     else:
         return commit.tree
@@ -350,7 +347,7 @@ def _get_tree_pygit2(repo, short):
     '''
     Return a pygit2.Tree object if the branch/tag/SHA is found, otherwise None
     '''
-    if short in envs():
+    if short in envs() or short == __opts__['gitfs_base']:
         for ref in repo.listall_references():
             _, rtype, rspec = ref.split('/', 2)
             if rtype in ('remotes', 'tags'):
@@ -378,7 +375,7 @@ def _get_tree_dulwich(repo, short):
     Return a dulwich.objects.Tree object if the branch/tag/SHA is found,
     otherwise None
     '''
-    if short in envs():
+    if short in envs() or short == __opts__['gitfs_base']:
         refs = repo.get_refs()
         # Sorting ensures we check heads (branches) before tags
         for ref in sorted(_dulwich_env_refs(refs)):
@@ -702,7 +699,8 @@ def purge_cache():
         except ValueError:
             pass
     remove_dirs = [os.path.join(bp_, rdir) for rdir in remove_dirs
-                   if rdir not in ('hash', 'refs', 'envs.p', 'remote_map.txt')]
+                   if rdir not in ('hash', 'refs', 'trees', 'blob_hashes',
+                                   'envs.p', 'ref_map.p', 'remote_map.txt')]
     if remove_dirs:
         for rdir in remove_dirs:
             shutil.rmtree(rdir)
@@ -710,89 +708,214 @@ def purge_cache():
     return False
 
 
-def update():
-    '''
-    Execute a git fetch on all of the repos
-    '''
-    # data for the fileserver event
-    data = {'changed': False,
-            'backend': 'gitfs'}
-    provider = _get_provider()
-    pid = os.getpid()
-    data['changed'] = purge_cache()
-    for repo_conf in init():
-        repo = repo_conf['repo']
+def _fetch(repo_conf, provider):
+    '''
+    Fetch a single remote, return True if anything changed
+    '''
+    repo = repo_conf['repo']
+    if provider == 'gitpython':
+        origin = repo.remotes[0]
+        working_dir = repo.working_dir
+    elif provider == 'pygit2':
+        origin = repo.remotes[0]
+        working_dir = repo.workdir
+    elif provider == 'dulwich':
+        # origin is just a uri here, there is no origin object
+        origin = repo_conf['uri']
+        working_dir = repo.path
+    changed = False
+    lk_fn = os.path.join(working_dir, 'update.lk')
+    with salt.utils.fopen(lk_fn, 'w+') as fp_:
+        fp_.write(str(os.getpid()))
+    try:
         if provider == 'gitpython':
-            origin = repo.remotes[0]
-            working_dir = repo.working_dir
+            for fetch in origin.fetch():
+                if fetch.old_commit is not None or \
+                        fetch.flags & (fetch.NEW_HEAD | fetch.NEW_TAG):
+                    changed = True
         elif provider == 'pygit2':
-            origin = repo.remotes[0]
-            working_dir = repo.workdir
+            fetch = origin.fetch()
+            if fetch.get('received_objects', 0):
+                changed = True
         elif provider == 'dulwich':
-            # origin is just a uri here, there is no origin object
-            origin = repo_conf['uri']
-            working_dir = repo.path
-        lk_fn = os.path.join(working_dir, 'update.lk')
-        with salt.utils.fopen(lk_fn, 'w+') as fp_:
-            fp_.write(str(pid))
-        try:
-            if provider == 'gitpython':
-                for fetch in origin.fetch():
-                    if fetch.old_commit is not None:
-                        data['changed'] = True
-            elif provider == 'pygit2':
-                fetch = origin.fetch()
-                if fetch.get('received_objects', 0):
-                    data['changed'] = True
-            elif provider == 'dulwich':
-                client, path = \
-                    dulwich.client.get_transport_and_path_from_url(
-                        origin, thin_packs=True
-                    )
-                refs_pre = repo.get_refs()
+            client, path = \
+                dulwich.client.get_transport_and_path_from_url(
+                    origin, thin_packs=True
+                )
+            refs_pre = repo.get_refs()
+            try:
+                refs_post = client.fetch(path, repo)
+                # Newer dulwich releases wrap the refs in a FetchPackResult
+                refs_post = getattr(refs_post, 'refs', refs_post)
+            except KeyError:
+                log.critical(
+                    'Local repository cachedir {0!r} (corresponding '
+                    'remote: {1}) has been corrupted. Salt will now '
+                    'attempt to remove the local checkout to allow it to '
+                    'be re-initialized in the next fileserver cache '
+                    'update.'
+                    .format(repo_conf['cachedir'], repo_conf['uri'])
+                )
                 try:
-                    refs_post = client.fetch(path, repo)
-                except KeyError:
+                    salt.utils.rm_rf(repo_conf['cachedir'])
+                except OSError as exc:
                     log.critical(
-                        'Local repository cachedir {0!r} (corresponding '
-                        'remote: {1}) has been corrupted. Salt will now '
-                        'attempt to remove the local checkout to allow it to '
-                        'be re-initialized in the next fileserver cache '
-                        'update.'
-                        .format(repo_conf['cachedir'], repo_conf['uri'])
-                    )
-                    try:
-                        salt.utils.rm_rf(repo_conf['cachedir'])
-                    except OSError as exc:
-                        log.critical(
-                            'Unable to remove {0!r}: {1}'
-                            .format(repo_conf['cachedir'], exc)
-                        )
-                    continue
-                if refs_post is None:
-                    # Empty repository
-                    log.warning(
-                        'gitfs remote {0!r} is an empty repository and will '
-                        'be skipped.'.format(origin)
+                        'Unable to remove {0!r}: {1}'
+                        .format(repo_conf['cachedir'], exc)
                     )
-                    continue
-                if refs_pre != refs_post:
-                    data['changed'] = True
-                    # Update local refs
-                    for ref in _dulwich_env_refs(refs_post):
-                        repo[ref] = refs_post[ref]
-                    # Prune stale refs
-                    for ref in repo.get_refs():
-                        if ref not in refs_post:
-                            del repo[ref]
-        except Exception as exc:
-            log.warning(
-                'Exception caught while fetching: {0}'.format(exc)
-            )
+                return False
+            if refs_post is None:
+                # Empty repository
+                log.warning(
+                    'gitfs remote {0!r} is an empty repository and will '
+                    'be skipped.'.format(origin)
+                )
+                return False
+            if refs_pre != refs_post:
+                changed = True
+                # Update local refs
+                for ref in _dulwich_env_refs(refs_post):
+                    repo[ref] = refs_post[ref]
+                # Prune stale refs
+                for ref in repo.get_refs():
+                    if ref not in refs_post:
+                        del repo[ref]
+    finally:
         try:
             os.remove(lk_fn)
         except (IOError, OSError):
             pass
+    return changed
+
+
+def _fetch_worker(repo_conf, provider, done):
+    '''
+    Fetch a remote in a worker thread and report the result to the queue
+    '''
+    start = time.time()
+    try:
+        ret = {'result': 'ok', 'changed': _fetch(repo_conf, provider)}
+        if ret['changed']:
+            _CHANGED.add(repo_conf['hash'])
+    except Exception as exc:
+        log.warning(
+            'Exception caught while fetching {0}: {1}'
+            .format(repo_conf['uri'], exc)
+        )
+        ret = {'result': 'error', 'changed': False}
+    ret['duration'] = time.time() - start
+    done.put((repo_conf['hash'], ret))
+
+
+def _backoff(repo_conf, now):
+    '''
+    Record a failed fetch and return when the remote may be fetched again
+    '''
+    failures = _BACKOFF.get(repo_conf['hash'], (0, 0))[0] + 1
+    delay = min(
+        __opts__.get('gitfs_update_backoff', 60) * 2 ** (failures - 1),
+        __opts__.get('gitfs_update_backoff_max', 3600)
+    )
+    _BACKOFF[repo_conf['hash']] = (failures, now + delay)
+    log.warning(
+        'Fetching gitfs remote {0} failed {1} time(s) in a row, not trying '
+        'again for {2} seconds'.format(repo_conf['uri'], failures, delay)
+    )
+
+
+def _fetch_all(repos, provider):
+    '''
+    Fetch the remotes in a bounded pool of threads. A remote which fails or
+    does not finish within its timeout is backed off exponentially. Returns
+    a dict of repo hash -> uri, result, changed flag and duration. A remote
+    changed by a fetch which finished after its deadline is reported as
+    changed by the next call.
+    '''
+    workers = max(1, __opts__.get('gitfs_update_workers', 4))
+    done = Queue.Queue()
+    pending = []
+    ret = {}
+    now = time.time()
+    for repo_conf in repos:
+        thread = _FETCHING.get(repo_conf['hash'])
+        if thread is not None and thread.is_alive():
+            # A fetch which timed out earlier is still hanging
+            ret[repo_conf['hash']] = {'result': 'running', 'changed': False}
+        elif _BACKOFF.get(repo_conf['hash'], (0, 0))[1] > now:
+            ret[repo_conf['hash']] = {'result': 'backoff', 'changed': False}
+        else:
+            pending.append(repo_conf)
+            continue
+        ret[repo_conf['hash']]['uri'] = repo_conf['uri']
+    # repo hash -> (repo_conf, start, deadline)
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            repo_conf = pending.pop(0)
+            timeout = repo_conf.get('update_timeout') or \
+                __opts__.get('gitfs_update_timeout', 300)
+            thread = threading.Thread(
+                target=_fetch_worker, args=(repo_conf, provider, done)
+            )
+            thread.daemon = True
+            thread.start()
+            _FETCHING[repo_conf['hash']] = thread
+            start = time.time()
+            running[repo_conf['hash']] = (repo_conf, start, start + timeout)
+        wait = min(item[2] for item in running.values()) - time.time()
+        try:
+            repo_hash, result = done.get(timeout=max(wait, 0.01))
+        except Queue.Empty:
+            # Give up on the remotes which passed their deadline, the
+            # threads keep running but no longer hold a worker slot
+            now = time.time()
+            for repo_hash, (repo_conf, start, deadline) in running.items():
+                if deadline <= now:
+                    del running[repo_hash]
+                    log.warning(
+                        'Timed out fetching gitfs remote {0}'
+                        .format(repo_conf['uri'])
+                    )
+                    ret[repo_hash] = {'uri': repo_conf['uri'],
+                                      'result': 'timeout',
+                                      'changed': False,
+                                      'duration': now - start}
+                    _backoff(repo_conf, now)
+            continue
+        if repo_hash not in running:
+            # Finished after its deadline
+            continue
+        repo_conf = running.pop(repo_hash)[0]
+        _FETCHING.pop(repo_hash, None)
+        result['uri'] = repo_conf['uri']
+        ret[repo_hash] = result
+        if result['result'] == 'ok':
+            _BACKOFF.pop(repo_hash, None)
+        else:
+            _backoff(repo_conf, time.time())
+    # Pick up the changes of the fetches finished since they were last
+    # picked up, on time or late
+    for repo_hash in ret:
+        if repo_hash in _CHANGED:
+            _CHANGED.discard(repo_hash)
+            ret[repo_hash]['changed'] = True
+    return ret
+
+
+def update():
+    '''
+    Execute a git fetch on all of the repos
+    '''
+    # data for the fileserver event
+    data = {'changed': False,
+            'backend': 'gitfs'}
+    provider = _get_provider()
+    data['changed'] = purge_cache()
+    repos = init()
+    data['remotes'] = _fetch_all(repos, provider)
+    for result in data['remotes'].itervalues():
+        if result['changed']:
+            data['changed'] = True
 
     env_cache = os.path.join(__opts__['cachedir'], 'gitfs/envs.p')
     if data.get('changed', False) is True or not os.path.isfile(env_cache):
@@ -802,18 +925,19 @@ def update():
             fp_.write(serial.dumps(new_envs))
             log.trace('Wrote env cache data to {0}'.format(env_cache))
 
+    ref_map_path = os.path.join(__opts__['cachedir'], 'gitfs/ref_map.p')
+    if data['changed'] or not os.path.isfile(ref_map_path):
+        _write_ref_map(repos, provider, ref_map_path)
+
     # if there is a change, fire an event
     if __opts__.get('fileserver_events', False):
         event = salt.utils.event.MasterEvent(__opts__['sock_dir'])
         event.fire_event(data, tagify(['gitfs', 'update'], prefix='fileserver'))
-    try:
-        salt.fileserver.reap_fileserver_cache_dir(
-            os.path.join(__opts__['cachedir'], 'gitfs/hash'),
-            find_file
-        )
-    except (IOError, OSError):
-        # Hash file won't exist if no files have yet been served up
-        pass
+    if data['changed']:
+        try:
+            _reap_cache()
+        except (IOError, OSError) as exc:
+            log.error('Unable to clean the gitfs cache: {0}'.format(exc))
 
 
 def _env_is_exposed(env):
@@ -924,6 +1048,269 @@ def _envs_dulwich(repo, base_branch):
     return ret
 
 
+def _get_tree(repo, tgt_env, provider):
+    '''
+    Return the tree object of a branch/tag/SHA in a repo, or None
+    '''
+    if provider == 'gitpython':
+        return _get_tree_gitpython(repo, tgt_env)
+    elif provider == 'pygit2':
+        return _get_tree_pygit2(repo, tgt_env)
+    elif provider == 'dulwich':
+        return _get_tree_dulwich(repo, tgt_env)
+    return None
+
+
+def _tree_sha(tree, provider):
+    '''
+    Return the SHA of a tree object
+    '''
+    if provider == 'gitpython':
+        return tree.hexsha
+    elif provider == 'pygit2':
+        return tree.hex
+    elif provider == 'dulwich':
+        return tree.id
+
+
+def _build_tree_index(repo, tree, provider):
+    '''
+    Walk a tree once, return a dict of the path of each blob to its
+    (blob SHA, mode, size) and a list of the directories
+    '''
+    files = {}
+    dirs = []
+    if provider == 'gitpython':
+        for obj in tree.traverse():
+            if isinstance(obj, git.Blob):
+                files[obj.path] = (obj.hexsha, obj.mode, obj.size)
+            elif isinstance(obj, git.Tree):
+                dirs.append(obj.path)
+    elif provider == 'pygit2':
+        def _traverse(tree, prefix):
+            for entry in iter(tree):
+                obj = repo[entry.oid]
+                path = os.path.join(prefix, entry.name)
+                if isinstance(obj, pygit2.Blob):
+                    files[path] = (obj.hex, entry.filemode, obj.size)
+                elif isinstance(obj, pygit2.Tree):
+                    dirs.append(path)
+                    _traverse(obj, path)
+        _traverse(tree, '')
+    elif provider == 'dulwich':
+        def _traverse(tree, prefix):
+            for item in tree.items():
+                path = os.path.join(prefix, item.path)
+                if stat.S_ISDIR(item.mode):
+                    dirs.append(path)
+                    _traverse(repo.get_object(item.sha), path)
+                elif not dulwich.objects.S_ISGITLINK(item.mode):
+                    size = len(repo.object_store.get_raw(item.sha)[1])
+                    files[path] = (item.sha, item.mode, size)
+        _traverse(tree, '')
+    return {'files': files, 'dirs': dirs}
+
+
+def _tree_index(repo_conf, tgt_env, provider, tree=None):
+    '''
+    Return the index of the tree of a branch/tag/SHA in a repo, or None if it
+    does not exist there. The indexes are kept on disk by tree SHA, so they
+    never need to be invalidated, and the tree SHA of each branch and tag is
+    looked up in the ref map written by update().
+    '''
+    if tree is None:
+        tree_sha = _ref_map().get(repo_conf['hash'], {}).get(tgt_env)
+    else:
+        tree_sha = _tree_sha(tree, provider)
+    if tree_sha is None:
+        tree = _get_tree(repo_conf['repo'], tgt_env, provider)
+        if not tree:
+            return None
+        tree_sha = _tree_sha(tree, provider)
+    index = _read_tree_index(tree_sha)
+    if index is not None:
+        return index
+    if tree is None:
+        tree = _get_tree(repo_conf['repo'], tgt_env, provider)
+        if not tree:
+            return None
+    index = _build_tree_index(repo_conf['repo'], tree, provider)
+    index_path = os.path.join(
+        __opts__['cachedir'], 'gitfs/trees', '{0}.p'.format(tree_sha)
+    )
+    index_dir = os.path.dirname(index_path)
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    tmp = '{0}.{1}'.format(index_path, os.getpid())
+    with salt.utils.fopen(tmp, 'w+b') as fp_:
+        fp_.write(salt.payload.Serial(__opts__).dumps(index))
+    os.rename(tmp, index_path)
+    _TREES[tree_sha] = index
+    return index
+
+
+def _read_tree_index(tree_sha):
+    '''
+    Return the index of a tree from memory or from disk, or None
+    '''
+    if tree_sha in _TREES:
+        return _TREES[tree_sha]
+    index_path = os.path.join(
+        __opts__['cachedir'], 'gitfs/trees', '{0}.p'.format(tree_sha)
+    )
+    try:
+        with salt.utils.fopen(index_path, 'rb') as fp_:
+            index = salt.payload.Serial(__opts__).load(fp_)
+    except (IOError, OSError, ValueError):
+        return None
+    _TREES[tree_sha] = index
+    return index
+
+
+def _ref_map():
+    '''
+    Return the map of repo hash -> branch/tag -> tree SHA written by update(),
+    it is only read again when update() has written a new one
+    '''
+    ref_map_path = os.path.join(__opts__['cachedir'], 'gitfs/ref_map.p')
+    try:
+        stat_ = os.stat(ref_map_path)
+    except OSError:
+        return {}
+    key = (stat_.st_ino, stat_.st_mtime, stat_.st_size)
+    if _REF_MAP[0] != key:
+        try:
+            with salt.utils.fopen(ref_map_path, 'rb') as fp_:
+                ref_map = salt.payload.Serial(__opts__).load(fp_)
+        except (IOError, OSError, ValueError):
+            return {}
+        # Forget the trees which are no longer checked out
+        current = set()
+        for trees in ref_map.itervalues():
+            current.update(trees.itervalues())
+        for tree_sha in list(_TREES):
+            if tree_sha not in current:
+                del _TREES[tree_sha]
+        _REF_MAP[:] = [key, ref_map]
+    return _REF_MAP[1]
+
+
+def _write_ref_map(repos, provider, ref_map_path):
+    '''
+    Resolve the tree SHA of every environment in every repo, index the trees
+    and write the ref map
+    '''
+    base_branch = __opts__['gitfs_base']
+    ref_map = {}
+    for repo_conf in repos:
+        trees = ref_map.setdefault(repo_conf['hash'], {})
+        for env in envs():
+            tgt_env = base_branch if env == 'base' else env
+            try:
+                tree = _get_tree(repo_conf['repo'], tgt_env, provider)
+                if not tree:
+                    continue
+                trees[tgt_env] = _tree_sha(tree, provider)
+                _tree_index(repo_conf, tgt_env, provider, tree)
+            except Exception as exc:
+                log.error(
+                    'Exception {0} occurred indexing {1} in gitfs remote '
+                    '{2}'.format(exc, tgt_env, repo_conf['uri'])
+                )
+    tmp = '{0}.{1}'.format(ref_map_path, os.getpid())
+    with salt.utils.fopen(tmp, 'w+b') as fp_:
+        fp_.write(salt.payload.Serial(__opts__).dumps(ref_map))
+    os.rename(tmp, ref_map_path)
+
+
+def _reap_cache():
+    '''
+    Remove the tree indexes, the blobs written out for each environment and
+    the blob hashes which are no longer referenced by any branch or tag
+    '''
+    ref_map = _ref_map()
+    if not ref_map:
+        return
+    trees = set()
+    for refs in ref_map.itervalues():
+        trees.update(refs.itervalues())
+    blobs = set()
+    for tree_sha in trees:
+        index = _read_tree_index(tree_sha)
+        if index is None:
+            # Do not throw away what might still be referenced
+            return
+        blobs.update(item[0] for item in index['files'].itervalues())
+
+    tree_dir = os.path.join(__opts__['cachedir'], 'gitfs/trees')
+    if os.path.isdir(tree_dir):
+        for fn_ in os.listdir(tree_dir):
+            if fn_.split('.', 1)[0] not in trees:
+                try:
+                    os.remove(os.path.join(tree_dir, fn_))
+                except OSError:
+                    pass
+
+    salt.fileserver.reap_hash_store(
+        os.path.join(__opts__['cachedir'], 'gitfs/blob_hashes'), blobs
+    )
+
+    hash_base = os.path.join(__opts__['cachedir'], 'gitfs/hash')
+    refs_base = os.path.join(__opts__['cachedir'], 'gitfs/refs')
+    suffix = '.hash.blob_sha1'
+    for root, dirs, files in os.walk(hash_base, topdown=False):
+        for fn_ in files:
+            path = os.path.join(root, fn_)
+            if fn_.endswith(suffix):
+                try:
+                    with salt.utils.fopen(path, 'r') as fp_:
+                        if fp_.read() in blobs:
+                            continue
+                except (IOError, OSError):
+                    continue
+                rel = os.path.relpath(path, hash_base)[:-len(suffix)]
+                for stale in (path, os.path.join(refs_base, rel)):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+            elif '.hash.' in fn_:
+                # Hashes cached per path by older versions
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if not os.listdir(root) and root != hash_base:
+            os.rmdir(root)
+
+
+def _write_blob(repo, provider, blob_sha, fp_):
+    '''
+    Write the contents of a blob to a file object
+    '''
+    if provider == 'gitpython':
+        git.Blob(repo, binascii.unhexlify(blob_sha)).stream_data(fp_)
+    elif provider == 'pygit2':
+        fp_.write(repo[blob_sha].data)
+    elif provider == 'dulwich':
+        fp_.write(repo.get_object(blob_sha).as_raw_string())
+
+
+def _index_paths(paths, root, mountpoint):
+    '''
+    Return the paths below the root, relative to it and under the mountpoint
+    '''
+    root = root.strip(os.path.sep)
+    ret = set()
+    for path in paths:
+        if root:
+            if not path.startswith(root + os.path.sep):
+                continue
+            path = path[len(root) + 1:]
+        ret.add(os.path.join(mountpoint, path))
+    return ret
+
+
 def find_file(path, tgt_env='base', **kwargs):
     '''
     Find the first file to match the path and ref, read the file out of git
@@ -973,42 +1360,14 @@ def find_file(path, tgt_env='base', **kwargs):
         if root:
             repo_path = os.path.join(root, repo_path)
 
-        if provider == 'gitpython':
-            tree = _get_tree_gitpython(repo, tgt_env)
-            if not tree:
-                # Branch/tag/SHA not found in repo, try the next
-                continue
-            try:
-                blob = tree / repo_path
-            except KeyError:
-                continue
-            blob_hexsha = blob.hexsha
-
-        elif provider == 'pygit2':
-            tree = _get_tree_pygit2(repo, tgt_env)
-            if not tree:
-                # Branch/tag/SHA not found in repo, try the next
-                continue
-            try:
-                blob = repo[tree[repo_path].oid]
-            except KeyError:
-                continue
-            blob_hexsha = blob.hex
-
-        elif provider == 'dulwich':
-            prefix_dirs, _, filename = repo_path.rpartition(os.path.sep)
-            tree = _get_tree_dulwich(repo, tgt_env)
-            tree = _dulwich_walk_tree(repo, tree, prefix_dirs)
-            if not isinstance(tree, dulwich.objects.Tree):
-                # Branch/tag/SHA not found in repo, try the next
-                continue
-            try:
-                # Referencing the path in the tree returns a tuple, the
-                # second element of which is the object ID of the blob
-                blob = repo.get_object(tree[filename][1])
-            except KeyError:
-                continue
-            blob_hexsha = blob.sha().hexdigest()
+        index = _tree_index(repo_conf, tgt_env, provider)
+        if index is None:
+            # Branch/tag/SHA not found in repo, try the next
+            continue
+        try:
+            blob_hexsha = index['files'][repo_path][0]
+        except KeyError:
+            continue
 
         salt.fileserver.wait_lock(lk_fn, dest)
         if os.path.isfile(blobshadest) and os.path.isfile(dest):
@@ -1017,6 +1376,7 @@ def find_file(path, tgt_env='base', **kwargs):
                 if sha == blob_hexsha:
                     fnd['rel'] = path
                     fnd['path'] = dest
+                    fnd['blob'] = blob_hexsha
                     return fnd
         with salt.utils.fopen(lk_fn, 'w+') as fp_:
             fp_.write('')
@@ -1026,12 +1386,7 @@ def find_file(path, tgt_env='base', **kwargs):
             except Exception:
                 pass
         with salt.utils.fopen(dest, 'w+') as fp_:
-            if provider == 'gitpython':
-                blob.stream_data(fp_)
-            elif provider == 'pygit2':
-                fp_.write(blob.data)
-            elif provider == 'dulwich':
-                fp_.write(blob.as_raw_string())
+            _write_blob(repo, provider, blob_hexsha, fp_)
         with salt.utils.fopen(blobshadest, 'w+') as fp_:
             fp_.write(blob_hexsha)
         try:
@@ -1040,6 +1395,7 @@ def find_file(path, tgt_env='base', **kwargs):
             pass
         fnd['rel'] = path
         fnd['path'] = dest
+        fnd['blob'] = blob_hexsha
         return fnd
     return fnd
 
@@ -1089,28 +1445,17 @@ def file_hash(load, fnd):
     if 'path' not in load or 'saltenv' not in load:
         return ''
     ret = {'hash_type': __opts__['hash_type']}
-    short = load['saltenv']
-    base_branch = __opts__['gitfs_base']
-    if short == 'base':
-        short = base_branch
-    relpath = fnd['rel']
-    path = fnd['path']
-    hashdest = os.path.join(__opts__['cachedir'],
-                            'gitfs/hash',
-                            short,
-                            '{0}.hash.{1}'.format(relpath,
-                                                  __opts__['hash_type']))
-    if not os.path.isfile(hashdest):
-        with salt.utils.fopen(path, 'rb') as fp_:
-            ret['hsum'] = getattr(hashlib, __opts__['hash_type'])(
-                fp_.read()).hexdigest()
-        with salt.utils.fopen(hashdest, 'w+') as fp_:
-            fp_.write(ret['hsum'])
-        return ret
-    else:
-        with salt.utils.fopen(hashdest, 'rb') as fp_:
-            ret['hsum'] = fp_.read()
-        return ret
+    if 'blob' not in fnd:
+        fnd = find_file(fnd['rel'], load['saltenv'])
+        if not fnd['path']:
+            return ''
+    ret['hsum'] = salt.fileserver.blob_hash(
+        __opts__,
+        os.path.join(__opts__['cachedir'], 'gitfs/blob_hashes'),
+        fnd['blob'],
+        fnd['path']
+    )
+    return ret
 
 
 def _file_lists(load, form):
@@ -1184,120 +1529,17 @@ def _get_file_list(load):
         load['saltenv'] = base_branch
     ret = set()
     for repo_conf in init():
-        repo = repo_conf['repo']
         root = repo_conf['root'] if repo_conf['root'] is not None \
             else gitfs_root
         mountpoint = repo_conf['mountpoint'] \
             if repo_conf['mountpoint'] is not None \
             else gitfs_mountpoint
-
-        if provider == 'gitpython':
-            ret.update(
-                _file_list_gitpython(repo, load['saltenv'], root, mountpoint)
-            )
-        elif provider == 'pygit2':
-            ret.update(
-                _file_list_pygit2(repo, load['saltenv'], root, mountpoint)
-            )
-        elif provider == 'dulwich':
-            ret.update(
-                _file_list_dulwich(repo, load['saltenv'], root, mountpoint)
-            )
+        index = _tree_index(repo_conf, load['saltenv'], provider)
+        if index is not None:
+            ret.update(_index_paths(index['files'], root, mountpoint))
     return sorted(ret)
 
 
-def _file_list_gitpython(repo, tgt, root, mountpoint):
-    '''
-    Get file list using GitPython
-    '''
-    ret = set()
-    tree = _get_tree_gitpython(repo, tgt)
-    if not tree:
-        return ret
-    if root:
-        try:
-            tree = tree / root
-        except KeyError:
-            return ret
-    for blob in tree.traverse():
-        if not isinstance(blob, git.Blob):
-            continue
-        if root:
-            path = os.path.relpath(blob.path, root)
-        else:
-            path = blob.path
-        ret.add(os.path.join(mountpoint, path))
-    return ret
-
-
-def _file_list_pygit2(repo, ref_tgt, root, mountpoint):
-    '''
-    Get file list using pygit2
-    '''
-    def _traverse(tree, repo, blobs, prefix):
-        '''
-        Traverse through a pygit2 Tree object recursively, accumulating all the
-        blob paths within it in the "blobs" list
-        '''
-        for entry in iter(tree):
-            blob = repo[entry.oid]
-            if isinstance(blob, pygit2.Blob):
-                blobs.append(os.path.join(prefix, entry.name))
-            elif isinstance(blob, pygit2.Tree):
-                _traverse(blob, repo, blobs, os.path.join(prefix, entry.name))
-    ret = set()
-    tree = _get_tree_pygit2(repo, ref_tgt)
-    if not tree:
-        return ret
-    if root:
-        try:
-            # This might need to be changed to account for a root that
-            # spans more than one directory
-            tree = repo[tree[root].oid]
-        except KeyError:
-            return ret
-        if not isinstance(tree, pygit2.Tree):
-            return ret
-    blobs = []
-    if len(tree):
-        _traverse(tree, repo, blobs, root)
-    for blob in blobs:
-        if root:
-            blob = os.path.relpath(blob, root)
-        ret.add(os.path.join(mountpoint, blob))
-    return ret
-
-
-def _file_list_dulwich(repo, ref_tgt, root, mountpoint):
-    '''
-    Get file list using dulwich
-    '''
-    def _traverse(tree, repo, blobs, prefix):
-        '''
-        Traverse through a dulwich Tree object recursively, accumulating all the
-        blob paths within it in the "blobs" list
-        '''
-        for item in tree.items():
-            obj = repo.get_object(item.sha)
-            if isinstance(obj, dulwich.objects.Blob):
-                blobs.append(os.path.join(prefix, item.path))
-            elif isinstance(obj, dulwich.objects.Tree):
-                _traverse(obj, repo, blobs, os.path.join(prefix, item.path))
-    ret = set()
-    tree = _get_tree_dulwich(repo, ref_tgt)
-    tree = _dulwich_walk_tree(repo, tree, root)
-    if not isinstance(tree, dulwich.objects.Tree):
-        return ret
-    blobs = []
-    if len(tree):
-        _traverse(tree, repo, blobs, root)
-    for blob in blobs:
-        if root:
-            blob = os.path.relpath(blob, root)
-        ret.add(os.path.join(mountpoint, blob))
-    return ret
-
-
 def file_list_emptydirs(load):
     '''
     Return a list of all empty directories on the master
@@ -1335,115 +1577,12 @@ def _get_dir_list(load):
         load['saltenv'] = base_branch
     ret = set()
     for repo_conf in init():
-        repo = repo_conf['repo']
         root = repo_conf['root'] if repo_conf['root'] is not None \
             else gitfs_root
         mountpoint = repo_conf['mountpoint'] \
             if repo_conf['mountpoint'] is not None \
             else gitfs_mountpoint
-
-        if provider == 'gitpython':
-            ret.update(
-                _dir_list_gitpython(repo, load['saltenv'], root, mountpoint)
-            )
-        elif provider == 'pygit2':
-            ret.update(
-                _dir_list_pygit2(repo, load['saltenv'], root, mountpoint)
-            )
-        elif provider == 'dulwich':
-            ret.update(
-                _dir_list_dulwich(repo, load['saltenv'], root, mountpoint)
-            )
+        index = _tree_index(repo_conf, load['saltenv'], provider)
+        if index is not None:
+            ret.update(_index_paths(index['dirs'], root, mountpoint))
     return sorted(ret)
-
-
-def _dir_list_gitpython(repo, tgt, root, mountpoint):
-    '''
-    Get list of directories using GitPython
-    '''
-    ret = set()
-    tree = _get_tree_gitpython(repo, tgt)
-    if not tree:
-        return ret
-    if root:
-        try:
-            tree = tree / root
-        except KeyError:
-            return ret
-    for blob in tree.traverse():
-        if not isinstance(blob, git.Tree):
-            continue
-        if root:
-            path = os.path.relpath(blob.path, root)
-        else:
-            path = blob.path
-        ret.add(os.path.join(mountpoint, path))
-    return ret
-
-
-def _dir_list_pygit2(repo, ref_tgt, root, mountpoint):
-    '''
-    Get a list of directories using pygit2
-    '''
-    def _traverse(tree, repo, blobs, prefix):
-        '''
-        Traverse through a pygit2 Tree object recursively, accumulating all the
-        empty directories within it in the "blobs" list
-        '''
-        for entry in iter(tree):
-            blob = repo[entry.oid]
-            if not isinstance(blob, pygit2.Tree):
-                continue
-            blobs.append(os.path.join(prefix, entry.name))
-            if len(blob):
-                _traverse(blob, repo, blobs, os.path.join(prefix, entry.name))
-    ret = set()
-    tree = _get_tree_pygit2(repo, ref_tgt)
-    if not tree:
-        return ret
-    if root:
-        try:
-            tree = repo[tree[root].oid]
-        except KeyError:
-            return ret
-        if not isinstance(tree, pygit2.Tree):
-            return ret
-    blobs = []
-    if len(tree):
-        _traverse(tree, repo, blobs, root)
-    for blob in blobs:
-        if root:
-            blob = os.path.relpath(blob, root)
-        ret.add(os.path.join(mountpoint, blob))
-    return ret
-
-
-def _dir_list_dulwich(repo, ref_tgt, root, mountpoint):
-    '''
-    Get a list of directories using pygit2
-    '''
-    def _traverse(tree, repo, blobs, prefix):
-        '''
-        Traverse through a dulwich Tree object recursively, accumulating all
-        the empty directories within it in the "blobs" list
-        '''
-        for item in tree.items():
-            obj = repo.get_object(item.sha)
-            if not isinstance(obj, dulwich.objects.Tree):
-                continue
-            blobs.append(os.path.join(prefix, item.path))
-            if len(repo.get_object(item.sha)):
-                _traverse(obj, repo, blobs, os.path.join(prefix, item.path))
-    ret = set()
-    tree = _get_tree_dulwich(repo, ref_tgt)
-    tree = _dulwich_walk_tree(repo, tree, root)
-    if not isinstance(tree, dulwich.objects.Tree):
-        return ret
-    blobs = []
-    if len(tree):
-        _traverse(tree, repo, blobs, root)
-    for blob in blobs:
-        if root:
-            blob = os.path.relpath(blob, root)
-        ret.add(os.path.join(mountpoint, blob))
-    return ret
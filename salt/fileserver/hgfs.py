@@ -46,9 +46,15 @@ except ImportError:
 import salt.utils
 import salt.fileserver
 from salt.utils.event import tagify
+from salt.utils.odict import OrderedDict
 
 log = logging.getLogger(__name__)
 
+# changeset -> path -> file node, see _manifest(), the least recently used
+# changesets are dropped past MANIFEST_CACHE_SIZE
+_MANIFESTS = OrderedDict()
+MANIFEST_CACHE_SIZE = 16
+
 # Define the module's virtual name
 __virtualname__ = 'hg'
 
@@ -149,6 +155,23 @@ def _get_ref(repo, name):
     return False
 
 
+def _manifest(repo, rev):
+    '''
+    Return a dict of the path of each file in a changeset to its file node.
+    The node of a file is the same in every changeset, and so every
+    environment, holding the same revision of the file.
+    '''
+    manifest = _MANIFESTS.pop(rev, None)
+    if manifest is None:
+        manifest = dict(
+            (item[4], item[0]) for item in repo.manifest(rev=rev)
+        )
+    _MANIFESTS[rev] = manifest
+    while len(_MANIFESTS) > MANIFEST_CACHE_SIZE:
+        _MANIFESTS.popitem(last=False)
+    return manifest
+
+
 def init():
     '''
     Return a list of hglib objects for the various hgfs remotes
@@ -258,7 +281,8 @@ def purge_cache():
         except ValueError:
             pass
     remove_dirs = [os.path.join(bp_, rdir) for rdir in remove_dirs
-                   if rdir not in ('hash', 'refs', 'envs.p', 'remote_map.txt')]
+                   if rdir not in ('hash', 'refs', 'blob_hashes', 'envs.p',
+                                   'remote_map.txt')]
     if remove_dirs:
         for rdir in remove_dirs:
             shutil.rmtree(rdir)
@@ -310,14 +334,65 @@ def update():
     if __opts__.get('fileserver_events', False):
         event = salt.utils.event.MasterEvent(__opts__['sock_dir'])
         event.fire_event(data, tagify(['hgfs', 'update'], prefix='fileserver'))
-    try:
-        salt.fileserver.reap_fileserver_cache_dir(
-            os.path.join(__opts__['cachedir'], 'hgfs/hash'),
-            find_file
-        )
-    except (IOError, OSError):
-        # Hash file won't exist if no files have yet been served up
-        pass
+    if data['changed']:
+        try:
+            _reap_cache()
+        except (IOError, OSError) as exc:
+            log.error('Unable to clean the hgfs cache: {0}'.format(exc))
+
+
+def _reap_cache():
+    '''
+    Remove the files written out for each environment and the file hashes
+    which are no longer referenced by any branch, bookmark or tag
+    '''
+    revs = set()
+    nodes = set()
+    for repo_conf in init():
+        repo = repo_conf['repo']
+        repo.open()
+        try:
+            for ref in _all_branches(repo) + _all_bookmarks(repo) \
+                    + _all_tags(repo):
+                revs.add(ref[2])
+                nodes.update(_manifest(repo, ref[2]).itervalues())
+        finally:
+            repo.close()
+    for rev in list(_MANIFESTS):
+        if rev not in revs:
+            del _MANIFESTS[rev]
+
+    salt.fileserver.reap_hash_store(
+        os.path.join(__opts__['cachedir'], 'hgfs/blob_hashes'), nodes
+    )
+
+    hash_base = os.path.join(__opts__['cachedir'], 'hgfs/hash')
+    refs_base = os.path.join(__opts__['cachedir'], 'hgfs/refs')
+    suffix = '.hash.blob_sha1'
+    for root, dirs, files in os.walk(hash_base, topdown=False):
+        for fn_ in files:
+            path = os.path.join(root, fn_)
+            if fn_.endswith(suffix):
+                try:
+                    with salt.utils.fopen(path, 'r') as fp_:
+                        if fp_.read() in revs:
+                            continue
+                except (IOError, OSError):
+                    continue
+                rel = os.path.relpath(path, hash_base)[:-len(suffix)]
+                for stale in (path, os.path.join(refs_base, rel)):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+            elif '.hash.' in fn_:
+                # Hashes cached per path by older versions
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if not os.listdir(root) and root != hash_base:
+            os.rmdir(root)
 
 
 def envs(ignore_cache=False):
@@ -405,6 +480,10 @@ def find_file(path, tgt_env='base', **kwargs):
             # Branch or tag not found in repo, try the next
             repo.close()
             continue
+        node = _manifest(repo, ref[2]).get(repo_path)
+        if node is None:
+            repo.close()
+            continue
         salt.fileserver.wait_lock(lk_fn, dest)
         if os.path.isfile(blobshadest) and os.path.isfile(dest):
             with salt.utils.fopen(blobshadest, 'r') as fp_:
@@ -412,6 +491,7 @@ def find_file(path, tgt_env='base', **kwargs):
                 if sha == ref[2]:
                     fnd['rel'] = path
                     fnd['path'] = dest
+                    fnd['blob'] = node
                     repo.close()
                     return fnd
         try:
@@ -434,6 +514,7 @@ def find_file(path, tgt_env='base', **kwargs):
             pass
         fnd['rel'] = path
         fnd['path'] = dest
+        fnd['blob'] = node
         repo.close()
         return fnd
     return fnd
@@ -484,28 +565,17 @@ def file_hash(load, fnd):
     if 'path' not in load or 'saltenv' not in load:
         return ''
     ret = {'hash_type': __opts__['hash_type']}
-    short = load['saltenv']
-    base_branch = __opts__['hgfs_base']
-    if short == 'base':
-        short = base_branch
-    relpath = fnd['rel']
-    path = fnd['path']
-    hashdest = os.path.join(__opts__['cachedir'],
-                            'hgfs/hash',
-                            short,
-                            '{0}.hash.{1}'.format(relpath,
-                                                  __opts__['hash_type']))
-    if not os.path.isfile(hashdest):
-        with salt.utils.fopen(path, 'rb') as fp_:
-            ret['hsum'] = getattr(hashlib, __opts__['hash_type'])(
-                fp_.read()).hexdigest()
-        with salt.utils.fopen(hashdest, 'w+') as fp_:
-            fp_.write(ret['hsum'])
-        return ret
-    else:
-        with salt.utils.fopen(hashdest, 'rb') as fp_:
-            ret['hsum'] = fp_.read()
-        return ret
+    if 'blob' not in fnd:
+        fnd = find_file(fnd['rel'], load['saltenv'])
+        if not fnd['path']:
+            return ''
+    ret['hsum'] = salt.fileserver.blob_hash(
+        __opts__,
+        os.path.join(__opts__['cachedir'], 'hgfs/blob_hashes'),
+        fnd['blob'],
+        fnd['path']
+    )
+    return ret
 
 
 def _file_lists(load, form):
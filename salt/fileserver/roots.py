@@ -12,11 +12,18 @@ import logging
 
 # Import salt libs
 import salt.fileserver
+import salt.payload
 import salt.utils
+import salt.utils.fsindex
 from salt.utils.event import tagify
 
 log = logging.getLogger(__name__)
 
+# saltenv -> FileIndex, only populated in the process running update()
+_INDEXES = {}
+# saltenv -> (stat key, file lists) of the last snapshot read
+_SNAPSHOTS = {}
+
 
 def find_file(path, saltenv='base', env=None, **kwargs):
     '''
@@ -122,22 +129,39 @@ def update():
         with salt.utils.fopen(mtime_map_path, 'rb') as fp_:
             for line in fp_:
                 file_path, mtime = line.split(':', 1)
-                old_mtime_map[file_path] = mtime
-
-    # generate the new map
-    new_mtime_map = salt.fileserver.generate_mtime_map(__opts__['file_roots'])
+                old_mtime_map[file_path] = mtime.strip()
+
+    if __opts__.get('fileserver_roots_index', False):
+        new_mtime_map = {}
+        for index in _indexes().itervalues():
+            index.refresh()
+            new_mtime_map.update(index.mtime_map())
+        # The stored map only has the string form of the mtimes
+        new_mtime_map = dict((file_path, '{0}'.format(mtime))
+                             for file_path, mtime in new_mtime_map.iteritems())
+        data['changed'] = old_mtime_map != new_mtime_map
+        if not data['changed'] and os.path.exists(mtime_map_path):
+            new_mtime_map = None
+    else:
+        # generate the new map
+        new_mtime_map = salt.fileserver.generate_mtime_map(
+            __opts__['file_roots']
+        )
 
-    # compare the maps, set changed to the return value
-    data['changed'] = salt.fileserver.diff_mtime_map(old_mtime_map, new_mtime_map)
+        # compare the maps, set changed to the return value
+        data['changed'] = salt.fileserver.diff_mtime_map(
+            old_mtime_map, new_mtime_map
+        )
 
     # write out the new map
     mtime_map_path_dir = os.path.dirname(mtime_map_path)
     if not os.path.exists(mtime_map_path_dir):
         os.makedirs(mtime_map_path_dir)
-    with salt.utils.fopen(mtime_map_path, 'w') as fp_:
-        for file_path, mtime in new_mtime_map.iteritems():
-            fp_.write('{file_path}:{mtime}\n'.format(file_path=file_path,
-                                                     mtime=mtime))
+    if new_mtime_map is not None:
+        with salt.utils.fopen(mtime_map_path, 'w') as fp_:
+            for file_path, mtime in new_mtime_map.iteritems():
+                fp_.write('{file_path}:{mtime}\n'.format(file_path=file_path,
+                                                         mtime=mtime))
 
     if __opts__.get('fileserver_events', False):
         # if there is a change, fire an event
@@ -190,7 +214,7 @@ def file_hash(load, fnd):
                     except OSError:
                         pass
                     return file_hash(load, fnd)
-                if os.path.getmtime(path) == mtime:
+                if '{0}'.format(os.path.getmtime(path)) == mtime:
                     # check if mtime changed
                     ret['hsum'] = hsum
                     return ret
@@ -216,6 +240,39 @@ def file_hash(load, fnd):
     return ret
 
 
+def _indexes():
+    '''
+    Return the file indexes of the environments, starting the missing ones
+    '''
+    for saltenv, roots in __opts__['file_roots'].iteritems():
+        roots = [os.path.normpath(root) for root in roots]
+        if saltenv in _INDEXES and _INDEXES[saltenv].roots == roots:
+            continue
+        index = salt.utils.fsindex.FileIndex(__opts__, saltenv, roots)
+        index.start()
+        _INDEXES[saltenv] = index
+    return _INDEXES
+
+
+def _read_snapshot(saltenv):
+    '''
+    Return the file lists from the snapshot written by the file index, or
+    None if there is no snapshot
+    '''
+    list_cache = salt.utils.fsindex.snapshot_path(__opts__, 'roots', saltenv)
+    try:
+        with salt.utils.fopen(list_cache, 'rb') as fp_:
+            stat = os.fstat(fp_.fileno())
+            key = (stat.st_ino, stat.st_mtime, stat.st_size)
+            if saltenv in _SNAPSHOTS and _SNAPSHOTS[saltenv][0] == key:
+                return _SNAPSHOTS[saltenv][1]
+            data = salt.payload.Serial(__opts__).loads(fp_.read())
+    except (IOError, OSError, ValueError):
+        return None
+    _SNAPSHOTS[saltenv] = (key, data)
+    return data
+
+
 def _file_lists(load, form):
     '''
     Return a dict containing the file lists for files, dirs, emtydirs and symlinks
@@ -230,6 +287,11 @@ def _file_lists(load, form):
     if load['saltenv'] not in __opts__['file_roots']:
         return []
 
+    if __opts__.get('fileserver_roots_index', False):
+        snapshot = _read_snapshot(load['saltenv'])
+        if snapshot is not None:
+            return snapshot.get(form, [])
+
     list_cachedir = os.path.join(__opts__['cachedir'], 'file_lists/roots')
     if not os.path.isdir(list_cachedir):
         try:
@@ -7,6 +7,8 @@ used to manage salt keys directly without interfacing with the CLI.
 # Import python libs
 from __future__ import print_function
 import os
+import time
+import errno
 import shutil
 import fnmatch
 import hashlib
@@ -17,6 +19,10 @@ import salt.utils
 import salt.utils.event
 from salt.utils.event import tagify
 
+# The keys in each key directory read by this process, path ->
+# (directory stat, time read, sorted keys)
+_KEY_INDEX = {}
+
 
 class KeyCLI(object):
     '''
@@ -329,17 +335,116 @@ class Key(object):
                                         'minions_rejected')
         return minions_accepted, minions_pre, minions_rejected
 
-    def check_minion_cache(self):
+    def check_minion_cache(self, minions=None):
         '''
-        Check the minion cache to make sure that old minion data is cleared
+        Check the minion cache to make sure that old minion data is cleared,
+        only the cache of the passed minions is checked if minions are passed
         '''
         m_cache = os.path.join(self.opts['cachedir'], 'minions')
         if not os.path.isdir(m_cache):
             return
-        keys = self.list_keys()
-        for minion in os.listdir(m_cache):
-            if minion not in keys['minions']:
-                shutil.rmtree(os.path.join(m_cache, minion))
+        keys = set(self.list_keys()['minions'])
+        if minions is None:
+            minions = os.listdir(m_cache)
+        for minion in minions:
+            if minion not in keys:
+                shutil.rmtree(os.path.join(m_cache, minion), True)
+
+    def _list_dir(self, dir_):
+        '''
+        Return the sorted keys in a key directory. The keys are read from the
+        index unless the directory changed since it was read.
+        '''
+        stat = os.stat(dir_)
+        stat = (stat.st_mtime, stat.st_ino)
+        cached = _KEY_INDEX.get(dir_)
+        # A change within the second the directory was read does not always
+        # show in the mtime
+        if cached and cached[0] == stat and cached[1] - stat[0] > 1:
+            return list(cached[2])
+        read = time.time()
+        keys = [fn_ for fn_ in salt.utils.isorted(os.listdir(dir_))
+                if os.path.isfile(os.path.join(dir_, fn_))]
+        _KEY_INDEX[dir_] = (stat, read, keys)
+        return list(keys)
+
+    def _move_keys(self, keys, src, dst):
+        '''
+        Move keys from the src to the dst key directory, the directories are
+        synced once for all of the keys. Returns the keys which were moved.
+        '''
+        moved = []
+        for key in keys:
+            src_path = os.path.join(self.opts['pki_dir'], src, key)
+            dst_path = os.path.join(self.opts['pki_dir'], dst, key)
+            try:
+                try:
+                    os.rename(src_path, dst_path)
+                except OSError as exc:
+                    if exc.errno != errno.EXDEV:
+                        raise
+                    shutil.move(src_path, dst_path)
+                moved.append(key)
+            except (IOError, OSError):
+                pass
+        if moved:
+            self._sync_dirs(src, dst)
+        return moved
+
+    def _remove_keys(self, keys, status):
+        '''
+        Remove keys from a key directory, the directory is synced once for
+        all of the keys. Returns the keys which were removed.
+        '''
+        removed = []
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.opts['pki_dir'], status, key))
+                removed.append(key)
+            except (IOError, OSError):
+                pass
+        if removed:
+            self._sync_dirs(status)
+        return removed
+
+    def _sync_dirs(self, *keydirs):
+        '''
+        Flush the changes to the key directories to disk
+        '''
+        for keydir in keydirs:
+            try:
+                fd_ = os.open(os.path.join(self.opts['pki_dir'], keydir),
+                              os.O_RDONLY)
+            except OSError:
+                # Directories can not be opened on every platform
+                continue
+            try:
+                os.fsync(fd_)
+            except OSError:
+                pass
+            finally:
+                os.close(fd_)
+
+    def _fire_key_events(self, act, keys):
+        '''
+        Fire the events for the keys which changed. One event per key is
+        fired, unless key_events_batch is set, then a single event lists the
+        ids of all of the keys.
+        '''
+        if not keys:
+            return
+        tag = tagify(prefix='key')
+        if self.opts.get('key_events_batch'):
+            eload = {'result': True,
+                     'act': act,
+                     'ids': list(keys)}
+            self.event.fire_event(eload, tag)
+            return
+        for key in keys:
+            eload = {'result': True,
+                     'act': act,
+                     'id': key}
+            self.event.fire_event(eload, tag)
 
     def check_master(self):
         '''
@@ -404,10 +509,7 @@ class Key(object):
         acc, pre, rej = self._check_minions_directories()
         ret = {}
         for dir_ in acc, pre, rej:
-            ret[os.path.basename(dir_)] = []
-            for fn_ in salt.utils.isorted(os.listdir(dir_)):
-                if os.path.isfile(os.path.join(dir_, fn_)):
-                    ret[os.path.basename(dir_)].append(fn_)
+            ret[os.path.basename(dir_)] = self._list_dir(dir_)
         return ret
 
     def all_keys(self):
@@ -425,20 +527,11 @@ class Key(object):
         acc, pre, rej = self._check_minions_directories()
         ret = {}
         if match.startswith('acc'):
-            ret[os.path.basename(acc)] = []
-            for fn_ in salt.utils.isorted(os.listdir(acc)):
-                if os.path.isfile(os.path.join(acc, fn_)):
-                    ret[os.path.basename(acc)].append(fn_)
+            ret[os.path.basename(acc)] = self._list_dir(acc)
         elif match.startswith('pre') or match.startswith('un'):
-            ret[os.path.basename(pre)] = []
-            for fn_ in salt.utils.isorted(os.listdir(pre)):
-                if os.path.isfile(os.path.join(pre, fn_)):
-                    ret[os.path.basename(pre)].append(fn_)
+            ret[os.path.basename(pre)] = self._list_dir(pre)
         elif match.startswith('rej'):
-            ret[os.path.basename(rej)] = []
-            for fn_ in salt.utils.isorted(os.listdir(rej)):
-                if os.path.isfile(os.path.join(rej, fn_)):
-                    ret[os.path.basename(rej)].append(fn_)
+            ret[os.path.basename(rej)] = self._list_dir(rej)
         elif match.startswith('all'):
             return self.all_keys()
         return ret
@@ -483,25 +576,12 @@ class Key(object):
         keydirs = ['minions_pre']
         if include_rejected:
             keydirs.append('minions_rejected')
+        accepted = []
         for keydir in keydirs:
-            for key in matches.get(keydir, []):
-                try:
-                    shutil.move(
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                keydir,
-                                key),
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions',
-                                key)
-                            )
-                    eload = {'result': True,
-                             'act': 'accept',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
-                except (IOError, OSError):
-                    pass
+            accepted.extend(
+                self._move_keys(matches.get(keydir, []), keydir, 'minions')
+            )
+        self._fire_key_events('accept', accepted)
         return (
             self.name_match(match) if match is not None
             else self.dict_match(matches)
@@ -512,24 +592,9 @@ class Key(object):
         Accept all keys in pre
         '''
         keys = self.list_keys()
-        for key in keys['minions_pre']:
-            try:
-                shutil.move(
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_pre',
-                            key),
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions',
-                            key)
-                        )
-                eload = {'result': True,
-                         'act': 'accept',
-                         'id': key}
-                self.event.fire_event(eload, tagify(prefix='key'))
-            except (IOError, OSError):
-                pass
+        accepted = self._move_keys(keys['minions_pre'], 'minions_pre',
+                                   'minions')
+        self._fire_key_events('accept', accepted)
         return self.list_keys()
 
     def delete_key(self, match=None, match_dict=None):
@@ -543,17 +608,11 @@ class Key(object):
             matches = match_dict
         else:
             matches = {}
+        deleted = []
         for status, keys in matches.items():
-            for key in keys:
-                try:
-                    os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                    eload = {'result': True,
-                             'act': 'delete',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
-                except (OSError, IOError):
-                    pass
-        self.check_minion_cache()
+            deleted.extend(self._remove_keys(keys, status))
+        self._fire_key_events('delete', deleted)
+        self.check_minion_cache(deleted)
         salt.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return (
             self.name_match(match) if match is not None
@@ -564,16 +623,10 @@ class Key(object):
         '''
         Delete all keys
         '''
+        deleted = []
         for status, keys in self.list_keys().items():
-            for key in keys:
-                try:
-                    os.remove(os.path.join(self.opts['pki_dir'], status, key))
-                    eload = {'result': True,
-                             'act': 'delete',
-                             'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
-                except (OSError, IOError):
-                    pass
+            deleted.extend(self._remove_keys(keys, status))
+        self._fire_key_events('delete', deleted)
         self.check_minion_cache()
         salt.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return self.list_keys()
@@ -592,26 +645,14 @@ class Key(object):
         keydirs = ['minions_pre']
         if include_accepted:
             keydirs.append('minions')
+        rejected = []
         for keydir in keydirs:
-            for key in matches.get(keydir, []):
-                try:
-                    shutil.move(
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                keydir,
-                                key),
-                            os.path.join(
-                                self.opts['pki_dir'],
-                                'minions_rejected',
-                                key)
-                            )
-                    eload = {'result': True,
-                            'act': 'reject',
-                            'id': key}
-                    self.event.fire_event(eload, tagify(prefix='key'))
-                except (IOError, OSError):
-                    pass
-        self.check_minion_cache()
+            rejected.extend(
+                self._move_keys(
+                    matches.get(keydir, []), keydir, 'minions_rejected')
+            )
+        self._fire_key_events('reject', rejected)
+        self.check_minion_cache(rejected)
         salt.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return (
             self.name_match(match) if match is not None
@@ -623,25 +664,10 @@ class Key(object):
         Reject all keys in pre
         '''
         keys = self.list_keys()
-        for key in keys['minions_pre']:
-            try:
-                shutil.move(
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_pre',
-                            key),
-                        os.path.join(
-                            self.opts['pki_dir'],
-                            'minions_rejected',
-                            key)
-                        )
-                eload = {'result': True,
-                         'act': 'reject',
-                         'id': key}
-                self.event.fire_event(eload, tagify(prefix='key'))
-            except (IOError, OSError):
-                pass
-        self.check_minion_cache()
+        rejected = self._move_keys(keys['minions_pre'], 'minions_pre',
+                                   'minions_rejected')
+        self._fire_key_events('reject', rejected)
+        self.check_minion_cache(rejected)
         salt.crypt.dropfile(self.opts['cachedir'], self.opts['user'])
         return self.list_keys()
 
@@ -11,10 +11,14 @@ import salt
 import logging
 import tempfile
 import time
+import Queue
+import threading
+import collections
 
 # Import salt libs
 from salt.exceptions import LoaderError
 from salt.template import check_render_pipe_str
+import salt.utils.atomicfile
 from salt.utils.decorators import Depends
 
 log = logging.getLogger(__name__)
@@ -22,6 +26,12 @@ log = logging.getLogger(__name__)
 SALT_BASE_PATH = os.path.dirname(salt.__file__)
 LOADED_BASE_NAME = 'salt.loaded'
 
+# The grains the modules rely on
+ESSENTIAL_GRAINS = ('os', 'os_family', 'kernel')
+
+# Changes on every boot, the cached grains are dropped when it changed
+BOOT_ID_PATH = '/proc/sys/kernel/random/boot_id'
+
 # Because on the cloud drivers we do `from salt.cloud.libcloudfuncs import *`
 # which simplifies code readability, it adds some unsupported functions into
 # the driver's module scope.
@@ -37,6 +47,24 @@ LIBCLOUD_FUNCS_NOT_SUPPORTED = (
 )
 
 
+def _core_grain(key):
+    '''
+    Tell if the grains function is one of the core grains module
+    '''
+    return key.split('.', 1)[0] == 'core'
+
+
+def _boot_id():
+    '''
+    Return the id of the current boot, None where it is not known
+    '''
+    try:
+        with salt.utils.fopen(BOOT_ID_PATH, 'r') as fp_:
+            return fp_.read().strip()
+    except (IOError, OSError):
+        return None
+
+
 def _create_loader(
         opts,
         ext_type,
@@ -288,10 +316,11 @@ def render(opts, functions, states=None):
     return rend
 
 
-def grains(opts):
+def grains(opts, stale=False, timings=None):
     '''
     Return the functions for the dynamic grains and the values for the static
-    grains.
+    grains. Pass stale to use the cached grains regardless of their age, and
+    a dict as timings to get the seconds each grains function took.
     '''
     if opts.get('skip_grains', False):
         return {}
@@ -319,7 +348,7 @@ def grains(opts):
         opts['grains'] = {}
 
     load = _create_loader(opts, 'grains', 'grain')
-    grains_info = load.gen_grains()
+    grains_info = load.gen_grains(stale=stale, timings=timings)
     grains_info.update(opts['grains'])
     return grains_info
 
@@ -991,70 +1020,78 @@ class Loader(object):
             funcs[key[key.rindex('.')] + 1:] = fun
         return funcs
 
-    def gen_grains(self):
+    def gen_grains(self, stale=False, timings=None):
         '''
         Read the grains directory and execute all of the public callable
         members. Then verify that the returns are python dict's and return
         a dict containing all of the returned values.
+
+        With ``grains_cache`` enabled the return of each function is cached
+        for its ``grains_cache_ttl``, only the functions whose return expired
+        are executed again. Pass stale to use every cached return regardless
+        of its age.
+
+        The functions are executed ``grains_parallel`` at a time. Pass a dict
+        as timings to have it filled with the seconds each one took.
         '''
+        cache = None
         if self.opts.get('grains_cache', False):
             cfn = os.path.join(
             self.opts['cachedir'],
             '{0}.cache.p'.format('grains')
             )
-            if os.path.isfile(cfn):
-                grains_cache_age = int(time.time() - os.path.getmtime(cfn))
-                if self.opts.get('grains_cache_expiration', 300) >= grains_cache_age and not \
-                    self.opts.get('refresh_grains_cache', False):
-                    log.debug('Retrieving grains from cache')
-                    try:
-                        with salt.utils.fopen(cfn, 'rb') as fp_:
-                            cached_grains = self.serial.load(fp_)
-                        return cached_grains
-                    except (IOError, OSError):
-                        pass
-                else:
-                    log.debug('Grains cache last modified {0} seconds ago and cache expiration is set to {1}. '
-                         'Grains cache expired. Refreshing.'.format(
-                    grains_cache_age, self.opts.get('grains_cache_expiration', 300)))
-            else:
-                log.debug('Grains cache file does not exist.')
-        grains_data = {}
+            cache = self._load_grains_cache(cfn)
+        now = time.time()
+        changed = False
         funcs = self.gen_functions()
-        for key, fun in funcs.items():
-            if key[key.index('.') + 1:] == 'core':
-                continue
-            try:
-                ret = fun()
-            except Exception:
-                log.critical(
-                    'Failed to load grains defined in grain file {0} in '
-                    'function {1}, error:\n'.format(
-                        key, fun
-                    ),
-                    exc_info=True
-                )
-                continue
-            if not isinstance(ret, dict):
-                continue
-            grains_data.update(ret)
-        for key, fun in funcs.items():
-            if key[key.index('.') + 1:] != 'core':
-                continue
-            ret = fun()
-            if not isinstance(ret, dict):
+        # The core grains are applied last, they win over the others
+        order = [key for key in funcs if not _core_grain(key)]
+        order.extend(key for key in funcs if _core_grain(key))
+        rets = {}
+        run = []
+        for key in order:
+            if cache is not None and key in cache:
+                cached, ret = cache[key]
+                if stale or now - cached < self._grain_ttl(key):
+                    rets[key] = ret
+                    continue
+            run.append(key)
+        for key, ret in self._run_grains(funcs, run, timings).items():
+            if ret is None:
+                if cache is not None and key in cache:
+                    # Timed out, fall back to what it returned before
+                    rets[key] = cache[key][1]
                 continue
-            grains_data.update(ret)
+            rets[key] = ret
+            if cache is not None:
+                cache[key] = (now, ret)
+                changed = True
+        grains_data = {}
+        for key in order:
+            if key in rets:
+                grains_data.update(rets[key])
+        missing = [grain for grain in ESSENTIAL_GRAINS
+                   if grain not in grains_data]
+        if missing:
+            log.error(
+                'The essential grains {0} are missing, the modules relying '
+                'on them will fail to load'.format(', '.join(missing))
+            )
         # Write cache if enabled
-        if self.opts.get('grains_cache', False):
+        if changed:
             cumask = os.umask(077)
             try:
                 if salt.utils.is_windows():
                     # Make sure cache file isn't read-only
                     self.state.functions['cmd.run']('attrib -R "{0}"'.format(cfn), output_loglevel='quiet')
-                with salt.utils.fopen(cfn, 'w+b') as fp_:
+                # The minion refreshes the grains in the background, keep
+                # the cache readable while it is written
+                with salt.utils.atomicfile.atomic_open(cfn, 'w+b') as fp_:
                     try:
-                        self.serial.dump(grains_data, fp_)
+                        self.serial.dump(
+                            {'version': 2, 'boot': _boot_id(),
+                             'funcs': cache},
+                            fp_)
                     except TypeError:
                         # Can't serialize pydsl
                         pass
@@ -1063,3 +1100,116 @@ class Loader(object):
                 log.error(msg.format(cfn))
             os.umask(cumask)
         return grains_data
+
+    def _run_grains(self, funcs, keys, timings=None):
+        '''
+        Execute the named grains functions, up to grains_parallel of them at
+        a time, and return the dict each one returned. A function which does
+        not return within grains_timeout seconds is left running and returns
+        None, but for the core grains which the modules rely on, those are
+        always waited for.
+        '''
+        if timings is None:
+            timings = {}
+        workers = max(int(self.opts.get('grains_parallel', 8) or 1), 1)
+        timeout = self.opts.get('grains_timeout', 60)
+        results = Queue.Queue()
+
+        def _run(key):
+            start = time.time()
+            try:
+                ret = (funcs[key](), None)
+            except Exception:
+                ret = (None, sys.exc_info())
+            results.put((key, ret, time.time() - start))
+
+        rets = {}
+        pending = collections.deque(keys)
+        # key -> the time it is given up on
+        active = {}
+        while pending or active:
+            while pending and len(active) < workers:
+                key = pending.popleft()
+                if workers == 1:
+                    # Run in this thread, without a timeout
+                    active[key] = None
+                    _run(key)
+                    continue
+                if timeout and not _core_grain(key):
+                    active[key] = time.time() + timeout
+                else:
+                    active[key] = None
+                thread = threading.Thread(target=_run, args=(key,))
+                thread.daemon = True
+                thread.start()
+            deadlines = [left for left in active.values() if left is not None]
+            wait = None
+            if deadlines:
+                wait = max(min(deadlines) - time.time(), 0)
+            try:
+                key, (ret, exc_info), spent = results.get(True, wait)
+            except Queue.Empty:
+                now = time.time()
+                for key, left in active.items():
+                    if left is not None and left <= now:
+                        log.error(
+                            'Grains function {0} did not return within {1} '
+                            'seconds, leaving it behind'.format(key, timeout)
+                        )
+                        del active[key]
+                        timings[key] = timeout
+                        rets[key] = None
+                continue
+            if key not in active:
+                # Returned after it was left behind
+                continue
+            del active[key]
+            timings[key] = spent
+            if exc_info is not None:
+                log.critical(
+                    'Failed to load grains defined in grain file {0} in '
+                    'function {1}, error:\n'.format(
+                        key, funcs[key]
+                    ),
+                    exc_info=exc_info
+                )
+                continue
+            if isinstance(ret, dict):
+                rets[key] = ret
+        return rets
+
+    def _load_grains_cache(self, cfn):
+        '''
+        Return the cached returns of the grains functions, keyed by the
+        function and holding the time of the return and the return
+        '''
+        if self.opts.get('refresh_grains_cache', False):
+            return {}
+        if not os.path.isfile(cfn):
+            log.debug('Grains cache file does not exist.')
+            return {}
+        try:
+            with salt.utils.fopen(cfn, 'rb') as fp_:
+                data = self.serial.load(fp_)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != 2:
+            # Written by an older minion, which cached the grains as a whole
+            return {}
+        if data.get('boot') != _boot_id():
+            # The os grains are wrong after an upgrade and a reboot
+            log.debug('The minion rebooted since the grains were cached')
+            return {}
+        log.debug('Retrieving grains from cache')
+        return dict((key, tuple(val)) for key, val in data['funcs'].items())
+
+    def _grain_ttl(self, key):
+        '''
+        Return the seconds the return of the grains function is cached for,
+        set by function or by module in grains_cache_ttl
+        '''
+        ttls = self.opts.get('grains_cache_ttl') or {}
+        for name in (key, key[:key.index('.')]):
+            if name in ttls:
+                return ttls[name]
+        return self.opts.get('grains_cache_expiration', 300)
@@ -18,6 +18,10 @@ try:
     import pwd
 except ImportError:  # This is in case windows minion is importing
     pass
+try:
+    import fcntl
+except ImportError:
+    pass
 import getpass
 import resource
 import subprocess
@@ -737,6 +741,7 @@ class AESFuncs(object):
         self._file_list = fs_.file_list
         self._file_list_emptydirs = fs_.file_list_emptydirs
         self._dir_list = fs_.dir_list
+        self._file_list_page = fs_.list_page
         self._symlink_list = fs_.symlink_list
         self._file_envs = fs_.envs
 
@@ -1189,18 +1194,72 @@ class AESFuncs(object):
                 self.mminion.functions)
         data = pillar.compile_pillar()
         if self.opts.get('minion_data_cache', False):
-            cdir = os.path.join(self.opts['cachedir'], 'minions', load['id'])
-            if not os.path.isdir(cdir):
-                os.makedirs(cdir)
-            datap = os.path.join(cdir, 'data.p')
-            with salt.utils.fopen(datap, 'w+b') as fp_:
-                fp_.write(
-                        self.serial.dumps(
-                            {'grains': load['grains'],
-                             'pillar': data})
-                            )
+            self.__update_minion_data(
+                load['id'],
+                lambda cached: dict(cached, grains=load['grains'], pillar=data)
+            )
         return data
 
+    def _minion_grains(self, load):
+        '''
+        Apply the grains which changed on a minion to its data cache
+        '''
+        if any(key not in load for key in ('id', 'grains', 'tok')):
+            return False
+        if not self.__verify_minion(load['id'], load['tok']):
+            # The minion is not who it says it is!
+            # We don't want to listen to it!
+            log.warn(
+                'Minion id {0} is not who it says it is!'.format(
+                    load['id']
+                )
+            )
+            return False
+        if self.opts.get('minion_data_cache', False):
+            def _apply(cached):
+                grains = dict(cached.get('grains', {}))
+                for key in load.get('removed', ()):
+                    grains.pop(key, None)
+                grains.update(load['grains'])
+                return dict(cached, grains=grains)
+            self.__update_minion_data(load['id'], _apply)
+        return True
+
+    def __minion_data(self, id_):
+        '''
+        Return the data cached for the minion
+        '''
+        datap = os.path.join(self.opts['cachedir'], 'minions', id_, 'data.p')
+        if not os.path.isfile(datap):
+            return {}
+        try:
+            with salt.utils.fopen(datap, 'rb') as fp_:
+                data = self.serial.load(fp_)
+        except (IOError, OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def __update_minion_data(self, id_, func):
+        '''
+        Update the data cached for the minion to what func returns for it,
+        the cache is only written when the data changed. The workers hold the
+        lock of the cache while they update it, so that none of them loses
+        the update of another.
+        '''
+        cdir = os.path.join(self.opts['cachedir'], 'minions', id_)
+        if not os.path.isdir(cdir):
+            os.makedirs(cdir)
+        with salt.utils.fopen(os.path.join(cdir, 'data.lock'), 'w') as lock:
+            if salt.utils.is_fcntl_available():
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            cached = self.__minion_data(id_)
+            data = func(cached)
+            if data == cached:
+                return
+            with salt.utils.atomicfile.atomic_open(
+                    os.path.join(cdir, 'data.p'), 'w+b') as fp_:
+                fp_.write(self.serial.dumps(data))
+
     def _minion_event(self, load):
         '''
         Receive an event from the minion and fire it on the master event
@@ -65,6 +65,8 @@ import salt.loader
 import salt.utils
 import salt.payload
 import salt.utils.schedule
+import salt.utils.returners
+import salt.utils.filehash
 import salt.utils.event
 
 from salt._compat import string_types
@@ -588,8 +590,9 @@ class Minion(MinionBase):
                         '3.2 which may result in loss of contact with '
                         'minions. Please upgrade your ZMQ!')
         # Late setup the of the opts grains, so we can log from the grains
-        # module
-        opts['grains'] = salt.loader.grains(opts)
+        # module. Cached grains are used as they are, the expired ones are
+        # refreshed in the background once the minion is up.
+        opts['grains'] = salt.loader.grains(opts, stale=True)
         opts.update(resolve_dns(opts))
         super(Minion, self).__init__(opts)
         self.authenticate(timeout, safe)
@@ -610,6 +613,8 @@ class Minion(MinionBase):
             self.returners)
 
         self.grains_cache = self.opts['grains']
+        self._grains_thread = None
+        self._new_grains = None
 
         if 'proxy' in self.opts['pillar']:
             log.debug('I am {0} and I need to start some proxies for {0}'.format(self.opts['id'],
@@ -659,7 +664,7 @@ class Minion(MinionBase):
             if not HAS_RESOURCE:
                 log.error('Unable to enforce modules_max_memory because resource is missing')
 
-        self.opts['grains'] = salt.loader.grains(self.opts)
+        self.opts['grains'] = salt.loader.grains(self.opts, stale=True)
         functions = salt.loader.minion_mods(self.opts)
         returners = salt.loader.returners(self.opts, functions)
 
@@ -918,6 +923,10 @@ class Minion(MinionBase):
                         exc
                         )
                     )
+            # Job processes exit without running the atexit handlers
+            salt.utils.returners.flush_buffers()
+        # Keep the hashes of the files of the job for the next jobs
+        salt.utils.filehash.flush()
 
     @classmethod
     def _thread_multi_return(cls, minion_instance, opts, data):
@@ -966,6 +975,10 @@ class Minion(MinionBase):
                         exc
                         )
                     )
+            # Job processes exit without running the atexit handlers
+            salt.utils.returners.flush_buffers()
+        # Keep the hashes of the files of the job for the next jobs
+        salt.utils.filehash.flush()
 
     def _return_pub(self, ret, ret_cmd='_return'):
         '''
@@ -1199,6 +1212,63 @@ class Minion(MinionBase):
         ).compile_pillar()
         self.module_refresh()
 
+    def grains_refresh(self):
+        '''
+        Recompute the grains in a background thread, with the grains cache
+        enabled only the expired grains are recomputed. The main loop picks
+        up the new grains once they are ready.
+        '''
+        if self._grains_thread is not None and self._grains_thread.is_alive():
+            return
+        self._grains_thread = threading.Thread(target=self._gather_grains)
+        self._grains_thread.daemon = True
+        self._grains_thread.start()
+
+    def _gather_grains(self):
+        try:
+            # Loading the grains resets the grains in the opts passed in
+            self._new_grains = salt.loader.grains(dict(self.opts))
+        except Exception:
+            log.error('Failed to refresh the grains', exc_info=True)
+
+    def _apply_grains(self):
+        '''
+        Update the grains with the refreshed ones, send the grains which
+        changed to the master and refresh the pillar, which may depend on them
+        '''
+        grains, self._new_grains = self._new_grains, None
+        changed = dict(
+            (key, val) for key, val in grains.items()
+            if key not in self.opts['grains'] or self.opts['grains'][key] != val
+        )
+        removed = [key for key in self.opts['grains'] if key not in grains]
+        if not changed and not removed:
+            return
+        log.debug('Grains changed: {0}, removed: {1}'.format(
+            sorted(changed), removed))
+        # The loaded modules share the grains dict
+        for key in removed:
+            del self.opts['grains'][key]
+        self.opts['grains'].update(changed)
+        load = {'id': self.opts['id'],
+                'cmd': '_minion_grains',
+                'grains': changed,
+                'removed': removed,
+                'tok': self.tok}
+        sreq = salt.payload.SREQ(self.opts['master_uri'])
+        try:
+            ret = self.crypticle.loads(
+                sreq.send('aes', self.crypticle.dumps(load))
+            )
+        except Exception as exc:
+            log.debug('Unable to send the changed grains: {0}'.format(exc))
+            ret = False
+        if ret is not True:
+            log.debug('The master did not take the changed grains, they are '
+                      'sent with the pillar request')
+        # The top file and the pillar sls may match on the grains
+        self.pillar_refresh()
+
     def environ_setenv(self, package):
         '''
         Set the salt-minion main process environment according to
@@ -1312,12 +1382,24 @@ class Minion(MinionBase):
                     exc)
             )
 
+        if self.opts.get('grains_cache', False):
+            # The minion started from the cached grains, bring the expired
+            # ones up to date and keep them so
+            self.grains_refresh()
+            if not self.opts['grains_refresh_every']:
+                ttls = [self.opts.get('grains_cache_expiration', 300)]
+                ttls.extend((self.opts.get('grains_cache_ttl') or {}).values())
+                self._refresh_grains_watcher(max(min(ttls) // 60, 1))
+
         while self._running is True:
             loop_interval = self.process_schedule(self, loop_interval)
             try:
                 socks = self._do_poll(loop_interval)
                 self._do_socket_recv(socks)
 
+                if self._new_grains is not None:
+                    self._apply_grains()
+
                 # Check the event system
                 if socks.get(self.epull_sock) == zmq.POLLIN:
                     package = self.epull_sock.recv(zmq.NOBLOCK)
@@ -1328,9 +1410,7 @@ class Minion(MinionBase):
                         elif package.startswith('pillar_refresh'):
                             self.pillar_refresh()
                         elif package.startswith('grains_refresh'):
-                            if self.grains_cache != self.opts['grains']:
-                                self.pillar_refresh()
-                                self.grains_cache = self.opts['grains']
+                            self.grains_refresh()
                         elif package.startswith('environ_setenv'):
                             self.environ_setenv(package)
                         elif package.startswith('fire_master'):
@@ -1951,6 +2031,8 @@ class ProxyMinion(Minion):
             self.functions,
             self.returners)
         self.grains_cache = self.opts['grains']
+        self._grains_thread = None
+        self._new_grains = None
         # self._running = True
 
     def _prep_mod_opts(self):
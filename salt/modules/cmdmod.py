@@ -11,14 +11,22 @@ import functools
 import json
 import logging
 import os
+import time
+import pipes
+import atexit
 import shutil
+import binascii
 import subprocess
 import sys
+import tempfile
+import threading
 import traceback
+import collections
 import yaml
 
 # Import salt libs
 import salt.utils
+import salt.utils.event
 import salt.utils.timed_subprocess
 import salt.grains.extra
 from salt._compat import string_types
@@ -40,6 +48,11 @@ log = logging.getLogger(__name__)
 
 DEFAULT_SHELL = salt.grains.extra.shell()['shell']
 
+# (runas, shell) -> (time captured, login environment of the runas user)
+_RUNAS_ENVS = {}
+# (runas, shell, pid) -> _RunasShell
+_RUNAS_SHELLS = {}
+
 
 def __virtual__():
     '''
@@ -208,6 +221,245 @@ def _check_loglevel(level='info', quiet=False):
     return LOG_LEVELS[level]
 
 
+def _runas_env(runas, shell, python_shell):
+    '''
+    Return the login environment of the runas user, it is captured again
+    once it is older than cmd_runas_env_ttl seconds
+    '''
+    key = (runas, shell)
+    cached = _RUNAS_ENVS.get(key)
+    if cached is not None and \
+            time.time() - cached[0] < __opts__.get('cmd_runas_env_ttl', 300):
+        return dict(cached[1])
+    # Getting the environment for the runas user
+    # There must be a better way to do this.
+    py_code = 'import os, json;' \
+              'print(json.dumps(os.environ.__dict__))'
+    if __grains__['os'] in ['MacOS', 'Darwin']:
+        env_cmd = ('sudo -i -u {1} -- "{2}"'
+                   ).format(shell, runas, sys.executable)
+    elif __grains__['os'] in ['FreeBSD']:
+        env_cmd = ('su - {1} -c "{0} -c \'{2}\'"'
+                   ).format(shell, runas, sys.executable)
+    else:
+        env_cmd = ('su -s {0} - {1} -c "{2}"'
+                   ).format(shell, runas, sys.executable)
+    env_json = subprocess.Popen(
+        env_cmd,
+        shell=python_shell,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE
+    ).communicate(py_code)[0]
+    env_json = (filter(lambda x: x.startswith('{') and x.endswith('}'),
+                       env_json.splitlines()) or ['{}']).pop()
+    env_runas = json.loads(env_json).get('data', {})
+    _RUNAS_ENVS[key] = (time.time(), env_runas)
+    return dict(env_runas)
+
+
+class _RunasShell(object):
+    '''
+    A login shell of the runas user which is kept running to execute
+    commands in, one after the other, sparing a login for every command.
+    Every command runs in a subshell of its own, with its output written to
+    files which are read back once the shell reports the command is done.
+    '''
+    def __init__(self, runas, shell):
+        self.runas = runas
+        self.shell = shell
+        self.proc = None
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _start(self):
+        with salt.utils.fopen(os.devnull, 'w') as devnull:
+            self.proc = subprocess.Popen(
+                ['su', '-s', self.shell, '-', self.runas],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+                close_fds=True)
+
+    def run(self, cmd, cwd, env, merge_stderr=False):
+        '''
+        Run the command and return the dict _run returns
+        '''
+        uid, gid = pwd.getpwnam(self.runas)[2:4]
+        paths = []
+        for name in ('stdout', 'stderr'):
+            fd_, path = tempfile.mkstemp(prefix='salt-cmd-', suffix=name)
+            os.close(fd_)
+            os.chown(path, uid, gid)
+            paths.append(path)
+        marker = 'salt-cmd-{0}'.format(binascii.hexlify(os.urandom(8)))
+        exports = ''
+        if env:
+            exports = 'export {0} && '.format(' '.join(
+                '{0}={1}'.format(key, pipes.quote(str(val)))
+                for key, val in env.items()))
+        line = '(cd {0} && {1}exec {2} -c {3}) >{4} 2>{5} </dev/null; ' \
+               'echo "{6} $?"\n'.format(
+                   pipes.quote(cwd), exports, pipes.quote(self.shell),
+                   pipes.quote(cmd), pipes.quote(paths[0]),
+                   '&1' if merge_stderr else pipes.quote(paths[1]), marker)
+        try:
+            with self.lock:
+                for attempt in (1, 2):
+                    if self.proc is None or self.proc.poll() is not None:
+                        self._start()
+                    try:
+                        self.proc.stdin.write(line)
+                        self.proc.stdin.flush()
+                        retcode = self._wait(marker)
+                        break
+                    except (IOError, OSError, EOFError):
+                        # The shell went away, start another one
+                        self.close()
+                        if attempt == 2:
+                            raise
+                pid = self.proc.pid
+            ret = {'retcode': retcode, 'pid': pid, 'stderr': None}
+            for name, path in zip(('stdout', 'stderr'), paths):
+                if name == 'stderr' and merge_stderr:
+                    continue
+                with salt.utils.fopen(path, 'rb') as fp_:
+                    ret[name] = fp_.read()
+        finally:
+            for path in paths:
+                os.remove(path)
+        return ret
+
+    def _wait(self, marker):
+        '''
+        Skip what the shell prints until the marker of the command, and
+        return the exit status printed with it
+        '''
+        while True:
+            line = self.proc.stdout.readline()
+            if not line:
+                raise EOFError('The shell of {0} exited'.format(self.runas))
+            if line.startswith('{0} '.format(marker)):
+                return int(line.split()[1])
+
+    def close(self):
+        '''
+        Stop the shell
+        '''
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+            proc.wait()
+        except (IOError, OSError):
+            pass
+
+
+def _runas_shell(runas, shell):
+    '''
+    Return the login shell of the runas user kept by this process
+    '''
+    key = (runas, shell, os.getpid())
+    if key not in _RUNAS_SHELLS:
+        _RUNAS_SHELLS[key] = _RunasShell(runas, shell)
+    return _RUNAS_SHELLS[key]
+
+
+class _OutputStream(object):
+    '''
+    Take in the output of a streamed command as it is read. The output is
+    sent to the master in chunks of cmd_stream_chunk_size bytes as progress
+    events of the job, only its last cmd_stream_tail bytes are kept for the
+    return, and all of it is written to a spool file if asked to.
+    '''
+    def __init__(self, jid=None, spool=False):
+        self.jid = jid
+        self.chunk_size = int(__opts__.get('cmd_stream_chunk_size', 65536))
+        self.tail_size = int(__opts__.get('cmd_stream_tail', 65536))
+        self.spool = spool
+        self.lock = threading.Lock()
+        self.tails = {}
+        self.sizes = {}
+        self.chunks = {}
+        self.spools = {}
+        self.files = {}
+        self.seq = 0
+        self.truncated = False
+
+    def __call__(self, name, data):
+        with self.lock:
+            if name not in self.tails:
+                self._open(name)
+            tail = self.tails[name]
+            tail.append(data)
+            self.sizes[name] += len(data)
+            while self.sizes[name] - len(tail[0]) >= self.tail_size:
+                self.sizes[name] -= len(tail.popleft())
+                self.truncated = True
+            if self.sizes[name] > self.tail_size:
+                # What is past the tail size is cut out by tail()
+                self.truncated = True
+            if self.spool:
+                self.files[name].write(data)
+            if self.jid:
+                chunk = self.chunks[name]
+                chunk.append(data)
+                if sum(len(part) for part in chunk) >= self.chunk_size:
+                    self._send(name)
+
+    def _open(self, name):
+        self.tails[name] = collections.deque()
+        self.sizes[name] = 0
+        self.chunks[name] = []
+        if not self.spool:
+            return
+        spool_dir = os.path.join(__opts__['cachedir'], 'cmd_spool')
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir)
+        fd_, path = tempfile.mkstemp(
+            prefix='{0}-'.format(self.jid or 'cmd'),
+            suffix='.{0}'.format(name),
+            dir=spool_dir)
+        self.spools[name] = path
+        self.files[name] = os.fdopen(fd_, 'w+b')
+
+    def _send(self, name):
+        data = ''.join(self.chunks[name])
+        self.chunks[name] = []
+        if not data:
+            return
+        tag = salt.utils.event.tagify(
+            [self.jid, 'prog', __opts__['id'], 'cmd', str(self.seq)], 'job')
+        self.seq += 1
+        try:
+            __salt__['event.fire_master'](
+                {'stream': name, 'seq': self.seq - 1, 'data': data}, tag)
+        except Exception as exc:
+            log.debug('Failed to send the command output: {0}'.format(exc))
+
+    def tail(self, name):
+        '''
+        Return the kept tail of the named output
+        '''
+        with self.lock:
+            data = ''.join(self.tails.get(name, ()))
+        if len(data) > self.tail_size:
+            data = data[-self.tail_size:]
+        return data
+
+    def close(self):
+        '''
+        Send the rest of the output and close the spool files
+        '''
+        with self.lock:
+            if self.jid:
+                for name in sorted(self.chunks):
+                    self._send(name)
+            for fp_ in self.files.values():
+                fp_.close()
+            self.files = {}
+
+
 def _run(cmd,
          cwd=None,
          stdin=None,
@@ -226,9 +478,15 @@ def _run(cmd,
          timeout=None,
          with_communicate=True,
          reset_system_locale=True,
-         saltenv='base'):
+         saltenv='base',
+         stream=False,
+         spool=False,
+         jid=None):
     '''
     Do the DRY thing and only call subprocess.Popen() once
+
+    With stream the output is not collected in memory, see _OutputStream,
+    spool streams the output to a file as well.
     '''
     if salt.utils.is_true(quiet):
         salt.utils.warn_until(
@@ -299,6 +557,15 @@ def _run(cmd,
         msg = 'Sorry, {0} does not support runas functionality'
         raise CommandExecutionError(msg.format(__grains__['os']))
 
+    # Run in the kept login shell of the runas user if enabled, which does not
+    # take input, timeouts, a umask or a clean environment
+    use_shell = bool(runas) and \
+        __opts__.get('cmd_runas_shell', False) is True and \
+        __grains__['os'] not in ['MacOS', 'Darwin', 'FreeBSD'] and \
+        python_shell is True and stdin is None and not timeout and \
+        not umask and not clean_env and not stream and not spool and \
+        stdout == subprocess.PIPE
+
     if runas:
         # Save the original command before munging it
         try:
@@ -308,30 +575,10 @@ def _run(cmd,
                 'User {0!r} is not available'.format(runas)
             )
         try:
-            # Getting the environment for the runas user
-            # There must be a better way to do this.
-            py_code = 'import os, json;' \
-                      'print(json.dumps(os.environ.__dict__))'
-            if __grains__['os'] in ['MacOS', 'Darwin']:
-                env_cmd = ('sudo -i -u {1} -- "{2}"'
-                           ).format(shell, runas, sys.executable)
-            elif __grains__['os'] in ['FreeBSD']:
-                env_cmd = ('su - {1} -c "{0} -c \'{2}\'"'
-                           ).format(shell, runas, sys.executable)
-            else:
-                env_cmd = ('su -s {0} - {1} -c "{2}"'
-                           ).format(shell, runas, sys.executable)
-            env_json = subprocess.Popen(
-                env_cmd,
-                shell=python_shell,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE
-            ).communicate(py_code)[0]
-            env_json = (filter(lambda x: x.startswith('{') and x.endswith('}'),
-                               env_json.splitlines()) or ['{}']).pop()
-            env_runas = json.loads(env_json).get('data', {})
-            env_runas.update(env)
-            env = env_runas
+            if not use_shell:
+                env_runas = _runas_env(runas, shell, python_shell)
+                env_runas.update(env)
+                env = env_runas
         except ValueError:
             raise CommandExecutionError(
                 'Environment could not be retrieved for User {0!r}'.format(
@@ -404,6 +651,32 @@ def _run(cmd,
             .format(cwd)
         )
 
+    if use_shell:
+        try:
+            ret = _runas_shell(runas, shell).run(
+                cmd, cwd, env, merge_stderr=stderr == subprocess.STDOUT
+            )
+        except (OSError, IOError, EOFError) as exc:
+            raise CommandExecutionError(
+                'Unable to run command {0!r} as user {1!r}, reason: {2}'
+                .format(cmd, runas, exc)
+            )
+        if rstrip:
+            ret['stdout'] = ret['stdout'].rstrip()
+            if ret['stderr'] is not None:
+                ret['stderr'] = ret['stderr'].rstrip()
+        try:
+            __context__['retcode'] = ret['retcode']
+        except NameError:
+            # Ignore the context error during grain generation
+            pass
+        return ret
+
+    output = None
+    if stream or spool:
+        output = _OutputStream(jid, spool=spool)
+        kwargs['stream'] = output
+
     # This is where the magic happens
     try:
         proc = salt.utils.timed_subprocess.TimedProc(cmd, **kwargs)
@@ -422,9 +695,19 @@ def _run(cmd,
         ret['pid'] = proc.process.pid
         # ok return code for timeouts?
         ret['retcode'] = 1
+        if output is not None:
+            output.close()
         return ret
 
     out, err = proc.stdout, proc.stderr
+    if output is not None:
+        output.close()
+        out = output.tail('stdout')
+        if proc.process.stderr is not None:
+            err = output.tail('stderr')
+        ret['truncated'] = output.truncated
+        if spool:
+            ret['spool'] = output.spools
 
     if rstrip:
         if out is not None:
@@ -522,6 +805,8 @@ def run(cmd,
         timeout=None,
         reset_system_locale=True,
         saltenv='base',
+        stream=False,
+        spool=False,
         **kwargs):
     '''
     Execute the passed command and return the output as a string
@@ -556,6 +841,15 @@ def run(cmd,
     .. code-block:: bash
 
         salt '*' cmd.run "grep f" stdin='one\\ntwo\\nthree\\nfour\\nfive\\n'
+
+    Pass ``stream=True`` for commands with a lot of output. The output is
+    sent to the master as progress events of the job while the command runs,
+    in chunks of ``cmd_stream_chunk_size`` bytes, and only the last
+    ``cmd_stream_tail`` bytes of it are returned:
+
+    .. code-block:: bash
+
+        salt '*' cmd.run "find /" stream=True
     '''
     ret = _run(cmd,
                runas=runas,
@@ -573,7 +867,10 @@ def run(cmd,
                quiet=quiet,
                timeout=timeout,
                reset_system_locale=reset_system_locale,
-               saltenv=saltenv)
+               saltenv=saltenv,
+               stream=stream,
+               spool=spool,
+               jid=kwargs.get('__pub_jid'))
 
     if 'pid' in ret and '__pub_jid' in kwargs:
         # Stuff the child pid in the JID file
@@ -781,6 +1078,8 @@ def run_all(cmd,
             timeout=None,
             reset_system_locale=True,
             saltenv='base',
+            stream=False,
+            spool=False,
             **kwargs):
     '''
     Execute the passed command and return a dict of return data
@@ -809,6 +1108,17 @@ def run_all(cmd,
     .. code-block:: bash
 
         salt '*' cmd.run_all "grep f" stdin='one\\ntwo\\nthree\\nfour\\nfive\\n'
+
+    Pass ``stream=True`` for commands with a lot of output, see
+    :py:func:`cmd.run <salt.modules.cmdmod.run>`. The return then holds
+    ``truncated``, which is True when only the tail of the output was kept.
+    With ``spool=True`` the whole output is written to files on the minion
+    as well, their paths are returned under ``spool`` and they can be sent
+    to the master with :py:func:`cp.push <salt.modules.cp.push>`:
+
+    .. code-block:: bash
+
+        salt '*' cmd.run_all "journalctl" spool=True
     '''
     ret = _run(cmd,
                runas=runas,
@@ -825,7 +1135,10 @@ def run_all(cmd,
                quiet=quiet,
                timeout=timeout,
                reset_system_locale=reset_system_locale,
-               saltenv=saltenv)
+               saltenv=saltenv,
+               stream=stream,
+               spool=spool,
+               jid=kwargs.get('__pub_jid'))
 
     lvl = _check_loglevel(output_loglevel, quiet)
     if lvl is not None:
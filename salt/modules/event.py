@@ -51,6 +51,47 @@ def fire_master(data, tag, preload=None):
             return False
 
 
+def fire_master_batch(events, preload=None):
+    '''
+    Fire a list of events up to the master server in a single request. Every
+    event is a dict holding at least the ``tag`` and ``data`` of the event,
+    the master fires each of them on its event bus.
+
+    If preload is specified it is merged into the request and the events are
+    sent on an independently authenticated channel, otherwise they are handed
+    to the minion daemon to send.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' event.fire_master_batch '[{"tag": "tag1", "data": {}}]'
+    '''
+    if not events:
+        return True
+    if preload is not None:
+        load = preload
+        auth = salt.crypt.SAuth(__opts__)
+        load.update({'id': __opts__['id'],
+                'events': events,
+                'tok': auth.gen_token('salt'),
+                'cmd': '_minion_event'})
+
+        sreq = salt.transport.Channel.factory(__opts__)
+        try:
+            sreq.send(load)
+        except Exception:
+            pass
+        return True
+    else:
+        try:
+            return salt.utils.event.MinionEvent(**__opts__).fire_event(
+                {'data': None, 'tag': None, 'events': events, 'pretag': None},
+                'fire_master')
+        except Exception:
+            return False
+
+
 def fire(data, tag):
     '''
     Fire an event on the local minion event bus. Data must be formed as a dict.
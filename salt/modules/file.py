@@ -40,6 +40,7 @@ except ImportError:
 import salt.utils
 import salt.utils.find
 import salt.utils.filebuffer
+import salt.utils.filehash
 import salt.utils.atomicfile
 from salt.exceptions import CommandExecutionError, SaltInvocationError
 import salt._compat
@@ -108,6 +109,52 @@ def _binary_replace(old, new):
     return ''
 
 
+def _hash(path, form='md5'):
+    '''
+    Return the hash of the file, from the hash cache of the minion if the
+    file did not change since it was last hashed
+    '''
+    return salt.utils.filehash.get_hash(path, form, __opts__)
+
+
+def _same_contents(path1, path2):
+    '''
+    Compare the contents of two files, reading them a chunk at a time
+    '''
+    if os.path.getsize(path1) != os.path.getsize(path2):
+        return False
+    with contextlib.nested(
+            salt.utils.fopen(path1, 'rb'),
+            salt.utils.fopen(path2, 'rb')) as (fp1, fp2):
+        while True:
+            chunk = fp1.read(salt.utils.filehash.CHUNK_SIZE)
+            if chunk != fp2.read(salt.utils.filehash.CHUNK_SIZE):
+                return False
+            if not chunk:
+                return True
+
+
+def _diff(old, new, fromfile='', tofile=''):
+    '''
+    Return the unified diff of the old file to the new one. Binary files and
+    files larger than file_diff_max_size bytes are not diffed, a note of the
+    change is returned instead.
+    '''
+    max_size = __opts__.get('file_diff_max_size', 1048576)
+    if max_size and \
+            max(os.path.getsize(old), os.path.getsize(new)) > max_size:
+        return 'Diff skipped, file larger than {0} bytes'.format(max_size)
+    bdiff = _binary_replace(old, new)
+    if bdiff:
+        return bdiff
+    with contextlib.nested(
+            salt.utils.fopen(new, 'rb'),
+            salt.utils.fopen(old, 'rb')) as (src, name_):
+        slines = src.readlines()
+        nlines = name_.readlines()
+    return ''.join(difflib.unified_diff(nlines, slines, fromfile, tofile))
+
+
 def _get_bkroot():
     '''
     Get the location of the backup dir in the minion cache
@@ -1764,7 +1811,14 @@ def stats(path, hash_type='md5', follow_symlinks=True):
     ret['ctime'] = pstat.st_ctime
     ret['size'] = pstat.st_size
     ret['mode'] = str(oct(stat.S_IMODE(pstat.st_mode)))
-    ret['sum'] = get_sum(path, hash_type)
+    if os.path.isfile(path):
+        try:
+            ret['sum'] = _hash(path, hash_type)
+        except (IOError, OSError, ValueError):
+            # Leave it to get_sum to describe the error
+            ret['sum'] = get_sum(path, hash_type)
+    else:
+        ret['sum'] = get_sum(path, hash_type)
     ret['type'] = 'file'
     if stat.S_ISDIR(pstat.st_mode):
         ret['type'] = 'dir'
@@ -2061,7 +2115,7 @@ def get_managed(
 
         if data['result']:
             sfn = data['data']
-            hsum = get_hash(sfn)
+            hsum = _hash(sfn)
             source_sum = {'hash_type': 'md5',
                           'hsum': hsum}
         else:
@@ -2361,18 +2415,7 @@ def check_file_meta(
                 if __salt__['config.option']('obfuscate_templates'):
                     changes['diff'] = '<Obfuscated Template>'
                 else:
-                    # Check to see if the files are bins
-                    bdiff = _binary_replace(name, sfn)
-                    if bdiff:
-                        changes['diff'] = bdiff
-                    else:
-                        with contextlib.nested(
-                                salt.utils.fopen(sfn, 'rb'),
-                                salt.utils.fopen(name, 'rb')) as (src, name_):
-                            slines = src.readlines()
-                            nlines = name_.readlines()
-                        changes['diff'] = \
-                            ''.join(difflib.unified_diff(nlines, slines))
+                    changes['diff'] = _diff(name, sfn)
             else:
                 changes['sum'] = 'Checksum differs'
 
@@ -2382,20 +2425,12 @@ def check_file_meta(
         with salt.utils.fopen(tmp, 'w') as tmp_:
             tmp_.write(str(contents))
         # Compare the static contents with the named file
-        with contextlib.nested(
-                salt.utils.fopen(tmp, 'rb'),
-                salt.utils.fopen(name, 'rb')) as (src, name_):
-            slines = src.readlines()
-            nlines = name_.readlines()
-        if ''.join(nlines) != ''.join(slines):
+        if not _same_contents(tmp, name):
             if __salt__['config.option']('obfuscate_templates'):
                 changes['diff'] = '<Obfuscated Template>'
             else:
-                if salt.utils.istextfile(name):
-                    changes['diff'] = \
-                        ''.join(difflib.unified_diff(nlines, slines))
-                else:
-                    changes['diff'] = 'Replace binary file with text file'
+                changes['diff'] = _diff(name, tmp)
+        __clean_tmp(tmp)
 
     if user is not None and user != lstats['user']:
         changes['user'] = user
@@ -2440,18 +2475,8 @@ def get_diff(
 
     sfn = __salt__['cp.cache_file'](masterfile, saltenv)
     if sfn:
-        with contextlib.nested(salt.utils.fopen(sfn, 'r'),
-                               salt.utils.fopen(minionfile, 'r')) \
-                as (src, name_):
-            slines = src.readlines()
-            nlines = name_.readlines()
-        if ''.join(nlines) != ''.join(slines):
-            bdiff = _binary_replace(minionfile, sfn)
-            if bdiff:
-                ret += bdiff
-            else:
-                ret += ''.join(difflib.unified_diff(nlines, slines,
-                                                    minionfile, masterfile))
+        if not _same_contents(sfn, minionfile):
+            ret += _diff(minionfile, sfn, minionfile, masterfile)
     else:
         ret = 'Failed to copy file from master'
 
@@ -2492,7 +2517,7 @@ def manage_file(name,
     if os.path.isfile(name):
         # Only test the checksums on files with managed contents
         if source:
-            name_sum = get_hash(name, source_sum['hash_type'])
+            name_sum = _hash(name, source_sum['hash_type'])
 
         # Check if file needs to be replaced
         if source and source_sum['hsum'] != name_sum:
@@ -2504,7 +2529,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if salt._compat.urlparse(source).scheme != 'salt':
-                dl_sum = get_hash(sfn, source_sum['hash_type'])
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -2520,18 +2545,7 @@ def manage_file(name,
             elif not show_diff:
                 ret['changes']['diff'] = '<show_diff=False>'
             else:
-                # Check to see if the files are bins
-                bdiff = _binary_replace(name, sfn)
-                if bdiff:
-                    ret['changes']['diff'] = bdiff
-                else:
-                    with contextlib.nested(
-                            salt.utils.fopen(sfn, 'rb'),
-                            salt.utils.fopen(name, 'rb')) as (src, name_):
-                        slines = src.readlines()
-                        nlines = name_.readlines()
-                    ret['changes']['diff'] = \
-                        ''.join(difflib.unified_diff(nlines, slines))
+                ret['changes']['diff'] = _diff(name, sfn)
 
             # Pre requisites are met, and the file needs to be replaced, do it
             try:
@@ -2551,25 +2565,13 @@ def manage_file(name,
                 tmp_.write(str(contents))
 
             # Compare contents of files to know if we need to replace
-            with contextlib.nested(
-                    salt.utils.fopen(tmp, 'rb'),
-                    salt.utils.fopen(name, 'rb')) as (src, name_):
-                slines = src.readlines()
-                nlines = name_.readlines()
-                different = ''.join(slines) != ''.join(nlines)
-
-            if different:
+            if not _same_contents(tmp, name):
                 if __salt__['config.option']('obfuscate_templates'):
                     ret['changes']['diff'] = '<Obfuscated Template>'
                 elif not show_diff:
                     ret['changes']['diff'] = '<show_diff=False>'
                 else:
-                    if salt.utils.istextfile(name):
-                        ret['changes']['diff'] = \
-                            ''.join(difflib.unified_diff(nlines, slines))
-                    else:
-                        ret['changes']['diff'] = \
-                            'Replace binary file with text file'
+                    ret['changes']['diff'] = _diff(name, tmp)
 
                 # Pre requisites are met, the file needs to be replaced, do it
                 try:
@@ -2606,7 +2608,7 @@ def manage_file(name,
             # If the downloaded file came from a non salt server source verify
             # that it matches the intended sum value
             if salt._compat.urlparse(source).scheme != 'salt':
-                dl_sum = get_hash(sfn, source_sum['hash_type'])
+                dl_sum = _hash(sfn, source_sum['hash_type'])
                 if dl_sum != source_sum['hsum']:
                     ret['comment'] = ('File sum set for file {0} of {1} does '
                                       'not match real sum of {2}'
@@ -10,10 +10,12 @@ import math
 import operator
 import os
 import random
+import time
 import yaml
 import logging
 
 # Import salt libs
+import salt.loader
 import salt.utils
 import salt.utils.dictupdate
 from salt.exceptions import SaltException
@@ -302,6 +304,43 @@ def ls():  # pylint: disable=C0103
     return sorted(__grains__)
 
 
+def profile(parallel=True):
+    '''
+    Load the grains afresh, bypassing the grains cache, and return the
+    seconds spent in each grains function and in each grains module along
+    with the total. Pass ``parallel=False`` to run the grains functions one
+    after the other.
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' grains.profile
+        salt '*' grains.profile parallel=False
+    '''
+    opts = dict(__opts__)
+    opts['grains_cache'] = False
+    if not parallel:
+        opts['grains_parallel'] = 1
+    timings = {}
+    start = time.time()
+    salt.loader.grains(opts, timings=timings)
+    total = time.time() - start
+    modules = {}
+    for key, spent in timings.items():
+        mod = key[:key.index('.')]
+        modules[mod] = modules.get(mod, 0) + spent
+    return {
+        'functions': dict(
+            (key, round(spent, 3)) for key, spent in timings.items()
+        ),
+        'modules': dict(
+            (mod, round(spent, 3)) for mod, spent in modules.items()
+        ),
+        'total': round(total, 3),
+    }
+
+
 def filter_by(lookup_dict, grain='os_family', merge=None, default='default'):
     '''
     .. versionadded:: 0.17.0
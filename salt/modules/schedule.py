@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+'''
+Inspect the jobs run by the minion scheduler
+'''
+
+# Import python libs
+import copy
+
+# Import salt libs
+import salt.utils.schedule
+
+__proxyenabled__ = ['*']
+
+__func_alias__ = {
+    'list_': 'list'
+}
+
+
+def list_(show_all=False):
+    '''
+    List the jobs in the schedule along with the run time statistics kept by
+    the scheduler for each of them. The statistics are found under the
+    ``stats`` key of each job and contain the number of runs started,
+    completed and skipped because of ``maxrunning``, the number of runs
+    currently in progress, the last and total run durations and the time of
+    the next run.
+
+    show_all
+        Also list the internal jobs, whose names start with ``__``
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' schedule.list
+    '''
+    schedule = __salt__['config.merge']('schedule', {}, omit_master=True)
+    if not isinstance(schedule, dict):
+        return {}
+    stats = salt.utils.schedule.read_stats(__opts__)
+    ret = {}
+    for job, data in schedule.items():
+        if job.startswith('__') and not show_all:
+            continue
+        if not isinstance(data, dict):
+            continue
+        ret[job] = copy.deepcopy(data)
+        ret[job]['stats'] = stats.get(job, {})
+    return ret
@@ -15,6 +15,9 @@ to the minion config files::
     mongo.password: <MongoDB user password>
     mongo.port: 27017
 
+The connections are pooled, and with ``returner_batch_size`` set the returns
+are written in batches, see :mod:`salt.utils.returners`.
+
 This mongo returner is being developed to replace the default mongodb returner
 in the future and should not be considered API stable yet.
 
@@ -23,6 +26,9 @@ in the future and should not be considered API stable yet.
 # Import python libs
 import logging
 
+# Import salt libs
+import salt.utils.returners
+
 # Import third party libs
 try:
     import pymongo
@@ -68,13 +74,32 @@ def _get_conn():
     return conn, mdb
 
 
+def _pooled_conn():
+    '''
+    Lend out a mongodb connection and database from the pool
+    '''
+    return salt.utils.returners.get_pool(
+        __virtualname__, _get_conn, __opts__,
+        close=lambda serv: serv[0].close(),
+        check=lambda serv: serv[0].admin.command('ping')).conn()
+
+
+def _insert_returns(rows):
+    '''
+    Insert the return documents, one insert per minion collection
+    '''
+    docs = {}
+    for minion, sdata in rows:
+        docs.setdefault(minion, []).append(sdata)
+    with _pooled_conn() as (conn, mdb):
+        for minion, sdatas in docs.items():
+            mdb[minion].insert(sdatas)
+
+
 def returner(ret):
     '''
     Return data to a mongodb server
     '''
-    conn, mdb = _get_conn()
-    col = mdb[ret['id']]
-
     if isinstance(ret['return'], dict):
         back = _remove_dots(ret['return'])
     else:
@@ -84,16 +109,20 @@ def returner(ret):
     sdata = {ret['jid']: back, 'fun': ret['fun']}
     if 'out' in ret:
         sdata['out'] = ret['out']
-    col.insert(sdata)
+    buf = salt.utils.returners.get_buffer(
+        __virtualname__, _insert_returns, __opts__)
+    if buf is None:
+        _insert_returns([(ret['id'], sdata)])
+    else:
+        buf.put((ret['id'], sdata))
 
 
 def save_load(jid, load):
     '''
     Save the load for a given job id
     '''
-    conn, mdb = _get_conn()
-    col = mdb[jid]
-    col.insert(load)
+    with _pooled_conn() as (conn, mdb):
+        mdb[jid].insert(load)
 
 
 def get_load(jid):
@@ -17,6 +17,9 @@ config, these are the defaults::
     mysql.db: 'salt'
     mysql.port: 3306
 
+The connections are pooled, and with ``returner_batch_size`` set the returns
+are written in batches, see :mod:`salt.utils.returners`.
+
 Use the following mysql database schema::
 
     CREATE DATABASE  `salt`
@@ -63,6 +66,9 @@ import sys
 import json
 import logging
 
+# Import salt libs
+import salt.utils.returners
+
 # Import third party libs
 try:
     import MySQLdb
@@ -103,42 +109,62 @@ def _get_options():
     return _options
 
 
+def _connect():
+    '''
+    Open a new connection to the MySQL server
+    '''
+    _options = _get_options()
+    return MySQLdb.connect(host=_options['host'], user=_options['user'], passwd=_options['pass'], db=_options['db'], port=_options['port'])
+
+
 @contextmanager
 def _get_serv(commit=False):
     '''
     Return a mysql cursor
     '''
-    _options = _get_options()
-    conn = MySQLdb.connect(host=_options['host'], user=_options['user'], passwd=_options['pass'], db=_options['db'], port=_options['port'])
-    cursor = conn.cursor()
-    try:
-        yield cursor
-    except MySQLdb.DatabaseError as err:
-        error, = err.args
-        sys.stderr.write(error.message)
-        cursor.execute("ROLLBACK")
-        raise err
-    else:
-        if commit:
-            cursor.execute("COMMIT")
-        else:
+    pool = salt.utils.returners.get_pool(
+        'mysql', _connect, __opts__, check=lambda conn: conn.ping())
+    with pool.conn() as conn:
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        except MySQLdb.DatabaseError as err:
+            error, = err.args
+            sys.stderr.write(error.message)
             cursor.execute("ROLLBACK")
-    finally:
-        conn.close()
+            raise err
+        else:
+            if commit:
+                cursor.execute("COMMIT")
+            else:
+                cursor.execute("ROLLBACK")
+        finally:
+            cursor.close()
 
 
-def returner(ret):
+def _insert_returns(rows):
     '''
-    Return data to a mysql server
+    Insert the rows of return data with one multi-row insert
     '''
     with _get_serv(commit=True) as cur:
         sql = '''INSERT INTO `salt_returns`
                 (`fun`, `jid`, `return`, `id`, `success`, `full_ret` )
                 VALUES (%s, %s, %s, %s, %s, %s)'''
 
-        cur.execute(sql, (ret['fun'], ret['jid'],
-                            json.dumps(ret['return']), ret['id'],
-                            ret['success'], json.dumps(ret)))
+        cur.executemany(sql, rows)
+
+
+def returner(ret):
+    '''
+    Return data to a mysql server
+    '''
+    row = (ret['fun'], ret['jid'], json.dumps(ret['return']), ret['id'],
+           ret['success'], json.dumps(ret))
+    buf = salt.utils.returners.get_buffer('mysql', _insert_returns, __opts__)
+    if buf is None:
+        _insert_returns([row])
+    else:
+        buf.put(row)
 
 
 def save_load(jid, load):
@@ -16,6 +16,9 @@ the following values configured in the minion or master config::
     returner.postgres.db: 'salt'
     returner.postgres.port: 5432
 
+The connections are pooled, and with ``returner_batch_size`` set the returns
+are written in batches, see :mod:`salt.utils.returners`.
+
 Running the following commands as the postgres user should create the database
 correctly::
 
@@ -60,6 +63,9 @@ Required python modules: psycopg2
 # Import python libs
 import json
 
+# Import salt libs
+import salt.utils.returners
+
 # Import third party libs
 try:
     import psycopg2
@@ -92,37 +98,73 @@ def _close_conn(conn):
     conn.close()
 
 
-def returner(ret):
+def _check_conn(conn):
     '''
-    Return data to a postgres server
+    Raise if the server closed the connection
     '''
-    conn = _get_conn()
     cur = conn.cursor()
+    try:
+        cur.execute('SELECT 1')
+    finally:
+        cur.close()
+    conn.rollback()
+
+
+def _pooled_conn():
+    '''
+    Lend out a postgres connection from the pool
+    '''
+    return salt.utils.returners.get_pool(
+        'postgres', _get_conn, __opts__, check=_check_conn).conn()
+
+
+def _insert_returns(rows):
+    '''
+    Insert the rows of return data with one multi-row insert
+    '''
     sql = '''INSERT INTO salt_returns
             (fun, jid, return, id, success)
-            VALUES (%s, %s, %s, %s, %s)'''
-    cur.execute(
-        sql, (
-            ret['fun'],
-            ret['jid'],
-            json.dumps(ret['return']),
-            ret['id'],
-            ret['success']
-        )
+            VALUES {0}'''.format(
+                ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows)))
+    with _pooled_conn() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, [field for row in rows for field in row])
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def returner(ret):
+    '''
+    Return data to a postgres server
+    '''
+    row = (
+        ret['fun'],
+        ret['jid'],
+        json.dumps(ret['return']),
+        ret['id'],
+        ret['success']
     )
-    _close_conn(conn)
+    buf = salt.utils.returners.get_buffer(
+        'postgres', _insert_returns, __opts__)
+    if buf is None:
+        _insert_returns([row])
+    else:
+        buf.put(row)
 
 
 def save_load(jid, load):
     '''
     Save the load to the specified jid id
     '''
-    conn = _get_conn()
-    cur = conn.cursor()
     sql = '''INSERT INTO jids (jid, load) VALUES (%s, %s)'''
 
-    cur.execute(sql, (jid, json.dumps(load)))
-    _close_conn(conn)
+    with _pooled_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, (jid, json.dumps(load)))
+        conn.commit()
 
 
 def get_load(jid):
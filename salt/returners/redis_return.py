@@ -9,10 +9,18 @@ config, these are the defaults:
     redis.db: '0'
     redis.host: 'salt'
     redis.port: 6379
+
+The returns of a job are kept in the ``ret:<jid>`` hash, keyed by minion id,
+and the ``fun:<fun>`` hash maps the minion ids to the jid of the last return
+of the function, so a job or function is looked up in one or two round trips.
+The keys written by older releases, ``<minion>:<jid>``, ``<minion>:<fun>``
+and ``<jid>``, are moved to this layout the first time the returns are looked
+up.
 '''
 
 # Import python libs
 import json
+import logging
 
 # Import third party libs
 try:
@@ -21,9 +29,22 @@ try:
 except ImportError:
     HAS_REDIS = False
 
+log = logging.getLogger(__name__)
+
 # Define the module's virtual name
 __virtualname__ = 'redis'
 
+# Marks a database whose keys are in the current layout
+LAYOUT_KEY = 'salt:layout'
+LAYOUT = '2'
+
+# The keys are moved this many at a time, the lock is renewed after each
+MIGRATE_CHUNK = 1000
+LOCK_TTL = 300
+
+# Set once this process saw the database in the current layout
+_MIGRATED = False
+
 
 def __virtual__():
     if not HAS_REDIS:
@@ -46,10 +67,12 @@ def returner(ret):
     Return data to a redis data store
     '''
     serv = _get_serv()
-    serv.set('{0}:{1}'.format(ret['id'], ret['jid']), json.dumps(ret))
-    serv.lpush('{0}:{1}'.format(ret['id'], ret['fun']), ret['jid'])
-    serv.sadd('minions', ret['id'])
-    serv.sadd('jids', ret['jid'])
+    pipe = serv.pipeline(transaction=False)
+    pipe.hset('ret:{0}'.format(ret['jid']), ret['id'], json.dumps(ret))
+    pipe.hset('fun:{0}'.format(ret['fun']), ret['id'], ret['jid'])
+    pipe.sadd('minions', ret['id'])
+    pipe.sadd('jids', ret['jid'])
+    pipe.execute()
 
 
 def save_load(jid, load):
@@ -57,8 +80,10 @@ def save_load(jid, load):
     Save the load to the specified jid
     '''
     serv = _get_serv()
-    serv.set(jid, json.dumps(load))
-    serv.sadd('jids', jid)
+    pipe = serv.pipeline(transaction=False)
+    pipe.set('load:{0}'.format(jid), json.dumps(load))
+    pipe.sadd('jids', jid)
+    pipe.execute()
 
 
 def get_load(jid):
@@ -66,7 +91,8 @@ def get_load(jid):
     Return the load data that marks a specified jid
     '''
     serv = _get_serv()
-    data = serv.get(jid)
+    # Loads saved by older releases are found under the bare jid
+    data = serv.get('load:{0}'.format(jid)) or serv.get(jid)
     if data:
         return json.loads(data)
     return {}
@@ -77,11 +103,10 @@ def get_jid(jid):
     Return the information returned when the specified job id was executed
     '''
     serv = _get_serv()
+    _migrate(serv)
     ret = {}
-    for minion in serv.smembers('minions'):
-        data = serv.get('{0}:{1}'.format(minion, jid))
-        if data:
-            ret[minion] = json.loads(data)
+    for minion, data in serv.hgetall('ret:{0}'.format(jid)).items():
+        ret[minion] = json.loads(data)
     return ret
 
 
@@ -90,14 +115,16 @@ def get_fun(fun):
     Return a dict of the last function called for all minions
     '''
     serv = _get_serv()
+    _migrate(serv)
+    last = serv.hgetall('fun:{0}'.format(fun))
+    if not last:
+        return {}
+    minions = list(last)
+    pipe = serv.pipeline(transaction=False)
+    for minion in minions:
+        pipe.hget('ret:{0}'.format(last[minion]), minion)
     ret = {}
-    for minion in serv.smembers('minions'):
-        ind_str = '{0}:{1}'.format(minion, fun)
-        try:
-            jid = serv.lindex(ind_str, 0)
-        except Exception:
-            continue
-        data = serv.get('{0}:{1}'.format(minion, jid))
+    for minion, data in zip(minions, pipe.execute()):
         if data:
             ret[minion] = json.loads(data)
     return ret
@@ -117,3 +144,90 @@ def get_minions():
     '''
     serv = _get_serv()
     return list(serv.smembers('minions'))
+
+
+def _key_minion(key, minions):
+    '''
+    Return the minion of an old ``<minion>:<suffix>`` key, None for the keys
+    of no known minion
+    '''
+    pos = key.find(':')
+    while pos != -1:
+        if key[:pos] in minions:
+            return key[:pos]
+        pos = key.find(':', pos + 1)
+    return None
+
+
+def _migrate_keys(serv, keys, jids):
+    '''
+    Move the old keys, a list of (key, minion, suffix), to the ``ret:<jid>``
+    and ``fun:<fun>`` hashes
+    '''
+    pipe = serv.pipeline(transaction=False)
+    for key, minion, suffix in keys:
+        if suffix in jids:
+            pipe.get(key)
+        else:
+            pipe.lindex(key, 0)
+    values = pipe.execute(raise_on_error=False)
+    pipe = serv.pipeline(transaction=False)
+    for (key, minion, suffix), value in zip(keys, values):
+        if value is None or isinstance(value, Exception):
+            continue
+        # Returns written since the upgrade are newer, keep them
+        if suffix in jids:
+            pipe.hsetnx('ret:{0}'.format(suffix), minion, value)
+        else:
+            pipe.hsetnx('fun:{0}'.format(suffix), minion, value)
+        pipe.delete(key)
+    pipe.execute()
+
+
+def _migrate(serv):
+    '''
+    Move the keys written by older releases to the current layout
+    '''
+    global _MIGRATED
+    if _MIGRATED:
+        return
+    if serv.get(LAYOUT_KEY) == LAYOUT:
+        _MIGRATED = True
+        return
+    # Only one process moves the keys, the others carry on meanwhile
+    lock = '{0}:lock'.format(LAYOUT_KEY)
+    if not serv.setnx(lock, 1):
+        return
+    serv.expire(lock, LOCK_TTL)
+    log.info('Moving the redis returner keys to the current layout')
+    jids = serv.smembers('jids')
+    # The old keys of these can not be told from the new ones
+    minions = serv.smembers('minions') - set(['ret', 'fun', 'load', 'salt'])
+    # One pass over the keyspace, the keys are moved a chunk at a time
+    chunk = []
+    for key in serv.scan_iter(match='*:*', count=MIGRATE_CHUNK):
+        minion = _key_minion(key, minions)
+        if minion is None:
+            continue
+        chunk.append((key, minion, key[len(minion) + 1:]))
+        if len(chunk) >= MIGRATE_CHUNK:
+            _migrate_keys(serv, chunk, jids)
+            chunk = []
+            # Hold on to the lock while the keys are moved
+            serv.expire(lock, LOCK_TTL)
+    if chunk:
+        _migrate_keys(serv, chunk, jids)
+    jids = list(jids)
+    pipe = serv.pipeline(transaction=False)
+    for jid in jids:
+        pipe.get(jid)
+    loads = pipe.execute(raise_on_error=False)
+    pipe = serv.pipeline(transaction=False)
+    for jid, load in zip(jids, loads):
+        if load is not None and not isinstance(load, Exception):
+            pipe.setnx('load:{0}'.format(jid), load)
+            pipe.delete(jid)
+    pipe.set(LAYOUT_KEY, LAYOUT)
+    pipe.delete(lock)
+    pipe.execute()
+    _MIGRATED = True
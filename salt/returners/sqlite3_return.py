@@ -17,6 +17,9 @@ minion config::
     returner.sqlite3.database: /usr/lib/salt/salt.db
     returner.sqlite3.timeout: 5.0
 
+The connections are pooled, and with ``returner_batch_size`` set the returns
+are written in batches, see :mod:`salt.utils.returners`.
+
 Use the commands to create the sqlite3 database and tables::
 
     sqlite3 /usr/lib/salt/salt.db << EOF
@@ -50,6 +53,9 @@ import logging
 import json
 import datetime
 
+# Import salt libs
+import salt.utils.returners
+
 # Better safe than sorry here. Even though sqlite3 is included in python
 try:
     import sqlite3
@@ -86,10 +92,19 @@ def _get_conn():
               __salt__['config.option']('returner.sqlite3.timeout')))
     conn = sqlite3.connect(
                   __salt__['config.option']('returner.sqlite3.database'),
-        timeout=float(__salt__['config.option']('returner.sqlite3.timeout')))
+        timeout=float(__salt__['config.option']('returner.sqlite3.timeout')),
+        check_same_thread=False)
     return conn
 
 
+def _pooled_conn():
+    '''
+    Lend out a sqlite3 database connection from the pool
+    '''
+    return salt.utils.returners.get_pool(
+        __virtualname__, _get_conn, __opts__).conn()
+
+
 def _close_conn(conn):
     '''
     Close the sqlite3 database connection
@@ -99,25 +114,40 @@ def _close_conn(conn):
     conn.close()
 
 
-def returner(ret):
+def _insert_returns(rows):
     '''
-    Insert minion return data into the sqlite3 database
+    Insert the rows of minion return data in one transaction
     '''
-    log.debug('sqlite3 returner <returner> called with data: {0}'.format(ret))
-    conn = _get_conn()
-    cur = conn.cursor()
     sql = '''INSERT INTO salt_returns
              (fun, jid, id, fun_args, date, full_ret, success)
              VALUES (:fun, :jid, :id, :fun_args, :date, :full_ret, :success)'''
-    cur.execute(sql,
-                {'fun': ret['fun'],
-                 'jid': ret['jid'],
-                 'id': ret['id'],
-                 'fun_args': str(ret['fun_args']) if ret['fun_args'] else None,
-                 'date': str(datetime.datetime.now()),
-                 'full_ret': json.dumps(ret['return']),
-                 'success': ret['success']})
-    _close_conn(conn)
+    with _pooled_conn() as conn:
+        try:
+            conn.executemany(sql, rows)
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def returner(ret):
+    '''
+    Insert minion return data into the sqlite3 database
+    '''
+    log.debug('sqlite3 returner <returner> called with data: {0}'.format(ret))
+    row = {'fun': ret['fun'],
+           'jid': ret['jid'],
+           'id': ret['id'],
+           'fun_args': str(ret['fun_args']) if ret['fun_args'] else None,
+           'date': str(datetime.datetime.now()),
+           'full_ret': json.dumps(ret['return']),
+           'success': ret['success']}
+    buf = salt.utils.returners.get_buffer(
+        __virtualname__, _insert_returns, __opts__)
+    if buf is None:
+        _insert_returns([row])
+    else:
+        buf.put(row)
 
 
 def save_load(jid, load):
@@ -126,13 +156,12 @@ def save_load(jid, load):
     '''
     log.debug('sqlite3 returner <save_load> called jid:{0} load:{1}'
               .format(jid, load))
-    conn = _get_conn()
-    cur = conn.cursor()
     sql = '''INSERT INTO jids (jid, load) VALUES (:jid, :load)'''
-    cur.execute(sql,
-                {'jid': jid,
-                 'load': json.dumps(load)})
-    _close_conn(conn)
+    with _pooled_conn() as conn:
+        conn.execute(sql,
+                     {'jid': jid,
+                      'load': json.dumps(load)})
+        conn.commit()
 
 
 def get_load(jid):
@@ -1,21 +1,41 @@
 # -*- coding: utf-8 -*-
 '''
 Scan a netmask or ipaddr for open ssh ports
+
+The addresses are probed with non-blocking connects, up to
+``ssh_scan_concurrency`` at a time, on each of the ``ssh_scan_ports``. A probe
+which does not connect within ``ssh_scan_timeout`` seconds counts the port as
+closed. The hosts found are cached for ``ssh_scan_cache_time`` seconds, so
+runs against the same target in the meantime do not scan again.
 '''
 
 # Import python libs
+import os
+import time
+import errno
+import select
 import socket
+import hashlib
+import logging
+import itertools
 
 # Import salt libs
+import salt.payload
+import salt.utils
 import salt.utils.ipaddr
 
+log = logging.getLogger(__name__)
+
+# The connects which are still going
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
 
 def targets(tgt, tgt_type='glob', **kwargs):
     '''
     Return the targets from the flat yaml file, checks opts for location but
     defaults to /etc/salt/roster
     '''
-    rmatcher = RosterMatcher(tgt, tgt_type)
+    rmatcher = RosterMatcher(tgt, tgt_type, __opts__)
     return rmatcher.targets()
 
 
@@ -23,9 +43,19 @@ class RosterMatcher(object):
     '''
     Matcher for the roster data structure
     '''
-    def __init__(self, tgt, tgt_type):
+    def __init__(self, tgt, tgt_type, opts=None):
         self.tgt = tgt
         self.tgt_type = tgt_type
+        self.opts = opts or {}
+        ports = self.opts.get('ssh_scan_ports', [22])
+        if isinstance(ports, (int, str)):
+            ports = str(ports).split(',')
+        self.ports = [int(port) for port in ports]
+        self.timeout = float(self.opts.get('ssh_scan_timeout', 1.0))
+        self.concurrency = _max_concurrency(
+            int(self.opts.get('ssh_scan_concurrency', 1024))
+        )
+        self.cache_time = self.opts.get('ssh_scan_cache_time', 0)
 
     def targets(self):
         '''
@@ -33,7 +63,6 @@ class RosterMatcher(object):
         it is the default
         '''
         addrs = ()
-        ret = {}
         try:
             salt.utils.ipaddr.IPAddress(self.tgt)
             addrs = [self.tgt]
@@ -41,16 +70,176 @@ class RosterMatcher(object):
             try:
                 addrs = salt.utils.ipaddr.IPNetwork(self.tgt).iterhosts()
             except ValueError:
-                pass
-        for addr in addrs:
-            addr = str(addr)
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(0.01)
-                sock.connect((addr, 22))
-                sock.shutdown(socket.SHUT_RDWR)
-                sock.close()
-                ret[addr] = {'host': addr}
-            except socket.error:
-                pass
+                return {}
+        ret = self._cached()
+        if ret is not None:
+            return ret
+        ret = {}
+        found = scan(
+            (str(addr) for addr in addrs),
+            self.ports,
+            self.timeout,
+            self.concurrency
+        )
+        for addr, port in found.items():
+            ret[addr] = {'host': addr}
+            if port != 22:
+                ret[addr]['port'] = port
+        self._store(ret)
         return ret
+
+    def _cache_path(self):
+        if not self.cache_time or not self.opts.get('cachedir'):
+            return None
+        key = hashlib.sha1('{0}:{1}'.format(
+            self.tgt, ','.join(str(port) for port in self.ports)
+        )).hexdigest()
+        return os.path.join(
+            self.opts['cachedir'], 'roster', 'scan', '{0}.p'.format(key)
+        )
+
+    def _cached(self):
+        '''
+        Return the cached scan of the target, None if there is none or it
+        expired
+        '''
+        path = self._cache_path()
+        if path is None:
+            return None
+        try:
+            if time.time() - os.path.getmtime(path) > self.cache_time:
+                return None
+            with salt.utils.fopen(path, 'rb') as fp_:
+                return salt.payload.Serial(self.opts).load(fp_)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, ret):
+        path = self._cache_path()
+        if path is None:
+            return
+        cachedir = os.path.dirname(path)
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+            with salt.utils.fopen(tmp, 'w+b') as fp_:
+                fp_.write(salt.payload.Serial(self.opts).dumps(ret))
+            os.rename(tmp, path)
+        except (IOError, OSError) as exc:
+            log.warning(
+                'Unable to cache the scan of {0}: {1}'.format(self.tgt, exc)
+            )
+
+
+def _max_concurrency(concurrency):
+    '''
+    Keep the number of open sockets below the file descriptor limit
+    '''
+    try:
+        import resource
+        soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return concurrency
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - 64))
+
+
+class _Poller(object):
+    '''
+    Wait for the sockets to become writable with poll, or with select where
+    poll is not available
+    '''
+    def __init__(self):
+        self.fds = set()
+        if hasattr(select, 'poll'):
+            self.poll = select.poll()
+        else:
+            self.poll = None
+
+    def register(self, fd_):
+        self.fds.add(fd_)
+        if self.poll is not None:
+            self.poll.register(fd_, select.POLLOUT | select.POLLERR |
+                               select.POLLHUP)
+
+    def unregister(self, fd_):
+        self.fds.discard(fd_)
+        if self.poll is not None:
+            self.poll.unregister(fd_)
+
+    def ready(self, timeout):
+        '''
+        Return the ready descriptors, waiting up to timeout seconds
+        '''
+        try:
+            if self.poll is not None:
+                return [fd_ for fd_, _ in self.poll.poll(timeout * 1000)]
+            _, wfds, xfds = select.select([], self.fds, self.fds, timeout)
+            return set(wfds) | set(xfds)
+        except (select.error, IOError, OSError) as exc:
+            if exc.args[0] == errno.EINTR:
+                return []
+            raise
+
+
+def scan(addrs, ports, timeout=1.0, concurrency=1024):
+    '''
+    Probe every port of the addrs with non-blocking connects. Returns a dict
+    of the addrs which accepted a connection, mapped to the first of the
+    ports which was open.
+    '''
+    probes = ((addr, port) for addr in addrs for port in ports)
+    poller = _Poller()
+    if poller.poll is None:
+        # select can not wait on descriptors above FD_SETSIZE
+        concurrency = min(concurrency, 512)
+    # fd -> (socket, addr, port, deadline)
+    active = {}
+    found = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(active) < concurrency:
+            try:
+                addr, port = next(probes)
+            except StopIteration:
+                exhausted = True
+                break
+            family = socket.AF_INET6 if ':' in addr else socket.AF_INET
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+            except socket.error as exc:
+                if exc.errno not in (errno.EMFILE, errno.ENFILE) \
+                        or not active:
+                    raise
+                # Out of descriptors, wait for the probes which are going
+                probes = itertools.chain([(addr, port)], probes)
+                break
+            sock.setblocking(0)
+            err = sock.connect_ex((addr, port))
+            if err in _IN_PROGRESS:
+                fd_ = sock.fileno()
+                active[fd_] = (sock, addr, port, time.time() + timeout)
+                poller.register(fd_)
+                continue
+            if err == 0:
+                found.setdefault(addr, []).append(port)
+            sock.close()
+        if not active:
+            break
+        wait = min(probe[3] for probe in active.values()) - time.time()
+        for fd_ in poller.ready(max(wait, 0)):
+            sock, addr, port, _ = active.pop(fd_)
+            poller.unregister(fd_)
+            if not sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                found.setdefault(addr, []).append(port)
+            sock.close()
+        now = time.time()
+        for fd_, probe in active.items():
+            if probe[3] <= now:
+                del active[fd_]
+                poller.unregister(fd_)
+                probe[0].close()
+    return dict((addr, min(open_, key=ports.index))
+                for addr, open_ in found.items())
@@ -16,9 +16,15 @@ The data sent to the state calls is as follows:
 import os
 import sys
 import copy
+import json
 import site
+import time
+import heapq
+import Queue
+import hashlib
 import fnmatch
 import logging
+import threading
 import collections
 import traceback
 import datetime
@@ -97,6 +103,19 @@ def trim_req(req):
     return req
 
 
+def req_matches(chunk, req_key, req_val):
+    '''
+    Check if a low chunk is matched by a single trimmed requisite
+    '''
+    if (fnmatch.fnmatch(chunk['name'], req_val) or
+        fnmatch.fnmatch(chunk['__id__'], req_val)):
+        return chunk['state'] == req_key
+    elif req_key == 'sls':
+        # Allow requisite tracking of entire sls files
+        return fnmatch.fnmatch(chunk['__sls__'], req_val)
+    return False
+
+
 def state_args(id_, state, high):
     '''
     Return a set of the arguments passed to the named state
@@ -187,6 +206,18 @@ def master_compile(master_opts, minion_opts, grains, id_, saltenv):
     return st_.compile_highstate()
 
 
+def _data_hash(data):
+    '''
+    Return a hash of a data structure which does not depend on dict ordering
+    '''
+    try:
+        serialized = json.dumps(data, sort_keys=True, default=repr)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        # Not stable across runs, the worst case is a cache miss
+        serialized = repr(data)
+    return hashlib.md5(serialized).hexdigest()
+
+
 def ishashable(obj):
     try:
         hash(obj)
@@ -202,6 +233,200 @@ class StateError(Exception):
     pass
 
 
+class ChunkIndex(object):
+    '''
+    Index the low chunks of a run by state and id, by state and name and by
+    sls, so that requisites which are not globs are resolved with dict
+    lookups instead of matching every chunk. Resolved requisites are cached
+    for the rest of the run.
+    '''
+    glob_chars = frozenset('*?[')
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.by_id = {}
+        self.by_name = {}
+        self.by_sls = {}
+        self.cache = {}
+        # fnmatch is case insensitive on Windows, lookups would not be
+        self.literal = not salt.utils.is_windows()
+        for pos, chunk in enumerate(chunks):
+            self.by_id.setdefault(
+                (chunk['state'], chunk['__id__']), []).append(pos)
+            self.by_name.setdefault(
+                (chunk['state'], chunk['name']), []).append(pos)
+            self.by_sls.setdefault(chunk.get('__sls__'), []).append(pos)
+
+    def find(self, req_key, req_val):
+        '''
+        Return the chunks matched by a single trimmed requisite, in the order
+        they appear in the chunks
+        '''
+        if req_val is None:
+            return []
+        if not isinstance(req_val, string_types):
+            return [chunk for chunk in self.chunks
+                    if req_matches(chunk, req_key, req_val)]
+        if (req_key, req_val) in self.cache:
+            return self.cache[(req_key, req_val)]
+        if not self.literal or self.glob_chars.intersection(req_val):
+            found = [chunk for chunk in self.chunks
+                     if req_matches(chunk, req_key, req_val)]
+        else:
+            pos = set(self.by_id.get((req_key, req_val), ()))
+            pos.update(self.by_name.get((req_key, req_val), ()))
+            if req_key == 'sls':
+                for spos in self.by_sls.get(req_val, ()):
+                    chunk = self.chunks[spos]
+                    # A chunk with a matching name or id is only matched
+                    # by its state
+                    if chunk['name'] != req_val and chunk['__id__'] != req_val:
+                        pos.add(spos)
+            found = [self.chunks[ind] for ind in sorted(pos)]
+        self.cache[(req_key, req_val)] = found
+        return found
+
+
+class StateEvents(object):
+    '''
+    Send the progress events of a state run to the master. The events are
+    queued and delivered from a background thread so that executing the
+    states never waits on the master, how the events are grouped depends on
+    the state_events_mode option.
+    '''
+    # How long to wait for the queued events to be delivered when the run
+    # is over
+    close_timeout = 10
+    # Queued by close() to stop the sending thread
+    stop = object()
+
+    def __init__(self, opts, functions, jid):
+        self.opts = opts
+        self.functions = functions
+        self.jid = jid
+        self.mode = opts.get('state_events_mode', 'chunk')
+        if self.mode not in ('chunk', 'batch', 'summary'):
+            log.warning(
+                'Invalid state_events_mode {0!r}, using \'chunk\''.format(
+                    self.mode
+                )
+            )
+            self.mode = 'chunk'
+        if self.mode == 'batch':
+            self.batch_size = max(
+                int(opts.get('state_events_batch_size', 100)), 1)
+        else:
+            self.batch_size = 1
+        self.batch_interval = float(opts.get('state_events_batch_interval', 5))
+        self.summary = {'len': 0,
+                        'total': 0,
+                        'succeeded': 0,
+                        'failed': 0,
+                        'changed': 0}
+        self.queue = None
+        self.thread = None
+        # The parallel state chunks add their events from several threads
+        self.lock = threading.Lock()
+
+    def _tag(self, suffix):
+        return salt.utils.event.tagify(
+                [self.jid, 'prog', self.opts['id'], suffix], 'job'
+                )
+
+    def add(self, chunk_ret, length):
+        '''
+        Queue the progress event of an executed state chunk
+        '''
+        if self.mode == 'summary':
+            with self.lock:
+                self.summary['len'] = length
+                self.summary['total'] += 1
+                if chunk_ret.get('result') is False:
+                    self.summary['failed'] += 1
+                else:
+                    self.summary['succeeded'] += 1
+                if chunk_ret.get('changes'):
+                    self.summary['changed'] += 1
+            return
+        self._put({'tag': self._tag(str(chunk_ret['__run_num__'])),
+                   'data': {'ret': chunk_ret, 'len': length}})
+
+    def _put(self, event):
+        with self.lock:
+            if self.thread is None:
+                self.queue = Queue.Queue()
+                self.thread = threading.Thread(
+                    target=self._run, args=(self.queue,))
+                self.thread.daemon = True
+                self.thread.start()
+            self.queue.put(event)
+
+    def _run(self, queue):
+        '''
+        Collect the queued events and send them once the batch is full, the
+        batch interval passed or the run is over
+        '''
+        batch = []
+        deadline = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(deadline - time.time(), 0)
+            try:
+                event = queue.get(timeout=timeout)
+            except Queue.Empty:
+                event = None
+            if event is not None and event is not self.stop:
+                if not batch:
+                    deadline = time.time() + self.batch_interval
+                batch.append(event)
+            if batch and (event is None or event is self.stop or
+                          len(batch) >= self.batch_size):
+                self._send(batch)
+                batch = []
+            if event is self.stop:
+                return
+
+    def _send(self, batch):
+        preload = {'jid': self.jid}
+        try:
+            if len(batch) == 1:
+                self.functions['event.fire_master'](
+                    batch[0]['data'], batch[0]['tag'], preload=preload)
+            else:
+                for event in batch:
+                    event['jid'] = self.jid
+                    event['id'] = self.opts['id']
+                self.functions['event.fire_master_batch'](
+                    batch, preload=preload)
+        except Exception as exc:
+            log.debug('Failed to send state events: {0}'.format(exc))
+
+    def close(self):
+        '''
+        Flush the queued events at the end of the run
+        '''
+        summary = None
+        with self.lock:
+            if self.mode == 'summary' and self.summary['total']:
+                summary = dict(self.summary)
+                for key in self.summary:
+                    self.summary[key] = 0
+        if summary is not None:
+            self._put({'tag': self._tag('summary'), 'data': summary})
+        with self.lock:
+            thread, queue = self.thread, self.queue
+            self.thread = None
+            self.queue = None
+        if thread is None:
+            return
+        # The queue is drained up to the sentinel before the thread exits
+        queue.put(self.stop)
+        thread.join(self.close_timeout)
+        if thread.is_alive():
+            log.warning('Timed out sending state events to the master')
+
+
 class Compiler(object):
     '''
     Class used to compile and manage the High Data structure
@@ -539,7 +764,10 @@ class State(object):
         self.mod_init = set()
         self.pre = {}
         self.__run_num = 0
+        self.run_num_lock = threading.Lock()
         self.jid = jid
+        self.events = StateEvents(self.opts, self.functions, self.jid)
+        self.chunk_index = None
 
     def _gather_pillar(self):
         '''
@@ -1307,8 +1535,7 @@ class State(object):
                 }
             for err in errors:
                 ret['comment'] += '{0}\n'.format(err)
-            ret['__run_num__'] = self.__run_num
-            self.__run_num += 1
+            ret['__run_num__'] = self.next_run_num()
             format_log(ret)
             self.check_refresh(low, ret)
             return ret
@@ -1407,30 +1634,233 @@ class State(object):
             low['__prereq__'] = False
             return ret
 
-        ret['__run_num__'] = self.__run_num
-        self.__run_num += 1
+        ret['__run_num__'] = self.next_run_num()
         format_log(ret)
         self.check_refresh(low, ret)
         log.info('Completed state [{0}] at time {1}'.format(low['name'], datetime.datetime.now().time().isoformat()))
         return ret
 
+    def next_run_num(self):
+        '''
+        Return the run number of the next state to finish
+        '''
+        with self.run_num_lock:
+            run_num = self.__run_num
+            self.__run_num += 1
+        return run_num
+
     def call_chunks(self, chunks):
         '''
         Iterate over a list of chunks and call them, checking for requires.
         '''
+        if self.opts.get('state_parallel', False):
+            return self.call_chunks_parallel(chunks)
         running = {}
+        try:
+            for low in chunks:
+                if '__FAILHARD__' in running:
+                    running.pop('__FAILHARD__')
+                    return running
+                tag = _gen_tag(low)
+                if tag not in running:
+                    running = self.call_chunk(low, running, chunks)
+                    if self.check_failhard(low, running):
+                        return running
+                self.active = set()
+        finally:
+            self.events.close()
+        return running
+
+    def _parallel_exclusive(self, low):
+        '''
+        Check if a chunk has to run alone when running chunks in parallel.
+        Prereqs switch the shared opts into test mode, providers and module
+        refreshes replace the loaded modules under the running states.
+        '''
+        for key in ('prereq', 'prerequired', 'provider'):
+            if key in low:
+                return True
+        if low.get('reload_modules', False) is True:
+            return True
+        if low['state'] in ('pkg', 'ports'):
+            return True
+        if low['state'] == 'file':
+            if low['fun'] in ('recurse', 'symlink'):
+                return True
+            if low['fun'] == 'managed' and str(low['name']).endswith(
+                    ('.py', '.pyx', '.pyo', '.pyc', '.so')):
+                return True
+        return False
+
+    def _parallel_deps(self, chunks):
+        '''
+        Return the tags of the chunks each chunk requires or watches
+        '''
+        index = self.index_chunks(chunks)
+        deps = []
         for low in chunks:
-            if '__FAILHARD__' in running:
-                running.pop('__FAILHARD__')
-                return running
             tag = _gen_tag(low)
-            if tag not in running:
-                running = self.call_chunk(low, running, chunks)
-                if self.check_failhard(low, running):
-                    return running
+            dep = set()
+            for r_state in ('require', 'watch'):
+                for req in low.get(r_state) or []:
+                    req = trim_req(req)
+                    req_key = next(iter(req))
+                    for chunk in index.find(req_key, req[req_key]):
+                        dep.add(_gen_tag(chunk))
+            dep.discard(tag)
+            deps.append(dep)
+        return deps
+
+    def call_chunks_parallel(self, chunks):
+        '''
+        Call the chunks in a pool of threads. A chunk is started as soon as
+        all the chunks it requires or watches have run, at most
+        state_parallel_workers chunks run at the same time and no more than
+        the cap set in state_parallel_caps (default 1) run for any one state
+        module. Chunks which cannot run alongside others are called on their
+        own, the same way call_chunks does.
+        '''
+        running = {}
+        workers = max(int(self.opts.get('state_parallel_workers', 4)), 1)
+        caps = self.opts.get('state_parallel_caps') or {}
+        start_num = self.__run_num
+        deps = self._parallel_deps(chunks)
+        # The positions waiting on each tag and the tags each position still
+        # waits on
+        dependents = {}
+        unmet = []
+        ready = []
+        for pos, dep in enumerate(deps):
+            unmet.append(set(dep))
+            for tag in dep:
+                dependents.setdefault(tag, []).append(pos)
+            if not dep:
+                ready.append(pos)
+        heapq.heapify(ready)
+        pending = set(range(len(chunks)))
+        seen = set()
+        inflight = {}
+        done = Queue.Queue()
+        failhard = False
+
+        def _call(low):
+            try:
+                self.call_chunk(low, running, chunks)
+            finally:
+                done.put(low)
+
+        def _update():
+            # Release the chunks waiting on states which finished, call_chunk
+            # can run more than one chunk when it resolves requisites
+            for tag in set(running).difference(seen):
+                seen.add(tag)
+                for pos in dependents.get(tag, ()):
+                    unmet[pos].discard(tag)
+                    if not unmet[pos] and pos in pending:
+                        heapq.heappush(ready, pos)
+
+        def _call_serial(low):
+            self.call_chunk(low, running, chunks)
             self.active = set()
+            _update()
+            return (running.pop('__FAILHARD__', False) or
+                    self.check_failhard(low, running))
+
+        try:
+            while pending or inflight:
+                blocked = []
+                while ready and not failhard:
+                    pos = ready[0]
+                    if pos not in pending:
+                        heapq.heappop(ready)
+                        continue
+                    low = chunks[pos]
+                    tag = _gen_tag(low)
+                    if tag in running:
+                        heapq.heappop(ready)
+                        pending.discard(pos)
+                        continue
+                    if self._parallel_exclusive(low):
+                        if inflight:
+                            # Wait for the running chunks to finish
+                            break
+                        heapq.heappop(ready)
+                        pending.discard(pos)
+                        failhard = _call_serial(low)
+                        continue
+                    if len(inflight) >= workers:
+                        break
+                    heapq.heappop(ready)
+                    mod = low['state']
+                    if (tag in inflight or
+                            inflight.values().count(mod) >= caps.get(mod, 1)):
+                        blocked.append(pos)
+                        continue
+                    pending.discard(pos)
+                    inflight[tag] = mod
+                    thread = threading.Thread(target=_call, args=(low,))
+                    thread.daemon = True
+                    thread.start()
+                for pos in blocked:
+                    heapq.heappush(ready, pos)
+                if inflight:
+                    low = done.get()
+                    tag = _gen_tag(low)
+                    inflight.pop(tag)
+                    _update()
+                    if tag in running and self.check_failhard(low, running):
+                        failhard = True
+                elif failhard:
+                    break
+                elif pending and not ready:
+                    # None of the chunks left have their requisites met, let
+                    # call_chunk resolve the next one the serial way
+                    pos = min(pending)
+                    pending.discard(pos)
+                    if _gen_tag(chunks[pos]) not in running:
+                        failhard = _call_serial(chunks[pos])
+        finally:
+            self.events.close()
+        running.pop('__FAILHARD__', None)
+        self._renumber(running, chunks, deps, start_num)
         return running
 
+    def _renumber(self, running, chunks, deps, start_num):
+        '''
+        Give the results of a parallel run the run numbers of a serial run in
+        requisite order, so the output does not depend on thread timing
+        '''
+        positions = {}
+        for pos, low in enumerate(chunks):
+            positions.setdefault(_gen_tag(low), pos)
+        tags = [tag for tag in running if tag in positions]
+        remaining = {}
+        dependents = {}
+        for tag in tags:
+            remaining[tag] = set(
+                dep for dep in deps[positions[tag]] if dep in running)
+            for dep in remaining[tag]:
+                dependents.setdefault(dep, []).append(tag)
+        order = []
+        ready = [(positions[tag], tag) for tag in tags if not remaining[tag]]
+        heapq.heapify(ready)
+        while ready:
+            _, tag = heapq.heappop(ready)
+            order.append(tag)
+            for other in dependents.get(tag, ()):
+                remaining[other].discard(tag)
+                if not remaining[other]:
+                    heapq.heappush(ready, (positions[other], other))
+        # Requisite loops are left in chunk order
+        ordered = set(order)
+        order.extend(sorted((tag for tag in tags if tag not in ordered),
+                            key=lambda tag: positions[tag]))
+        order.extend(sorted(tag for tag in running if tag not in positions))
+        for num, tag in enumerate(order):
+            running[tag]['__run_num__'] = start_num + num
+        with self.run_num_lock:
+            self.__run_num = start_num + len(order)
+
     def check_failhard(self, low, running):
         '''
         Check if the low data chunk should send a failhard signal
@@ -1441,6 +1871,15 @@ class State(object):
             return not running[tag]['result']
         return False
 
+    def index_chunks(self, chunks):
+        '''
+        Return the requisite index of the chunks, the index is built once per
+        list of chunks
+        '''
+        if self.chunk_index is None or self.chunk_index.chunks is not chunks:
+            self.chunk_index = ChunkIndex(chunks)
+        return self.chunk_index
+
     def check_requisite(self, low, running, chunks, pre=False):
         '''
         Look into the running data to check the status of all requisite
@@ -1467,28 +1906,16 @@ class State(object):
         reqs = {'require': [], 'watch': [], 'prereq': []}
         if pre:
             reqs['prerequired'] = []
+        index = self.index_chunks(chunks)
         for r_state in reqs:
             if r_state in low and low[r_state] is not None:
                 for req in low[r_state]:
                     req = trim_req(req)
-                    found = False
-                    for chunk in chunks:
-                        req_key = next(iter(req))
-                        req_val = req[req_key]
-                        if req_val is None:
-                            continue
-                        if (fnmatch.fnmatch(chunk['name'], req_val) or
-                            fnmatch.fnmatch(chunk['__id__'], req_val)):
-                            if chunk['state'] == req_key:
-                                found = True
-                                reqs[r_state].append(chunk)
-                        elif req_key == 'sls':
-                            # Allow requisite tracking of entire sls files
-                            if fnmatch.fnmatch(chunk['__sls__'], req_val):
-                                found = True
-                                reqs[r_state].append(chunk)
+                    req_key = next(iter(req))
+                    found = index.find(req_key, req[req_key])
                     if not found:
                         return 'unmet'
+                    reqs[r_state].extend(found)
         fun_stats = set()
         for r_state, chunks in reqs.items():
             if r_state == 'prereq':
@@ -1530,13 +1957,9 @@ class State(object):
         Fire an event on the master bus
         '''
         if not self.opts.get('local') and self.opts.get('state_events', True) and self.opts.get('master_uri'):
-            ret = {'ret': chunk_ret,
-                   'len': length}
-            tag = salt.utils.event.tagify(
-                    [self.jid, 'prog', self.opts['id'], str(chunk_ret['__run_num__'])], 'job'
-                    )
-            preload = {'jid': self.jid}
-            self.functions['event.fire_master'](ret, tag, preload=preload)
+            # The functions are reloaded on module refresh
+            self.events.functions = self.functions
+            self.events.add(chunk_ret, length)
 
     def call_chunk(self, low, running, chunks):
         '''
@@ -1556,34 +1979,23 @@ class State(object):
         if status == 'unmet':
             lost = {}
             reqs = []
+            index = self.index_chunks(chunks)
             for requisite in requisites:
                 lost[requisite] = []
                 if requisite not in low:
                     continue
                 for req in low[requisite]:
                     req = trim_req(req)
-                    found = False
-                    for chunk in chunks:
-                        req_key = next(iter(req))
-                        req_val = req[req_key]
-                        if req_val is None:
-                            continue
-                        if (fnmatch.fnmatch(chunk['name'], req_val) or
-                            fnmatch.fnmatch(chunk['__id__'], req_val)):
-                            if chunk['state'] == req_key:
-                                if requisite == 'prereq':
-                                    chunk['__prereq__'] = True
-                                elif requisite == 'prerequired':
-                                    chunk['__prerequired__'] = True
-                                reqs.append(chunk)
-                                found = True
-                        elif req_key == 'sls':
-                            # Allow requisite tracking of entire sls files
-                            if fnmatch.fnmatch(chunk['__sls__'], req_val):
-                                if requisite == 'prereq':
-                                    chunk['__prereq__'] = True
-                                reqs.append(chunk)
-                                found = True
+                    req_key = next(iter(req))
+                    found = index.find(req_key, req[req_key])
+                    for chunk in found:
+                        if requisite == 'prereq':
+                            chunk['__prereq__'] = True
+                        elif (requisite == 'prerequired' and
+                              chunk['state'] == req_key):
+                            # Not set when matched by a whole sls
+                            chunk['__prerequired__'] = True
+                    reqs.extend(found)
                     if not found:
                         lost[requisite].append(req)
             if lost['require'] or lost['watch'] or lost['prereq'] or lost.get('prerequired'):
@@ -1601,9 +2013,8 @@ class State(object):
                 running[tag] = {'changes': {},
                                 'result': False,
                                 'comment': comment,
-                                '__run_num__': self.__run_num,
+                                '__run_num__': self.next_run_num(),
                                 '__sls__': low['__sls__']}
-                self.__run_num += 1
                 self.event(running[tag], len(chunks))
                 return running
             for chunk in reqs:
@@ -1653,9 +2064,8 @@ class State(object):
             running[tag] = {'changes': {},
                             'result': False,
                             'comment': 'One or more requisite failed',
-                            '__run_num__': self.__run_num,
+                            '__run_num__': self.next_run_num(),
                             '__sls__': low['__sls__']}
-            self.__run_num += 1
         elif status == 'change' and not low.get('__prereq__'):
             ret = self.call(low, chunks, running)
             if not ret['changes']:
@@ -1668,9 +2078,8 @@ class State(object):
             running[tag] = {'changes': {},
                             'result': True,
                             'comment': 'No changes detected',
-                            '__run_num__': self.__run_num,
+                            '__run_num__': self.next_run_num(),
                             '__sls__': low['__sls__']}
-            self.__run_num += 1
         else:
             if low.get('__prereq__'):
                 self.pre[tag] = self.call(low, chunks, running)
@@ -1680,9 +2089,10 @@ class State(object):
             self.event(running[tag], len(chunks))
         return running
 
-    def call_high(self, high):
+    def compile_high(self, high):
         '''
-        Process a high data call and ensure the defined states.
+        Compile high data into the low chunks to execute, return the chunks
+        and a list of errors
         '''
         errors = []
         # If there is extension data reconcile it
@@ -1690,17 +2100,21 @@ class State(object):
         errors += ext_errors
         errors += self.verify_high(high)
         if errors:
-            return errors
+            return [], errors
         high, req_in_errors = self.requisite_in(high)
         errors += req_in_errors
         high = self.apply_exclude(high)
         # Verify that the high data is structurally sound
         if errors:
-            return errors
+            return [], errors
         # Compile and verify the raw chunks
-        chunks = self.compile_high_data(high)
-        # If there are extensions in the highstate, process them and update
-        # the low data chunks
+        return self.compile_high_data(high), errors
+
+    def call_high(self, high):
+        '''
+        Process a high data call and ensure the defined states.
+        '''
+        chunks, errors = self.compile_high(high)
         if errors:
             return errors
         ret = self.call_chunks(chunks)
@@ -1819,6 +2233,8 @@ class BaseHighState(object):
         self.avail = self.__gather_avail()
         self.serial = salt.payload.Serial(self.opts)
         self.building_highstate = {}
+        # The salt:// files fetched per saltenv to compile the highstate
+        self.fetched = collections.defaultdict(set)
 
     def __gather_avail(self):
         '''
@@ -1877,6 +2293,23 @@ class BaseHighState(object):
             envs.update(list(self.opts['file_roots']))
         return envs
 
+    def _cache_top(self, saltenv):
+        '''
+        Cache the top file of a saltenv and record it as part of the
+        highstate
+        '''
+        self.fetched[saltenv].add(self.opts['state_top'])
+        return self.client.cache_file(self.opts['state_top'], saltenv)
+
+    def _get_state(self, sls, saltenv):
+        '''
+        Cache an sls file and record it as part of the highstate
+        '''
+        state_data = self.client.get_state(sls, saltenv)
+        if state_data.get('source'):
+            self.fetched[saltenv].add(state_data['source'])
+        return state_data
+
     def get_tops(self):
         '''
         Gather the top files
@@ -1888,10 +2321,7 @@ class BaseHighState(object):
         if self.opts['environment']:
             tops[self.opts['environment']] = [
                     compile_template(
-                        self.client.cache_file(
-                            self.opts['state_top'],
-                            self.opts['environment']
-                            ),
+                        self._cache_top(self.opts['environment']),
                         self.state.rend,
                         self.state.opts['renderer'],
                         env=self.opts['environment']
@@ -1901,10 +2331,7 @@ class BaseHighState(object):
             for saltenv in self._get_envs():
                 tops[saltenv].append(
                         compile_template(
-                            self.client.cache_file(
-                                self.opts['state_top'],
-                                saltenv
-                                ),
+                            self._cache_top(saltenv),
                             self.state.rend,
                             self.state.opts['renderer'],
                             saltenv=saltenv
@@ -1932,7 +2359,7 @@ class BaseHighState(object):
                             continue
                         tops[saltenv].append(
                                 compile_template(
-                                    self.client.get_state(
+                                    self._get_state(
                                         sls,
                                         saltenv
                                         ).get('dest', False),
@@ -2090,7 +2517,7 @@ class BaseHighState(object):
         '''
         err = ''
         errors = []
-        state_data = self.client.get_state(sls, saltenv)
+        state_data = self._get_state(sls, saltenv)
         fn_ = state_data.get('dest', False)
         if not fn_:
             errors.append(
@@ -2438,6 +2865,86 @@ class BaseHighState(object):
             return False
         return True
 
+    def _fingerprint(self, exclude):
+        '''
+        Return the parts of the compiled highstate cache key which are known
+        before the highstate is rendered
+        '''
+        return {'pillar': _data_hash(self.state.opts['pillar']),
+                'grains': _data_hash(self.opts['grains']),
+                'avail': _data_hash(self.avail),
+                'exclude': exclude,
+                'environment': self.opts['environment'],
+                'state_top': self.opts['state_top']}
+
+    def _file_hashes(self, fetched):
+        '''
+        Return the file server hashes of the fetched files, None if one of
+        them is gone
+        '''
+        hashes = {}
+        for saltenv, paths in fetched.items():
+            for path in paths:
+                hsum = self.client.hash_file(path, saltenv)
+                if not hsum:
+                    return None
+                hashes['{0}|{1}'.format(saltenv, path)] = hsum
+        return hashes
+
+    def _load_compiled(self, cfn, exclude):
+        '''
+        Return the cached low chunks and top matches of the highstate if
+        neither the files it was rendered from, the pillar nor the grains
+        changed since it was compiled
+        '''
+        if not os.path.isfile(cfn):
+            return None
+        try:
+            with salt.utils.fopen(cfn, 'rb') as fp_:
+                data = self.serial.load(fp_)
+        except Exception as exc:
+            log.debug('Unable to read compiled highstate cache {0}: {1}'
+                      .format(cfn, exc))
+            return None
+        if not isinstance(data, dict):
+            return None
+        if data.get('fingerprint') != self._fingerprint(exclude):
+            return None
+        fetched = dict((saltenv, set(paths))
+                       for saltenv, paths in data['fetched'].items())
+        if self._file_hashes(fetched) != data['hashes']:
+            return None
+        return data
+
+    def _write_compiled(self, cfn, exclude, matches, chunks):
+        '''
+        Write the compiled low chunks of the highstate to the cache
+        '''
+        hashes = self._file_hashes(self.fetched)
+        if hashes is None:
+            return
+        data = {'fingerprint': self._fingerprint(exclude),
+                'fetched': dict((saltenv, sorted(paths))
+                                for saltenv, paths in self.fetched.items()),
+                'hashes': hashes,
+                'matches': matches,
+                'chunks': chunks}
+        cumask = os.umask(077)
+        try:
+            with salt.utils.fopen(cfn, 'w+b') as fp_:
+                self.serial.dump(data, fp_)
+        except TypeError:
+            # Can't serialize pydsl
+            try:
+                os.remove(cfn)
+            except OSError:
+                pass
+        except (IOError, OSError):
+            log.error('Unable to write to compiled highstate cache file '
+                      '{0}'.format(cfn))
+        finally:
+            os.umask(cumask)
+
     def call_highstate(self, exclude=None, cache=None, cache_name='highstate',
                        force=False):
         '''
@@ -2462,6 +2969,22 @@ class BaseHighState(object):
                 with salt.utils.fopen(cfn, 'rb') as fp_:
                     high = self.serial.load(fp_)
                     return self.state.call_high(high)
+        if isinstance(exclude, str):
+            exclude = exclude.split(',')
+        compile_cache = (self.opts.get('state_compile_cache', False) and
+                         self._check_pillar(force))
+        ccfn = os.path.join(
+                self.opts['cachedir'],
+                '{0}.compiled.p'.format(cache_name)
+        )
+        if compile_cache:
+            compiled = self._load_compiled(ccfn, exclude)
+            if compiled is not None:
+                log.debug('Nothing the highstate is compiled from has '
+                          'changed, using the compiled highstate cache')
+                self.load_dynamic(compiled['matches'])
+                return self.state.call_chunks(compiled['chunks'])
+        self.fetched.clear()
         #File exists so continue
         err = []
         try:
@@ -2483,8 +3006,6 @@ class BaseHighState(object):
         else:
             high, errors = self.render_highstate(matches)
             if exclude:
-                if isinstance(exclude, str):
-                    exclude = exclude.split(',')
                 if '__exclude__' in high:
                     high['__exclude__'].extend(exclude)
                 else:
@@ -2510,6 +3031,12 @@ class BaseHighState(object):
             log.error(msg.format(cfn))
 
         os.umask(cumask)
+        if compile_cache:
+            chunks, errors = self.state.compile_high(high)
+            if errors:
+                return errors
+            self._write_compiled(ccfn, exclude, matches, chunks)
+            return self.state.call_chunks(chunks)
         return self.state.call_high(high)
 
     def compile_highstate(self):
@@ -17,6 +17,16 @@ import logging
 import pipes
 import json
 import re
+import random
+import httplib
+import urlparse
+import threading
+import functools
+
+try:
+    import fcntl
+except ImportError:
+    pass
 
 # Let's import pwd and catch the ImportError. We'll raise it if this is not
 # Windows
@@ -65,6 +75,53 @@ SSH_PASSWORD_PROMP_RE = re.compile(r'(?:.*)[Pp]assword(?: for .*)?:')
 # Get logging started
 log = logging.getLogger(__name__)
 
+# Seconds spent in each phase of creating a VM, per process
+_PHASES = {}
+_PHASE_STACK = []
+
+
+def timed_phase(phase):
+    '''
+    Add the time spent in the decorated function to the named phase. Time
+    spent in a phase nested inside of another one only counts for the inner
+    phase.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            # [phase, start, seconds spent in nested phases]
+            frame = [phase, time.time(), 0]
+            _PHASE_STACK.append(frame)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _PHASE_STACK.remove(frame)
+                spent = time.time() - frame[1]
+                _PHASES[phase] = _PHASES.get(phase, 0) + spent - frame[2]
+                if _PHASE_STACK:
+                    _PHASE_STACK[-1][2] += spent
+        return wrapped
+    return decorator
+
+
+def reset_phases():
+    '''
+    Forget the phase timings gathered so far
+    '''
+    _PHASES.clear()
+    del _PHASE_STACK[:]
+
+
+def phase_times(total):
+    '''
+    Return the seconds spent in each phase since the last reset, the time
+    which was not spent in any of them counts as ``create``
+    '''
+    ret = dict((phase, round(spent, 3)) for phase, spent in _PHASES.items())
+    ret['create'] = round(max(total - sum(_PHASES.values()), 0), 3)
+    ret['total'] = round(total, 3)
+    return ret
+
 
 def __render_script(path, vm_=None, opts=None, minion=''):
     '''
@@ -278,6 +335,7 @@ def wait_for_fun(fun, timeout=900, **kwargs):
             )
 
 
+@timed_phase('wait_for_port')
 def wait_for_port(host, port=22, timeout=900, gateway=None):
     '''
     Wait until a connection to the specified port can be made on a specified
@@ -427,6 +485,7 @@ def wait_for_port(host, port=22, timeout=900, gateway=None):
         )
 
 
+@timed_phase('wait_for_port')
 def wait_for_winexesvc(host, port, username, password, timeout=900, gateway=None):
     '''
     Wait until winexe connection can be established.
@@ -474,6 +533,7 @@ def validate_windows_cred(host, username='Administrator', password=None):
     return retcode == 0
 
 
+@timed_phase('wait_for_passwd')
 def wait_for_passwd(host, port=22, ssh_timeout=15, username='root',
                     password=None, key_filename=None, maxtries=15,
                     trysleep=1, display_ssh_output=True, gateway=None):
@@ -536,6 +596,7 @@ def wait_for_passwd(host, port=22, ssh_timeout=15, username='root',
             time.sleep(trysleep)
 
 
+@timed_phase('deploy')
 def deploy_windows(host, port=445, timeout=900, username='Administrator',
                    password=None, name=None, pub_key=None, sock_dir=None,
                    conf_file=None, start_action=None, parallel=False,
@@ -653,6 +714,7 @@ def deploy_windows(host, port=445, timeout=900, username='Administrator',
     return False
 
 
+@timed_phase('deploy')
 def deploy_script(host, port=22, timeout=900, username='root',
                   password=None, key_filename=None, script=None,
                   name=None, pub_key=None, sock_dir=None, provider=None,
@@ -1403,6 +1465,7 @@ def remove_sshkey(host, known_hosts=None):
     subprocess.call(cmd, shell=True)
 
 
+@timed_phase('wait_for_ip')
 def wait_for_ip(update_callback,
                 update_args=None,
                 update_kwargs=None,
@@ -1646,6 +1709,297 @@ def delete_minion_cachedir(minion_id, base=None):
             os.remove(path)
 
 
+class NodeCache(object):
+    '''
+    Keep the nodes of a provider location around for ttl seconds, indexed
+    by name and by id, so a node can be found without listing them all.
+
+    The cache lives in a file, so the processes creating the VMs of a map in
+    parallel share it.
+    '''
+    def __init__(self, path, ttl=30):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with salt.utils.fopen(self.path, 'r') as fh_:
+                return json.load(fh_)
+        except (IOError, OSError, ValueError):
+            return {'time': 0, 'nodes': {}, 'ids': {}}
+
+    def _change(self, func):
+        '''
+        Apply func to the cache data, holding the lock of the cache file
+        '''
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with salt.utils.fopen('{0}.lock'.format(self.path), 'w') as lock:
+            if salt.utils.is_fcntl_available():
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            data = self._load()
+            func(data)
+            fd_, tmp = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd_, 'w') as fh_:
+                json.dump(data, fh_)
+            os.rename(tmp, self.path)
+
+    def get(self, name=None, node_id=None):
+        '''
+        Return the cached node by name or id, None if it is not cached or
+        the entry expired
+        '''
+        if not self.ttl:
+            return None
+        data = self._load()
+        if name is None:
+            name = data['ids'].get(node_id)
+        entry = data['nodes'].get(name)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def list(self):
+        '''
+        Return all the nodes if they were all listed within the ttl
+        '''
+        if not self.ttl:
+            return None
+        data = self._load()
+        if time.time() - data['time'] > self.ttl:
+            return None
+        return dict((name, entry[1])
+                    for name, entry in data['nodes'].items())
+
+    def update(self, nodes, id_key='id', complete=False):
+        '''
+        Store the nodes, a complete listing replaces the cached nodes
+        '''
+        if not self.ttl:
+            return
+        now = time.time()
+
+        def _update(data):
+            if complete:
+                data['time'] = now
+                data['nodes'] = {}
+                data['ids'] = {}
+            for name, node in nodes.items():
+                data['nodes'][name] = [now, node]
+                if node.get(id_key):
+                    data['ids'][node[id_key]] = name
+        self._change(_update)
+
+    def remove(self, name):
+        '''
+        Drop a node which was destroyed or renamed
+        '''
+        if not self.ttl or not os.path.isfile(self.path):
+            return
+
+        def _remove(data):
+            entry = data['nodes'].pop(name, None)
+            if entry is not None:
+                data['ids'] = dict((node_id, node_name) for node_id, node_name
+                                   in data['ids'].items() if node_name != name)
+        self._change(_remove)
+
+
+# The state of the HTTP client, per process
+_HTTP_POOLS = {}
+_HTTP_BUCKETS = {}
+_HTTP_METRICS = {}
+_HTTP_LOCK = threading.Lock()
+
+# The status codes of a throttled request
+HTTP_THROTTLE_CODES = (429, 503)
+# The methods of the requests which can safely be sent more than once
+HTTP_IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+
+class TokenBucket(object):
+    '''
+    Let through rate requests a second on average, and up to burst at once
+    '''
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(self.rate, 1))
+        self.tokens = self.capacity
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def consume(self):
+        '''
+        Take a token, waiting for one if the bucket is empty
+        '''
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.stamp) * self.rate
+                )
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _http_conn(scheme, netloc, timeout, reuse=True):
+    '''
+    Return an idle connection to netloc, or a new one
+    '''
+    key = (scheme, netloc, os.getpid())
+    with _HTTP_LOCK:
+        idle = _HTTP_POOLS.setdefault(key, [])
+        if idle and reuse:
+            return idle.pop(), True
+    if scheme == 'https':
+        return httplib.HTTPSConnection(netloc, timeout=timeout), False
+    return httplib.HTTPConnection(netloc, timeout=timeout), False
+
+
+def _http_release(scheme, netloc, conn, maxsize=8):
+    key = (scheme, netloc, os.getpid())
+    with _HTTP_LOCK:
+        idle = _HTTP_POOLS.setdefault(key, [])
+        if len(idle) < maxsize:
+            idle.append(conn)
+            return
+    conn.close()
+
+
+def http_metrics(key=None):
+    '''
+    Return the request counts and latencies of the HTTP client, for one
+    provider key or all of them
+    '''
+    with _HTTP_LOCK:
+        if key is not None:
+            return dict(_HTTP_METRICS.get(key, {}))
+        return dict((name, dict(stats))
+                    for name, stats in _HTTP_METRICS.items())
+
+
+def http_query(url,
+               method='GET',
+               data=None,
+               headers=None,
+               key=None,
+               rate=None,
+               burst=None,
+               attempts=5,
+               backoff=1.0,
+               max_backoff=30.0,
+               retry=None,
+               timeout=60,
+               idempotent=None):
+    '''
+    Send an HTTP request for a cloud driver, returns the status, the
+    headers and the body of the response
+
+    The connections are kept alive and reused. The requests of a key, such
+    as a provider and region, are limited to rate a second with bursts of
+    burst. Throttled requests, and those which retry(status, body) returns
+    True for, are sent again after an exponential backoff, up to attempts
+    times.
+
+    A request which fails to connect is also sent again. One which fails
+    after it was sent may have reached the server, it is only sent again if
+    it is idempotent, which defaults to the GET, HEAD, OPTIONS, PUT and DELETE
+    requests. The other requests are always sent on a new connection.
+    '''
+    parsed = urlparse.urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path = '{0}?{1}'.format(path, parsed.query)
+    if key is None:
+        key = parsed.netloc
+    with _HTTP_LOCK:
+        if rate and key not in _HTTP_BUCKETS:
+            _HTTP_BUCKETS[key] = TokenBucket(rate, burst)
+        bucket = _HTTP_BUCKETS.get(key) if rate else None
+        stats = _HTTP_METRICS.setdefault(
+            key,
+            {'requests': 0, 'errors': 0, 'throttled': 0, 'retries': 0,
+             'latency': 0.0, 'latency_max': 0.0}
+        )
+
+    if idempotent is None:
+        idempotent = method.upper() in HTTP_IDEMPOTENT_METHODS
+
+    attempt = 0
+    while True:
+        if bucket is not None:
+            bucket.consume()
+        # A kept alive connection may have been closed by the server, which
+        # is only found out once the request was sent
+        conn, reused = _http_conn(
+            parsed.scheme, parsed.netloc, timeout, reuse=idempotent)
+        start = time.time()
+        sent = False
+        try:
+            if conn.sock is None:
+                conn.connect()
+            sent = True
+            conn.request(method, path, data, headers or {})
+            resp = conn.getresponse()
+            body = resp.read()
+        except (httplib.HTTPException, socket.error) as exc:
+            conn.close()
+            with _HTTP_LOCK:
+                stats['errors'] += 1
+            if sent and not idempotent:
+                # The request may have reached the server
+                raise
+            if reused:
+                # The server closed the kept alive connection, try a new one
+                continue
+            if attempt >= attempts:
+                raise
+            delay = None
+            log.debug(
+                'HTTP request to {0} failed: {1}'.format(parsed.netloc, exc)
+            )
+        else:
+            latency = time.time() - start
+            with _HTTP_LOCK:
+                stats['requests'] += 1
+                stats['latency'] += latency
+                stats['latency_max'] = max(stats['latency_max'], latency)
+            log.debug(
+                'HTTP {0} {1} returned {2} in {3:.3f}s'.format(
+                    method, parsed.netloc, resp.status, latency
+                )
+            )
+            if resp.will_close:
+                conn.close()
+            else:
+                _http_release(parsed.scheme, parsed.netloc, conn)
+            throttled = resp.status in HTTP_THROTTLE_CODES
+            if not throttled and not (retry and retry(resp.status, body)):
+                return resp.status, dict(resp.getheaders()), body
+            if attempt >= attempts:
+                return resp.status, dict(resp.getheaders()), body
+            with _HTTP_LOCK:
+                stats['throttled' if throttled else 'retries'] += 1
+            delay = resp.getheader('retry-after')
+        attempt += 1
+        try:
+            delay = min(float(delay), max_backoff)
+        except (TypeError, ValueError):
+            delay = min(max_backoff, backoff * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.0)
+        log.debug(
+            'Retrying the HTTP request to {0} in {1:.2f}s, attempt {2} of '
+            '{3}'.format(parsed.netloc, delay, attempt, attempts)
+        )
+        time.sleep(delay)
+
+
 def _salt_cloud_force_ascii(exc):
     '''
     Helper method to try its best to convert any Unicode text into ASCII
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+'''
+Hash files once
+
+The hashes of a file are kept keyed by the inode, mtime and size of the file,
+a file which did not change since it was hashed is not read again. Files
+written by the fileclient are hashed on their way to the disk, with a
+:class:`HashingFile`.
+
+Only the files of at least ``file_hash_cache_min_size`` bytes are kept track
+of, smaller files are cheaper to hash again. Their hashes are also written to
+the minion cache, for the next processes to use, unless ``file_hash_cache`` is
+turned off. The cache is written by :func:`flush`, when a job is done or the
+process exits.
+
+As git does with its index, the hashes of a file modified shortly before it
+was hashed are not trusted: a file rewritten with the same size within the
+mtime granularity of its filesystem keeps its mtime.
+'''
+
+# Import python libs
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+
+# Import salt libs
+import salt.payload
+import salt.utils
+import salt.utils.atomicfile
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 65536
+
+# path -> ((inode, mtime, size), {hash type: hash}, time hashed)
+_HASHES = {}
+# The cache files loaded by this process
+_LOADED = set()
+# The cache files with hashes not written yet -> opts
+_DIRTY = {}
+_LOCK = threading.Lock()
+
+# The hashes of a file modified less than this many seconds before it was
+# hashed are not trusted
+RACY_WINDOW = 2
+
+
+def hash_types(opts):
+    '''
+    Return the hash types to compute for the files the fileclient writes
+    '''
+    return sorted(set(['md5', opts.get('hash_type', 'md5')]))
+
+
+def _stat(path):
+    st_ = os.stat(path)
+    return (st_.st_ino, st_.st_mtime, st_.st_size)
+
+
+def _cache_file(opts):
+    if not opts.get('cachedir') or not opts.get('file_hash_cache', True):
+        return None
+    return os.path.join(opts['cachedir'], 'file_hashes.p')
+
+
+def _load(opts):
+    '''
+    Read in the hashes kept in the minion cache, once per process
+    '''
+    cfn = _cache_file(opts)
+    if cfn is None or cfn in _LOADED:
+        return
+    _LOADED.add(cfn)
+    if not os.path.isfile(cfn):
+        return
+    try:
+        with salt.utils.fopen(cfn, 'rb') as fp_:
+            data = salt.payload.Serial(opts).load(fp_)
+    except (IOError, OSError, ValueError):
+        return
+    if not isinstance(data, dict):
+        return
+    for path, entry in data.items():
+        if len(entry) != 3:
+            # Written without the time of the hash
+            continue
+        stat, sums, hashed = entry
+        _HASHES.setdefault(path, (tuple(stat), sums, hashed))
+
+
+def _save(opts):
+    cfn = _cache_file(opts)
+    if cfn is None:
+        return
+    data = dict((path, entry) for path, entry in _HASHES.items()
+                if os.path.exists(path))
+    try:
+        with salt.utils.atomicfile.atomic_open(cfn, 'w+b') as fp_:
+            salt.payload.Serial(opts).dump(data, fp_)
+    except (IOError, OSError) as exc:
+        log.error('Unable to write the file hash cache {0}: {1}'.format(
+            cfn, exc))
+
+
+def _racy(entry):
+    return entry[0][1] > entry[2] - RACY_WINDOW
+
+
+def flush():
+    '''
+    Write the hashes kept since the last flush to the minion cache
+    '''
+    with _LOCK:
+        dirty = list(_DIRTY.values())
+        _DIRTY.clear()
+        for opts in dirty:
+            _save(opts)
+
+atexit.register(flush)
+
+
+def store(path, sums, opts, stat=None):
+    '''
+    Keep the hashes of the file, a dict of hash type to hash, which were
+    computed while it was written
+    '''
+    if stat is None:
+        stat = _stat(path)
+    if stat[2] < opts.get('file_hash_cache_min_size', 1048576):
+        return
+    new = (stat, {}, time.time())
+    with _LOCK:
+        _load(opts)
+        entry = _HASHES.get(path)
+        if entry is None or entry[0] != stat or (_racy(entry) and
+                                                 not _racy(new)):
+            entry = _HASHES[path] = new
+        entry[1].update(sums)
+        cfn = _cache_file(opts)
+        if cfn is not None:
+            _DIRTY[cfn] = opts
+
+
+def get_hash(path, form, opts):
+    '''
+    Return the hash of the file, only reading the file if it changed since
+    it was last hashed
+    '''
+    stat = _stat(path)
+    if stat[2] >= opts.get('file_hash_cache_min_size', 1048576):
+        with _LOCK:
+            _load(opts)
+            entry = _HASHES.get(path)
+            if (entry is not None and entry[0] == stat and
+                    not _racy(entry) and form in entry[1]):
+                return entry[1][form]
+    hsum = salt.utils.get_hash(path, form, CHUNK_SIZE)
+    if _stat(path) == stat:
+        # The file was not changed while it was read
+        store(path, {form: hsum}, opts, stat)
+    return hsum
+
+
+class HashingFile(object):
+    '''
+    Wrap a file opened for writing, and hash the data written to it
+    '''
+    def __init__(self, fp_, forms=('md5',)):
+        self.fp_ = fp_
+        self.hashes = dict((form, getattr(hashlib, form)()) for form in forms)
+
+    def write(self, data):
+        for hash_obj in self.hashes.values():
+            hash_obj.update(data)
+        self.fp_.write(data)
+
+    def sums(self):
+        '''
+        Return the hashes of the data written so far
+        '''
+        return dict((form, hash_obj.hexdigest())
+                    for form, hash_obj in self.hashes.items())
+
+    def __getattr__(self, name):
+        return getattr(self.fp_, name)
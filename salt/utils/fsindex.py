@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+'''
+Incremental index of the files in a set of fileserver roots
+
+The index walks the roots once and then only rescans the directories which
+changed. When pyinotify is available the changed directories and files are
+taken from inotify events, otherwise the known directories are polled for
+new mtimes. After each refresh the file lists are written to a snapshot in
+the same format as the roots file list cache, next to it, which the master
+workers read without walking the roots themselves.
+'''
+
+# Import python libs
+import os
+import logging
+import threading
+
+# Import salt libs
+import salt.fileserver
+import salt.payload
+import salt.utils
+
+try:
+    import pyinotify
+    HAS_PYINOTIFY = True
+except ImportError:
+    HAS_PYINOTIFY = False
+
+log = logging.getLogger(__name__)
+
+
+def snapshot_path(opts, backend, saltenv):
+    '''
+    Return the path to the file list snapshot for the saltenv
+    '''
+    return os.path.join(
+        opts['cachedir'], 'file_lists', backend, '{0}.index.p'.format(saltenv)
+    )
+
+
+class _Dir(object):
+    '''
+    The state of a single walked directory
+    '''
+    __slots__ = ('mtime', 'dirs', 'files', 'linked')
+
+    def __init__(self, mtime, linked):
+        self.mtime = mtime
+        self.dirs = set()
+        self.files = set()
+        self.linked = linked
+
+
+class FileIndex(object):
+    '''
+    Keep the file lists and the mtime map of a saltenv up to date
+    '''
+    def __init__(self, opts, saltenv, roots, backend='roots'):
+        self.opts = opts
+        self.saltenv = saltenv
+        self.roots = [os.path.normpath(root) for root in roots]
+        self.backend = backend
+        self.serial = salt.payload.Serial(opts)
+        self.lock = threading.RLock()
+        self.thread = None
+        self.generation = 0
+        # root -> reldir -> _Dir
+        self.dirs = {}
+        # full path of a file -> (mtime, is_link)
+        self.files = {}
+        self.ignored = {}
+        self.dirty_dirs = set()
+        self.dirty_files = set()
+        self.rescan = False
+        self.changed = False
+        self.notifier = None
+        if HAS_PYINOTIFY:
+            self._watch()
+        for root in self.roots:
+            self._scan_root(root)
+        self._write()
+
+    def _watch(self):
+        '''
+        Set up an inotify watch on every root
+        '''
+        mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+                pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MODIFY |
+                pyinotify.IN_ATTRIB | pyinotify.IN_DELETE_SELF)
+        manager = pyinotify.WatchManager()
+        try:
+            for root in self.roots:
+                if os.path.isdir(root):
+                    manager.add_watch(root, mask, rec=True, auto_add=True,
+                                      quiet=False)
+        except (pyinotify.WatchManagerError, OSError) as exc:
+            log.warning(
+                'Unable to watch the {0} file roots, falling back to '
+                'polling: {1}'.format(self.saltenv, exc)
+            )
+            manager.close()
+            return
+        self.notifier = pyinotify.Notifier(manager, self._event, timeout=0)
+
+    def _event(self, event):
+        '''
+        Mark the directory or file referred to by an inotify event as dirty
+        '''
+        if event.mask & pyinotify.IN_Q_OVERFLOW:
+            self.rescan = True
+        elif event.dir or event.mask & (pyinotify.IN_CREATE |
+                                         pyinotify.IN_DELETE |
+                                         pyinotify.IN_MOVED_FROM |
+                                         pyinotify.IN_MOVED_TO):
+            self.dirty_dirs.add(event.path)
+            self.dirty_files.add(event.pathname)
+        else:
+            self.dirty_files.add(event.pathname)
+
+    def _ignored(self, rel):
+        if rel not in self.ignored:
+            self.ignored[rel] = salt.fileserver.is_file_ignored(self.opts, rel)
+        return self.ignored[rel]
+
+    def _stat_file(self, full):
+        try:
+            mtime = os.path.getmtime(full)
+        except OSError:
+            # A dangling symlink is still listed
+            try:
+                mtime = os.lstat(full).st_mtime
+            except OSError:
+                return None
+        return mtime, os.path.islink(full)
+
+    def _scan_root(self, root):
+        if root in self.dirs:
+            self._drop_dir(root, '.')
+        self.dirs[root] = {}
+        if os.path.isdir(root):
+            self._scan_dir(root, '.', False)
+
+    def _scan_dir(self, root, rel, linked):
+        '''
+        Scan a directory and everything below it which has not been walked
+        '''
+        full = os.path.normpath(os.path.join(root, rel))
+        try:
+            names = os.listdir(full)
+            mtime = os.stat(full).st_mtime
+        except OSError:
+            self._drop_dir(root, rel)
+            return
+        old = self.dirs[root].get(rel)
+        entry = _Dir(mtime, linked)
+        self.dirs[root][rel] = entry
+        followlinks = self.opts['fileserver_followsymlinks']
+        for name in names:
+            path = os.path.join(full, name)
+            sub = os.path.normpath(os.path.join(rel, name))
+            if os.path.isdir(path):
+                entry.dirs.add(name)
+                if old is not None and name in old.dirs:
+                    continue
+                is_link = os.path.islink(path)
+                if followlinks or not is_link:
+                    self._scan_dir(root, sub, linked or is_link)
+            else:
+                entry.files.add(name)
+                self._refresh_file(path, sub)
+        if old is None or old.dirs != entry.dirs or old.files != entry.files:
+            self.changed = True
+        if old is not None:
+            for name in old.dirs - entry.dirs:
+                self._drop_dir(root, os.path.normpath(os.path.join(rel, name)))
+            for name in old.files - entry.files:
+                self.files.pop(os.path.join(full, name), None)
+                self._clear_hash(os.path.normpath(os.path.join(rel, name)))
+
+    def _drop_dir(self, root, rel):
+        '''
+        Forget a directory and everything below it
+        '''
+        entry = self.dirs[root].pop(rel, None)
+        if entry is None:
+            return
+        self.changed = True
+        full = os.path.normpath(os.path.join(root, rel))
+        for name in entry.files:
+            self.files.pop(os.path.join(full, name), None)
+            self._clear_hash(os.path.normpath(os.path.join(rel, name)))
+        for name in entry.dirs:
+            self._drop_dir(root, os.path.normpath(os.path.join(rel, name)))
+
+    def _clear_hash(self, rel):
+        '''
+        Remove the cached hash of a changed file
+        '''
+        cache_path = os.path.join(
+            self.opts['cachedir'], self.backend, 'hash', self.saltenv,
+            '{0}.hash.{1}'.format(rel, self.opts['hash_type'])
+        )
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+
+    def _locate(self, path):
+        '''
+        Return the root and relative path for a full path
+        '''
+        for root in self.roots:
+            rel = os.path.relpath(path, root)
+            if rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+                return root, rel
+        return None, None
+
+    def _refresh_dir(self, root, rel):
+        entry = self.dirs[root].get(rel)
+        if entry is not None:
+            self._scan_dir(root, rel, entry.linked)
+
+    def _refresh_file(self, path, rel):
+        '''
+        Stat a file again, its cached hash is removed when it changed
+        '''
+        stat = self._stat_file(path)
+        old = self.files.get(path)
+        if stat == old:
+            return
+        if stat is None:
+            del self.files[path]
+        else:
+            self.files[path] = stat
+        if old is not None:
+            self._clear_hash(rel)
+        self.changed = True
+
+    def _poll(self, linked_only=False):
+        '''
+        Find the changed directories and files by stat
+        '''
+        for root in self.roots:
+            for rel, entry in self.dirs[root].items():
+                if linked_only and not entry.linked:
+                    continue
+                if rel not in self.dirs[root]:
+                    # Dropped while rescanning its parent
+                    continue
+                full = os.path.normpath(os.path.join(root, rel))
+                try:
+                    mtime = os.stat(full).st_mtime
+                except OSError:
+                    mtime = None
+                if mtime != entry.mtime:
+                    self._scan_dir(root, rel, entry.linked)
+                for name in entry.files:
+                    self.dirty_files.add(os.path.join(full, name))
+
+    def refresh(self):
+        '''
+        Bring the index up to date, returns True if anything changed
+        '''
+        with self.lock:
+            if self.notifier is not None:
+                if self.notifier.check_events(0):
+                    self.notifier.read_events()
+                    self.notifier.process_events()
+                if self.rescan:
+                    self.rescan = False
+                    for root in self.roots:
+                        self._scan_root(root)
+                # inotify does not follow symlinked directories
+                self._poll(linked_only=True)
+            else:
+                self._poll()
+            for path in sorted(self.dirty_dirs):
+                root, rel = self._locate(path)
+                if root is not None:
+                    self._refresh_dir(root, os.path.normpath(rel))
+            self.dirty_dirs.clear()
+            for path in self.dirty_files:
+                path = os.path.normpath(path)
+                # Files in new directories were stat'ed by the rescan
+                if path in self.files:
+                    root, rel = self._locate(path)
+                    self._refresh_file(path, rel)
+            self.dirty_files.clear()
+            changed = self.changed
+            if changed:
+                self._write()
+            return changed
+
+    def file_lists(self):
+        '''
+        Return the file lists in the format of the roots file list cache
+        '''
+        ret = {'files': set(),
+               'dirs': set(),
+               'empty_dirs': set(),
+               'links': set()}
+        ignoresymlinks = self.opts['fileserver_ignoresymlinks']
+        with self.lock:
+            for root in self.roots:
+                for rel, entry in self.dirs[root].items():
+                    ret['dirs'].add(rel)
+                    if not entry.dirs and not entry.files:
+                        if not self._ignored(rel):
+                            ret['empty_dirs'].add(rel)
+                    full = os.path.normpath(os.path.join(root, rel))
+                    for fname in entry.files:
+                        stat = self.files.get(os.path.join(full, fname))
+                        is_link = stat is not None and stat[1]
+                        if is_link:
+                            ret['links'].add(fname)
+                            if ignoresymlinks:
+                                continue
+                        rel_fn = os.path.normpath(os.path.join(rel, fname))
+                        if not self._ignored(rel_fn):
+                            ret['files'].add(rel_fn)
+        return dict((key, sorted(val)) for key, val in ret.items())
+
+    def mtime_map(self):
+        '''
+        Return a dict of filename -> mtime
+        '''
+        with self.lock:
+            return dict((path, stat[0])
+                        for path, stat in self.files.items())
+
+    def _write(self):
+        '''
+        Atomically replace the snapshot read by the workers
+        '''
+        self.generation += 1
+        self.changed = False
+        path = snapshot_path(self.opts, self.backend, self.saltenv)
+        cachedir = os.path.dirname(path)
+        if not os.path.isdir(cachedir):
+            try:
+                os.makedirs(cachedir)
+            except OSError:
+                log.critical('Unable to make cachedir {0}'.format(cachedir))
+                return
+        data = self.file_lists()
+        data['generation'] = self.generation
+        tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+        with salt.utils.fopen(tmp, 'w+b') as fp_:
+            fp_.write(self.serial.dumps(data))
+        os.rename(tmp, path)
+
+    def start(self):
+        '''
+        Keep refreshing the index in a background thread
+        '''
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        interval = self.opts.get('fileserver_list_cache_time', 30)
+        event = threading.Event()
+        while True:
+            if self.notifier is not None:
+                # Wake up on the first event, then let a burst settle
+                if self.notifier.check_events(interval * 1000):
+                    event.wait(1)
+            else:
+                event.wait(interval)
+            try:
+                self.refresh()
+            except Exception as exc:
+                log.error(
+                    'Exception {0} occurred refreshing the {1} file '
+                    'index'.format(exc, self.saltenv)
+                )
@@ -2182,9 +2182,10 @@ class SaltSSHOptionParser(OptionParser, ConfigDirMixIn, MergeConfigMixIn,
             default=25,
             type=int,
             help='Set the number of concurrent minions to communicate with. '
-                 'This value defines how many processes are opened up at a '
-                 'time to manage connections, the more running processes the '
-                 'faster communication should be, default is %default'
+                 'This value defines how many threads or processes are '
+                 'opened up at a time to manage connections, the more '
+                 'running at once the faster communication should be, '
+                 'default is %default'
         )
         self.add_option(
             '-v', '--verbose',
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+'''
+Connection pooling and write buffering for the database returners
+
+A returner which writes to a database can keep its connections in a
+:class:`ConnectionPool` instead of connecting for every return, and hand its
+rows to a :class:`ReturnBuffer`, which writes them out as multi-row inserts
+every ``returner_batch_size`` rows or ``returner_batch_interval``
+milliseconds, whichever comes first.
+
+At most ``returner_batch_queue`` rows are held in memory, once the queue is
+full the caller writes the queue out itself, which holds back the return
+path until the database catches up. Rows which fail to be written are spooled
+to the cachedir and written again after the next successful write, by
+whichever process claims the spool first.
+
+Minion job processes exit without running the atexit handlers, the minion
+writes out their buffers with :func:`flush_buffers` when the job is done.
+'''
+
+# Import python libs
+import os
+import time
+import errno
+import atexit
+import logging
+import threading
+import collections
+from contextlib import contextmanager
+
+# Import salt libs
+import salt.payload
+import salt.utils
+
+log = logging.getLogger(__name__)
+
+# (name, pid) -> ConnectionPool or ReturnBuffer, a forked process starts out
+# with its own
+_POOLS = {}
+_BUFFERS = {}
+_LOCK = threading.Lock()
+
+
+def get_pool(name, connect, opts, close=None, check=None):
+    '''
+    Return the connection pool of the named returner in this process
+    '''
+    key = (name, os.getpid())
+    with _LOCK:
+        if key not in _POOLS:
+            _POOLS[key] = ConnectionPool(
+                connect,
+                size=opts.get('returner_pool_size', 4),
+                close=close,
+                check=check)
+        return _POOLS[key]
+
+
+def get_buffer(name, flush, opts):
+    '''
+    Return the write buffer of the named returner in this process, None if
+    returns are not batched
+    '''
+    if not opts.get('returner_batch_size', 0):
+        return None
+    key = (name, os.getpid())
+    with _LOCK:
+        if key not in _BUFFERS:
+            _BUFFERS[key] = ReturnBuffer(name, flush, opts)
+        return _BUFFERS[key]
+
+
+def flush_buffers():
+    '''
+    Write out what is queued in the write buffers of this process
+    '''
+    pid = os.getpid()
+    with _LOCK:
+        buffers = [buf for key, buf in _BUFFERS.items() if key[1] == pid]
+    for buf in buffers:
+        buf.flush()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno != errno.ESRCH
+    return True
+
+
+class ConnectionPool(object):
+    '''
+    Hand out open connections, keeping up to size of them around between
+    uses. The servers close the connections which stay idle for too long,
+    an idle connection is handed out again only if check(conn) does not
+    raise.
+    '''
+    def __init__(self, connect, size=4, close=None, check=None):
+        self.connect = connect
+        self.size = size
+        self._close = close or (lambda conn: conn.close())
+        self._check = check
+        self.idle = collections.deque()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def conn(self):
+        '''
+        Lend out a connection for the duration of the block. A connection
+        used by a block which raised is closed, it may be broken.
+        '''
+        conn = self._checkout()
+        try:
+            yield conn
+        except Exception:
+            self._discard(conn)
+            raise
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _checkout(self):
+        while True:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                return self.connect()
+            if self._check is None:
+                return conn
+            try:
+                self._check(conn)
+            except Exception as exc:
+                log.debug(
+                    'Dropping a pooled connection which was closed: '
+                    '{0}'.format(exc)
+                )
+                self._discard(conn)
+                continue
+            return conn
+
+    def _discard(self, conn):
+        try:
+            self._close(conn)
+        except Exception:
+            pass
+
+    def close(self):
+        '''
+        Close the idle connections
+        '''
+        with self.lock:
+            idle = list(self.idle)
+            self.idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+
+class ReturnBuffer(object):
+    '''
+    Queue up rows and write them out in batches from a background thread
+    '''
+    def __init__(self, name, flush, opts):
+        self.name = name
+        self._flush = flush
+        self.batch_size = max(int(opts.get('returner_batch_size', 100)), 1)
+        self.interval = opts.get('returner_batch_interval', 1000) / 1000.0
+        self.max_queue = max(
+            int(opts.get('returner_batch_queue', 10000)), self.batch_size)
+        self.spool_dir = os.path.join(
+            opts.get('cachedir', ''), 'returners', 'spool', name)
+        self.serial = salt.payload.Serial(opts)
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.stopped = False
+        self.spooled = os.path.isdir(self.spool_dir) and \
+            bool(os.listdir(self.spool_dir))
+        atexit.register(self.stop)
+
+    def put(self, row):
+        '''
+        Queue a row to be written
+        '''
+        with self.cond:
+            self.queue.append(row)
+            size = len(self.queue)
+            if size >= self.batch_size:
+                self.cond.notify()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run)
+                self.thread.daemon = True
+                self.thread.start()
+        if size >= self.max_queue:
+            # The writer is not keeping up, hold the caller back
+            self.flush()
+
+    def flush(self):
+        '''
+        Write out everything which is queued
+        '''
+        with self.flush_lock:
+            with self.cond:
+                rows = list(self.queue)
+                self.queue.clear()
+            for ind in range(0, len(rows), self.batch_size):
+                self._write(rows[ind:ind + self.batch_size])
+
+    def stop(self):
+        '''
+        Stop the background thread and write out what is left
+        '''
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.thread is not None and \
+                self.thread is not threading.current_thread():
+            self.thread.join(self.interval + 5)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if len(self.queue) < self.batch_size and not self.stopped:
+                    self.cond.wait(self.interval)
+                stopped = self.stopped
+            self.flush()
+            if stopped:
+                return
+
+    def _write(self, rows):
+        try:
+            self._flush(rows)
+        except Exception as exc:
+            log.error(
+                'Failed to write {0} returns to {1}, spooling them: {2}'.format(
+                    len(rows), self.name, exc
+                )
+            )
+            self._spool(rows)
+            return
+        if self.spooled:
+            self._replay()
+
+    def _spool(self, rows):
+        try:
+            if not os.path.isdir(self.spool_dir):
+                os.makedirs(self.spool_dir)
+            path = os.path.join(
+                self.spool_dir,
+                '{0:.6f}-{1}.p'.format(time.time(), os.getpid()))
+            tmp = '{0}.tmp'.format(path)
+            with salt.utils.fopen(tmp, 'w+b') as fp_:
+                fp_.write(self.serial.dumps(rows))
+            os.rename(tmp, path)
+            self.spooled = True
+        except (IOError, OSError) as exc:
+            log.error(
+                'Unable to spool {0} returns for {1}, they are lost: {2}'.format(
+                    len(rows), self.name, exc
+                )
+            )
+
+    def _spools(self):
+        '''
+        Return the names of the spools which are not claimed, oldest first,
+        along with the claims of processes which died
+        '''
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            return []
+        spools = []
+        for fn_ in names:
+            if fn_.endswith('.p'):
+                spools.append(fn_)
+            elif fn_.endswith('.replaying'):
+                try:
+                    pid = int(fn_.split('.')[-2])
+                except ValueError:
+                    continue
+                if pid != os.getpid() and not _pid_alive(pid):
+                    spools.append(fn_)
+        return sorted(spools)
+
+    def _replay(self):
+        '''
+        Write out the spooled rows, oldest first. The processes share the
+        spool directory, a spool is claimed by renaming it before its rows
+        are written so that no two processes write the same rows.
+        '''
+        for fn_ in self._spools():
+            # <time>-<pid>.p, or <time>-<pid>.p.<pid>.replaying if claimed
+            path = os.path.join(self.spool_dir, fn_[:fn_.index('.p') + 2])
+            claim = '{0}.{1}.replaying'.format(path, os.getpid())
+            try:
+                os.rename(os.path.join(self.spool_dir, fn_), claim)
+            except OSError:
+                # Claimed by another process
+                continue
+            try:
+                with salt.utils.fopen(claim, 'rb') as fp_:
+                    rows = self.serial.load(fp_)
+            except (IOError, OSError, ValueError) as exc:
+                log.error('Dropping unreadable spool {0}: {1}'.format(
+                    path, exc))
+                rows = []
+            if rows:
+                try:
+                    self._flush(rows)
+                except Exception as exc:
+                    log.error(
+                        'Failed to write the spooled returns of {0}: '
+                        '{1}'.format(self.name, exc)
+                    )
+                    # Give up the claim, the spool is tried again later
+                    try:
+                        os.rename(claim, path)
+                    except OSError:
+                        pass
+                    return
+            try:
+                os.remove(claim)
+            except OSError:
+                pass
+        self.spooled = False
@@ -32,11 +32,45 @@ code-block:: yaml
           jid_include: True
           maxrunning: 1
 
+Jobs can also be scheduled with a cron-style expression instead of an
+interval. The expression has the usual five fields: minute, hour, day of
+month, month and day of week (0 or 7 is Sunday).
+
+code-block:: yaml
+
+    schedule:
+      nightly_highstate:
+        function: state.highstate
+        cron: '30 2 * * *'
+
+To avoid a whole fleet of minions firing the same job at the same instant, a
+job can be given a splay. A random number of seconds between 0 and the splay
+value is added to every fire time of the job.
+
+code-block:: yaml
+
+    schedule:
+      job1:
+        function: state.sls
+        minutes: 30
+        splay: 120
+        args:
+          - httpd
+
+Jobs are kept in a heap ordered by their next fire time, so evaluating the
+schedule only touches the jobs which are due. Due jobs are started without
+waiting for earlier runs to finish, the maxrunning value of each job is what
+bounds how many copies of it run at the same time. Run time statistics for
+every job are written to the cache directory and can be viewed with the
+``schedule.list`` execution function.
 '''
 
 # Import python libs
 import os
+import copy
 import time
+import heapq
+import random
 import datetime
 import multiprocessing
 import threading
@@ -70,6 +104,18 @@ class Schedule(object):
         self.schedule_returner = self.option('schedule_returner')
         # Keep track of the lowest loop interval needed in this variable
         self.loop_interval = sys.maxint
+        # Heap of (next_fire, job) tuples, entries which do not match the
+        # time stored in self.next_fire are stale and skipped when popped
+        self.heap = []
+        self.next_fire = {}
+        # The job data each heap entry was computed from, used to notice
+        # when a job is changed or removed from the schedule
+        self.jobs = {}
+        # The processes or threads started for each job which have not been
+        # reaped yet, as (start time, proc) tuples
+        self.running = {}
+        self.stats = {}
+        self.stats_dirty = False
         clean_proc_dir(opts)
 
     def option(self, opt):
@@ -123,8 +169,6 @@ class Schedule(object):
                                     func, data['maxrunning']))
                             return False
 
-        salt.utils.daemonize_if(self.opts)
-
         ret['pid'] = os.getpid()
 
         if 'jid_include' not in data or data['jid_include']:
@@ -180,76 +224,364 @@ class Schedule(object):
         except OSError:
             pass
 
-    def eval(self):
+    def _handle_func_detached(self, func, data):
         '''
-        Evaluate and execute the schedule
+        Run handle_func in a new session. Unlike daemonize_if the process stays
+        a child of the minion or master, so the run can be reaped and timed.
         '''
-        schedule = self.option('schedule')
-        if not isinstance(schedule, dict):
-            return
+        if not salt.utils.is_windows() and 'salt-call' not in sys.argv[0]:
+            try:
+                os.setsid()
+            except OSError:
+                pass
+        self.handle_func(func, data)
+
+    def _interval(self, data):
+        '''
+        Return the number of seconds between two runs of an interval job
+        '''
+        seconds = 0
+        seconds += int(data.get('seconds', 0))
+        seconds += int(data.get('minutes', 0)) * 60
+        seconds += int(data.get('hours', 0)) * 3600
+        seconds += int(data.get('days', 0)) * 86400
+        return seconds
+
+    def _splay(self, data):
+        '''
+        Return the random number of seconds to add to a fire time of the job
+        '''
+        splay = int(data.get('splay', 0))
+        if splay <= 0:
+            return 0
+        return random.randint(0, splay)
+
+    def _calc_next_fire(self, job, data, now):
+        '''
+        Return the next time the job should fire, after it last ran at the
+        time stored in self.intervals
+        '''
+        if 'cron' in data:
+            return Cron(data['cron']).next_fire(now) + self._splay(data)
+        if job not in self.intervals:
+            # Never ran, fire as soon as the splay allows
+            return now + self._splay(data)
+        return (self.intervals[job] + self._interval(data) +
+                self._splay(data))
+
+    def _push(self, job, when):
+        '''
+        Record the next fire time of the job and add it to the heap
+        '''
+        self.next_fire[job] = when
+        heapq.heappush(self.heap, (when, job))
+        self.stats.setdefault(job, _new_stats())['next_fire'] = when
+        self.stats_dirty = True
+
+    def _sync(self, schedule, now):
+        '''
+        Bring the heap in line with the current schedule. Only jobs which are
+        new, changed or removed since the last evaluation are recomputed.
+        '''
+        for job in list(self.jobs):
+            if job not in schedule:
+                self.jobs.pop(job)
+                self.next_fire.pop(job, None)
+                self.stats.pop(job, None)
+                self.stats_dirty = True
+        loop_interval = sys.maxint
         for job, data in schedule.items():
-            if 'function' in data:
-                func = data['function']
-            elif 'func' in data:
-                func = data['func']
-            elif 'fun' in data:
-                func = data['fun']
-            else:
-                func = None
-            if func not in self.functions:
-                log.info(
-                    'Invalid function: {0} in job {1}. Ignoring.'.format(
-                        job, func
-                    )
-                )
+            if not isinstance(data, dict):
                 continue
-            # Add up how many seconds between now and then
-            seconds = 0
-            seconds += int(data.get('seconds', 0))
-            seconds += int(data.get('minutes', 0)) * 60
-            seconds += int(data.get('hours', 0)) * 3600
-            seconds += int(data.get('days', 0)) * 86400
+            if 'cron' in data:
+                seconds = 60
+            else:
+                seconds = self._interval(data)
             # Check if the seconds variable is lower than current lowest
             # loop interval needed. If it is lower then overwrite variable
             # external loops using can then check this variable for how often
             # they need to reschedule themselves
-            if seconds < self.loop_interval:
-                self.loop_interval = seconds
-            now = int(time.time())
-            run = False
-            if job in self.intervals:
-                if now - self.intervals[job] >= seconds:
-                    run = True
-            else:
-                run = True
-            if not run:
+            if seconds < loop_interval:
+                loop_interval = seconds
+            if self.jobs.get(job) == data:
                 continue
+            self.jobs[job] = copy.deepcopy(data)
+            try:
+                when = self._calc_next_fire(job, data, now)
+            except ValueError as exc:
+                log.error(
+                    'Invalid schedule for job {0}: {1}'.format(job, exc)
+                )
+                self.next_fire.pop(job, None)
+                continue
+            self._push(job, when)
+        if loop_interval < self.loop_interval:
+            self.loop_interval = loop_interval
+
+    def _reap(self):
+        '''
+        Collect the runs which have finished and update their statistics
+        '''
+        now = time.time()
+        for job, procs in self.running.items():
+            alive = []
+            for start, proc in procs:
+                if proc.is_alive():
+                    alive.append((start, proc))
+                    continue
+                stats = self.stats.setdefault(job, _new_stats())
+                duration = now - start
+                stats['last_duration'] = duration
+                stats['total_duration'] += duration
+                stats['completed'] += 1
+                self.stats_dirty = True
+            if alive:
+                self.running[job] = alive
             else:
-                log.debug('Running scheduled job: {0}'.format(job))
-
-            if 'jid_include' not in data or data['jid_include']:
-                data['jid_include'] = True
-                log.debug('schedule: This job was scheduled with jid_include, '
-                          'adding to cache (jid_include defaults to True)')
-                if 'maxrunning' in data:
-                    log.debug('schedule: This job was scheduled with a max '
-                              'number of {0}'.format(data['maxrunning']))
-                else:
-                    log.info('schedule: maxrunning parameter was not specified for '
-                              'job {0}, defaulting to 1.'.format(job))
-                    data['maxrunning'] = 1
+                self.running.pop(job)
+        for job in self.stats:
+            self.stats[job]['running'] = len(self.running.get(job, []))
 
+    def eval(self):
+        '''
+        Evaluate and execute the schedule
+        '''
+        schedule = self.option('schedule')
+        if not isinstance(schedule, dict):
+            return
+        self._reap()
+        now = int(time.time())
+        self._sync(schedule, now)
+        while self.heap and self.heap[0][0] <= now:
+            when, job = heapq.heappop(self.heap)
+            if self.next_fire.get(job) != when:
+                # Stale entry, the job was changed or removed
+                continue
+            data = copy.deepcopy(self.jobs[job])
             try:
-                if self.opts.get('multiprocessing', True):
-                    thread_cls = multiprocessing.Process
-                else:
-                    thread_cls = threading.Thread
-                proc = thread_cls(target=self.handle_func, args=(func, data))
-                proc.start()
-                if self.opts.get('multiprocessing', True):
-                    proc.join()
+                self._run_job(job, data)
             finally:
                 self.intervals[job] = int(time.time())
+                try:
+                    # Never fire a job twice in the same evaluation
+                    self._push(
+                        job, max(self._calc_next_fire(job, data, now), now + 1)
+                    )
+                except ValueError:
+                    self.next_fire.pop(job, None)
+        if self.stats_dirty:
+            self.stats_dirty = False
+            _write_stats(self.opts, self.stats)
+
+    def _run_job(self, job, data):
+        '''
+        Start a single run of a due job, unless the job already has
+        maxrunning copies of itself running
+        '''
+        if 'function' in data:
+            func = data['function']
+        elif 'func' in data:
+            func = data['func']
+        elif 'fun' in data:
+            func = data['fun']
+        else:
+            func = None
+        if func not in self.functions:
+            log.info(
+                'Invalid function: {0} in job {1}. Ignoring.'.format(
+                    job, func
+                )
+            )
+            return
+        stats = self.stats.setdefault(job, _new_stats())
+
+        if 'jid_include' not in data or data['jid_include']:
+            data['jid_include'] = True
+            log.debug('schedule: This job was scheduled with jid_include, '
+                      'adding to cache (jid_include defaults to True)')
+            if 'maxrunning' in data:
+                log.debug('schedule: This job was scheduled with a max '
+                          'number of {0}'.format(data['maxrunning']))
+            else:
+                log.info('schedule: maxrunning parameter was not specified for '
+                          'job {0}, defaulting to 1.'.format(job))
+                data['maxrunning'] = 1
+            if len(self.running.get(job, [])) >= data['maxrunning']:
+                log.debug(
+                    'schedule: The scheduled job {0} was not started, {1} '
+                    'already running'.format(job, data['maxrunning']))
+                stats['skipped'] += 1
+                self.stats_dirty = True
+                return
+
+        log.debug('Running scheduled job: {0}'.format(job))
+        if self.opts.get('multiprocessing', True):
+            proc = multiprocessing.Process(
+                target=self._handle_func_detached, args=(func, data)
+            )
+        else:
+            proc = threading.Thread(target=self.handle_func, args=(func, data))
+        start = time.time()
+        proc.start()
+        self.running.setdefault(job, []).append((start, proc))
+        stats['runs'] += 1
+        stats['last_run'] = start
+        stats['running'] = len(self.running[job])
+        self.stats_dirty = True
+
+
+class Cron(object):
+    '''
+    Parse a five field cron expression and calculate the times it matches
+    '''
+    # (low, high) bounds of minute, hour, day of month, month, day of week
+    bounds = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        fields = str(expr).split()
+        if len(fields) != 5:
+            raise ValueError(
+                'Cron expression {0!r} does not have 5 fields'.format(expr)
+            )
+        self.expr = expr
+        (self.minutes,
+         self.hours,
+         self.doms,
+         self.months,
+         self.dows) = [self._parse(field, low, high)
+                       for field, (low, high) in zip(fields, self.bounds)]
+        # Sunday can be written as 0 or 7
+        if 7 in self.dows:
+            self.dows.add(0)
+            self.dows.discard(7)
+        # Like cron, when both day fields are restricted a day matches if
+        # either of them does
+        self.dom_star = fields[2] == '*'
+        self.dow_star = fields[4] == '*'
+
+    def _parse(self, field, low, high):
+        '''
+        Return the set of values matched by a single field
+        '''
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/', 1)
+                step = int(step)
+                if step < 1:
+                    raise ValueError('Invalid cron step in {0!r}'.format(field))
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = [int(x) for x in part.split('-', 1)]
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(
+                    'Cron field {0!r} is out of range {1}-{2}'.format(
+                        field, low, high
+                    )
+                )
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day):
+        '''
+        Check the day of month and day of week fields against a date
+        '''
+        # datetime weekday() has Monday as 0, cron has Sunday as 0
+        dow = (day.weekday() + 1) % 7
+        dom_ok = day.day in self.doms
+        dow_ok = dow in self.dows
+        if self.dom_star or self.dow_star:
+            return dom_ok and dow_ok
+        return dom_ok or dow_ok
+
+    def next_fire(self, now):
+        '''
+        Return the first epoch time after now matched by the expression
+        '''
+        when = datetime.datetime.fromtimestamp(int(now) // 60 * 60 + 60)
+        # Five years covers every valid combination, including leap days
+        limit = when + datetime.timedelta(days=366 * 5)
+        while when < limit:
+            if when.month not in self.months:
+                if when.month == 12:
+                    when = when.replace(year=when.year + 1, month=1, day=1,
+                                        hour=0, minute=0)
+                else:
+                    when = when.replace(month=when.month + 1, day=1,
+                                        hour=0, minute=0)
+                continue
+            if not self._day_matches(when):
+                when = (when + datetime.timedelta(days=1)).replace(hour=0,
+                                                                   minute=0)
+                continue
+            if when.hour not in self.hours:
+                when = (when + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            if when.minute not in self.minutes:
+                when += datetime.timedelta(minutes=1)
+                continue
+            return int(time.mktime(when.timetuple()))
+        raise ValueError(
+            'Cron expression {0!r} never matches'.format(self.expr)
+        )
+
+
+def _new_stats():
+    '''
+    Return the empty run time statistics of a job
+    '''
+    return {'runs': 0,
+            'completed': 0,
+            'skipped': 0,
+            'running': 0,
+            'last_run': None,
+            'last_duration': None,
+            'total_duration': 0.0,
+            'next_fire': None}
+
+
+def stats_path(opts):
+    '''
+    Return the path to the file the schedule statistics are stored in
+    '''
+    return os.path.join(opts['cachedir'], 'schedule_stats.p')
+
+
+def _write_stats(opts, stats):
+    '''
+    Persist the run time statistics so they can be read by other processes
+    '''
+    path = stats_path(opts)
+    tmp = '{0}.tmp'.format(path)
+    try:
+        with salt.utils.fopen(tmp, 'w+b') as fp_:
+            salt.payload.Serial(opts).dump(stats, fp_)
+        os.rename(tmp, path)
+    except (IOError, OSError) as exc:
+        log.debug('Unable to write schedule statistics: {0}'.format(exc))
+
+
+def read_stats(opts):
+    '''
+    Return the run time statistics written by the running scheduler
+    '''
+    path = stats_path(opts)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with salt.utils.fopen(path, 'rb') as fp_:
+            stats = salt.payload.Serial(opts).load(fp_)
+    except (IOError, OSError) as exc:
+        log.debug('Unable to read schedule statistics: {0}'.format(exc))
+        return {}
+    if not isinstance(stats, dict):
+        return {}
+    return stats
 
 
 def clean_proc_dir(opts):
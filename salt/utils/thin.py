@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
 '''
 Generate the salt thin tarball from the installed python files
+
+The thin is content addressed, the id of a thin is the hash of its manifest,
+the list of the files in it and their hashes. The manifests of the thins
+which were generated are kept, so a host which still holds an older thin can
+be upgraded by sending only the files which changed.
 '''
 
 # Import python libs
 import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
 import tarfile
+import tempfile
+import StringIO
+import threading
+import subprocess
+from contextlib import closing
 
 # Import third party libs
 import jinja2
@@ -28,6 +43,10 @@ if __name__ == '__main__':
     salt_call()
 '''
 
+# The hashes of the generated bundles, keyed on the path and its stat
+_SUMS = {}
+_SUMS_LOCK = threading.Lock()
+
 
 def gen_thin(cachedir, extra_mods='', overwrite=False):
     '''
@@ -49,11 +68,13 @@ def gen_thin(cachedir, extra_mods='', overwrite=False):
         os.makedirs(thindir)
     thintar = os.path.join(thindir, 'thin.tgz')
     thinver = os.path.join(thindir, 'version')
+    thinid = os.path.join(thindir, 'thin_id')
     salt_call = os.path.join(thindir, 'salt-call')
     with open(salt_call, 'w+') as fp_:
         fp_.write(SALTCALL)
     if os.path.isfile(thintar):
-        if overwrite or not os.path.isfile(thinver):
+        if overwrite or not os.path.isfile(thinver) \
+                or not os.path.isfile(thinid):
             os.remove(thintar)
         elif open(thinver).read() == salt.__version__:
             return thintar
@@ -82,33 +103,181 @@ def gen_thin(cachedir, extra_mods='', overwrite=False):
                 pass
     if HAS_MARKUPSAFE:
         tops.append(os.path.dirname(markupsafe.__file__))
-    tfp = tarfile.open(thintar, 'w:gz', dereference=True)
-    start_dir = os.getcwd()
+    # arcname -> path of the file
+    members = {}
     for top in tops:
-        base = os.path.basename(top)
-        os.chdir(os.path.dirname(top))
         if not os.path.isdir(top):
             # top is a single file module
-            tfp.add(base)
+            members[os.path.basename(top)] = top
             continue
-        for root, dirs, files in os.walk(base):
+        for root, dirs, files in os.walk(top):
             for name in files:
                 if not name.endswith(('.pyc', '.pyo')):
-                    tfp.add(os.path.join(root, name))
-    os.chdir(thindir)
-    tfp.add('salt-call')
+                    full = os.path.join(root, name)
+                    members[os.path.relpath(full, os.path.dirname(top))] = full
+    members['salt-call'] = salt_call
     with open(thinver, 'w+') as fp_:
         fp_.write(salt.__version__)
-    os.chdir(os.path.dirname(thinver))
-    tfp.add('version')
-    os.chdir(start_dir)
-    tfp.close()
+    members['version'] = thinver
+    manifest = dict((arcname, salt.utils.get_hash(path, 'sha1'))
+                    for arcname, path in members.items())
+    id_ = manifest_id(manifest)
+    mandir = os.path.join(thindir, 'manifests')
+    if not os.path.isdir(mandir):
+        os.makedirs(mandir)
+    with salt.utils.fopen(os.path.join(mandir, id_), 'w+') as fp_:
+        json.dump(manifest, fp_)
+    with salt.utils.fopen(thinid, 'w+') as fp_:
+        fp_.write(id_)
+    members['thin_id'] = thinid
+    _write_tar(thintar, sorted(members.items()))
+    # The deltas were made for the previous thin
+    shutil.rmtree(os.path.join(thindir, 'delta'), ignore_errors=True)
     return thintar
 
 
+def manifest_id(manifest):
+    '''
+    Return the id of a thin from its manifest
+    '''
+    hsum = hashlib.sha1()
+    for arcname in sorted(manifest):
+        hsum.update('{0}\0{1}\n'.format(arcname, manifest[arcname]))
+    return hsum.hexdigest()
+
+
+def thin_id(cachedir):
+    '''
+    Return the id of the current thin tarball
+    '''
+    gen_thin(cachedir)
+    with salt.utils.fopen(os.path.join(cachedir, 'thin', 'thin_id')) as fp_:
+        return fp_.read().strip()
+
+
+def _read_manifest(thindir, id_):
+    path = os.path.join(thindir, 'manifests', os.path.basename(id_))
+    try:
+        with salt.utils.fopen(path) as fp_:
+            return json.load(fp_)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def thin_delta(cachedir, held):
+    '''
+    Return the path to a tarball which upgrades the thin with the id held by
+    a host to the current thin. The files which were removed are listed in
+    the ``thin.deleted`` file of the tarball. None is returned when the held
+    thin is not known, the full thin has to be sent then.
+    '''
+    thintar = gen_thin(cachedir)
+    current = thin_id(cachedir)
+    if not held or held == current:
+        return None
+    thindir = os.path.dirname(thintar)
+    old = _read_manifest(thindir, held)
+    new = _read_manifest(thindir, current)
+    if old is None or new is None:
+        return None
+    deltadir = os.path.join(thindir, 'delta')
+    delta = os.path.join(
+        deltadir, '{0}-{1}.tgz'.format(os.path.basename(held), current)
+    )
+    if os.path.isfile(delta):
+        return delta
+    if not os.path.isdir(deltadir):
+        try:
+            os.makedirs(deltadir)
+        except OSError:
+            # Made by another routine
+            pass
+    changed = set(arcname for arcname, hsum in new.items()
+                  if old.get(arcname) != hsum)
+    changed.add('thin_id')
+    deleted = sorted(set(old) - set(new))
+    fd_, tarpath = tempfile.mkstemp(dir=deltadir)
+    try:
+        with closing(os.fdopen(fd_, 'w+b')) as tfo:
+            with closing(tarfile.open(fileobj=tfo, mode='w')) as tfp:
+                with closing(tarfile.open(thintar, 'r:gz')) as thin:
+                    for member in thin:
+                        if member.name in changed:
+                            tfp.addfile(member, thin.extractfile(member))
+                info = tarfile.TarInfo('thin.deleted')
+                data = ''.join('{0}\n'.format(name) for name in deleted)
+                info.size = len(data)
+                tfp.addfile(info, StringIO.StringIO(data))
+        gzip_tar(tarpath, delta)
+    finally:
+        os.remove(tarpath)
+    return delta
+
+
+def _write_tar(dest, members):
+    '''
+    Write the (arcname, path) members to the compressed tarball dest
+    '''
+    fd_, tarpath = tempfile.mkstemp(dir=os.path.dirname(dest))
+    try:
+        with closing(os.fdopen(fd_, 'w+b')) as tfo:
+            with closing(tarfile.open(fileobj=tfo, mode='w',
+                                      dereference=True)) as tfp:
+                for arcname, path in members:
+                    tfp.add(path, arcname)
+        gzip_tar(tarpath, dest)
+    finally:
+        os.remove(tarpath)
+
+
+def gzip_tar(src, dest):
+    '''
+    Compress the file src to dest, with pigz when it is available. The
+    result replaces dest atomically.
+    '''
+    fd_, tmp = tempfile.mkstemp(dir=os.path.dirname(dest))
+    pigz = salt.utils.which('pigz')
+    with closing(os.fdopen(fd_, 'w+b')) as ofp:
+        retcode = 1
+        if pigz:
+            with salt.utils.fopen(src, 'rb') as ifp:
+                retcode = subprocess.call(
+                    [pigz, '-n', '-c'], stdin=ifp, stdout=ofp
+                )
+        if retcode:
+            ofp.seek(0)
+            ofp.truncate()
+            kwargs = {}
+            if sys.version_info >= (2, 7):
+                # A fixed mtime keeps the tarball of the same files the same
+                kwargs['mtime'] = 0
+            with closing(gzip.GzipFile(filename='', mode='wb', fileobj=ofp,
+                                       **kwargs)) as gzf:
+                with salt.utils.fopen(src, 'rb') as ifp:
+                    shutil.copyfileobj(ifp, gzf)
+    os.chmod(tmp, 0644)
+    os.rename(tmp, dest)
+
+
+def bundle_sum(path, form='sha1'):
+    '''
+    Return the checksum of a generated bundle, the checksum is only computed
+    again when the bundle changed
+    '''
+    stat = os.stat(path)
+    key = (path, form, stat.st_mtime, stat.st_size, stat.st_ino)
+    with _SUMS_LOCK:
+        if key in _SUMS:
+            return _SUMS[key]
+    hsum = salt.utils.get_hash(path, form)
+    with _SUMS_LOCK:
+        _SUMS[key] = hsum
+    return hsum
+
+
 def thin_sum(cachedir, form='sha1'):
     '''
     Return the checksum of the current thin tarball
     '''
     thintar = gen_thin(cachedir)
-    return salt.utils.get_hash(thintar, form)
+    return bundle_sum(thintar, form)
@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 """For running command line executables with a timeout"""
 
+import os
 import subprocess
 import threading
 import salt.exceptions
 
+# The most read from a pipe at once when streaming
+STREAM_READ_SIZE = 65536
+
 
 class TimedProc(object):
     '''
     Create a TimedProc object, calls subprocess.Popen with passed args and **kwargs
+
+    Pass a callable as stream to have the output handed to it as it is read,
+    as the name of the pipe ('stdout' or 'stderr') and the data read, rather
+    than collected in memory. It is called from one thread per pipe.
     '''
     def __init__(self, args, **kwargs):
 
@@ -20,6 +28,7 @@ class TimedProc(object):
             self.stdin = self.stdin.replace('\\n', '\n')
             kwargs['stdin'] = subprocess.PIPE
         self.with_communicate = kwargs.pop('with_communicate', True)
+        self.stream = kwargs.pop('stream', None)
 
         self.process = subprocess.Popen(args, **kwargs)
 
@@ -29,7 +38,9 @@ class TimedProc(object):
         If timeout is reached, throw TimedProcTimeoutError
         '''
         def receive():
-            if self.with_communicate:
+            if self.stream is not None:
+                self._stream()
+            elif self.with_communicate:
                 (self.stdout, self.stderr) = self.process.communicate(input=self.stdin)
             else:
                 self.process.wait()
@@ -56,3 +67,39 @@ class TimedProc(object):
         else:
             receive()
         return self.process.returncode
+
+    def _stream(self):
+        '''
+        Hand the output to the stream callable as it is read
+        '''
+        def _read(name, pipe):
+            while True:
+                data = os.read(pipe.fileno(), STREAM_READ_SIZE)
+                if not data:
+                    break
+                self.stream(name, data)
+            pipe.close()
+
+        def _write():
+            try:
+                self.process.stdin.write(self.stdin)
+            except (IOError, OSError):
+                # The command does not read all of its input
+                pass
+            self.process.stdin.close()
+
+        threads = []
+        if self.stdin is not None:
+            threads.append(threading.Thread(target=_write))
+        for name in ('stdout', 'stderr'):
+            pipe = getattr(self.process, name)
+            if pipe is not None:
+                threads.append(
+                    threading.Thread(target=_read, args=(name, pipe)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.process.wait()
+        (self.stdout, self.stderr) = (None, None)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.batch_test
+    ~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.cli.batch
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.opts = {'tgt': '*',
+                     'fun': 'test.ping',
+                     'arg': [],
+                     'timeout': 5,
+                     'batch': '2',
+                     'conf_file': '/etc/salt/master'}
+        self.published = []
+        self.queue = []
+        local = MagicMock()
+        local.run_job.side_effect = self._run_job
+        local.event.get_event.side_effect = self._get_event
+        local.cmd_iter.return_value = [{'web{0}'.format(num): True}
+                                       for num in range(5)]
+        with patch('salt.client.LocalClient', MagicMock(return_value=local)):
+            self.batch = salt.cli.batch.Batch(self.opts, quiet=True)
+        self.local = local
+
+    def _run_job(self, tgt, fun, arg, expr_form, timeout=None):
+        jid = str(len(self.published))
+        self.published.append(tgt)
+        self.queue.extend((jid, minion) for minion in tgt)
+        return {'jid': jid, 'minions': tgt}
+
+    def _get_event(self, wait, full=False):
+        jid, minion = self.queue.pop(0)
+        return {'tag': 'salt/job/{0}/ret/{1}'.format(jid, minion),
+                'data': {'jid': jid, 'id': minion, 'return': True}}
+
+    def test_sliding_window(self):
+        rets = list(self.batch.run())
+        self.assertEqual(sorted(rets),
+                         [{'web{0}'.format(num): True} for num in range(5)])
+        # A new minion is started as soon as one returns
+        self.assertEqual([len(tgt) for tgt in self.published],
+                         [2, 1, 1, 1])
+        self.local.event.subscribe.assert_called_once_with('')
+
+    def test_overdue(self):
+        self.opts['timeout'] = 0
+        self.local.gather_job_info.return_value = {}
+        rets = list(self.batch.run())
+        self.assertEqual(sorted(rets),
+                         [{'web{0}'.format(num): {}} for num in range(5)])
+        self.assertFalse(self.local.event.get_event.called)
+
+    def test_overdue_raw(self):
+        self.opts['timeout'] = 0
+        self.opts['raw'] = True
+        self.local.gather_job_info.return_value = {}
+        rets = list(self.batch.run())
+        self.assertEqual(sorted(rets, key=lambda ret: ret['id']),
+                         [{'id': 'web{0}'.format(num), 'ret': {}}
+                          for num in range(5)])
+
+    def test_presence(self):
+        self.opts['batch_presence'] = True
+        ckminions = MagicMock()
+        ckminions.connected_ids.return_value = set(['web1', 'web3'])
+        ckminions.check_minions.return_value = ['web1', 'web2', 'web3']
+        with patch('salt.utils.minions.CkMinions',
+                   MagicMock(return_value=ckminions)):
+            with patch('salt.client.LocalClient',
+                       MagicMock(return_value=self.local)):
+                batch = salt.cli.batch.Batch(self.opts, quiet=True)
+        self.assertEqual(batch.minions, ['web1', 'web3'])
+        ckminions.check_minions.assert_called_once_with('*', 'glob')
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(BatchTestCase, needs_daemon=False)
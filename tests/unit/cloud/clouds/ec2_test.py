@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.cloud.clouds.ec2_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import shutil
+import httplib
+import urlparse
+import tempfile
+import threading
+import multiprocessing
+import BaseHTTPServer
+
+# Import Salt Testing libs
+from salttesting import skipIf, TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../../')
+
+# Import salt libs
+try:
+    from salt.cloud.clouds import ec2
+    HAS_LIBCLOUD = True
+except ImportError:
+    HAS_LIBCLOUD = False
+
+INSTANCE = '''<item>
+  <reservationId>r-{0}</reservationId>
+  <instancesSet><item>
+    <instanceId>i-{0:08x}</instanceId>
+    <imageId>ami-1</imageId>
+    <instanceState><code>16</code><name>running</name></instanceState>
+    <instanceType>t1.micro</instanceType>
+    <tagSet><item><key>Name</key><value>web{0}</value></item></tagSet>
+  </item></instancesSet>
+</item>'''
+
+RESPONSE = '''<DescribeInstancesResponse
+    xmlns="http://ec2.amazonaws.com/doc/2013-10-01/">
+  <requestId>1</requestId>
+  <reservationSet>{0}</reservationSet>
+</DescribeInstancesResponse>'''
+
+
+class EC2StandIn(BaseHTTPServer.HTTPServer):
+    '''
+    Answer DescribeInstances for the web0 to web299 instances
+    '''
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), EC2Handler)
+        self.requests = []
+
+
+class EC2Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = dict(urlparse.parse_qsl(urlparse.urlparse(self.path).query))
+        self.server.requests.append(params)
+        nums = range(300)
+        if 'InstanceId.1' in params:
+            nums = [num for num in nums
+                    if 'i-{0:08x}'.format(num) == params['InstanceId.1']]
+        if 'Filter.1.Value.1' in params:
+            nums = [num for num in nums
+                    if 'web{0}'.format(num) == params['Filter.1.Value.1']]
+        body = RESPONSE.format(''.join(INSTANCE.format(num) for num in nums))
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipIf(HAS_LIBCLOUD is False, 'libcloud is not installed')
+class NodeLookupTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.server = EC2StandIn()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        provider = {'id': 'id', 'key': 'key', 'node_cache_ttl': 30,
+                    'endpoint': '127.0.0.1:{0}'.format(
+                        self.server.server_address[1])}
+        self.patches = [
+            patch.object(ec2, '__opts__', {'cachedir': self.cachedir},
+                         create=True),
+            patch.object(ec2, '__active_provider_name__', 'my-ec2:ec2',
+                         create=True),
+            patch.object(ec2, 'get_configured_provider',
+                         MagicMock(return_value=provider)),
+            patch.object(ec2, 'get_location',
+                         MagicMock(return_value='us-east-1')),
+            # The stand-in does not speak TLS
+            patch.object(httplib, 'HTTPSConnection', httplib.HTTPConnection),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cachedir)
+
+    def test_filtered_and_cached(self):
+        node = ec2._get_node('web5')
+        self.assertEqual(node['instanceId'], 'i-00000005')
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0]['Filter.1.Value.1'], 'web5')
+        self.assertEqual(ec2._get_node('web5'), node)
+        self.assertEqual(ec2.show_instance('web5', call='action'), node)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_shared_with_workers(self):
+        ec2._get_node('web5')
+        que = multiprocessing.Queue()
+        proc = multiprocessing.Process(
+            target=lambda: que.put(ec2._get_node('web5')['instanceId']))
+        proc.start()
+        self.assertEqual(que.get(timeout=10), 'i-00000005')
+        proc.join()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_full_listing(self):
+        self.assertEqual(len(ec2.list_nodes_full('us-east-1')), 300)
+        self.assertEqual(ec2._get_node('web7')['instanceId'], 'i-00000007')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_node_filter(self):
+        self.assertEqual(ec2._node_filter('i-0123abcd'),
+                         {'InstanceId.1': 'i-0123abcd'})
+        self.assertEqual(ec2._node_filter('i-0123456789abcdef0'),
+                         {'InstanceId.1': 'i-0123456789abcdef0'})
+        # A Name tag starting with i-
+        self.assertEqual(ec2._node_filter('i-web1'),
+                         {'Filter.1.Name': 'tag:Name',
+                          'Filter.1.Value.1': 'i-web1'})
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(NodeLookupTestCase, needs_daemon=False)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.cloud.map_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.cloud
+
+
+class CreateParallelTestCase(TestCase):
+    def setUp(self):
+        self.map = salt.cloud.Map.__new__(salt.cloud.Map)
+        self.lock = threading.Lock()
+        self.events = []
+
+    def _create(self, parallel_data):
+        name = parallel_data['name']
+        with self.lock:
+            self.events.append(('start', name))
+        time.sleep(parallel_data['profile']['sleep'])
+        with self.lock:
+            self.events.append(('end', name))
+        if parallel_data['profile'].get('fail'):
+            raise Exception('boom')
+        return {name: {'deployed': True}}
+
+    def _run(self, vms, existing=()):
+        dmap = {'create': {}, 'existing': dict((name, {}) for name in existing)}
+        parallel_data = []
+        for name, profile in vms.items():
+            dmap['create'][name] = {'name': name,
+                                    'requires': profile.get('requires', [])}
+            parallel_data.append({'name': name, 'profile': profile})
+        with patch('salt.cloud.multiprocessing.Pool', ThreadPool):
+            with patch('salt.cloud.create_multiprocessing',
+                       MagicMock(side_effect=self._create)):
+                ret = self.map._create_parallel(dmap, parallel_data, 4)
+        out = {}
+        for obj in ret:
+            out.update(obj)
+        return out
+
+    def test_starts_as_dependencies_finish(self):
+        out = self._run({
+            'slow': {'sleep': 0.5},
+            'fast': {'sleep': 0.05},
+            'after_fast': {'sleep': 0.05, 'requires': ['fast']},
+            'after_slow': {'sleep': 0.05, 'requires': ['slow', 'db']},
+        }, existing=['db'])
+        self.assertEqual(sorted(out), ['after_fast', 'after_slow', 'fast',
+                                       'slow'])
+        # The VM requiring the fast one does not wait on the whole level
+        self.assertLess(self.events.index(('start', 'after_fast')),
+                        self.events.index(('end', 'slow')))
+        self.assertGreater(self.events.index(('start', 'after_slow')),
+                           self.events.index(('end', 'slow')))
+
+    def test_failed_dependency(self):
+        out = self._run({
+            'web': {'sleep': 0, 'fail': True},
+            'app': {'sleep': 0, 'requires': ['web']},
+            'lb': {'sleep': 0, 'requires': ['app']},
+            'db': {'sleep': 0},
+        })
+        self.assertEqual(out['web'], {'Error': 'boom'})
+        self.assertIn('Error', out['app'])
+        self.assertIn('Error', out['lb'])
+        self.assertEqual(out['db'], {'deployed': True})
+        self.assertNotIn(('start', 'app'), self.events)
+        self.assertNotIn(('start', 'lb'), self.events)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(CreateParallelTestCase, needs_daemon=False)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileserver.gitfs_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import hashlib
+import time
+import shutil
+import tempfile
+import subprocess
+
+# Import Salt Testing libs
+from salttesting import TestCase, skipIf
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.utils
+from salt.fileserver import gitfs
+
+
+def _git(cwd, *args):
+    subprocess.check_call(('git',) + args, cwd=cwd,
+                          stdout=open(os.devnull, 'w'))
+
+
+@skipIf(not salt.utils.which('git'), 'git is not installed')
+class GitfsUpdateTestCase(TestCase):
+    provider = None
+
+    def setUp(self):
+        if self.provider is None:
+            self.skipTest('No gitfs provider')
+        self.tmp = tempfile.mkdtemp()
+        self.remotes = [self._repo('one'), self._repo('two')]
+        self.opts = {'cachedir': os.path.join(self.tmp, 'cache'),
+                     'sock_dir': self.tmp,
+                     'fileserver_backend': ['git'],
+                     'fileserver_events': True,
+                     'gitfs_provider': self.provider,
+                     'gitfs_remotes': list(self.remotes),
+                     'gitfs_root': '',
+                     'gitfs_mountpoint': '',
+                     'gitfs_base': 'master',
+                     'gitfs_env_whitelist': [],
+                     'gitfs_env_blacklist': [],
+                     'gitfs_update_backoff': 60}
+        self.event = MagicMock()
+        self.patches = [
+            patch.dict(gitfs.__dict__, {'__opts__': self.opts}),
+            patch('salt.utils.event.MasterEvent',
+                  MagicMock(return_value=self.event)),
+            patch.dict(gitfs._BACKOFF, clear=True),
+            patch.dict(gitfs._FETCHING, clear=True),
+            patch.object(gitfs, '_CHANGED', set()),
+            patch.dict(gitfs._TREES, clear=True),
+            patch.object(gitfs, '_REF_MAP', [None, {}]),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def _repo(self, name):
+        work = os.path.join(self.tmp, name)
+        os.makedirs(work)
+        _git(work, 'init', '-q')
+        os.makedirs(os.path.join(work, 'salt', 'web'))
+        for path in ('top.sls', 'salt/web/init.sls'):
+            with open(os.path.join(work, path), 'w') as fp_:
+                fp_.write(name)
+            _git(work, 'add', path)
+        _git(work, '-c', 'user.name=salt', '-c', 'user.email=salt@localhost',
+             'commit', '-q', '-m', name)
+        _git(work, 'branch', '-M', 'master')
+        bare = os.path.join(self.tmp, '{0}.git'.format(name))
+        _git(self.tmp, 'clone', '-q', '--bare', work, bare)
+        return 'file://' + bare
+
+    def _commit(self, name, data, *branches):
+        work = os.path.join(self.tmp, name)
+        with open(os.path.join(work, 'top.sls'), 'w') as fp_:
+            fp_.write(data)
+        _git(work, '-c', 'user.name=salt', '-c', 'user.email=salt@localhost',
+             'commit', '-q', '-a', '-m', data)
+        for branch in branches:
+            _git(work, 'branch', '-f', branch)
+        _git(work, 'push', '-q', '-f',
+             os.path.join(self.tmp, '{0}.git'.format(name)),
+             'master', *branches)
+
+    def _update(self):
+        gitfs.update()
+        data = self.event.fire_event.call_args[0][0]
+        # Look the remotes up by uri
+        data['remotes'] = dict((ret['uri'], ret)
+                               for ret in data['remotes'].values())
+        return data
+
+    def test_update(self):
+        bad = 'file://' + os.path.join(self.tmp, 'missing.git')
+        self.opts['gitfs_remotes'].append(bad)
+        data = self._update()
+        self.assertTrue(data['changed'])
+        for remote in self.remotes:
+            self.assertEqual(data['remotes'][remote]['result'], 'ok')
+            self.assertTrue(data['remotes'][remote]['changed'])
+            self.assertIn('duration', data['remotes'][remote])
+        self.assertEqual(data['remotes'][bad]['result'], 'error')
+
+        data = self._update()
+        self.assertFalse(data['changed'])
+        self.assertEqual(data['remotes'][self.remotes[0]],
+                         dict(data['remotes'][self.remotes[0]],
+                              result='ok', changed=False))
+        self.assertEqual(data['remotes'][bad]['result'], 'backoff')
+
+    def test_tree_index(self):
+        self._update()
+        load = {'saltenv': 'base'}
+        self.assertEqual(gitfs._get_file_list(dict(load)),
+                         ['salt/web/init.sls', 'top.sls'])
+        self.assertEqual(gitfs._get_dir_list(dict(load)),
+                         ['salt', 'salt/web'])
+        self.opts['gitfs_root'] = 'salt'
+        self.opts['gitfs_mountpoint'] = 'salt://mp'
+        self.assertEqual(gitfs._get_file_list(dict(load)),
+                         ['mp/web/init.sls'])
+        self.assertEqual(gitfs._get_dir_list(dict(load)), ['mp/web'])
+        # Served from the first remote which has the file
+        first = os.path.basename(gitfs.init()[0]['uri'])[:-len('.git')]
+        fnd = gitfs.find_file('mp/web/init.sls')
+        with salt.utils.fopen(fnd['path']) as fp_:
+            self.assertEqual(fp_.read(), first)
+        self.assertEqual(gitfs.find_file('mp/missing.sls'),
+                         {'path': '', 'rel': ''})
+
+    def test_tree_index_cached(self):
+        self._update()
+        with patch.object(gitfs, '_write_ref_map', MagicMock()) as write:
+            self._update()
+            self.assertFalse(write.called)
+        # Another process reads the indexes written by update()
+        gitfs._TREES.clear()
+        gitfs._REF_MAP[:] = [None, {}]
+        with patch.object(gitfs, '_build_tree_index',
+                          MagicMock(side_effect=AssertionError)):
+            self.assertEqual(gitfs._get_file_list({'saltenv': 'base'}),
+                             ['salt/web/init.sls', 'top.sls'])
+
+    def test_file_hash(self):
+        self.opts['gitfs_remotes'] = self.remotes[:1]
+        self.opts['hash_type'] = 'md5'
+        store = os.path.join(self.opts['cachedir'], 'gitfs', 'blob_hashes')
+
+        def _hash(saltenv):
+            fnd = gitfs.find_file('top.sls', saltenv)
+            return gitfs.file_hash({'path': 'top.sls', 'saltenv': saltenv},
+                                   fnd)['hsum']
+
+        def _blob(saltenv):
+            return gitfs.find_file('top.sls', saltenv)['blob']
+
+        def _stored():
+            ret = []
+            for name in os.listdir(store):
+                ret.extend(os.listdir(os.path.join(store, name)))
+            return sorted(ret)
+
+        self._commit('one', 'foo', 'dev')
+        self._update()
+        # Hashed and stored once for both environments
+        self.assertEqual(_hash('base'), hashlib.md5('foo').hexdigest())
+        self.assertEqual(_hash('dev'), _hash('base'))
+        self.assertEqual(len(_stored()), 1)
+        # Stored by the blob SHA
+        self.assertEqual(_stored()[0].split('.')[0],
+                         _blob('base'))
+
+        self._commit('one', 'bar')
+        self._update()
+        self.assertEqual(_hash('base'), hashlib.md5('bar').hexdigest())
+        # The old blob is still referenced by dev
+        self.assertEqual(len(_stored()), 2)
+        self._commit('one', 'baz', 'dev')
+        self._update()
+        self.assertEqual(_stored(), [])
+        # Only the index of the tree both branches point to is kept
+        trees = set(gitfs._ref_map().values()[0].values())
+        self.assertEqual(
+            os.listdir(os.path.join(self.opts['cachedir'], 'gitfs', 'trees')),
+            ['{0}.p'.format(trees.pop())])
+        self.assertEqual(trees, set())
+
+    def test_concurrent_and_timeout(self):
+        def _fetch(repo_conf, provider):
+            time.sleep(1 if repo_conf['uri'] == 'slow' else 0.3)
+            return False
+
+        repos = [{'uri': str(num), 'hash': str(num), 'update_timeout': None}
+                 for num in range(3)]
+        repos.append({'uri': 'slow', 'hash': 'slow', 'update_timeout': 0.5})
+        with patch.object(gitfs, '_fetch', _fetch):
+            start = time.time()
+            data = gitfs._fetch_all(repos, self.provider)
+            self.assertTrue(time.time() - start < 0.8)
+            self.assertEqual([data[str(num)]['result'] for num in range(3)],
+                             ['ok'] * 3)
+            self.assertEqual(data['slow']['result'], 'timeout')
+            self.assertIn('slow', gitfs._BACKOFF)
+            # The abandoned fetch is not started again while it hangs
+            gitfs._BACKOFF.clear()
+            data = gitfs._fetch_all(repos, self.provider)
+            self.assertEqual(data['slow']['result'], 'running')
+
+    def test_late_change(self):
+        def _fetch(repo_conf, provider):
+            time.sleep(0.3)
+            return True
+
+        repos = [{'uri': 'slow', 'hash': 'slow', 'update_timeout': 0.1}]
+        with patch.object(gitfs, '_fetch', _fetch):
+            data = gitfs._fetch_all(repos, self.provider)
+            self.assertEqual(data['slow']['result'], 'timeout')
+            self.assertFalse(data['slow']['changed'])
+            gitfs._FETCHING['slow'].join()
+            # The change of the late fetch is picked up next time
+            data = gitfs._fetch_all(repos, self.provider)
+            self.assertEqual(data['slow']['result'], 'backoff')
+            self.assertTrue(data['slow']['changed'])
+            data = gitfs._fetch_all(repos, self.provider)
+            self.assertFalse(data['slow']['changed'])
+
+    def test_same_uri(self):
+        def _fetch(repo_conf, provider):
+            return repo_conf['hash'] == 'two'
+
+        repos = [{'uri': 'foo', 'hash': 'one', 'update_timeout': None},
+                 {'uri': 'foo', 'hash': 'two', 'update_timeout': None}]
+        with patch.object(gitfs, '_fetch', _fetch):
+            data = gitfs._fetch_all(repos, self.provider)
+        self.assertEqual(sorted(data), ['one', 'two'])
+        self.assertFalse(data['one']['changed'])
+        self.assertTrue(data['two']['changed'])
+
+    def test_backoff(self):
+        repo_conf = {'uri': 'foo', 'hash': 'foo'}
+        self.opts['gitfs_update_backoff_max'] = 200
+        for delay in (60, 120, 200):
+            gitfs._backoff(repo_conf, 1000)
+            self.assertEqual(gitfs._BACKOFF['foo'][1], 1000 + delay)
+
+
+if gitfs.HAS_GITPYTHON:
+    GitfsUpdateTestCase.provider = 'gitpython'
+elif gitfs.HAS_DULWICH:
+    GitfsUpdateTestCase.provider = 'dulwich'
+
+
+@skipIf(not gitfs.HAS_DULWICH, 'dulwich is not installed')
+class DulwichUpdateTestCase(GitfsUpdateTestCase):
+    provider = 'dulwich'
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([GitfsUpdateTestCase, DulwichUpdateTestCase],
+              needs_daemon=False)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileserver.hgfs_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+from salt.fileserver import hgfs
+from salt.utils.odict import OrderedDict
+
+
+class ManifestCacheTestCase(TestCase):
+    def test_bounded(self):
+        repo = MagicMock()
+        repo.manifest.side_effect = lambda rev: [
+            ('node{0}'.format(rev), '644', False, False, 'top.sls')]
+        with patch.object(hgfs, '_MANIFESTS', OrderedDict()), \
+                patch.object(hgfs, 'MANIFEST_CACHE_SIZE', 2):
+            self.assertEqual(hgfs._manifest(repo, 1), {'top.sls': 'node1'})
+            hgfs._manifest(repo, 2)
+            # The least recently used changeset is dropped
+            hgfs._manifest(repo, 1)
+            hgfs._manifest(repo, 3)
+            self.assertEqual(list(hgfs._MANIFESTS), [1, 3])
+            hgfs._manifest(repo, 1)
+            self.assertEqual(repo.manifest.call_count, 3)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(ManifestCacheTestCase, needs_daemon=False)
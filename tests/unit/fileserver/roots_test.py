@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileserver.roots_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.utils.fsindex
+from salt.fileserver import roots
+
+
+class RootsIndexUpdateTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, 'root')
+        os.makedirs(os.path.join(self.root, 'web'))
+        for path in ('top.sls', 'web/init.sls'):
+            with open(os.path.join(self.root, path), 'w') as fp_:
+                fp_.write('foo')
+        self.opts = {'cachedir': os.path.join(self.tmp, 'cache'),
+                     'sock_dir': self.tmp,
+                     'file_roots': {'base': [self.root]},
+                     'hash_type': 'md5',
+                     'file_ignore_regex': None,
+                     'file_ignore_glob': None,
+                     'fileserver_followsymlinks': True,
+                     'fileserver_ignoresymlinks': False,
+                     'fileserver_events': True,
+                     'fileserver_roots_index': True}
+        self.event = MagicMock()
+        self.patches = [
+            patch.dict(roots.__dict__, {'__opts__': self.opts}),
+            patch.dict(roots._INDEXES, clear=True),
+            patch.object(salt.utils.fsindex, 'HAS_PYINOTIFY', False),
+            patch.object(salt.utils.fsindex.FileIndex, 'start', MagicMock()),
+            patch('salt.utils.event.MasterEvent',
+                  MagicMock(return_value=self.event)),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def _changed(self):
+        roots.update()
+        return self.event.fire_event.call_args[0][0]['changed']
+
+    def test_unchanged(self):
+        self.assertTrue(self._changed())
+        self.assertFalse(self._changed())
+        self.assertFalse(self._changed())
+        with open(os.path.join(self.root, 'web', 'new.sls'), 'w') as fp_:
+            fp_.write('bar')
+        self.assertTrue(self._changed())
+        self.assertFalse(self._changed())
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(RootsIndexUpdateTestCase, needs_daemon=False)
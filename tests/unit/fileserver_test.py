@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.fileserver_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import hashlib
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.fileclient
+import salt.fileserver
+import salt.transport
+
+
+class ListPageTestCase(TestCase):
+    def setUp(self):
+        self.files = ['top.sls', 'web/init.sls', 'web/files/httpd.conf',
+                      'webapp/init.sls', 'db/init.sls']
+        self.roots = MagicMock(side_effect=lambda load: self.files)
+        opts = {'fileserver_backend': ['roots'],
+                'fileserver_list_page_size': 2}
+        with patch('salt.loader.fileserver',
+                   MagicMock(return_value={'roots.envs': None,
+                                           'roots.file_list': self.roots})):
+            self.fileserver = salt.fileserver.Fileserver(opts)
+
+    def _pages(self, **load):
+        load.setdefault('saltenv', 'base')
+        ret = []
+        while True:
+            page = self.fileserver.list_page(load)
+            ret.append(page['items'])
+            if not page['marker']:
+                return ret
+            load['marker'] = page['marker']
+
+    def test_file_list_prefix(self):
+        self.assertEqual(self.fileserver.file_list({'saltenv': 'base'}),
+                         sorted(self.files))
+        self.assertEqual(
+            self.fileserver.file_list({'saltenv': 'base', 'prefix': 'web/f'}),
+            ['web/files/httpd.conf'])
+        self.assertEqual(
+            self.fileserver.file_list({'saltenv': 'base', 'prefix': 'web'}),
+            ['web/files/httpd.conf', 'web/init.sls', 'webapp/init.sls'])
+        self.assertEqual(
+            self.fileserver.file_list({'saltenv': 'base', 'prefix': 'x'}),
+            [])
+
+    def test_pages(self):
+        self.assertEqual(self._pages(),
+                         [['db/init.sls', 'top.sls'],
+                          ['web/files/httpd.conf', 'web/init.sls'],
+                          ['webapp/init.sls']])
+        self.assertEqual(self._pages(prefix='web', limit=1),
+                         [['web/files/httpd.conf'],
+                          ['web/init.sls'],
+                          ['webapp/init.sls']])
+        self.assertEqual(self._pages(prefix='web/i'),
+                         [['web/init.sls']])
+
+    def test_version(self):
+        load = {'saltenv': 'base'}
+        version = self.fileserver.list_page(load)['version']
+        load['version'] = version
+        self.assertEqual(self.fileserver.list_page(load),
+                         {'version': version, 'unchanged': True})
+        self.files = self.files + ['new.sls']
+        page = self.fileserver.list_page(load)
+        self.assertNotEqual(page['version'], version)
+        self.assertEqual(page['items'], ['db/init.sls', 'new.sls'])
+
+    def test_index_reused(self):
+        first = self.fileserver._list_index('base', 'files')
+        self.assertIs(self.fileserver._list_index('base', 'files')[1],
+                      first[1])
+
+
+class RemoteListTestCase(TestCase):
+    def setUp(self):
+        case = ListPageTestCase('test_pages')
+        case.setUp()
+        self.fileserver = case.fileserver
+        self.loads = []
+        self.channel = MagicMock()
+        self.channel.send.side_effect = self._send
+        self.patch = patch.object(salt.transport.Channel, 'factory',
+                                  MagicMock(return_value=self.channel))
+        self.patch.start()
+        self.client = salt.fileclient.RemoteClient.__new__(
+            salt.fileclient.RemoteClient)
+        self.client.opts = {}
+        self.client.auth = ''
+        self.client.list_cache = {}
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def _send(self, load):
+        self.loads.append(dict(load))
+        return self.fileserver.list_page(dict(load))
+
+    def test_paged_and_cached(self):
+        files = ['web/files/httpd.conf', 'web/init.sls', 'webapp/init.sls']
+        self.assertEqual(self.client.file_list('base', prefix='web'), files)
+        self.assertEqual(len(self.loads), 2)
+        self.assertEqual(self.client.file_list('base', prefix='web'), files)
+        self.assertEqual(len(self.loads), 3)
+        self.assertIn('version', self.loads[-1])
+
+    def test_old_master(self):
+        self.channel.send.side_effect = [False, ['top.sls']]
+        self.assertEqual(self.client.file_list('base'), ['top.sls'])
+        self.assertEqual(self.channel.send.call_args[0][0]['cmd'],
+                         '_file_list')
+
+
+class HashStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = os.path.join(self.tmp, 'store')
+        self.path = os.path.join(self.tmp, 'file')
+        with open(self.path, 'w') as fp_:
+            fp_.write('foo')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_blob_hash(self):
+        opts = {'hash_type': 'md5'}
+        hsum = hashlib.md5('foo').hexdigest()
+        self.assertEqual(
+            salt.fileserver.blob_hash(opts, self.store, 'abcd', self.path),
+            hsum)
+        self.assertEqual(os.listdir(os.path.join(self.store, 'ab')),
+                         ['abcd.md5'])
+        # Read back from the store, the file is not hashed again
+        os.remove(self.path)
+        self.assertEqual(
+            salt.fileserver.blob_hash(opts, self.store, 'abcd', self.path),
+            hsum)
+
+    def test_reap(self):
+        opts = {'hash_type': 'md5'}
+        for blob in ('abcd', 'abef', 'cdef'):
+            salt.fileserver.blob_hash(opts, self.store, blob, self.path)
+        self.assertEqual(
+            salt.fileserver.reap_hash_store(self.store, set(['abef'])), 2)
+        self.assertEqual(os.listdir(self.store), ['ab'])
+        self.assertEqual(os.listdir(os.path.join(self.store, 'ab')),
+                         ['abef.md5'])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([ListPageTestCase, RemoteListTestCase, HashStoreTestCase],
+              needs_daemon=False)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.key_test
+    ~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.key
+
+
+class KeyTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pki_dir = os.path.join(self.tmp, 'pki')
+        self.cachedir = os.path.join(self.tmp, 'cache')
+        for keydir in ('minions', 'minions_pre', 'minions_rejected'):
+            os.makedirs(os.path.join(self.pki_dir, keydir))
+        for minion in ('web1', 'web2', 'db1'):
+            self._write('minions_pre', minion)
+        self._write('minions', 'old')
+        os.makedirs(os.path.join(self.cachedir, 'minions', 'old'))
+        self.opts = {'pki_dir': self.pki_dir,
+                     'cachedir': self.cachedir,
+                     'sock_dir': self.tmp,
+                     'user': 'root'}
+        with patch('salt.utils.event.MasterEvent', MagicMock()):
+            self.key = salt.key.Key(self.opts)
+        self.patch = patch('salt.crypt.dropfile', MagicMock())
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.tmp)
+
+    def _write(self, keydir, minion):
+        with open(os.path.join(self.pki_dir, keydir, minion), 'w') as fp_:
+            fp_.write('key')
+
+    def _events(self):
+        return [call[0][0] for call in self.key.event.fire_event.call_args_list]
+
+    def test_index(self):
+        keys = self.key.list_keys()
+        self.assertEqual(keys['minions_pre'], ['db1', 'web1', 'web2'])
+        # An unchanged directory is not read again
+        pre = os.path.join(self.pki_dir, 'minions_pre')
+        salt.key._KEY_INDEX[pre] = (salt.key._KEY_INDEX[pre][0],
+                                    salt.key._KEY_INDEX[pre][1] + 2,
+                                    ['cached'])
+        self.assertEqual(self.key.list_keys()['minions_pre'], ['cached'])
+        # A changed one is
+        self._write('minions_pre', 'web3')
+        mtime = os.path.getmtime(pre) + 5
+        os.utime(pre, (mtime, mtime))
+        self.assertEqual(self.key.list_keys()['minions_pre'],
+                         ['db1', 'web1', 'web2', 'web3'])
+
+    def test_accept(self):
+        self.assertEqual(self.key.accept('web*'),
+                         {'minions': ['web1', 'web2']})
+        self.assertEqual(self.key.list_keys()['minions_pre'], ['db1'])
+        self.assertEqual(
+            [(event['act'], event['id']) for event in self._events()],
+            [('accept', 'web1'), ('accept', 'web2')])
+
+    def test_events_batch(self):
+        self.opts['key_events_batch'] = True
+        self.key.accept_all()
+        self.assertEqual(self._events(),
+                         [{'result': True, 'act': 'accept',
+                           'ids': ['db1', 'web1', 'web2']}])
+
+    def test_reject_and_delete(self):
+        self.key.reject('old', include_accepted=True)
+        self.assertEqual(self.key.list_keys()['minions_rejected'], ['old'])
+        # The cache of the minion is cleared
+        self.assertEqual(os.listdir(os.path.join(self.cachedir, 'minions')),
+                         [])
+        self.key.delete_key('web1')
+        self.assertEqual(self.key.list_keys()['minions_pre'],
+                         ['db1', 'web2'])
+        self.assertEqual([event['act'] for event in self._events()],
+                         ['reject', 'delete'])
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(KeyTestCase, needs_daemon=False)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.loader_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.loader
+import salt.payload
+
+
+class GrainsCacheTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.now = [1000.0]
+        self.patch = patch('time.time', lambda: self.now[0])
+        self.patch.start()
+        self.boot_id = patch.object(salt.loader, '_boot_id',
+                                    MagicMock(return_value='boot1'))
+        self.boot_id.start()
+        self.os_data = MagicMock(return_value={'os': 'Fedora'})
+        self.ip4 = MagicMock(return_value={'ipv4': ['10.0.0.1']})
+        self.custom = MagicMock(return_value={'role': 'web'})
+
+    def tearDown(self):
+        self.boot_id.stop()
+        self.patch.stop()
+        shutil.rmtree(self.cachedir)
+
+    def _grains(self, stale=False, **opts):
+        loader = salt.loader.Loader.__new__(salt.loader.Loader)
+        loader.opts = {'cachedir': self.cachedir,
+                       'grains_cache': True,
+                       'grains_cache_expiration': 300,
+                       'grains_cache_ttl': {'core.os_data': 86400,
+                                            'core.ip4': 60}}
+        loader.opts.update(opts)
+        loader.serial = salt.payload.Serial(loader.opts)
+        funcs = {'core.os_data': self.os_data,
+                 'core.ip4': self.ip4,
+                 'custom.roles': self.custom}
+        with patch.object(loader, 'gen_functions',
+                          MagicMock(return_value=funcs)):
+            return loader.gen_grains(stale=stale)
+
+    def test_ttl_per_function(self):
+        grains = {'os': 'Fedora', 'ipv4': ['10.0.0.1'], 'role': 'web'}
+        self.assertEqual(self._grains(), grains)
+        self.assertEqual(self._grains(), grains)
+        self.assertEqual(self.os_data.call_count, 1)
+        self.assertEqual(self.ip4.call_count, 1)
+        # Only the network grains expired
+        self.now[0] += 120
+        self.ip4.return_value = {'ipv4': ['10.0.0.2']}
+        self.assertEqual(self._grains()['ipv4'], ['10.0.0.2'])
+        self.assertEqual(self.ip4.call_count, 2)
+        self.assertEqual(self.os_data.call_count, 1)
+        self.assertEqual(self.custom.call_count, 1)
+        # Then the ones cached for grains_cache_expiration
+        self.now[0] += 300
+        self._grains()
+        self.assertEqual(self.custom.call_count, 2)
+        self.assertEqual(self.os_data.call_count, 1)
+        self._grains(refresh_grains_cache=True)
+        self.assertEqual(self.os_data.call_count, 2)
+
+    def test_stale(self):
+        self._grains()
+        self.now[0] += 100000
+        self.assertEqual(self._grains(stale=True)['os'], 'Fedora')
+        self.assertEqual(self.os_data.call_count, 1)
+        self.assertEqual(self.ip4.call_count, 1)
+
+    def test_old_cache(self):
+        # A cache of the whole grains written by an older minion
+        serial = salt.payload.Serial({})
+        with open(os.path.join(self.cachedir, 'grains.cache.p'), 'w+b') as fp_:
+            serial.dump({'os': 'Gentoo'}, fp_)
+        self.assertEqual(self._grains()['os'], 'Fedora')
+
+    def test_reboot(self):
+        self._grains()
+        self._grains()
+        self.assertEqual(self.os_data.call_count, 1)
+        # The os may have been upgraded before the reboot
+        salt.loader._boot_id.return_value = 'boot2'
+        self.os_data.return_value = {'os': 'Fedora', 'osrelease': '21'}
+        self.assertEqual(self._grains(stale=True)['osrelease'], '21')
+        self.assertEqual(self.os_data.call_count, 2)
+
+
+class GrainsParallelTestCase(TestCase):
+    def _grains(self, funcs, timings=None, **opts):
+        loader = salt.loader.Loader.__new__(salt.loader.Loader)
+        loader.opts = opts
+        with patch.object(loader, 'gen_functions',
+                          MagicMock(return_value=funcs)):
+            return loader.gen_grains(timings=timings)
+
+    def _sleeper(self, secs, ret):
+        def _grain():
+            time.sleep(secs)
+            return ret
+        return _grain
+
+    def test_parallel(self):
+        funcs = dict(('mod{0}.probe'.format(num),
+                      self._sleeper(0.2, {'probe{0}'.format(num): num}))
+                     for num in range(4))
+        timings = {}
+        start = time.time()
+        grains = self._grains(funcs, timings=timings, grains_parallel=4)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(grains, {'probe0': 0, 'probe1': 1, 'probe2': 2,
+                                  'probe3': 3})
+        self.assertEqual(sorted(timings), sorted(funcs))
+        self.assertTrue(all(spent >= 0.2 for spent in timings.values()))
+
+    def test_timeout(self):
+        funcs = {'virt.probe': self._sleeper(1, {'virtual': 'kvm'}),
+                 'mod.fast': self._sleeper(0, {'fast': True})}
+        start = time.time()
+        grains = self._grains(funcs, grains_timeout=0.2)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(grains, {'fast': True})
+
+    def test_core_not_timed_out(self):
+        funcs = {'core.os_data': self._sleeper(0.5, {'os': 'Fedora',
+                                                     'os_family': 'RedHat',
+                                                     'kernel': 'Linux'}),
+                 'virt.probe': self._sleeper(1, {'virtual': 'kvm'})}
+        with patch.object(salt.loader.log, 'error') as error:
+            grains = self._grains(funcs, grains_timeout=0.2)
+        self.assertEqual(grains, {'os': 'Fedora', 'os_family': 'RedHat',
+                                  'kernel': 'Linux'})
+        self.assertEqual(error.call_count, 1)
+        # The essential grains are missing without the core grains
+        funcs['core.os_data'] = self._sleeper(0, {})
+        with patch.object(salt.loader.log, 'error') as error:
+            self._grains(funcs, grains_timeout=0.2)
+        self.assertIn('os, os_family, kernel', error.call_args_list[-1][0][0])
+
+    def test_core_applied_last(self):
+        funcs = {'core.os_data': self._sleeper(0, {'os': 'Fedora'}),
+                 'zmod.os': self._sleeper(0.1, {'os': 'Gentoo'}),
+                 'mod.broken': MagicMock(side_effect=Exception)}
+        for workers in (1, 4):
+            self.assertEqual(self._grains(funcs, grains_parallel=workers),
+                             {'os': 'Fedora'})
+        # A failing core grains function is logged like the others
+        funcs['core.os_data'] = MagicMock(side_effect=ValueError)
+        self.assertEqual(self._grains(funcs), {'os': 'Gentoo'})
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([GrainsCacheTestCase, GrainsParallelTestCase],
+              needs_daemon=False)
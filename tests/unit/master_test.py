@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.master_test
+    ~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.master
+import salt.payload
+
+
+class MinionDataCacheTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.aes_funcs = salt.master.AESFuncs.__new__(salt.master.AESFuncs)
+        self.aes_funcs.opts = {'cachedir': self.cachedir,
+                               'minion_data_cache': True}
+        self.aes_funcs.serial = salt.payload.Serial(self.aes_funcs.opts)
+        self.datap = os.path.join(self.cachedir, 'minions', 'web1', 'data.p')
+        self.patch = patch.object(salt.master.AESFuncs,
+                                  '_AESFuncs__verify_minion',
+                                  MagicMock(return_value=True))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.cachedir)
+
+    def _data(self):
+        with open(self.datap, 'rb') as fp_:
+            return self.aes_funcs.serial.load(fp_)
+
+    def test_grains_diff(self):
+        self.aes_funcs._AESFuncs__update_minion_data(
+            'web1', lambda data: {'grains': {'os': 'Fedora', 'role': 'web'},
+                                  'pillar': {'foo': 'bar'}})
+        self.assertTrue(self.aes_funcs._minion_grains(
+            {'id': 'web1', 'tok': 'tok', 'grains': {'ipv4': ['10.0.0.1']},
+             'removed': ['role']}))
+        self.assertEqual(self._data(),
+                         {'grains': {'os': 'Fedora', 'ipv4': ['10.0.0.1']},
+                          'pillar': {'foo': 'bar'}})
+
+    def test_unchanged_not_written(self):
+        update = lambda data: {'grains': {'os': 'Fedora'}, 'pillar': {}}
+        self.aes_funcs._AESFuncs__update_minion_data('web1', update)
+        with patch('salt.utils.atomicfile.atomic_open') as atomic_open:
+            self.aes_funcs._AESFuncs__update_minion_data('web1', update)
+            self.aes_funcs._minion_grains(
+                {'id': 'web1', 'tok': 'tok', 'grains': {'os': 'Fedora'}})
+        self.assertFalse(atomic_open.called)
+
+    def test_concurrent_updates(self):
+        minion_data = self.aes_funcs._AESFuncs__minion_data
+
+        def _slow_read(id_):
+            data = minion_data(id_)
+            # Let the other worker read the cache meanwhile
+            time.sleep(0.2)
+            return data
+
+        self.aes_funcs._AESFuncs__minion_data = _slow_read
+        threads = [
+            threading.Thread(
+                target=self.aes_funcs._minion_grains,
+                args=({'id': 'web1', 'tok': 'tok', 'grains': {key: True}},))
+            for key in ('foo', 'bar')
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self._data(),
+                         {'grains': {'foo': True, 'bar': True}})
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(MinionDataCacheTestCase, needs_daemon=False)
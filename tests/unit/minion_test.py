@@ -6,7 +6,7 @@
 # Import Salt Testing libs
 from salttesting import TestCase, skipIf
 from salttesting.helpers import ensure_in_syspath
-from salttesting.mock import NO_MOCK, NO_MOCK_REASON, patch
+from salttesting.mock import NO_MOCK, NO_MOCK_REASON, MagicMock, patch
 
 from salt import minion
 from salt.exceptions import SaltSystemExit
@@ -22,3 +22,45 @@ class MinionTestCase(TestCase):
     def test_invalid_master_address(self):
         with patch.dict(__opts__, {'ipv6': False, 'master': float('127.0'), 'master_port': '4555', 'retry_dns': False}):
             self.assertRaises(SaltSystemExit, minion.resolve_dns, __opts__)
+
+
+@skipIf(NO_MOCK, NO_MOCK_REASON)
+class GrainsRefreshTestCase(TestCase):
+    def setUp(self):
+        self.minion = minion.Minion.__new__(minion.Minion)
+        self.grains = {'os': 'Fedora', 'ipv4': ['10.0.0.1'], 'role': 'web'}
+        self.minion.opts = {'id': 'web1', 'grains': self.grains,
+                            'master_uri': 'tcp://127.0.0.1:4506'}
+        self.minion.tok = 'tok'
+        self.minion.crypticle = MagicMock()
+        self.minion.crypticle.dumps.side_effect = lambda load: load
+        self.minion.pillar_refresh = MagicMock()
+        self.sreq = MagicMock()
+
+    def _apply(self, grains):
+        self.minion._new_grains = grains
+        with patch('salt.payload.SREQ', MagicMock(return_value=self.sreq)):
+            self.minion._apply_grains()
+
+    def test_send_changes(self):
+        self.minion.crypticle.loads.return_value = True
+        self._apply({'os': 'Fedora', 'ipv4': ['10.0.0.2'], 'mem': 512})
+        load = self.sreq.send.call_args[0][1]
+        self.assertEqual(load['cmd'], '_minion_grains')
+        self.assertEqual(load['grains'], {'ipv4': ['10.0.0.2'], 'mem': 512})
+        self.assertEqual(load['removed'], ['role'])
+        # Updated in place, the loaded modules see the new grains
+        self.assertEqual(self.grains,
+                         {'os': 'Fedora', 'ipv4': ['10.0.0.2'], 'mem': 512})
+        # The pillar may depend on the grains
+        self.assertEqual(self.minion.pillar_refresh.call_count, 1)
+        self.assertIsNone(self.minion._new_grains)
+        # Nothing changed, nothing is sent
+        self._apply(dict(self.grains))
+        self.assertEqual(self.sreq.send.call_count, 1)
+        self.assertEqual(self.minion.pillar_refresh.call_count, 1)
+
+    def test_old_master(self):
+        self.minion.crypticle.loads.return_value = False
+        self._apply({'os': 'Fedora', 'ipv4': ['10.0.0.2'], 'role': 'web'})
+        self.assertTrue(self.minion.pillar_refresh.called)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+# Import python libs
+import os
+import pwd
+import shutil
+import subprocess
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+
+ensure_in_syspath('../../')
+
+# Import Salt libs
+from salt.modules import cmdmod
+
+cmdmod.__grains__ = {'os': 'Linux'}
+cmdmod.__salt__ = {}
+cmdmod.__context__ = {}
+
+
+class StreamTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.fire = MagicMock(return_value=True)
+        self.patches = [
+            patch.dict(cmdmod.__salt__, {'event.fire_master': self.fire}),
+            patch.object(cmdmod, '__opts__',
+                         {'id': 'web1', 'cachedir': self.cachedir,
+                          'cmd_stream_chunk_size': 1000,
+                          'cmd_stream_tail': 100},
+                         create=True),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        # 10000 numbered lines of 6 bytes each
+        self.cmd = 'seq -w 10000 19999'
+        self.output = ''.join('{0}\n'.format(num)
+                              for num in range(10000, 20000))
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        shutil.rmtree(self.cachedir)
+
+    def test_stream(self):
+        ret = cmdmod.run_all(self.cmd, stream=True, __pub_jid='20141018')
+        self.assertEqual(ret['retcode'], 0)
+        self.assertTrue(ret['truncated'])
+        self.assertEqual(ret['stdout'], self.output.rstrip()[-99:])
+        self.assertEqual(ret['stderr'], '')
+        chunks = [call[0][0] for call in self.fire.call_args_list]
+        self.assertEqual(''.join(chunk['data'] for chunk in chunks),
+                         self.output)
+        self.assertEqual([chunk['seq'] for chunk in chunks],
+                         range(len(chunks)))
+        self.assertTrue(all(len(chunk['data']) < 1000 + 65536
+                            for chunk in chunks))
+        self.assertEqual(self.fire.call_args[0][1],
+                         'salt/job/20141018/prog/web1/cmd/{0}'.format(
+                             len(chunks) - 1))
+
+    def test_spool(self):
+        ret = cmdmod.run_all('{0}; echo oops >&2'.format(self.cmd),
+                             spool=True)
+        # Not run as a job, nothing is sent to the master
+        self.assertFalse(self.fire.called)
+        self.assertEqual(ret['stderr'], 'oops')
+        with open(ret['spool']['stdout']) as fp_:
+            self.assertEqual(fp_.read(), self.output)
+        with open(ret['spool']['stderr']) as fp_:
+            self.assertEqual(fp_.read(), 'oops\n')
+        self.assertEqual(os.path.dirname(ret['spool']['stdout']),
+                         os.path.join(self.cachedir, 'cmd_spool'))
+
+    def test_small_output(self):
+        self.assertEqual(cmdmod.run('echo foo', stream=True), 'foo')
+        self.assertFalse(self.fire.called)
+        ret = cmdmod.run_all('echo foo')
+        self.assertNotIn('truncated', ret)
+
+    def test_truncated_within_read(self):
+        stream = cmdmod._OutputStream()
+        stream('stdout', 'x' * 100)
+        self.assertFalse(stream.truncated)
+        stream = cmdmod._OutputStream()
+        # A single read larger than the tail
+        stream('stdout', 'x' * 150)
+        self.assertEqual(len(stream.tail('stdout')), 100)
+        self.assertTrue(stream.truncated)
+        stream = cmdmod._OutputStream()
+        stream('stdout', 'x' * 60)
+        stream('stdout', 'y' * 50)
+        self.assertEqual(stream.tail('stdout'), 'x' * 50 + 'y' * 50)
+        self.assertTrue(stream.truncated)
+        stream = cmdmod._OutputStream()
+        stream('stdout', 'x' * 10)
+        stream('stdout', 'y' * 100)
+        self.assertEqual(stream.tail('stdout'), 'y' * 100)
+        self.assertTrue(stream.truncated)
+
+
+class RunasTestCase(TestCase):
+    def setUp(self):
+        self.user = pwd.getpwuid(os.getuid()).pw_name
+        cmdmod._RUNAS_ENVS.clear()
+
+    def test_env_cached(self):
+        proc = MagicMock()
+        proc.communicate.return_value = (
+            'motd\n{"data": {"HOME": "/home/foo"}}\n', '')
+        opts = {'cmd_runas_env_ttl': 300}
+        with patch.object(cmdmod, '__opts__', opts, create=True):
+            with patch('subprocess.Popen', MagicMock(return_value=proc)) \
+                    as popen:
+                env = cmdmod._runas_env('foo', '/bin/sh', True)
+                self.assertEqual(env, {'HOME': '/home/foo'})
+                # The cached environment is not changed by the caller
+                env['HOME'] = '/tmp'
+                self.assertEqual(cmdmod._runas_env('foo', '/bin/sh', True),
+                                 {'HOME': '/home/foo'})
+                self.assertEqual(popen.call_count, 1)
+                self.assertIn('su -s /bin/sh - foo', popen.call_args[0][0])
+                opts['cmd_runas_env_ttl'] = 0
+                cmdmod._runas_env('foo', '/bin/sh', True)
+                self.assertEqual(popen.call_count, 2)
+
+    def test_shell(self):
+        shell = cmdmod._RunasShell(self.user, '/bin/sh')
+
+        def _start():
+            # Stand in for the login shell of the user
+            shell.proc = subprocess.Popen(
+                ['/bin/sh'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        cwd = tempfile.mkdtemp()
+        try:
+            with patch.object(shell, '_start', _start):
+                ret = shell.run('pwd; echo $FOO; echo oops >&2; exit 3',
+                                cwd, {'FOO': 'b a\'r'})
+                self.assertEqual(ret['retcode'], 3)
+                self.assertEqual(ret['stdout'],
+                                 '{0}\nb a\'r\n'.format(cwd))
+                self.assertEqual(ret['stderr'], 'oops\n')
+                pid = ret['pid']
+                ret = shell.run('echo foo >&2', cwd, {}, merge_stderr=True)
+                self.assertEqual(ret['stdout'], 'foo\n')
+                self.assertIsNone(ret['stderr'])
+                # The same shell ran both
+                self.assertEqual(ret['pid'], pid)
+                # A shell which went away is started again
+                shell.proc.kill()
+                shell.proc.wait()
+                self.assertEqual(shell.run('true', cwd, {})['retcode'], 0)
+                self.assertNotEqual(shell.proc.pid, pid)
+        finally:
+            shell.close()
+            shutil.rmtree(cwd)
+
+    def test_shell_used(self):
+        shell = MagicMock()
+        shell.run.return_value = {'stdout': 'foo\n', 'stderr': '',
+                                  'retcode': 0, 'pid': 1}
+        opts = {'cmd_runas_shell': True}
+        with patch.object(cmdmod, '__opts__', opts, create=True):
+            with patch.object(cmdmod, '_runas_shell',
+                              MagicMock(return_value=shell)):
+                with patch.object(cmdmod, '_runas_env',
+                                  MagicMock(return_value={})) as runas_env:
+                    self.assertEqual(
+                        cmdmod.run('echo foo', runas=self.user), 'foo')
+                    self.assertFalse(runas_env.called)
+                    # Commands with input log in as the user
+                    cmdmod.run('cat', runas=self.user, stdin='foo')
+                    self.assertTrue(runas_env.called)
+        self.assertEqual(shell.run.call_count, 1)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([StreamTestCase, RunasTestCase], needs_daemon=False)
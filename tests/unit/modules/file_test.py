@@ -8,7 +8,7 @@ import textwrap
 # Import Salt Testing libs
 from salttesting import TestCase
 from salttesting.helpers import ensure_in_syspath
-from salttesting.mock import MagicMock
+from salttesting.mock import MagicMock, patch
 
 ensure_in_syspath('../../')
 
@@ -414,6 +414,22 @@ class FileModuleTestCase(TestCase):
                 'hash_type': 'sha1'
             })
 
+    def test_diff(self):
+        with tempfile.NamedTemporaryFile() as old:
+            with tempfile.NamedTemporaryFile() as new:
+                old.write('foo\nbar\n')
+                old.flush()
+                new.write('foo\nbaz\n')
+                new.flush()
+                self.assertFalse(filemod._same_contents(old.name, new.name))
+                self.assertTrue(filemod._same_contents(old.name, old.name))
+                self.assertIn('-bar\n+baz\n',
+                              filemod._diff(old.name, new.name))
+                with patch.dict(filemod.__opts__, {'file_diff_max_size': 4}):
+                    self.assertEqual(filemod._diff(old.name, new.name),
+                                     'Diff skipped, file larger than 4 '
+                                     'bytes')
+
 
 if __name__ == '__main__':
     from integration import run_tests
@@ -3,6 +3,7 @@
 # Import Salt Testing libs
 from salttesting import TestCase
 from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
 
 ensure_in_syspath('../../')
 
@@ -13,6 +14,7 @@ from salt.modules import grains as grainsmod
 grainsmod.__grains__ = {
   'os_family': 'MockedOS'
 }
+grainsmod.__opts__ = {}
 
 
 class GrainsModuleTestCase(TestCase):
@@ -96,6 +98,22 @@ class GrainsModuleTestCase(TestCase):
         res = grainsmod.filter_by(dict1, default='Z')
         self.assertEqual(res, {'D': {'E': 'F', 'G': 'H'}})
 
+    def test_profile(self):
+        def _grains(opts, timings=None):
+            self.assertFalse(opts['grains_cache'])
+            self.assertEqual(opts['grains_parallel'], 1)
+            timings.update({'core.os_data': 2.5, 'core.ip4': 0.25,
+                            'extra.shell': 0.0001})
+            return {}
+
+        with patch('salt.loader.grains', MagicMock(side_effect=_grains)):
+            ret = grainsmod.profile(parallel=False)
+        self.assertEqual(ret['functions'], {'core.os_data': 2.5,
+                                            'core.ip4': 0.25,
+                                            'extra.shell': 0.0})
+        self.assertEqual(ret['modules'], {'core': 2.75, 'extra': 0.0})
+        self.assertIn('total', ret)
+
 
 if __name__ == '__main__':
     from integration import run_tests
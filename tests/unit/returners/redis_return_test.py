@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.returners.redis_return_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import json
+import time
+import fnmatch
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+
+ensure_in_syspath('../../')
+
+# Import salt libs
+from salt.returners import redis_return
+
+
+class FakeRedis(object):
+    '''
+    The few redis commands used by the returner, counting the round trips
+    '''
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+
+    def __getattr__(self, name):
+        cmd = getattr(self, '_{0}'.format(name))
+
+        def _call(*args, **kwargs):
+            self.round_trips += 1
+            return cmd(*args, **kwargs)
+        return _call
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def _get(self, key):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, str):
+            raise TypeError('WRONGTYPE')
+        return value
+
+    def _set(self, key, value):
+        self.data[key] = str(value)
+
+    def _setnx(self, key, value):
+        if key in self.data:
+            return False
+        self.data[key] = str(value)
+        return True
+
+    def _expire(self, key, seconds):
+        return key in self.data
+
+    def _delete(self, key):
+        return self.data.pop(key, None) is not None
+
+    def _sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def _smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def _hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+
+    def _hsetnx(self, key, field, value):
+        self.data.setdefault(key, {}).setdefault(field, value)
+
+    def _hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def _hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def _lpush(self, key, value):
+        self.data.setdefault(key, []).insert(0, value)
+
+    def _lindex(self, key, index):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, list):
+            raise TypeError('WRONGTYPE')
+        return value[index] if value else None
+
+    def _scan_iter(self, match=None, count=None):
+        return iter([key for key in self.data if fnmatch.fnmatch(key, match)])
+
+
+class FakePipeline(object):
+    def __init__(self, serv):
+        self.serv = serv
+        self.cmds = []
+
+    def __getattr__(self, name):
+        def _queue(*args):
+            self.cmds.append((getattr(self.serv, '_{0}'.format(name)), args))
+        return _queue
+
+    def execute(self, raise_on_error=True):
+        self.serv.round_trips += 1
+        ret = []
+        for cmd, args in self.cmds:
+            try:
+                ret.append(cmd(*args))
+            except TypeError as exc:
+                if raise_on_error:
+                    raise
+                ret.append(exc)
+        return ret
+
+
+class RedisReturnerTestCase(TestCase):
+    def setUp(self):
+        self.serv = FakeRedis()
+        self.patches = [
+            patch.object(redis_return, '_get_serv',
+                         MagicMock(return_value=self.serv)),
+            patch.object(redis_return, '_MIGRATED', False),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+
+    def _ret(self, minion, jid, fun='test.ping'):
+        return {'id': minion, 'jid': jid, 'fun': fun, 'return': minion}
+
+    def test_round_trips(self):
+        minions = ['web{0}'.format(num) for num in range(2000)]
+        for minion in minions:
+            redis_return.returner(self._ret(minion, '1'))
+            redis_return.returner(self._ret(minion, '2'))
+        self.serv.data[redis_return.LAYOUT_KEY] = redis_return.LAYOUT
+        self.serv.round_trips = 0
+        start = time.time()
+        ret = redis_return.get_jid('2')
+        self.assertEqual(len(ret), 2000)
+        self.assertEqual(ret['web7'], self._ret('web7', '2'))
+        self.assertEqual(self.serv.round_trips, 2)
+        self.serv.round_trips = 0
+        ret = redis_return.get_fun('test.ping')
+        self.assertEqual(len(ret), 2000)
+        self.assertEqual(ret['web7']['jid'], '2')
+        self.assertEqual(self.serv.round_trips, 2)
+        # The layout is looked up once per process
+        self.serv.round_trips = 0
+        redis_return.get_jid('2')
+        self.assertEqual(self.serv.round_trips, 1)
+        self.assertTrue(time.time() - start < 5)
+
+    def test_migrate(self):
+        # Keys as the returner wrote them before
+        for minion, jid in (('web1', '1'), ('web1', '2'), ('web2', '1')):
+            ret = self._ret(minion, jid)
+            self.serv._set('{0}:{1}'.format(minion, jid), json.dumps(ret))
+            self.serv._lpush('{0}:test.ping'.format(minion), jid)
+            self.serv._sadd('minions', minion)
+            self.serv._sadd('jids', jid)
+        self.serv._set('1', json.dumps({'fun': 'test.ping'}))
+        self.assertEqual(redis_return.get_load('1'), {'fun': 'test.ping'})
+        self.assertEqual(sorted(redis_return.get_jid('1')), ['web1', 'web2'])
+        self.assertEqual(
+            dict((minion, ret['jid']) for minion, ret
+                 in redis_return.get_fun('test.ping').items()),
+            {'web1': '2', 'web2': '1'})
+        self.assertEqual(redis_return.get_load('1'), {'fun': 'test.ping'})
+        self.assertEqual(
+            sorted(self.serv.data),
+            ['fun:test.ping', 'jids', 'load:1', 'minions', 'ret:1', 'ret:2',
+             'salt:layout'])
+
+    @patch.object(redis_return, 'MIGRATE_CHUNK', 10)
+    def test_migrate_one_pass(self):
+        for num in range(50):
+            minion = 'web{0}'.format(num)
+            self.serv._set('{0}:1'.format(minion),
+                           json.dumps(self._ret(minion, '1')))
+            self.serv._lpush('{0}:test.ping'.format(minion), '1')
+            self.serv._sadd('minions', minion)
+        self.serv._sadd('jids', '1')
+        # A minion id with a colon, and a key of no minion
+        self.serv._set('db:1:1', json.dumps(self._ret('db:1', '1')))
+        self.serv._sadd('minions', 'db:1')
+        self.serv._set('other:key', 'x')
+        scan = MagicMock(wraps=self.serv._scan_iter)
+        expire = MagicMock(wraps=self.serv._expire)
+        with patch.object(self.serv, '_scan_iter', scan), \
+                patch.object(self.serv, '_expire', expire):
+            ret = redis_return.get_jid('1')
+        self.assertEqual(len(ret), 51)
+        self.assertEqual(ret['db:1'], self._ret('db:1', '1'))
+        self.assertEqual(scan.call_count, 1)
+        # The lock is renewed after each chunk of keys
+        self.assertEqual(expire.call_count, 11)
+        self.assertEqual(self.serv.data['other:key'], 'x')
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(RedisReturnerTestCase, needs_daemon=False)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.returners.sqlite3_return_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.utils.returners
+from salt.returners import sqlite3_return
+
+sqlite3_return.__salt__ = {}
+sqlite3_return.__opts__ = {}
+
+
+class SQLite3ReturnerTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.database = os.path.join(self.tmp, 'salt.db')
+        conn = sqlite3.connect(self.database)
+        conn.execute('''CREATE TABLE salt_returns (
+                        fun TEXT KEY, jid TEXT KEY, id TEXT KEY,
+                        fun_args TEXT, date TEXT NOT NULL,
+                        full_ret TEXT NOT NULL, success TEXT NOT NULL)''')
+        conn.close()
+        options = {'returner.sqlite3.database': self.database,
+                   'returner.sqlite3.timeout': 5.0}
+        self.real_connect = sqlite3_return._get_conn
+        self.connect = MagicMock(side_effect=self.real_connect)
+        self.patches = [
+            patch.dict(sqlite3_return.__salt__,
+                       {'config.option': options.get}),
+            patch.dict(sqlite3_return.__opts__, {'cachedir': self.tmp}),
+            patch.object(sqlite3_return, '_get_conn', self.connect),
+            patch.dict(salt.utils.returners._POOLS, clear=True),
+            patch.dict(salt.utils.returners._BUFFERS, clear=True),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for buf in salt.utils.returners._BUFFERS.values():
+            buf.stop()
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def _ret(self, minion):
+        return {'fun': 'test.ping', 'jid': '20141018120000000000',
+                'id': minion, 'fun_args': [], 'return': True,
+                'success': True}
+
+    def _count(self):
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute(
+                'SELECT COUNT(*) FROM salt_returns').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_pooled(self):
+        for num in range(5):
+            sqlite3_return.returner(self._ret('web{0}'.format(num)))
+        self.assertEqual(self._count(), 5)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_batched(self):
+        sqlite3_return.__opts__.update({'returner_batch_size': 3,
+                                        'returner_batch_interval': 60000})
+        with patch.object(sqlite3_return, '_insert_returns',
+                          MagicMock(wraps=sqlite3_return._insert_returns)) \
+                as insert:
+            for num in range(5):
+                sqlite3_return.returner(self._ret('web{0}'.format(num)))
+            salt.utils.returners._BUFFERS.values()[0].stop()
+        self.assertEqual(self._count(), 5)
+        self.assertEqual([len(call[0][0]) for call in insert.call_args_list],
+                         [3, 2])
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_backpressure(self):
+        sqlite3_return.__opts__.update({'returner_batch_size': 2,
+                                        'returner_batch_interval': 60000,
+                                        'returner_batch_queue': 4})
+        buf = salt.utils.returners.get_buffer(
+            'sqlite3', sqlite3_return._insert_returns,
+            sqlite3_return.__opts__)
+        with buf.cond:
+            # Hold up the writer thread, the caller writes out the full queue
+            for num in range(4):
+                sqlite3_return.returner(self._ret('web{0}'.format(num)))
+                if num < 3:
+                    self.assertEqual(self._count(), 0)
+            self.assertEqual(self._count(), 4)
+            self.assertEqual(len(buf.queue), 0)
+
+    def test_spool(self):
+        sqlite3_return.__opts__.update({'returner_batch_size': 10,
+                                        'returner_batch_interval': 60000})
+        self.connect.side_effect = sqlite3.OperationalError('locked')
+        for num in range(2):
+            sqlite3_return.returner(self._ret('web{0}'.format(num)))
+        buf = salt.utils.returners._BUFFERS.values()[0]
+        buf.flush()
+        spool = os.path.join(self.tmp, 'returners', 'spool', 'sqlite3')
+        self.assertEqual(len(os.listdir(spool)), 1)
+        self.assertEqual(self._count(), 0)
+        # The spooled returns are written after the next ones
+        self.connect.side_effect = self.real_connect
+        sqlite3_return.returner(self._ret('web2'))
+        buf.flush()
+        self.assertEqual(self._count(), 3)
+        self.assertEqual(os.listdir(spool), [])
+
+    def test_spool_claimed(self):
+        sqlite3_return.__opts__.update({'returner_batch_size': 10,
+                                        'returner_batch_interval': 60000})
+        self.connect.side_effect = sqlite3.OperationalError('locked')
+        sqlite3_return.returner(self._ret('web0'))
+        buf = salt.utils.returners._BUFFERS.values()[0]
+        buf.flush()
+        spool = os.path.join(self.tmp, 'returners', 'spool', 'sqlite3')
+        name = os.listdir(spool)[0]
+        # Another process is replaying the spool
+        claim = '{0}.{1}.replaying'.format(name, os.getppid())
+        os.rename(os.path.join(spool, name), os.path.join(spool, claim))
+        self.connect.side_effect = self.real_connect
+        sqlite3_return.returner(self._ret('web1'))
+        buf.flush()
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(os.listdir(spool), [claim])
+        # The process died before it was done, the spool is taken over
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        dead = '{0}.{1}.replaying'.format(name, proc.pid)
+        os.rename(os.path.join(spool, claim), os.path.join(spool, dead))
+        buf.spooled = True
+        sqlite3_return.returner(self._ret('web2'))
+        buf.flush()
+        self.assertEqual(self._count(), 3)
+        self.assertEqual(os.listdir(spool), [])
+
+    def test_flush_buffers(self):
+        sqlite3_return.__opts__.update({'returner_batch_size': 10,
+                                        'returner_batch_interval': 60000})
+        for num in range(2):
+            sqlite3_return.returner(self._ret('web{0}'.format(num)))
+        self.assertEqual(self._count(), 0)
+        salt.utils.returners.flush_buffers()
+        self.assertEqual(self._count(), 2)
+
+
+    def test_pool_check(self):
+        pool = salt.utils.returners.ConnectionPool(
+            self.real_connect, check=lambda conn: conn.execute('SELECT 1'))
+        with pool.conn() as conn:
+            first = conn
+        with pool.conn() as conn:
+            self.assertIs(conn, first)
+        # Closed while it was idle, as servers do past their idle timeout
+        first.close()
+        with pool.conn() as conn:
+            self.assertIsNot(conn, first)
+            conn.execute('SELECT 1')
+        pool.close()
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(SQLite3ReturnerTestCase, needs_daemon=False)
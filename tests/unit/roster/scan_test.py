@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.roster.scan_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import shutil
+import socket
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+from salt.roster import scan
+
+
+class ScanTestCase(TestCase):
+    def setUp(self):
+        self.listeners = []
+        self.ports = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(128)
+            self.listeners.append(sock)
+            self.ports.append(sock.getsockname()[1])
+        # A port nothing listens on
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        self.closed = sock.getsockname()[1]
+        sock.close()
+        self.cachedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for sock in self.listeners:
+            sock.close()
+        shutil.rmtree(self.cachedir)
+
+    def test_scan(self):
+        addrs = ['127.0.0.1', '127.0.0.2', '127.0.0.3']
+        self.assertEqual(
+            scan.scan(addrs, [self.closed, self.ports[1], self.ports[0]],
+                      concurrency=2),
+            {'127.0.0.1': self.ports[1]})
+        self.assertEqual(scan.scan(addrs, [self.closed]), {})
+
+    def test_targets_cached(self):
+        opts = {'cachedir': self.cachedir,
+                'ssh_scan_ports': [self.closed, self.ports[0]],
+                'ssh_scan_cache_time': 300}
+        matcher = scan.RosterMatcher('127.0.0.0/30', 'glob', opts)
+        ret = {'127.0.0.1': {'host': '127.0.0.1', 'port': self.ports[0]}}
+        self.assertEqual(matcher.targets(), ret)
+        # The second run is served from the cache
+        with patch.object(scan, 'scan', MagicMock()) as scan_:
+            self.assertEqual(matcher.targets(), ret)
+            self.assertFalse(scan_.called)
+            opts['ssh_scan_cache_time'] = 0
+            scan.RosterMatcher('127.0.0.0/30', 'glob', opts).targets()
+            self.assertTrue(scan_.called)
+
+    def test_bad_target(self):
+        self.assertEqual(scan.RosterMatcher('web*', 'glob').targets(), {})
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(ScanTestCase, needs_daemon=False)
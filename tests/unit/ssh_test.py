@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.ssh_test
+    ~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import Queue
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+from contextlib import closing
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.client.ssh
+import salt.client.ssh.shell
+import salt.client.ssh.state
+import salt.utils
+from salt.client.ssh import RSTR
+
+
+class ShellTestCase(TestCase):
+    def setUp(self):
+        self.sock_dir = tempfile.mkdtemp()
+        self.opts = {'sock_dir': self.sock_dir, 'ssh_control_persist': 60}
+
+    def tearDown(self):
+        shutil.rmtree(self.sock_dir)
+
+    def _shell(self):
+        return salt.client.ssh.shell.Shell(
+            self.opts, 'web1', user='root', port='22', priv='/tmp/key',
+            timeout=60)
+
+    def test_control_opts(self):
+        shell = self._shell()
+        self.assertTrue(shell.control_path.startswith(
+            os.path.join(self.sock_dir, 'ssh')))
+        for ssh in ('ssh', 'scp'):
+            self.assertIn('-o ControlPath={0} '.format(shell.control_path),
+                          shell._cmd_str('true', ssh=ssh))
+        self.opts['ssh_control_persist'] = 0
+        shell = self._shell()
+        self.assertIsNone(shell.control_path)
+        self.assertNotIn('ControlPath', shell._cmd_str('true'))
+
+    def test_master_started_once(self):
+        shell = self._shell()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        def _call(cmd, **kwargs):
+            # Stand in for the backgrounded ssh master
+            listener.bind(shell.control_path)
+            listener.listen(5)
+            return 0
+
+        try:
+            with patch('subprocess.call', MagicMock(side_effect=_call)) \
+                    as call:
+                with patch.object(shell, '_run_cmd',
+                                  MagicMock(return_value=('', '', 0))):
+                    shell.exec_cmd('true')
+                    shell.send('/tmp/foo', '/tmp/foo')
+            self.assertEqual(call.call_count, 1)
+            self.assertIn('-o ControlMaster=yes', call.call_args[0][0])
+            self.assertIn('-o ControlPersist=60', call.call_args[0][0])
+        finally:
+            listener.close()
+        # The socket of a master which went away is cleaned up
+        self.assertFalse(shell._master_alive())
+        self.assertFalse(os.path.exists(shell.control_path))
+
+
+class SingleTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        opts = {'cachedir': self.cachedir,
+                'hash_type': 'md5',
+                'ssh_control_persist': 0}
+        with patch('salt.loader.ssh_wrapper', MagicMock(return_value={})):
+            self.single = salt.client.ssh.Single(
+                opts, 'test.ping', 'web1', host='web1', priv='/tmp/key')
+        self.single.shell = MagicMock()
+        self.thin = os.path.join(self.cachedir, 'thin.tgz')
+        with open(self.thin, 'w') as fp_:
+            fp_.write('thin')
+        self.patches = [
+            patch('salt.utils.thin.gen_thin',
+                  MagicMock(return_value=self.thin)),
+            patch('salt.utils.thin.thin_sum', MagicMock(return_value='abc')),
+            patch('salt.utils.thin.thin_id', MagicMock(return_value='new')),
+            patch('salt.utils.thin.thin_delta', MagicMock(return_value=None)),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        shutil.rmtree(self.cachedir)
+
+    def test_deploy_and_run(self):
+        stdins = []
+
+        def _exec_cmd(cmd, stdin=None):
+            if stdin is None:
+                return '{0}\ndeploy\n'.format(RSTR), '', 1
+            stdins.append(stdin.read())
+            return '{0}\n{{"local": true}}'.format(RSTR), '', 0
+
+        self.single.shell.exec_cmd.side_effect = _exec_cmd
+        self.assertEqual(self.single.cmd_block(),
+                         ('{"local": true}', '', 0))
+        self.assertEqual(stdins, ['thin'])
+        cmd = self.single.shell.exec_cmd.call_args[0][0]
+        self.assertIn('cat > /tmp/.salt/salt-thin.tgz', cmd)
+        # The thin held by the target is unknown, it is cleared out
+        self.assertIn('rm -rf', cmd)
+        self.assertFalse(self.single.shell.send.called)
+
+    def test_delta_deploy(self):
+        delta = os.path.join(self.cachedir, 'delta.tgz')
+        with open(delta, 'w') as fp_:
+            fp_.write('delta')
+        stdins = []
+
+        def _exec_cmd(cmd, stdin=None):
+            if stdin is None:
+                return '{0}\ndeploy old\n'.format(RSTR), '', 1
+            stdins.append(stdin.read())
+            return '{0}\n{{"local": true}}'.format(RSTR), '', 0
+
+        self.single.shell.exec_cmd.side_effect = _exec_cmd
+        with patch('salt.utils.thin.thin_delta',
+                   MagicMock(return_value=delta)) as thin_delta:
+            self.assertEqual(self.single.cmd_block(),
+                             ('{"local": true}', '', 0))
+        thin_delta.assert_called_once_with(self.cachedir, 'old')
+        self.assertEqual(stdins, ['delta'])
+        cmd = self.single.shell.exec_cmd.call_args[0][0]
+        self.assertNotIn('rm -rf', cmd)
+        self.assertIn(salt.utils.get_hash(delta, 'md5'), cmd)
+
+    def test_deploy_fallback(self):
+        self.single.shell.exec_cmd.side_effect = [
+            ('{0}\ndeploy\n'.format(RSTR), '', 1),
+            ('', 'Unmatched \'.', 1),
+            ('', '', 0),
+            ('{0}\n{{"local": true}}'.format(RSTR), '', 0),
+        ]
+        self.assertEqual(self.single.cmd_block(),
+                         ('{"local": true}', '', 0))
+        self.assertTrue(self.single.shell.send.called)
+
+    def test_send_bundle(self):
+        bundle = os.path.join(self.cachedir, 'abcd.tgz')
+        remote = '{0}/abcd.tgz'.format(salt.client.ssh.STATE_DIR)
+        self.single.shell.exec_cmd.return_value = ('', '', 0)
+        self.assertEqual(self.single.send_bundle(bundle), remote)
+        self.assertFalse(self.single.shell.send.called)
+        self.single.shell.exec_cmd.return_value = ('', '', 1)
+        self.assertEqual(self.single.send_bundle(bundle), remote)
+        self.single.shell.send.assert_called_once_with(bundle, remote)
+
+
+class TransTarTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.cachedir}
+        self.sls = os.path.join(self.cachedir, 'web.sls')
+        with open(self.sls, 'w') as fp_:
+            fp_.write('foo')
+        self.client = MagicMock()
+        self.client.cache_file.side_effect = \
+            lambda name, saltenv: self.sls if name == 'salt://web.sls' else ''
+        self.client.cache_dir.return_value = []
+        self.patch = patch('salt.fileclient.LocalClient',
+                           MagicMock(return_value=self.client))
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.cachedir)
+
+    def _prep(self, chunks):
+        return salt.client.ssh.state.prep_trans_tar(
+            self.opts, chunks, {'base': [['salt://web.sls']]})
+
+    def test_content_addressed(self):
+        chunks = [{'state': 'file', 'fun': 'managed', 'name': '/tmp/foo'}]
+        trans_tar = self._prep(chunks)
+        with closing(tarfile.open(trans_tar)) as tfp:
+            self.assertEqual(sorted(tfp.getnames()),
+                             ['base', 'base/web.sls', 'lowstate.json'])
+        with patch('salt.utils.thin.gzip_tar', MagicMock()) as gzip_tar:
+            self.assertEqual(self._prep(chunks), trans_tar)
+            self.assertFalse(gzip_tar.called)
+        # A changed file makes a new package
+        with open(self.sls, 'w') as fp_:
+            fp_.write('bar')
+        self.assertNotEqual(self._prep(chunks), trans_tar)
+        self.assertNotEqual(self._prep(chunks * 2), trans_tar)
+
+    def test_reproducible(self):
+        chunks = [{'state': 'file', 'fun': 'managed', 'name': '/tmp/foo'}]
+        trans_tar = self._prep(chunks)
+        with open(trans_tar, 'rb') as fp_:
+            data = fp_.read()
+        # Rebuilt later from files with other times, as after the bundle
+        # was reaped or by a concurrent run
+        os.remove(trans_tar)
+        os.utime(self.sls, (1000, 1000))
+        with patch('time.time', MagicMock(return_value=2000)):
+            self.assertEqual(self._prep(chunks), trans_tar)
+        with open(trans_tar, 'rb') as fp_:
+            self.assertEqual(fp_.read(), data)
+
+
+class HandleSSHTestCase(TestCase):
+    def setUp(self):
+        self.ssh = salt.client.ssh.SSH.__new__(salt.client.ssh.SSH)
+        self.ssh.opts = {'raw_shell': True, 'ssh_max_procs': 3}
+        self.ssh.defaults = {'user': 'root'}
+        self.ssh.targets = dict(('web{0}'.format(num), {})
+                                for num in range(6))
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def _routine(self, que, opts, host, target):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.1)
+        with self.lock:
+            self.active -= 1
+        que.put({'id': host, 'ret': target['user']})
+
+    def test_threads(self):
+        with patch.object(self.ssh, 'handle_routine', self._routine):
+            start = time.time()
+            rets = list(self.ssh.handle_ssh())
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(self.max_active, 3)
+        self.assertEqual(sorted(ret.keys()[0] for ret in rets),
+                         sorted(self.ssh.targets))
+        self.assertEqual(set(ret.values()[0] for ret in rets), set(['root']))
+
+    def test_routine_died(self):
+        self.ssh.targets = {'web0': {}}
+        with patch.object(self.ssh, 'handle_routine', MagicMock()):
+            self.assertEqual(
+                list(self.ssh.handle_ssh()),
+                [{'web0': 'Target routine exited without a return'}])
+
+    def test_return_after_timeout(self):
+        self.ssh.targets = {'web0': {}}
+
+        base = Queue.Queue
+
+        class RacyQueue(base):
+            '''
+            Time out while the routine puts its return and exits
+            '''
+            raced = False
+
+            def get(self, block=True, timeout=None):
+                if block and not self.raced:
+                    self.raced = True
+                    while self.empty():
+                        time.sleep(0.01)
+                    time.sleep(0.1)
+                    raise Queue.Empty
+                return base.get(self, block, timeout)
+
+        with patch.object(self.ssh, 'handle_routine', self._routine):
+            with patch.object(Queue, 'Queue', RacyQueue):
+                self.assertEqual(list(self.ssh.handle_ssh()),
+                                 [{'web0': 'root'}])
+
+    def test_wrapper_functions_use_processes(self):
+        self.ssh.opts = {'arg_str': 'state.sls web'}
+        with patch('salt.loader.ssh_wrapper',
+                   MagicMock(return_value={'state.sls': None})):
+            self.assertFalse(self.ssh._threaded())
+            self.ssh.opts['arg_str'] = 'test.ping'
+            self.assertTrue(self.ssh._threaded())
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([ShellTestCase, SingleTestCase, TransTarTestCase,
+               HandleSSHTestCase], needs_daemon=False)
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.state_test
+    ~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import Queue
+import shutil
+import tempfile
+import threading
+import collections
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../')
+
+# Import salt libs
+import salt.payload
+import salt.state
+
+
+def _chunk(state, id_, name, sls, **kwargs):
+    chunk = {'state': state,
+             '__id__': id_,
+             'name': name,
+             '__sls__': sls,
+             'fun': 'managed'}
+    chunk.update(kwargs)
+    return chunk
+
+
+class ChunkIndexTestCase(TestCase):
+    chunks = [
+        _chunk('file', 'motd', '/etc/motd', 'base'),
+        _chunk('pkg', 'apache', 'httpd', 'web'),
+        _chunk('service', 'apache', 'httpd', 'web'),
+        _chunk('file', 'apache_conf', '/etc/httpd/httpd.conf', 'web'),
+        _chunk('file', 'web', '/srv/web', 'www'),
+        _chunk('cmd', 'web', 'make', 'web'),
+    ]
+
+    def _scan(self, req_key, req_val):
+        return [chunk for chunk in self.chunks
+                if salt.state.req_matches(chunk, req_key, req_val)]
+
+    def test_matches_scan(self):
+        index = salt.state.ChunkIndex(self.chunks)
+        for req in (('file', 'motd'),
+                    ('file', '/etc/motd'),
+                    ('pkg', 'apache'),
+                    ('pkg', 'httpd'),
+                    ('service', 'httpd'),
+                    ('file', '/etc/*'),
+                    ('file', 'apache*'),
+                    ('sls', 'web'),
+                    ('sls', 'w*'),
+                    ('sls', 'base'),
+                    ('file', 'missing'),
+                    ('pkg', 'motd')):
+            self.assertEqual(index.find(*req), self._scan(*req), req)
+
+    def test_none(self):
+        index = salt.state.ChunkIndex(self.chunks)
+        self.assertEqual(index.find('file', None), [])
+
+    def test_cached(self):
+        index = salt.state.ChunkIndex(self.chunks)
+        self.assertIs(index.find('pkg', 'httpd'), index.find('pkg', 'httpd'))
+
+    def test_benchmark(self):
+        # A synthetic 10k chunk highstate where every state requires the
+        # one before it, by id, by name and through its sls
+        count = 10000
+        chunks = []
+        for num in range(count):
+            chunks.append(_chunk(
+                'file', 'id{0}'.format(num), '/tmp/{0}'.format(num),
+                'sls{0}'.format(num // 100),
+                require=[{'file': 'id{0}'.format(num - 1)},
+                         {'file': '/tmp/{0}'.format(num - 1)},
+                         {'sls': 'sls{0}'.format((num - 1) // 100)}]))
+        index = salt.state.ChunkIndex(chunks)
+        with patch('salt.state.req_matches',
+                   wraps=salt.state.req_matches) as req_matches:
+            for chunk in chunks[1:]:
+                for req in chunk['require']:
+                    req_key = next(iter(req))
+                    self.assertTrue(index.find(req_key, req[req_key]))
+        # Every requisite was resolved through the index, without scanning
+        # the chunks
+        self.assertFalse(req_matches.called)
+
+
+class ParallelStateTestCase(TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.finished = []
+
+        def _run(name, result=True):
+            with self.lock:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            time.sleep(0.1)
+            with self.lock:
+                self.active -= 1
+                self.finished.append(name)
+            return {'name': name,
+                    'result': result,
+                    'changes': {},
+                    'comment': ''}
+
+        states = {'alpha.run': _run, 'beta.run': _run, 'gamma.run': _run}
+
+        def _load(state, data=None):
+            state.functions = {}
+            state.states = states
+
+        opts = {'id': 'minion',
+                'grains': {},
+                'failhard': False,
+                'local': True,
+                'state_parallel': True,
+                'state_parallel_workers': 4}
+        with patch.object(salt.state.State, '_gather_pillar',
+                          MagicMock(return_value={})):
+            with patch.object(salt.state.State, 'load_modules', _load):
+                self.state = salt.state.State(opts)
+
+    def _chunks(self, *specs):
+        chunks = []
+        for order, spec in enumerate(specs):
+            state, id_ = spec[:2]
+            chunk = _chunk(state, id_, id_, 'test', fun='run', order=order)
+            if len(spec) > 2:
+                chunk.update(spec[2])
+            chunks.append(chunk)
+        return chunks
+
+    def _run_nums(self, ret):
+        return sorted((data['__run_num__'], data['name'])
+                      for data in ret.values())
+
+    def test_independent_modules_run_concurrently(self):
+        chunks = self._chunks(('alpha', 'a'), ('beta', 'b'), ('gamma', 'c'))
+        ret = self.state.call_chunks(chunks)
+        self.assertEqual(self.max_active, 3)
+        self.assertEqual(self._run_nums(ret), [(0, 'a'), (1, 'b'), (2, 'c')])
+
+    def test_module_cap(self):
+        chunks = self._chunks(('alpha', 'a1'), ('alpha', 'a2'),
+                              ('alpha', 'a3'))
+        ret = self.state.call_chunks(chunks)
+        self.assertEqual(self.max_active, 1)
+        self.assertEqual(len(ret), 3)
+        self.state.opts['state_parallel_caps'] = {'alpha': 3}
+        self.max_active = 0
+        self.state.call_chunks(chunks)
+        self.assertEqual(self.max_active, 3)
+
+    def test_requisites(self):
+        chunks = self._chunks(
+            ('alpha', 'a', {'require': [{'beta': 'b'}]}),
+            ('beta', 'b'),
+            ('gamma', 'c', {'require': [{'alpha': 'a'}]}),
+            ('gamma', 'd'))
+        ret = self.state.call_chunks(chunks)
+        self.assertTrue(self.finished.index('b') < self.finished.index('a'))
+        self.assertTrue(self.finished.index('a') < self.finished.index('c'))
+        # Run numbers follow the requisites, then the chunk order
+        self.assertEqual(self._run_nums(ret),
+                         [(0, 'b'), (1, 'a'), (2, 'c'), (3, 'd')])
+
+    def test_failed_requisite(self):
+        chunks = self._chunks(
+            ('alpha', 'a', {'result': False}),
+            ('beta', 'b', {'require': [{'alpha': 'a'}]}))
+        ret = self.state.call_chunks(chunks)
+        self.assertEqual(self.finished, ['a'])
+        results = dict((data['__run_num__'], data['result'])
+                       for data in ret.values())
+        self.assertEqual(results, {0: False, 1: False})
+
+    def test_failhard(self):
+        chunks = self._chunks(
+            ('alpha', 'a', {'result': False, 'failhard': True}),
+            ('alpha', 'b'),
+            ('alpha', 'c'))
+        ret = self.state.call_chunks(chunks)
+        self.assertEqual(self.finished, ['a'])
+        self.assertEqual(len(ret), 1)
+
+
+class CompiledHighstateCacheTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.cfn = os.path.join(self.cachedir, 'highstate.compiled.p')
+        self.hashes = {'salt://top.sls': 'aaa', 'salt://web/init.sls': 'bbb'}
+        highstate = salt.state.BaseHighState.__new__(salt.state.BaseHighState)
+        highstate.opts = {'grains': {'os': 'Arch'},
+                          'environment': None,
+                          'state_top': 'salt://top.sls'}
+        highstate.serial = salt.payload.Serial('msgpack')
+        highstate.avail = {'base': ['top', 'web']}
+        highstate.state = MagicMock()
+        highstate.state.opts = {'pillar': {'role': 'web'}}
+        highstate.client = MagicMock()
+        highstate.client.hash_file.side_effect = self._hash_file
+        highstate.fetched = collections.defaultdict(set)
+        highstate.fetched['base'].update(self.hashes)
+        self.highstate = highstate
+        self.chunks = [_chunk('pkg', 'apache', 'httpd', 'web')]
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def _hash_file(self, path, saltenv):
+        if path not in self.hashes:
+            return {}
+        return {'hsum': self.hashes[path], 'hash_type': 'md5'}
+
+    def _write(self, exclude=None):
+        self.highstate._write_compiled(
+            self.cfn, exclude, {'base': ['web']}, self.chunks)
+
+    def test_unchanged(self):
+        self._write()
+        data = self.highstate._load_compiled(self.cfn, None)
+        self.assertEqual(data['chunks'], self.chunks)
+        self.assertEqual(data['matches'], {'base': ['web']})
+
+    def test_file_changed(self):
+        self._write()
+        self.hashes['salt://web/init.sls'] = 'ccc'
+        self.assertIsNone(self.highstate._load_compiled(self.cfn, None))
+
+    def test_file_removed(self):
+        self._write()
+        del self.hashes['salt://web/init.sls']
+        self.assertIsNone(self.highstate._load_compiled(self.cfn, None))
+
+    def test_pillar_and_grains_changed(self):
+        self._write()
+        self.highstate.state.opts['pillar']['role'] = 'db'
+        self.assertIsNone(self.highstate._load_compiled(self.cfn, None))
+        self.highstate.state.opts['pillar']['role'] = 'web'
+        self.highstate.opts['grains']['os'] = 'Debian'
+        self.assertIsNone(self.highstate._load_compiled(self.cfn, None))
+
+    def test_exclude_changed(self):
+        self._write(exclude=['web'])
+        self.assertIsNone(self.highstate._load_compiled(self.cfn, None))
+        self.assertIsNotNone(
+            self.highstate._load_compiled(self.cfn, ['web']))
+
+
+class StateEventsTestCase(TestCase):
+    def _events(self, **opts):
+        opts.setdefault('id', 'minion')
+        functions = {'event.fire_master': MagicMock(),
+                     'event.fire_master_batch': MagicMock()}
+        return salt.state.StateEvents(opts, functions, '20140101')
+
+    def _add(self, events, count, **ret):
+        for num in range(count):
+            chunk_ret = {'result': True, 'changes': {}, '__run_num__': num}
+            chunk_ret.update(ret)
+            events.add(chunk_ret, count)
+
+    def test_chunk_mode(self):
+        events = self._events()
+        self._add(events, 3)
+        events.close()
+        fire = events.functions['event.fire_master']
+        self.assertEqual(fire.call_count, 3)
+        data, tag = fire.call_args[0]
+        self.assertEqual(tag, 'salt/job/20140101/prog/minion/2')
+        self.assertEqual(data['len'], 3)
+        self.assertEqual(fire.call_args[1], {'preload': {'jid': '20140101'}})
+        self.assertFalse(events.functions['event.fire_master_batch'].called)
+
+    def test_batch_mode(self):
+        events = self._events(state_events_mode='batch',
+                              state_events_batch_size=4,
+                              state_events_batch_interval=60)
+        self._add(events, 10)
+        events.close()
+        fire = events.functions['event.fire_master_batch']
+        sizes = [len(call[0][0]) for call in fire.call_args_list]
+        self.assertEqual(sum(sizes), 10)
+        self.assertTrue(max(sizes) <= 4)
+        first = fire.call_args_list[0][0][0][0]
+        self.assertEqual(first['tag'], 'salt/job/20140101/prog/minion/0')
+        self.assertEqual(first['jid'], '20140101')
+        self.assertEqual(first['id'], 'minion')
+
+    def test_batch_interval(self):
+        events = self._events(state_events_mode='batch',
+                              state_events_batch_size=100,
+                              state_events_batch_interval=0)
+        self._add(events, 1)
+        events.thread.join(0.01)
+        events.close()
+        fire = events.functions['event.fire_master']
+        self.assertEqual(fire.call_count, 1)
+
+    def test_summary_mode(self):
+        events = self._events(state_events_mode='summary')
+        self._add(events, 5)
+        self._add(events, 2, result=False, changes={'foo': 'bar'})
+        self.assertIsNone(events.thread)
+        events.close()
+        fire = events.functions['event.fire_master']
+        self.assertEqual(fire.call_count, 1)
+        data, tag = fire.call_args[0]
+        self.assertEqual(tag, 'salt/job/20140101/prog/minion/summary')
+        self.assertEqual(data, {'len': 2,
+                                'total': 7,
+                                'succeeded': 5,
+                                'failed': 2,
+                                'changed': 2})
+
+
+    def test_threads(self):
+        events = self._events()
+        base = Queue.Queue
+        queues = []
+
+        class SlowQueue(base):
+            def __init__(self):
+                # Let the other threads find no sending thread meanwhile
+                time.sleep(0.1)
+                base.__init__(self)
+                queues.append(self)
+
+        with patch.object(Queue, 'Queue', SlowQueue):
+            adders = [threading.Thread(target=self._add, args=(events, 5))
+                      for _ in range(4)]
+            for adder in adders:
+                adder.start()
+            for adder in adders:
+                adder.join()
+        events.close()
+        # One sending thread, which close() stops
+        self.assertEqual(len(queues), 1)
+        self.assertEqual(events.functions['event.fire_master'].call_count,
+                         20)
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([ChunkIndexTestCase,
+               ParallelStateTestCase,
+               CompiledHighstateCacheTestCase,
+               StateEventsTestCase], needs_daemon=False)
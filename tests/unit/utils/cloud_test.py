@@ -11,9 +11,19 @@
     Test the salt-cloud utilities module
 '''
 
+# Import python libs
+import os
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import BaseHTTPServer
+
 # Import Salt Testing libs
 from salttesting import TestCase
 from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
 ensure_in_syspath('../../')
 
 # Import salt libs
@@ -41,6 +51,210 @@ class CloudUtilsTestCase(TestCase):
             )
 
 
+class NodeCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = cloud.NodeCache(
+            os.path.join(self.tmp, 'nodes', 'ec2-us-east-1.json'), ttl=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_update(self):
+        self.assertIsNone(self.cache.get('web1'))
+        self.cache.update({'web1': {'id': 'i-1'}, 'web2': {'id': 'i-2'}})
+        self.assertEqual(self.cache.get('web1'), {'id': 'i-1'})
+        self.assertEqual(self.cache.get(node_id='i-2'), {'id': 'i-2'})
+        # Only a complete listing is returned as one
+        self.assertIsNone(self.cache.list())
+        self.cache.update({'web3': {'id': 'i-3'}}, complete=True)
+        self.assertEqual(self.cache.list(), {'web3': {'id': 'i-3'}})
+        self.assertIsNone(self.cache.get('web1'))
+        self.cache.update({'web1': {'id': 'i-1'}})
+        self.assertEqual(sorted(self.cache.list()), ['web1', 'web3'])
+
+    def test_expire_and_remove(self):
+        self.cache.update({'web1': {'id': 'i-1'}})
+        self.cache.remove('web1')
+        self.assertIsNone(self.cache.get('web1'))
+        self.assertIsNone(self.cache.get(node_id='i-1'))
+        self.cache.update({'web1': {'id': 'i-1'}})
+        now = time.time()
+        with patch('time.time', MagicMock(return_value=now + 31)):
+            self.assertIsNone(self.cache.get('web1'))
+        self.cache.ttl = 0
+        self.assertIsNone(self.cache.get('web1'))
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.path == '/drop' and self.server.drop:
+            # The request is received but never answered
+            self.server.drop -= 1
+            self.close_connection = 1
+            return
+        status, body = 200, 'ok'
+        if self.path == '/throttle' and self.server.throttle:
+            self.server.throttle -= 1
+            status, body = 503, 'RequestLimitExceeded'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPQueryTestCase(TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(
+            ('127.0.0.1', 0), KeepAliveHandler)
+        self.server.connections = 0
+        self.server.throttle = 0
+        self.server.drop = 0
+        self.server.requests = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+        self.patches = [
+            patch.dict(cloud._HTTP_POOLS, clear=True),
+            patch.dict(cloud._HTTP_BUCKETS, clear=True),
+            patch.dict(cloud._HTTP_METRICS, clear=True),
+        ]
+        for patcher in self.patches:
+            patcher.start()
+
+    def tearDown(self):
+        for idle in cloud._HTTP_POOLS.values():
+            for conn in idle:
+                conn.close()
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for _ in range(3):
+            status, _, body = cloud.http_query(self.url + '/', key='test')
+            self.assertEqual((status, body), (200, 'ok'))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(cloud.http_metrics('test')['requests'], 3)
+
+    def test_backoff(self):
+        self.server.throttle = 2
+        with patch('time.sleep', MagicMock()) as sleep:
+            status, _, body = cloud.http_query(
+                self.url + '/throttle', key='test', backoff=1.0)
+        self.assertEqual((status, body), (200, 'ok'))
+        self.assertEqual(cloud.http_metrics('test')['throttled'], 2)
+        delays = [call[0][0] for call in sleep.call_args_list]
+        self.assertTrue(0.5 <= delays[0] <= 1.0)
+        self.assertTrue(1.0 <= delays[1] <= 2.0)
+        # Still throttled after the last attempt, the response is returned
+        self.server.throttle = 5
+        with patch('time.sleep', MagicMock()):
+            status, _, _ = cloud.http_query(
+                self.url + '/throttle', key='test', attempts=2)
+        self.assertEqual(status, 503)
+
+    def test_rate_limit(self):
+        clock = [1000.0]
+
+        def _sleep(secs):
+            clock[0] += secs
+
+        with patch('time.sleep', MagicMock(side_effect=_sleep)) as sleep:
+            with patch('time.time', MagicMock(side_effect=lambda: clock[0])):
+                for _ in range(3):
+                    cloud.http_query(self.url + '/', key='test', rate=2,
+                                     burst=2)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertAlmostEqual(sleep.call_args[0][0], 0.5)
+
+    def test_retry_sent(self):
+        # An idempotent request is sent again
+        self.server.drop = 1
+        with patch('time.sleep', MagicMock()):
+            status, _, _ = cloud.http_query(self.url + '/drop', key='test')
+        self.assertEqual(status, 200)
+        self.assertEqual(self.server.requests, 2)
+        # The server serves one connection at a time, and the requests which
+        # are not idempotent do not reuse the kept alive one
+        for conn in cloud._HTTP_POOLS.values()[0]:
+            conn.close()
+        # Those are not sent again, they may have been acted on
+        self.server.drop = 1
+        self.server.requests = 0
+        with patch('time.sleep', MagicMock()):
+            self.assertRaises(
+                Exception, cloud.http_query, self.url + '/drop',
+                method='POST', data='x', key='test')
+        self.assertEqual(self.server.requests, 1)
+        self.server.drop = 1
+        self.server.requests = 0
+        with patch('time.sleep', MagicMock()):
+            self.assertRaises(
+                Exception, cloud.http_query, self.url + '/drop',
+                key='test', idempotent=False)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_retry_connect(self):
+        # Nothing listens on the port once the socket is closed
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:{0}/'.format(sock.getsockname()[1])
+        sock.close()
+        with patch('time.sleep', MagicMock()) as sleep:
+            self.assertRaises(
+                socket.error, cloud.http_query, url, method='POST',
+                data='x', key='test', attempts=2)
+        # A request which failed to connect never reached the server
+        self.assertEqual(sleep.call_count, 2)
+
+
+class PhaseTestCase(TestCase):
+    def setUp(self):
+        self.now = [100.0]
+        self.patch = patch('time.time', lambda: self.now[0])
+        self.patch.start()
+        cloud.reset_phases()
+
+    def tearDown(self):
+        self.patch.stop()
+        cloud.reset_phases()
+
+    def test_nested_phases(self):
+        @cloud.timed_phase('wait_for_port')
+        def _wait():
+            self.now[0] += 2
+
+        @cloud.timed_phase('deploy')
+        def _deploy():
+            self.now[0] += 1
+            _wait()
+            _wait()
+            self.now[0] += 3
+
+        _deploy()
+        self.assertEqual(cloud.phase_times(10),
+                         {'wait_for_port': 4, 'deploy': 4,
+                          'create': 2, 'total': 10})
+        cloud.reset_phases()
+        self.assertEqual(cloud.phase_times(1), {'create': 1, 'total': 1})
+
 if __name__ == '__main__':
     from integration import run_tests
-    run_tests(CloudUtilsTestCase, needs_daemon=False)
+    run_tests([CloudUtilsTestCase, NodeCacheTestCase, HTTPQueryTestCase,
+               PhaseTestCase],
+              needs_daemon=False)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.filehash_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.utils
+import salt.utils.filehash
+
+
+class FileHashTestCase(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.tmp, 'file_hash_cache_min_size': 3}
+        self.path = os.path.join(self.tmp, 'file')
+        self._write('foo')
+        self._reset()
+
+    def _write(self, data, age=10):
+        with open(self.path, 'w') as fp_:
+            fp_.write(data)
+        # Modified well before it is hashed
+        mtime = time.time() - age
+        os.utime(self.path, (mtime, mtime))
+
+    def tearDown(self):
+        self._reset()
+        shutil.rmtree(self.tmp)
+
+    def _reset(self):
+        # Stand in for a new process
+        salt.utils.filehash.flush()
+        salt.utils.filehash._HASHES.clear()
+        salt.utils.filehash._LOADED.clear()
+
+    def _get_hash(self, form='md5'):
+        with patch('salt.utils.get_hash',
+                   wraps=salt.utils.get_hash) as get_hash:
+            hsum = salt.utils.filehash.get_hash(self.path, form, self.opts)
+        return hsum, get_hash.call_count
+
+    def test_cached(self):
+        md5 = hashlib.md5('foo').hexdigest()
+        self.assertEqual(self._get_hash(), (md5, 1))
+        self.assertEqual(self._get_hash(), (md5, 0))
+        self.assertEqual(self._get_hash('sha1'),
+                         (hashlib.sha1('foo').hexdigest(), 1))
+        # Kept in the minion cache for the next process
+        self._reset()
+        self.assertEqual(self._get_hash(), (md5, 0))
+        # A changed file is hashed again
+        self._write('barbaz')
+        self.assertEqual(self._get_hash(),
+                         (hashlib.md5('barbaz').hexdigest(), 1))
+
+    def test_small_files(self):
+        self.opts['file_hash_cache_min_size'] = 4
+        self._get_hash()
+        self.assertEqual(self._get_hash()[1], 1)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmp, 'file_hashes.p')))
+
+    def test_hashing_file(self):
+        with salt.utils.fopen(self.path, 'wb') as fp_:
+            fp_ = salt.utils.filehash.HashingFile(
+                fp_, salt.utils.filehash.hash_types({'hash_type': 'sha256'}))
+            fp_.write('bar')
+            fp_.write('baz')
+        sums = fp_.sums()
+        self.assertEqual(sums, {'md5': hashlib.md5('barbaz').hexdigest(),
+                                'sha256': hashlib.sha256('barbaz').hexdigest()})
+        with patch('time.time', MagicMock(return_value=time.time() + 10)):
+            salt.utils.filehash.store(self.path, sums, self.opts)
+            self.assertEqual(self._get_hash('sha256'), (sums['sha256'], 0))
+
+    def test_racy(self):
+        md5 = hashlib.md5('bar').hexdigest()
+        # Rewritten within the mtime granularity, the stat is the same
+        self._write('bar', age=0)
+        self.assertEqual(self._get_hash(), (md5, 1))
+        self.assertEqual(self._get_hash(), (md5, 1))
+        # Trusted once hashed well after it was modified
+        with patch('time.time', MagicMock(return_value=time.time() + 10)):
+            self.assertEqual(self._get_hash(), (md5, 1))
+            self.assertEqual(self._get_hash(), (md5, 0))
+
+    def test_written_once(self):
+        cfn = os.path.join(self.tmp, 'file_hashes.p')
+        paths = []
+        for num in range(5):
+            paths.append(os.path.join(self.tmp, str(num)))
+            with open(paths[-1], 'w') as fp_:
+                fp_.write('foo')
+        with patch('salt.utils.filehash._save',
+                   wraps=salt.utils.filehash._save) as save:
+            with patch('time.time',
+                       MagicMock(return_value=time.time() + 10)):
+                for path in paths:
+                    salt.utils.filehash.get_hash(path, 'md5', self.opts)
+            self.assertFalse(os.path.exists(cfn))
+            salt.utils.filehash.flush()
+            salt.utils.filehash.flush()
+        self.assertEqual(save.call_count, 1)
+        self.assertTrue(os.path.exists(cfn))
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(FileHashTestCase, needs_daemon=False)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.fsindex_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import time
+import shutil
+import tempfile
+
+# Import Salt Testing libs
+from salttesting import TestCase, skipIf
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.payload
+import salt.utils.fsindex
+from salt.utils.fsindex import FileIndex
+
+
+class FileIndexTestCase(TestCase):
+    inotify = False
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cachedir = tempfile.mkdtemp()
+        self.opts = {'cachedir': self.cachedir,
+                     'hash_type': 'md5',
+                     'file_ignore_regex': None,
+                     'file_ignore_glob': ['*.swp'],
+                     'fileserver_followsymlinks': True,
+                     'fileserver_ignoresymlinks': False}
+        for path in ('top.sls', 'web/init.sls', 'web/files/httpd.conf',
+                     'web/files/.httpd.conf.swp'):
+            self._write(path)
+        os.makedirs(os.path.join(self.root, 'empty'))
+        os.symlink('init.sls', os.path.join(self.root, 'web', 'link.sls'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.cachedir)
+
+    def _write(self, path, data='foo'):
+        full = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(full)):
+            os.makedirs(os.path.dirname(full))
+        with open(full, 'w') as fp_:
+            fp_.write(data)
+
+    def _index(self):
+        with patch.object(salt.utils.fsindex, 'HAS_PYINOTIFY',
+                          self.inotify):
+            return FileIndex(self.opts, 'base', [self.root])
+
+    def _walk(self):
+        '''
+        The file lists as built by the roots backend
+        '''
+        ret = {'files': set(), 'dirs': set(), 'empty_dirs': set(),
+               'links': set()}
+        for root, dirs, files in os.walk(self.root, followlinks=True):
+            rel = os.path.relpath(root, self.root)
+            ret['dirs'].add(rel)
+            if not dirs and not files:
+                ret['empty_dirs'].add(rel)
+            for fname in files:
+                if os.path.islink(os.path.join(root, fname)):
+                    ret['links'].add(fname)
+                if not fname.endswith('.swp'):
+                    ret['files'].add(
+                        os.path.relpath(os.path.join(root, fname), self.root))
+        return dict((key, sorted(val)) for key, val in ret.items())
+
+    def _snapshot(self):
+        path = salt.utils.fsindex.snapshot_path(self.opts, 'roots', 'base')
+        with open(path, 'rb') as fp_:
+            return salt.payload.Serial('msgpack').loads(fp_.read())
+
+    def _refresh(self, index):
+        # Directory mtimes only have a one second resolution on some
+        # filesystems
+        if not self.inotify:
+            time.sleep(1.1)
+        return index.refresh()
+
+    def test_initial(self):
+        index = self._index()
+        self.assertEqual(index.file_lists(), self._walk())
+        snapshot = self._snapshot()
+        self.assertEqual(snapshot['generation'], 1)
+        self.assertEqual(snapshot['files'], self._walk()['files'])
+        self.assertIn('web/link.sls', snapshot['files'])
+        self.assertIn('empty', snapshot['empty_dirs'])
+
+    def test_unchanged(self):
+        index = self._index()
+        self.assertFalse(self._refresh(index))
+        self.assertEqual(self._snapshot()['generation'], 1)
+
+    def test_create_and_delete(self):
+        index = self._index()
+        self._write('db/init.sls')
+        self._write('empty/new.sls')
+        os.remove(os.path.join(self.root, 'top.sls'))
+        shutil.rmtree(os.path.join(self.root, 'web', 'files'))
+        self.assertTrue(self._refresh(index))
+        self.assertEqual(index.file_lists(), self._walk())
+        self.assertEqual(self._snapshot()['files'], self._walk()['files'])
+        self.assertNotIn(os.path.join(self.root, 'top.sls'),
+                         index.mtime_map())
+
+    def test_modify(self):
+        index = self._index()
+        path = os.path.join(self.root, 'web', 'init.sls')
+        hash_path = os.path.join(self.cachedir, 'roots', 'hash', 'base',
+                                 'web', 'init.sls.hash.md5')
+        os.makedirs(os.path.dirname(hash_path))
+        with open(hash_path, 'w') as fp_:
+            fp_.write('abc:0')
+        mtime = int(os.path.getmtime(path)) - 10
+        os.utime(path, (mtime, mtime))
+        self.assertTrue(self._refresh(index))
+        self.assertEqual(index.mtime_map()[path], mtime)
+        # The stale hash is thrown away
+        self.assertFalse(os.path.exists(hash_path))
+
+    def test_ignoresymlinks(self):
+        self.opts['fileserver_ignoresymlinks'] = True
+        index = self._index()
+        self.assertNotIn('web/link.sls', index.file_lists()['files'])
+        self.assertEqual(index.file_lists()['links'], ['link.sls'])
+
+
+@skipIf(not salt.utils.fsindex.HAS_PYINOTIFY, 'pyinotify is not installed')
+class InotifyFileIndexTestCase(FileIndexTestCase):
+    inotify = True
+
+    def test_watching(self):
+        self.assertIsNotNone(self._index().notifier)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([FileIndexTestCase, InotifyFileIndexTestCase],
+              needs_daemon=False)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.schedule_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import shutil
+import tempfile
+import threading
+import time
+import datetime
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.minion
+import salt.utils.schedule
+from salt.utils.schedule import Cron, Schedule
+
+
+def _epoch(*args):
+    return int(time.mktime(datetime.datetime(*args).timetuple()))
+
+
+class CronTestCase(TestCase):
+    def test_every_fifteen_minutes(self):
+        cron = Cron('*/15 * * * *')
+        self.assertEqual(cron.next_fire(_epoch(2014, 3, 1, 10, 7)),
+                         _epoch(2014, 3, 1, 10, 15))
+        self.assertEqual(cron.next_fire(_epoch(2014, 3, 1, 10, 45)),
+                         _epoch(2014, 3, 1, 11, 0))
+
+    def test_daily(self):
+        cron = Cron('30 2 * * *')
+        self.assertEqual(cron.next_fire(_epoch(2014, 3, 1, 10, 0)),
+                         _epoch(2014, 3, 2, 2, 30))
+
+    def test_month_rollover(self):
+        cron = Cron('0 0 1 1 *')
+        self.assertEqual(cron.next_fire(_epoch(2014, 3, 1, 10, 0)),
+                         _epoch(2015, 1, 1, 0, 0))
+
+    def test_day_of_week(self):
+        # 2014-03-01 is a Saturday, Sunday can be 0 or 7
+        for expr in ('0 12 * * 0', '0 12 * * 7'):
+            self.assertEqual(Cron(expr).next_fire(_epoch(2014, 3, 1, 10, 0)),
+                             _epoch(2014, 3, 2, 12, 0))
+
+    def test_dom_or_dow(self):
+        # Both restricted, either one matching is enough
+        cron = Cron('0 0 15 * 1')
+        self.assertEqual(cron.next_fire(_epoch(2014, 3, 1, 10, 0)),
+                         _epoch(2014, 3, 3, 0, 0))
+
+    def test_invalid(self):
+        for expr in ('* * * *', '61 * * * *', '*/0 * * * *', '0 0 31 2 *'):
+            self.assertRaises(ValueError, lambda: Cron(expr).next_fire(0))
+
+
+class ScheduleTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.release = threading.Event()
+        self.calls = []
+        self.opts = {'cachedir': self.cachedir,
+                     'multiprocessing': False,
+                     'schedule': {}}
+        self.functions = {'test.block': self._block}
+
+    def tearDown(self):
+        self.release.set()
+        shutil.rmtree(self.cachedir)
+
+    def _block(self):
+        self.calls.append(time.time())
+        self.release.wait(10)
+        return True
+
+    def _wait_running(self, schedule, job):
+        for _ in range(100):
+            schedule._reap()
+            if not schedule.running.get(job):
+                return
+            time.sleep(0.05)
+
+    def test_only_due_jobs_run(self):
+        self.opts['schedule'] = {
+            'fast': {'function': 'test.block', 'seconds': 1,
+                     'jid_include': False},
+            'slow': {'function': 'test.block', 'hours': 1,
+                     'jid_include': False},
+        }
+        self.release.set()
+        schedule = Schedule(self.opts, self.functions)
+        schedule.intervals['slow'] = int(time.time())
+        schedule.eval()
+        self._wait_running(schedule, 'fast')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(schedule.loop_interval, 1)
+        self.assertEqual(schedule.heap[0][1], 'fast')
+        stats = salt.utils.schedule.read_stats(self.opts)
+        self.assertEqual(stats['fast']['runs'], 1)
+        self.assertEqual(stats['slow']['runs'], 0)
+        self.assertEqual(schedule.stats['fast']['completed'], 1)
+
+    def test_maxrunning(self):
+        self.opts['schedule'] = {
+            'job': {'function': 'test.block', 'seconds': 1, 'maxrunning': 2},
+        }
+        schedule = Schedule(self.opts, self.functions)
+        for _ in range(3):
+            schedule.next_fire['job'] = 0
+            schedule.heap = [(0, 'job')]
+            schedule.eval()
+        self.assertEqual(len(schedule.running['job']), 2)
+        self.assertEqual(schedule.stats['job']['skipped'], 1)
+        self.release.set()
+        self._wait_running(schedule, 'job')
+        self.assertEqual(schedule.stats['job']['completed'], 2)
+
+    def test_changed_job_is_rescheduled(self):
+        self.opts['schedule'] = {
+            'job': {'function': 'test.block', 'hours': 1,
+                    'jid_include': False},
+        }
+        schedule = Schedule(self.opts, self.functions)
+        schedule.intervals['job'] = int(time.time())
+        schedule.eval()
+        first = schedule.next_fire['job']
+        self.opts['schedule']['job']['hours'] = 2
+        schedule.eval()
+        self.assertEqual(schedule.next_fire['job'], first + 3600)
+        del self.opts['schedule']['job']
+        schedule.eval()
+        self.assertNotIn('job', schedule.next_fire)
+        self.assertEqual(self.calls, [])
+
+    def test_splay(self):
+        self.opts['schedule'] = {
+            'job': {'function': 'test.block', 'seconds': 60, 'splay': 30},
+        }
+        schedule = Schedule(self.opts, self.functions)
+        now = int(time.time())
+        schedule.intervals['job'] = now
+        for _ in range(20):
+            when = schedule._calc_next_fire(
+                'job', self.opts['schedule']['job'], now)
+            self.assertTrue(now + 60 <= when <= now + 90)
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests([CronTestCase, ScheduleTestCase], needs_daemon=False)
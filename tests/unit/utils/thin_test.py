@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+    tests.unit.utils.thin_test
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+'''
+
+# Import python libs
+import os
+import json
+import shutil
+import tarfile
+import tempfile
+from contextlib import closing
+
+# Import Salt Testing libs
+from salttesting import TestCase
+from salttesting.helpers import ensure_in_syspath
+from salttesting.mock import MagicMock, patch
+ensure_in_syspath('../../')
+
+# Import salt libs
+import salt.utils.thin
+
+
+class ThinTestCase(TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.thindir = os.path.join(self.cachedir, 'thin')
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def _manifest(self, id_):
+        with open(os.path.join(self.thindir, 'manifests', id_)) as fp_:
+            return json.load(fp_)
+
+    def test_gen_thin(self):
+        thintar = salt.utils.thin.gen_thin(self.cachedir)
+        id_ = salt.utils.thin.thin_id(self.cachedir)
+        manifest = self._manifest(id_)
+        self.assertEqual(salt.utils.thin.manifest_id(manifest), id_)
+        with closing(tarfile.open(thintar)) as tfp:
+            names = set(tfp.getnames())
+        self.assertEqual(names, set(manifest) | set(['thin_id']))
+        self.assertIn('salt/version.py', names)
+        self.assertFalse([name for name in names if name.endswith('.pyc')])
+
+    def test_gzip_fallback(self):
+        src = os.path.join(self.cachedir, 'src')
+        dest = os.path.join(self.cachedir, 'dest.gz')
+        with open(src, 'w') as fp_:
+            fp_.write('foo' * 100)
+        with patch('salt.utils.which', MagicMock(return_value=None)):
+            salt.utils.thin.gzip_tar(src, dest)
+            first = open(dest, 'rb').read()
+            salt.utils.thin.gzip_tar(src, dest)
+        # The same input gives the same bundle
+        self.assertEqual(open(dest, 'rb').read(), first)
+
+    def test_delta(self):
+        thintar = salt.utils.thin.gen_thin(self.cachedir)
+        id_ = salt.utils.thin.thin_id(self.cachedir)
+        self.assertIsNone(salt.utils.thin.thin_delta(self.cachedir, id_))
+        self.assertIsNone(salt.utils.thin.thin_delta(self.cachedir, 'bad'))
+        # A thin held by a target, with a changed and a removed file
+        manifest = self._manifest(id_)
+        manifest['salt/version.py'] = 'old'
+        manifest['salt/removed.py'] = 'old'
+        held = salt.utils.thin.manifest_id(manifest)
+        with open(os.path.join(self.thindir, 'manifests', held), 'w') as fp_:
+            json.dump(manifest, fp_)
+        delta = salt.utils.thin.thin_delta(self.cachedir, held)
+        with closing(tarfile.open(delta)) as tfp:
+            self.assertEqual(sorted(tfp.getnames()),
+                             ['salt/version.py', 'thin.deleted', 'thin_id'])
+            self.assertEqual(tfp.extractfile('thin.deleted').read(),
+                             'salt/removed.py\n')
+            self.assertEqual(tfp.extractfile('thin_id').read(), id_)
+        # The delta is built once
+        self.assertEqual(salt.utils.thin.thin_delta(self.cachedir, held),
+                         delta)
+        # and thrown away with the thin it was made for
+        salt.utils.thin.gen_thin(self.cachedir, overwrite=True)
+        self.assertFalse(os.path.exists(delta))
+        self.assertTrue(os.path.isfile(thintar))
+
+
+if __name__ == '__main__':
+    from integration import run_tests
+    run_tests(ThinTestCase, needs_daemon=False)